@@ -0,0 +1,274 @@
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Literal, Optional
+
+import numpy as np
+import pint
+from pydantic import BaseModel, Field
+
+from app.constants import (PRIMARY_CLARIFIER_OVERFLOW_RATE_RANGE,
+                           PRIMARY_CLARIFIER_DETENTION_TIME_RANGE,
+                           PRIMARY_CLARIFIER_SLR,
+                           PRIMARY_CLARIFIER_WLR,
+                           )
+from app.helpers import as_magnitude_array
+from app.units import ureg
+from app.wastewater_treatment.primary_treatment import calculate_design_batch
+
+# Primary clarifier layout optimization.
+# Decision variables: tank type, length-to-width ratio, side water depth, number
+# of parallel units and the design overflow rate (which sets the unit surface area).
+# Each start runs a vectorized differential evolution (DE/rand/1/bin) with
+# Deb's feasibility rules; starts are spread over a process pool and the
+# feasible designs they visit are merged into a footprint vs. effluent TSS Pareto front.
+
+_FLOW_UNIT = ureg.meter ** 3 / ureg.day
+_OVERFLOW_UNIT = ureg.meter / ureg.day
+_CONCENTRATION_UNIT = ureg.milligram / ureg.liter
+
+
+class ClarifierDesignProblem(BaseModel):
+    """Design brief and constraints of a primary clarifier layout optimization."""
+
+    flow_rate: pint.Quantity = Field(..., gt=0)
+    influent_tss: pint.Quantity = Field(..., gt=0)
+    influent_bod: pint.Quantity = Field(..., gt=0)
+
+    tank_types: tuple[Literal["circular", "rectangular"], ...] = ("rectangular", "circular")
+    length_to_width_ratio_bounds: tuple[float, float] = (3.0, 6.0)
+    side_water_depth_bounds: pint.Quantity = (3.0, 5.0) * ureg.meter
+    max_units: int = Field(8, ge=1)
+
+    overflow_rate_range: pint.Quantity = PRIMARY_CLARIFIER_OVERFLOW_RATE_RANGE
+    detention_time_range: pint.Quantity = PRIMARY_CLARIFIER_DETENTION_TIME_RANGE
+    weir_loading_range: pint.Quantity = PRIMARY_CLARIFIER_WLR
+    solids_loading_range: pint.Quantity = PRIMARY_CLARIFIER_SLR
+    # Rectangular tanks: effluent launders span the tank width, this is the
+    # number of weir edges per tank (e.g. 2 double-sided launders -> 4).
+    # Circular tanks use a single peripheral weir.
+    weir_passes: float = Field(4.0, gt=0)
+
+    # Cost objective: area_cost * total area + volume_cost * total volume + unit_cost * units.
+    # The defaults minimize the footprint.
+    area_cost: float = Field(1.0, ge=0)
+    volume_cost: float = Field(0.0, ge=0)
+    unit_cost: float = Field(0.0, ge=0)
+
+    class Config:
+        arbitrary_types_allowed = True  # Allow pint.Quantity
+
+
+class ClarifierOptimizationResult(BaseModel):
+    """Best layout found and the footprint vs. effluent TSS Pareto front."""
+
+    best_design: dict[str, object]
+    best_cost: float
+    pareto_front: dict[str, np.ndarray]
+    evaluations: int
+
+    class Config:
+        arbitrary_types_allowed = True  # Allow numpy arrays
+
+
+def evaluate_layouts(problem: ClarifierDesignProblem,
+                     tank_type: str,
+                     length_to_width_ratio: np.ndarray,
+                     side_water_depth: np.ndarray,
+                     n_units: np.ndarray,
+                     overflow_rate: np.ndarray) -> dict[str, np.ndarray]:
+    """Vectorized evaluation of clarifier layouts.
+
+    Args:
+        problem: The design problem.
+        tank_type: "rectangular" or "circular".
+        length_to_width_ratio: Length to width ratios (ignored for circular tanks).
+        side_water_depth: Side water depths in meters.
+        n_units: Numbers of parallel units.
+        overflow_rate: Design overflow rates at average flow, in m/day.
+
+    Returns:
+        Plain arrays of the total footprint (m^2), total volume (m^3), cost,
+        effluent TSS and BOD (mg/L), loading rates and the summed relative
+        constraint violation (zero for feasible layouts).
+    """
+    n_units = np.asarray(n_units, dtype=float)
+    unit_flow = as_magnitude_array(problem.flow_rate, _FLOW_UNIT) / n_units
+    tss = as_magnitude_array(problem.influent_tss, _CONCENTRATION_UNIT)
+
+    design = calculate_design_batch(
+        flow_rate=unit_flow,
+        surface_overflow_velocity=overflow_rate,
+        side_water_depth=side_water_depth,
+        tank_type=tank_type,
+        length_to_width_ratio=length_to_width_ratio,
+        influent_tss=problem.influent_tss,
+        influent_bod=problem.influent_bod,
+    )
+    area = design["surface_area"].magnitude
+    volume = design["volume"].magnitude
+    if tank_type == "circular":
+        weir_length = np.pi * design["diameter"].magnitude
+    else:
+        weir_length = problem.weir_passes * design["width"].magnitude
+
+    loadings = {
+        "overflow_rate": (design["surface_overflow_velocity"].magnitude,
+                          as_magnitude_array(problem.overflow_rate_range, _OVERFLOW_UNIT)),
+        "detention_time": (design["detention_time"].magnitude,
+                           as_magnitude_array(problem.detention_time_range, ureg.hour)),
+        "weir_loading_rate": (unit_flow / weir_length,
+                              as_magnitude_array(problem.weir_loading_range, ureg.meter ** 2 / ureg.day)),
+        "solids_loading_rate": (unit_flow * tss * 1e-3 / area,
+                                as_magnitude_array(problem.solids_loading_range,
+                                                   ureg.kg / (ureg.meter ** 2 * ureg.day))),
+    }
+    violation = np.zeros(np.shape(area))
+    for value, (low, high) in loadings.values():
+        violation += np.maximum(0, low - value) / low + np.maximum(0, value - high) / high
+
+    footprint = area * n_units
+    total_volume = volume * n_units
+    return {
+        "footprint": footprint,
+        "volume": total_volume,
+        "cost": problem.area_cost * footprint + problem.volume_cost * total_volume + problem.unit_cost * n_units,
+        "effluent_tss": design["effluent_tss"].magnitude,
+        "effluent_bod": design["effluent_bod"].magnitude,
+        **{name: value for name, (value, _) in loadings.items()},
+        "violation": violation,
+    }
+
+
+def pareto_mask(footprint: np.ndarray, effluent_tss: np.ndarray) -> np.ndarray:
+    """Returns a mask of the points not dominated in (footprint, effluent TSS)."""
+    order = np.lexsort((effluent_tss, footprint))
+    sorted_tss = effluent_tss[order]
+    best_before = np.minimum.accumulate(np.concatenate([[np.inf], sorted_tss[:-1]]))
+    mask = np.zeros(len(footprint), dtype=bool)
+    mask[order] = sorted_tss < best_before
+    return mask
+
+
+def _decode(problem: ClarifierDesignProblem, x: np.ndarray):
+    return (x[:, 0], x[:, 1], np.minimum(np.floor(x[:, 2]), problem.max_units), x[:, 3])
+
+
+def _differential_evolution(problem: ClarifierDesignProblem, tank_type: str, population_size: int,
+                            generations: int, seed: int, mutation: float = 0.7,
+                            crossover: float = 0.9) -> dict[str, np.ndarray]:
+    """Runs one DE start and returns the best layout and the visited Pareto set."""
+    rng = np.random.default_rng(seed)
+    depth_bounds = as_magnitude_array(problem.side_water_depth_bounds, ureg.meter)
+    overflow_bounds = as_magnitude_array(problem.overflow_rate_range, _OVERFLOW_UNIT)
+    low = np.array([problem.length_to_width_ratio_bounds[0], depth_bounds[0], 1, overflow_bounds[0]])
+    high = np.array([problem.length_to_width_ratio_bounds[1], depth_bounds[1],
+                     problem.max_units + 1 - 1e-9, overflow_bounds[1]])
+
+    def evaluate(x):
+        return evaluate_layouts(problem, tank_type, *_decode(problem, x))
+
+    population = low + (high - low) * rng.random((population_size, 4))
+    scores = evaluate(population)
+    archive = [(population, scores)]
+
+    idx = np.arange(population_size)
+    for _ in range(generations):
+        # Pick three distinct partners different from the target vector
+        partners = np.argsort(rng.random((population_size, population_size - 1)), axis=1)[:, :3]
+        partners = np.where(partners >= idx[:, None], partners + 1, partners)
+        a, b, c = population[partners[:, 0]], population[partners[:, 1]], population[partners[:, 2]]
+        mutant = np.clip(a + mutation * (b - c), low, high)
+
+        cross = rng.random(population.shape) < crossover
+        cross[idx, rng.integers(0, 4, population_size)] = True
+        trial = np.where(cross, mutant, population)
+        trial_scores = evaluate(trial)
+        archive.append((trial, trial_scores))
+
+        # Deb's rules: feasible beats infeasible, then lower cost or lower violation
+        v_old, v_new = scores["violation"], trial_scores["violation"]
+        better = np.where(
+            (v_old == 0) & (v_new == 0),
+            trial_scores["cost"] <= scores["cost"],
+            v_new <= v_old,
+        )
+        population = np.where(better[:, None], trial, population)
+        scores = {key: np.where(better, trial_scores[key], scores[key]) for key in scores}
+
+    # Keep only the feasible, non-dominated designs visited during the run
+    x = np.concatenate([entry[0] for entry in archive])
+    visited = {key: np.concatenate([entry[1][key] for entry in archive]) for key in scores}
+    feasible = visited["violation"] == 0
+    ratio, depth, units, overflow = _decode(problem, x)
+    candidates = {"length_to_width_ratio": ratio, "side_water_depth": depth,
+                  "n_units": units, "overflow_rate": overflow, **visited}
+    candidates = {key: value[feasible] for key, value in candidates.items()}
+    front = pareto_mask(candidates["footprint"], candidates["effluent_tss"])
+
+    best = int(np.argmin(np.where(scores["violation"] == 0, scores["cost"], np.inf) + scores["violation"]))
+    ratio, depth, units, overflow = _decode(problem, population[best:best + 1])
+    return {
+        "best": {"tank_type": str(tank_type), "length_to_width_ratio": float(ratio[0]),
+                 "side_water_depth": float(depth[0]), "n_units": int(units[0]),
+                 "overflow_rate": float(overflow[0]),
+                 **{key: float(value[best]) for key, value in scores.items()}},
+        "front": {key: value[front] for key, value in candidates.items()},
+        "evaluations": population_size * (generations + 1),
+    }
+
+
+def optimize_clarifier(problem: ClarifierDesignProblem,
+                       n_starts: int = 4,
+                       population_size: int = 40,
+                       generations: int = 100,
+                       n_workers: Optional[int] = None,
+                       seed: Optional[int] = None) -> ClarifierOptimizationResult:
+    """Finds the cheapest primary clarifier layout that satisfies the loading ranges.
+
+    Runs `n_starts` independent differential evolution searches per tank type on
+    a process pool (in-process when `n_workers=1`).
+
+    Args:
+        problem: The design problem.
+        n_starts: Number of independent starts per tank type.
+        population_size: DE population size (at least 4).
+        generations: Number of DE generations per start.
+        n_workers: Number of processes. Defaults to the number of CPUs.
+        seed: Seed of the random generators.
+
+    Returns:
+        The best feasible layout and the Pareto front of footprint vs. effluent TSS.
+
+    Raises:
+        ValueError: If no feasible layout was found.
+    """
+    if population_size < 4:
+        raise ValueError("population_size must be at least 4")
+    seeds = np.random.SeedSequence(seed).generate_state(n_starts * len(problem.tank_types))
+    tasks = [(problem, tank_type, population_size, generations, int(s))
+             for tank_type, s in zip(np.repeat(problem.tank_types, n_starts), seeds)]
+
+    n_workers = n_workers or os.cpu_count() or 1
+    if n_workers == 1 or len(tasks) == 1:
+        runs = [_differential_evolution(*task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=min(n_workers, len(tasks))) as executor:
+            runs = list(executor.map(_differential_evolution, *zip(*tasks)))
+
+    feasible_runs = [run for run in runs if run["best"]["violation"] == 0]
+    if not feasible_runs:
+        raise ValueError("No feasible clarifier layout found for the given constraints.")
+    best = min(feasible_runs, key=lambda run: run["best"]["cost"])["best"]
+
+    fronts = [dict(run["front"], tank_type=np.full(len(run["front"]["footprint"]), run["best"]["tank_type"]))
+              for run in runs]
+    merged = {key: np.concatenate([front[key] for front in fronts]) for key in fronts[0]}
+    mask = pareto_mask(merged["footprint"], merged["effluent_tss"])
+    order = np.argsort(merged["footprint"][mask])
+    pareto_front = {key: value[mask][order] for key, value in merged.items()}
+
+    evaluations = sum(run["evaluations"] for run in runs)
+    logging.debug(f"Clarifier optimization: {evaluations} evaluations, best cost {best['cost']:.2f}")
+    return ClarifierOptimizationResult(best_design=best, best_cost=best["cost"],
+                                       pareto_front=pareto_front, evaluations=evaluations)
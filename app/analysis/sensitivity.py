@@ -0,0 +1,254 @@
+import logging
+import os
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Optional
+
+import numpy as np
+from pydantic import BaseModel
+
+from app.units import ureg
+from app.wastewater_treatment.parameters import terminal_settling_velocity_batch
+from app.wastewater_treatment.primary_treatment import calculate_design_batch
+
+# Global variance-based (Sobol) sensitivity analysis using the Saltelli sampling
+# scheme. For k inputs and a base sample size N the model is evaluated on the
+# matrices A, B, AB_i and BA_i (i = 1..k), i.e. N * (2k + 2) times.
+# First-order indices use the Saltelli (2010) estimator and total-order
+# indices the Jansen (1999) estimator, both averaged over the AB and BA sets.
+
+# A model takes a dict of input arrays (one entry per input name) and returns
+# a dict of output arrays of the same length.
+BatchModel = Callable[[dict[str, np.ndarray]], dict[str, np.ndarray]]
+
+# Nominal values used by `clarifier_model` for inputs that are not sampled.
+# Units: m^3/day, -, m/day, hours, °C, m, kg/m^3, mg/L, mg/L
+CLARIFIER_NOMINAL_INPUTS = {
+    "flow_rate": 10000.0,
+    "peaking_factor": 2.5,
+    "surface_overflow_velocity": 40.0,
+    "detention_time": 2.0,
+    "temperature": 20.0,
+    "particle_diameter": 1e-4,
+    "particle_density": 1200.0,
+    "influent_tss": 250.0,
+    "influent_bod": 200.0,
+}
+
+
+class SobolIndices(BaseModel):
+    """First- and total-order Sobol indices of one model output."""
+
+    names: list[str]
+    first_order: list[float]
+    first_order_conf: list[tuple[float, float]]
+    total_order: list[float]
+    total_order_conf: list[tuple[float, float]]
+
+    def as_dict(self) -> dict[str, dict[str, float]]:
+        """Returns the indices keyed by input name."""
+        return {
+            name: {
+                "S1": s1, "S1_low": s1_ci[0], "S1_high": s1_ci[1],
+                "ST": st, "ST_low": st_ci[0], "ST_high": st_ci[1],
+            }
+            for name, s1, s1_ci, st, st_ci in zip(self.names, self.first_order, self.first_order_conf,
+                                                  self.total_order, self.total_order_conf)
+        }
+
+
+def clarifier_model(inputs: dict[str, np.ndarray]) -> dict[str, np.ndarray]:
+    """Batched primary clarifier model used for sensitivity studies.
+
+    Sizes the tank with `calculate_design_batch` and evaluates the settling
+    velocity of the design particle with `terminal_settling_velocity_batch`.
+    Inputs missing from `inputs` take their value from `CLARIFIER_NOMINAL_INPUTS`.
+
+    Returns:
+        Plain arrays for surface area (m^2), volume (m^3), effluent TSS and BOD
+        (mg/L), peak overflow rate (m/day), settling velocity (m/day) and the
+        ideal (Hazen) removal fraction of the design particle at peak flow.
+    """
+    values = {**CLARIFIER_NOMINAL_INPUTS, **inputs}
+    n = max((np.size(v) for v in inputs.values()), default=1)
+    values = {name: np.broadcast_to(np.asarray(v, dtype=float), (n,)) for name, v in values.items()}
+
+    design = calculate_design_batch(
+        flow_rate=values["flow_rate"],
+        surface_overflow_velocity=values["surface_overflow_velocity"],
+        detention_time=values["detention_time"],
+        influent_tss=values["influent_tss"],
+        influent_bod=values["influent_bod"],
+        peaking_factor=values["peaking_factor"],
+    )
+    settling_velocity = terminal_settling_velocity_batch(
+        particle_diameter=values["particle_diameter"] * ureg.meter,
+        particle_density=values["particle_density"] * ureg.kg / ureg.meter ** 3,
+        temperature=values["temperature"],
+    ).to(ureg.meter / ureg.day).magnitude
+    peak_overflow = design["peak_overflow_rate"].magnitude
+
+    return {
+        "surface_area": design["surface_area"].magnitude,
+        "volume": design["volume"].magnitude,
+        "effluent_tss": design["effluent_tss"].magnitude,
+        "effluent_bod": design["effluent_bod"].magnitude,
+        "peak_overflow_rate": peak_overflow,
+        "settling_velocity": settling_velocity,
+        "particle_removal": np.minimum(1.0, settling_velocity / peak_overflow),
+    }
+
+
+def saltelli_sample(bounds: dict[str, tuple[float, float]], n_samples: int,
+                    seed: Optional[int] = None) -> np.ndarray:
+    """Generates the Saltelli sample matrices.
+
+    Args:
+        bounds: Lower and upper bound of every input, in model units.
+        n_samples: Base sample size N.
+        seed: Seed of the random generator.
+
+    Returns:
+        An array of shape (2k + 2, N, k) stacking A, B, AB_1..AB_k and BA_1..BA_k.
+    """
+    if n_samples <= 0:
+        raise ValueError("n_samples must be greater than zero")
+    k = len(bounds)
+    if k == 0:
+        raise ValueError("At least one input must be sampled")
+    low = np.array([b[0] for b in bounds.values()], dtype=float)
+    high = np.array([b[1] for b in bounds.values()], dtype=float)
+    if np.any(high < low):
+        raise ValueError("Upper bounds must not be lower than lower bounds")
+
+    rng = np.random.default_rng(seed)
+    base = low + (high - low) * rng.random((2, n_samples, k))
+    a, b = base
+
+    samples = np.empty((2 * k + 2, n_samples, k))
+    samples[0] = a
+    samples[1] = b
+    for i in range(k):
+        samples[2 + i] = a
+        samples[2 + i, :, i] = b[:, i]
+        samples[2 + k + i] = b
+        samples[2 + k + i, :, i] = a[:, i]
+    return samples
+
+
+def _evaluate_chunk(model: BatchModel, names: list[str], chunk: np.ndarray) -> dict[str, np.ndarray]:
+    return model({name: chunk[:, j] for j, name in enumerate(names)})
+
+
+def evaluate_batched(model: BatchModel, names: list[str], samples: np.ndarray,
+                     n_workers: Optional[int] = None, chunk_size: int = 20000) -> dict[str, np.ndarray]:
+    """Evaluates a batch model over the rows of `samples`, in parallel.
+
+    The rows are split into chunks that are dispatched to a process pool; with
+    `n_workers=1` everything runs in the calling process. `model` must be a
+    module-level (picklable) function when more than one worker is used.
+
+    Args:
+        model: Batched model.
+        names: Input names, one per column of `samples`.
+        samples: 2-D array of input rows.
+        n_workers: Number of processes. Defaults to the number of CPUs.
+        chunk_size: Number of rows per task.
+
+    Returns:
+        The concatenated model outputs.
+    """
+    samples = np.asarray(samples, dtype=float)
+    n_workers = n_workers or os.cpu_count() or 1
+    chunks = [samples[i:i + chunk_size] for i in range(0, len(samples), chunk_size)]
+
+    if n_workers == 1 or len(chunks) == 1:
+        results = [_evaluate_chunk(model, names, chunk) for chunk in chunks]
+    else:
+        with ProcessPoolExecutor(max_workers=min(n_workers, len(chunks))) as executor:
+            results = list(executor.map(_evaluate_chunk,
+                                        [model] * len(chunks), [names] * len(chunks), chunks))
+
+    return {key: np.concatenate([np.asarray(r[key], dtype=float) for r in results]) for key in results[0]}
+
+
+def _sobol_estimates(f_a: np.ndarray, f_b: np.ndarray, f_ab: np.ndarray, f_ba: np.ndarray):
+    """Computes first- and total-order indices along the last axis.
+
+    `f_a` and `f_b` have shape (..., N), `f_ab` and `f_ba` have shape (k, ..., N).
+    """
+    variance = np.var(np.concatenate([f_a, f_b], axis=-1), axis=-1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        first = 0.5 * (np.mean(f_b * (f_ab - f_a), axis=-1)
+                       + np.mean(f_a * (f_ba - f_b), axis=-1)) / variance
+        total = 0.25 * (np.mean((f_a - f_ab) ** 2, axis=-1)
+                        + np.mean((f_b - f_ba) ** 2, axis=-1)) / variance
+    return first, total
+
+
+def sobol_analysis(
+        model: BatchModel,
+        bounds: dict[str, tuple[float, float]],
+        n_samples: int = 1024,
+        n_bootstrap: int = 100,
+        confidence_level: float = 0.95,
+        n_workers: Optional[int] = None,
+        chunk_size: int = 20000,
+        seed: Optional[int] = None,
+) -> dict[str, SobolIndices]:
+    """Runs a Sobol sensitivity analysis of a batched model.
+
+    Args:
+        model: Batched model, e.g. `clarifier_model`.
+        bounds: Uniform sampling range of every varied input, in model units.
+        n_samples: Base sample size N. The model is evaluated N * (2k + 2) times.
+        n_bootstrap: Number of bootstrap resamples for the confidence intervals.
+        confidence_level: Confidence level of the bootstrap intervals.
+        n_workers: Number of processes used for the model evaluations.
+        chunk_size: Number of model evaluations per task.
+        seed: Seed of the random generator (sampling and bootstrap).
+
+    Returns:
+        The indices of every model output, keyed by output name.
+    """
+    if not 0 < confidence_level < 1:
+        raise ValueError("confidence_level must be between 0 and 1")
+
+    names = list(bounds)
+    k = len(names)
+    samples = saltelli_sample(bounds, n_samples, seed=seed)
+    outputs = evaluate_batched(model, names, samples.reshape(-1, k),
+                               n_workers=n_workers, chunk_size=chunk_size)
+    logging.debug(f"Sobol analysis: {samples.shape[0] * n_samples} model evaluations")
+
+    rng = np.random.default_rng(None if seed is None else seed + 1)
+    resamples = rng.integers(0, n_samples, size=(n_bootstrap, n_samples))
+    alpha = (1 - confidence_level) / 2
+
+    results = {}
+    for key, values in outputs.items():
+        values = values.reshape(2 * k + 2, n_samples)
+        f_a, f_b, f_ab, f_ba = values[0], values[1], values[2:2 + k], values[2 + k:]
+        first, total = _sobol_estimates(f_a, f_b, f_ab, f_ba)
+
+        if n_bootstrap > 0:
+            boot_first, boot_total = _sobol_estimates(
+                f_a[resamples], f_b[resamples], f_ab[:, resamples], f_ba[:, resamples]
+            )
+            with warnings.catch_warnings():
+                # Constant outputs have undefined indices (all-NaN bootstrap rows)
+                warnings.simplefilter("ignore", RuntimeWarning)
+                first_conf = np.nanquantile(boot_first, [alpha, 1 - alpha], axis=1).T
+                total_conf = np.nanquantile(boot_total, [alpha, 1 - alpha], axis=1).T
+        else:
+            first_conf = np.column_stack([first, first])
+            total_conf = np.column_stack([total, total])
+
+        results[key] = SobolIndices(
+            names=names,
+            first_order=first.tolist(),
+            first_order_conf=[tuple(ci) for ci in first_conf.tolist()],
+            total_order=total.tolist(),
+            total_order_conf=[tuple(ci) for ci in total_conf.tolist()],
+        )
+    return results
@@ -0,0 +1,329 @@
+import functools
+import hashlib
+import inspect
+import json
+import logging
+import math
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, Iterable, Optional
+
+import numpy as np
+import pint
+from pydantic import BaseModel
+
+from app import constants, dependency_graph, helpers
+
+# Persistent, content-addressed cache of design computations.
+# A result is stored under the SHA-256 of its namespace (usually the function),
+# a code version and the canonical form of its inputs: quantities are converted
+# to base SI units, numbers to floats (12 significant digits) and mappings
+# sorted by key, so that 1000 L and 1 m^3 hit the same entry. Results are
+# pickled into a SQLite file in WAL mode, which lets several worker processes
+# read and write concurrently. When the file grows beyond `max_bytes`, the least
+# recently used entries are evicted; the number and size of the entries are kept
+# up to date by triggers in a one-row "totals" table, so writes do not sum them.
+# The code version defaults to the hash of the function's whole module, so that
+# edits of the helpers and constants it uses also invalidate its results.
+
+MISSING = object()  # Marks a cache miss in batch results
+
+
+def _canonical(value: Any) -> Any:
+    """Converts inputs to a JSON-serializable form independent of units and types."""
+    if isinstance(value, pint.Quantity):
+        base = value.to_base_units()
+        return {"__quantity__": _canonical(base.magnitude), "units": str(base.units)}
+    if isinstance(value, BaseModel):
+        return {"__model__": type(value).__qualname__, "fields": _canonical(value.model_dump())}
+    if isinstance(value, (bool, np.bool_)) or value is None or isinstance(value, str):
+        return value.item() if isinstance(value, np.bool_) else value
+    if isinstance(value, (int, float, np.integer, np.floating)):
+        number = float(value)
+        if math.isnan(number):
+            return "nan"
+        # 12 significant digits absorb unit conversion round-off (1000 L -> 1.0000000000000002 m^3)
+        return float(f"{number:.12g}") + 0.0  # + 0.0 turns -0.0 into 0.0
+    if isinstance(value, np.ndarray):
+        return {"__array__": _canonical(value.tolist()), "shape": list(value.shape)}
+    if isinstance(value, dict):
+        return {str(key): _canonical(value[key]) for key in sorted(value, key=str)}
+    if isinstance(value, (list, tuple)):
+        return [_canonical(item) for item in value]
+    raise TypeError(f"Cannot build a cache key from {type(value).__name__}")
+
+
+def cache_key(namespace: str, inputs: Any, version: str = "") -> str:
+    """SHA-256 key of unit-normalized inputs."""
+    payload = json.dumps(_canonical(inputs), sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(f"{namespace}\0{version}\0{payload}".encode()).hexdigest()
+
+
+def code_version(*objects) -> str:
+    """Hash of the source code of functions or classes, to invalidate results when they change.
+
+    The modules defining the objects are hashed with them, as their helpers and
+    constants are part of the computation. Modules may be passed too, e.g. those
+    of helpers imported from elsewhere.
+    """
+    digest = hashlib.sha256()
+    for obj in objects:
+        module = obj if inspect.ismodule(obj) else inspect.getmodule(obj)
+        for source in dict.fromkeys((obj, module)):
+            try:
+                digest.update(inspect.getsource(source).encode())
+            except (OSError, TypeError):
+                digest.update(getattr(source, "__qualname__", repr(source)).encode())
+    return digest.hexdigest()[:16]
+
+
+class CacheStats(BaseModel):
+    """Lookups served by a cache instance."""
+
+    hits: int = 0
+    misses: int = 0
+    writes: int = 0
+    evictions: int = 0
+    entries: int = 0
+    size_bytes: int = 0
+
+    @property
+    def hit_ratio(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
+class ResultCache:
+    """SQLite-backed result cache, safe to share between processes.
+
+    Args:
+        path: The database file (created when missing).
+        max_bytes: Size bound of the stored results; least recently used
+            entries are evicted beyond it.
+        busy_timeout: Seconds to wait for another process holding the write lock.
+    """
+
+    def __init__(self, path: str, max_bytes: int = 512 * 2 ** 20, busy_timeout: float = 30.0):
+        if max_bytes <= 0:
+            raise ValueError("max_bytes must be greater than zero")
+        self.path = os.fspath(path)
+        self.max_bytes = max_bytes
+        self.busy_timeout = busy_timeout
+        self._stats = CacheStats()
+        self._lock = threading.Lock()
+        self._connection = None
+        self._pid = None
+        self._connect()
+
+    def _connect(self) -> sqlite3.Connection:
+        # SQLite connections must not cross a fork: reopen in child processes
+        if self._connection is None or self._pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=self.busy_timeout, isolation_level=None,
+                                         check_same_thread=False)
+            connection.execute(f"PRAGMA busy_timeout = {int(self.busy_timeout * 1000)}")
+            connection.execute("PRAGMA journal_mode = WAL")
+            connection.execute("PRAGMA synchronous = NORMAL")
+            connection.execute("""CREATE TABLE IF NOT EXISTS results (
+                                      key TEXT PRIMARY KEY,
+                                      namespace TEXT NOT NULL,
+                                      value BLOB NOT NULL,
+                                      size INTEGER NOT NULL,
+                                      accessed REAL NOT NULL)""")
+            connection.execute("CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed)")
+            # REPLACE deletes the previous row of a key: its delete trigger only fires with recursive triggers
+            connection.execute("PRAGMA recursive_triggers = ON")
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                connection.execute("""CREATE TABLE IF NOT EXISTS totals (
+                                          id INTEGER PRIMARY KEY CHECK (id = 0),
+                                          entries INTEGER NOT NULL,
+                                          size INTEGER NOT NULL)""")
+                # Files of earlier versions are summed once
+                connection.execute("""INSERT OR IGNORE INTO totals
+                                      SELECT 0, COUNT(*), COALESCE(SUM(size), 0) FROM results""")
+                connection.execute("""CREATE TRIGGER IF NOT EXISTS results_inserted AFTER INSERT ON results BEGIN
+                                          UPDATE totals SET entries = entries + 1, size = size + NEW.size;
+                                      END""")
+                connection.execute("""CREATE TRIGGER IF NOT EXISTS results_deleted AFTER DELETE ON results BEGIN
+                                          UPDATE totals SET entries = entries - 1, size = size - OLD.size;
+                                      END""")
+                connection.execute("COMMIT")
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+            self._connection, self._pid = connection, os.getpid()
+        return self._connection
+
+    def close(self):
+        if self._connection is not None and self._pid == os.getpid():
+            self._connection.close()
+        self._connection = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __getstate__(self):
+        # Pickled into worker processes without the open connection
+        state = self.__dict__.copy()
+        state.update(_connection=None, _pid=None, _lock=None, _stats=CacheStats())
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def get_many(self, keys: list[str]) -> list[Any]:
+        """Looks up many keys at once; missing entries are returned as `MISSING`."""
+        found = {}
+        with self._lock:
+            connection = self._connect()
+            for start in range(0, len(keys), 500):  # SQLite bound parameter limit
+                batch = keys[start:start + 500]
+                rows = connection.execute(
+                    f"SELECT key, value FROM results WHERE key IN ({','.join('?' * len(batch))})", batch)
+                found.update(rows.fetchall())
+            if found:
+                now = time.time()
+                connection.executemany("UPDATE results SET accessed = ? WHERE key = ?",
+                                       [(now, key) for key in found])
+            self._stats.hits += sum(1 for key in keys if key in found)
+            self._stats.misses += sum(1 for key in keys if key not in found)
+        return [pickle.loads(found[key]) if key in found else MISSING for key in keys]
+
+    def put_many(self, keys: list[str], values: list[Any], namespace: str = ""):
+        """Stores many results in one transaction, then evicts beyond `max_bytes`."""
+        if len(keys) != len(values):
+            raise ValueError("keys and values must have the same length")
+        now = time.time()
+        rows = []
+        for key, value in zip(keys, values):
+            blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+            rows.append((key, namespace, blob, len(blob), now))
+        with self._lock:
+            connection = self._connect()
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                connection.executemany("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?)", rows)
+                self._evict(connection)
+                connection.execute("COMMIT")
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+            self._stats.writes += len(rows)
+
+    def _evict(self, connection: sqlite3.Connection):
+        total = connection.execute("SELECT size FROM totals").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # Evict down to 90 % so that evictions are not triggered by every write
+        excess = total - int(0.9 * self.max_bytes)
+        freed, victims = 0, []
+        for key, size in connection.execute("SELECT key, size FROM results ORDER BY accessed"):
+            if freed >= excess:
+                break
+            victims.append((key,))
+            freed += size
+        connection.executemany("DELETE FROM results WHERE key = ?", victims)
+        self._stats.evictions += len(victims)
+        logging.debug(f"Result cache evicted {len(victims)} entries ({freed} bytes)")
+
+    def get(self, key: str, default: Any = None) -> Any:
+        value = self.get_many([key])[0]
+        return default if value is MISSING else value
+
+    def put(self, key: str, value: Any, namespace: str = ""):
+        self.put_many([key], [value], namespace)
+
+    def clear(self, namespace: Optional[str] = None):
+        with self._lock:
+            connection = self._connect()
+            if namespace is None:
+                connection.execute("DELETE FROM results")
+            else:
+                connection.execute("DELETE FROM results WHERE namespace = ?", (namespace,))
+
+    def stats(self) -> CacheStats:
+        """Lookups of this instance, with the current number and size of entries."""
+        with self._lock:
+            entries, size = self._connect().execute("SELECT entries, size FROM totals").fetchone()
+            return self._stats.model_copy(update={"entries": entries, "size_bytes": size})
+
+    def evaluate_many(self, function: Callable, inputs: Iterable[dict],
+                      namespace: Optional[str] = None, version: Optional[str] = None) -> list[Any]:
+        """Evaluates `function(**kwargs)` for many inputs, computing only the misses.
+
+        Args:
+            function: The computation, called with keyword arguments.
+            inputs: One dict of keyword arguments per point.
+            namespace: Key namespace, defaults to the function's qualified name.
+            version: Code version, defaults to the hash of the function's source and module.
+
+        Returns:
+            The results in input order.
+        """
+        namespace = namespace or f"{function.__module__}.{function.__qualname__}"
+        version = code_version(function) if version is None else version
+        inputs = list(inputs)
+        keys = [cache_key(namespace, kwargs, version) for kwargs in inputs]
+        results = self.get_many(keys)
+        missing = [i for i, result in enumerate(results) if result is MISSING]
+        for i in missing:
+            results[i] = function(**inputs[i])
+        if missing:
+            self.put_many([keys[i] for i in missing], [results[i] for i in missing], namespace)
+        return results
+
+    def memoize(self, function: Callable = None, *, namespace: Optional[str] = None,
+                version: Optional[str] = None):
+        """Decorator caching a function on its bound (defaults applied) arguments."""
+        def decorator(func):
+            signature = inspect.signature(func)
+            key_namespace = namespace or f"{func.__module__}.{func.__qualname__}"
+            key_version = code_version(func) if version is None else version
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                bound = signature.bind(*args, **kwargs)
+                bound.apply_defaults()
+                key = cache_key(key_namespace, dict(bound.arguments), key_version)
+                result = self.get(key, MISSING)
+                if result is MISSING:
+                    result = func(*args, **kwargs)
+                    self.put(key, result, key_namespace)
+                return result
+
+            return wrapper
+
+        return decorator if function is None else decorator(function)
+
+    def calculate_designs(self, models: list[BaseModel]) -> list[BaseModel]:
+        """Runs `calculate_design` on models of one class (e.g. SedimentationTank), reusing cached designs.
+
+        The key covers every field of the model as given, and as the version the source of the
+        model class, its module and the modules its design runs on (dependency graph, constants,
+        helpers); designed models are restored field by field.
+        """
+        if not models:
+            return []
+        version = code_version(type(models[0]), dependency_graph, constants, helpers)
+        keys = [cache_key(type(model).__qualname__, model, version) for model in models]
+        cached = self.get_many(keys)
+        designed, new_keys, new_values = [], [], []
+        for model, key, fields in zip(models, keys, cached):
+            if fields is MISSING:
+                model.calculate_design()
+                new_keys.append(key)
+                new_values.append({name: getattr(model, name) for name in type(model).model_fields})
+            else:
+                for name, value in fields.items():
+                    setattr(model, name, value)
+            designed.append(model)
+        if new_keys:
+            self.put_many(new_keys, new_values, type(models[0]).__qualname__)
+        return designed
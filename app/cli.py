@@ -0,0 +1,348 @@
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+import tomllib
+from pathlib import Path
+from typing import Any, Literal, Optional
+
+import numpy as np
+import pint
+from pydantic import BaseModel, Field, ValidationError
+
+from app import instrumentation
+from app.quantity_column import QuantityColumn
+from app.distributed import DEFAULT_PORT as DISTRIBUTED_PORT
+from app.distributed import default_authkey, join_workers, parse_address, run_distributed_sweep, run_workers
+from app.service import DEFAULT_HOST, DEFAULT_PORT, serve
+from app.sweep import MODELS, evaluate, grid_chunks, grid_size, open_sink, parse_values, table_chunks
+from utils.helpers import SCHEMA_CACHE_PATH
+from utils.ingest import ingest, read_table_chunks
+from utils.schema import SchemaCache
+
+# Command-line batch runner, for headless servers (no Qt import anywhere):
+#
+#     python -m app.cli run jobs.toml --workers 8
+#     python -m app.cli models
+#     python -m app.cli ingest exports/ merged/  # historian exports merged by timestamp
+#     python -m app.cli serve --workers 4     # local JSON service, see app/service.py
+#     python -m app.cli coordinate jobs.toml --bind 0.0.0.0:5757   # sweeps on remote workers,
+#     python -m app.cli worker coordinator-host:5757 -j 8           # see app/distributed.py
+#     python -m app.cli --profile run jobs.toml     # hot-path statistics on stderr, and
+#     python -m app.cli --trace run.json run ...    # a trace (see app/instrumentation.py)
+#
+# A spec file (TOML or JSON) lists jobs:
+#
+#     workers = 4                      # defaults for every job
+#
+#     [[jobs]]
+#     name = "designs"
+#     type = "design"                  # or "settling": inputs broadcast row by row
+#     output = "out/designs.csv"       # .csv, or a directory for a columnar dataset
+#     inputs = { flow_rate = [500, 1000, 4000], surface_overflow_velocity = "40 m/day",
+#                detention_time = "2 h", tank_type = "circular" }
+#
+#     [[jobs]]
+#     name = "peak-sweep"
+#     type = "sweep"                   # cartesian product of the grid
+#     model = "clarifier"
+#     output = "out/sweep"
+#     grid = { flow_rate = { start = 5000, stop = 50000, num = 200, unit = "m^3/day" },
+#              particle_diameter = { start = 5e-5, stop = 5e-4, num = 50, log = true } }
+#     inputs = { temperature = "12 degC" }
+#
+# Design and settling jobs may read their inputs from a data file instead
+# (`input = "flows.csv"`, `columns = { flow_rate = "Q" }`); columns are
+# converted from the units of the file's header ("Q (L/s)") to the model's.
+
+DEFAULT_CHUNK_SIZE = 65536
+
+
+class JobSpec(BaseModel):
+    """One job of a spec file."""
+
+    name: Optional[str] = None
+    type: Literal["design", "settling", "sweep"]
+    model: Optional[str] = None  # Sweeps only (defaults to "clarifier")
+    output: str
+    format: Optional[Literal["csv", "columnar"]] = None
+    inputs: dict[str, Any] = {}
+    grid: dict[str, Any] = {}
+    input: Optional[str] = None  # Data file of row inputs
+    columns: dict[str, str] = {}  # Model input -> data file column
+    chunk_size: Optional[int] = Field(None, gt=0)
+    workers: Optional[int] = Field(None, gt=0)
+
+
+class Spec(BaseModel):
+    """A spec file: job defaults and the jobs."""
+
+    workers: int = Field(1, gt=0)
+    chunk_size: int = Field(DEFAULT_CHUNK_SIZE, gt=0)
+    jobs: list[JobSpec]
+
+
+def load_spec(path: str) -> Spec:
+    """Reads a TOML or JSON spec file.
+
+    Raises:
+        ValueError: If the file is not a valid spec.
+    """
+    with open(path, "rb") as file:
+        data = tomllib.load(file) if Path(path).suffix.lower() == ".toml" else json.load(file)
+    spec = Spec.model_validate(data)
+    base = Path(path).parent
+    for index, job in enumerate(spec.jobs):
+        job.name = job.name or f"job-{index + 1}"
+        job.output = str(base / job.output)
+        if job.input is not None:
+            job.input = str(base / job.input)
+    return spec
+
+
+def _file_chunks(job: JobSpec, units: dict[str, str], chunk_size: int):
+    """Input chunks read from a data file, converted to the model units."""
+    schema = SchemaCache(SCHEMA_CACHE_PATH).schema_for(job.input)
+    file_units = schema.units if schema is not None else {}
+    columns = {name: job.columns.get(name, name) for name in units}
+    for chunk in read_table_chunks(job.input, chunk_rows=chunk_size, schema=schema):
+        inputs = {}
+        for name, column in columns.items():
+            if column not in chunk:
+                continue
+            values = chunk[column]
+            if column in file_units and values.dtype.kind == "f":
+                values = QuantityColumn(values, file_units[column]).m_as(units[name])
+            inputs[name] = values
+        if not inputs:
+            raise ValueError(f"{job.input} has none of the columns {sorted(columns.values())}")
+        yield inputs
+
+
+def run_job(job: JobSpec, workers: int = 1, chunk_size: int = DEFAULT_CHUNK_SIZE) -> int:
+    """Runs one job and streams its results to its output; returns the number of rows."""
+    model = job.model or ("clarifier" if job.type == "sweep" else job.type)
+    if model not in MODELS:
+        raise ValueError(f"{job.name}: unknown model {model!r}, expected one of {sorted(MODELS)}")
+    units = MODELS[model].input_units
+    inputs = {name: parse_values(value, units.get(name)) for name, value in job.inputs.items()}
+    if job.type == "sweep":
+        if not job.grid:
+            raise ValueError(f"{job.name}: a sweep needs a grid")
+        grid = {name: np.atleast_1d(parse_values(value, units.get(name))) for name, value in job.grid.items()}
+        logging.info(f"{job.name}: {grid_size(grid)} grid points")
+        chunks = grid_chunks(grid, chunk_size)
+    elif job.input is not None:
+        chunks = _file_chunks(job, units, chunk_size)
+    else:
+        rows = {name: value for name, value in inputs.items() if isinstance(value, np.ndarray) and value.ndim}
+        inputs = {name: value for name, value in inputs.items() if name not in rows}
+        chunks = table_chunks(rows, chunk_size) if rows else iter([{}])
+    options = {name: value.item() if isinstance(value, np.ndarray) and value.ndim == 0 else value
+               for name, value in inputs.items()}
+    with open_sink(job.output, job.format) as sink:
+        for columns in evaluate(model, chunks, options, workers):
+            sink.write(columns)
+    return sink.rows
+
+
+def _selected_jobs(spec: Spec, arguments: argparse.Namespace) -> list[JobSpec]:
+    """Jobs named with --job (all by default), with the output overrides of the command line."""
+    selected = [job for job in spec.jobs if not arguments.job or job.name in arguments.job]
+    for job in selected:
+        if arguments.output_dir:
+            job.output = os.path.join(arguments.output_dir, Path(job.output).name)
+        if arguments.format:
+            job.format = arguments.format
+            output = Path(job.output)
+            is_csv = output.suffix.lower() == ".csv"
+            if arguments.format == "csv" and not is_csv:
+                job.output = str(output.with_name(output.name + ".csv"))
+            elif arguments.format == "columnar" and is_csv:
+                job.output = str(output.with_suffix(""))
+    return selected
+
+
+def _load(arguments: argparse.Namespace) -> Optional[Spec]:
+    try:
+        return load_spec(arguments.spec)
+    except (OSError, ValueError, ValidationError, tomllib.TOMLDecodeError) as error:
+        print(f"Invalid spec {arguments.spec}: {error}", file=sys.stderr)
+        return None
+
+
+def _run(arguments: argparse.Namespace) -> int:
+    spec = _load(arguments)
+    if spec is None:
+        return 2
+    for job in _selected_jobs(spec, arguments):
+        workers = arguments.workers or job.workers or spec.workers
+        chunk_size = arguments.chunk_size or job.chunk_size or spec.chunk_size
+        start = time.perf_counter()
+        try:
+            rows = run_job(job, workers, chunk_size)
+        except (OSError, ValueError, KeyError, TypeError, pint.errors.PintError) as error:
+            print(f"{job.name} failed: {error}", file=sys.stderr)
+            return 1
+        print(f"{job.name}: {rows} rows -> {job.output} ({time.perf_counter() - start:.2f} s)")
+    return 0
+
+
+def _coordinate(arguments: argparse.Namespace) -> int:
+    spec = _load(arguments)
+    if spec is None:
+        return 2
+    address = parse_address(arguments.bind)
+    local_workers = run_workers(address, arguments.local_workers) if arguments.local_workers else []
+    try:
+        for job in _selected_jobs(spec, arguments):
+            chunk_size = arguments.chunk_size or job.chunk_size or spec.chunk_size
+            start = time.perf_counter()
+            try:
+                if job.type == "sweep":
+                    rows = run_distributed_sweep(job.model or "clarifier", job.grid, job.output, job.inputs,
+                                                 chunk_size, address, lease_timeout=arguments.lease,
+                                                 output_format=job.format,
+                                                 worker_timeout=arguments.worker_timeout)
+                else:  # Row jobs are small: run them here
+                    rows = run_job(job, job.workers or spec.workers, chunk_size)
+            except (OSError, ValueError, KeyError, TypeError, pint.errors.PintError) as error:
+                print(f"{job.name} failed: {error}", file=sys.stderr)
+                return 1
+            print(f"{job.name}: {rows} rows -> {job.output} ({time.perf_counter() - start:.2f} s)")
+    finally:
+        for worker in local_workers:
+            worker.terminate()
+    return 0
+
+
+def _worker(arguments: argparse.Namespace) -> int:
+    address = parse_address(arguments.coordinator)
+    try:
+        workers = run_workers(address, arguments.workers, default_authkey(address[0]), arguments.wait)
+    except ValueError as error:
+        print(error, file=sys.stderr)
+        return 2
+    return join_workers(workers) or 0
+
+
+def _models(arguments: argparse.Namespace) -> int:
+    for name, model in MODELS.items():
+        print(f"{name}: {model.description}")
+        for input_name, unit in model.input_units.items():
+            print(f"    {input_name} [{unit}]")
+    return 0
+
+
+def _ingest(arguments: argparse.Namespace) -> int:
+    try:
+        units = dict(item.split("=", 1) for item in arguments.unit or [])
+    except ValueError:
+        print(f"Invalid --unit {arguments.unit}: expected NAME=UNIT", file=sys.stderr)
+        return 2
+    # One argument may be a directory or a glob pattern, several are files
+    sources = arguments.sources[0] if len(arguments.sources) == 1 else arguments.sources
+    start = time.perf_counter()
+    try:
+        dataset = ingest(sources, arguments.output, time_column=arguments.time_column,
+                         time_format=arguments.time_format, units=units or None, mode=arguments.mode,
+                         max_workers=arguments.workers, schemas=SchemaCache(SCHEMA_CACHE_PATH))
+    except (OSError, ValueError, KeyError, TypeError, pint.errors.PintError) as error:
+        print(f"Ingest failed: {error}", file=sys.stderr)
+        return 1
+    print(f"{len(dataset)} rows, columns {', '.join(dataset.names)} -> {arguments.output} "
+          f"({time.perf_counter() - start:.2f} s)")
+    return 0
+
+
+def _serve(arguments: argparse.Namespace) -> int:
+    serve(arguments.host, arguments.port, arguments.workers, arguments.max_delay / 1000)
+    return 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="h2optim", description="Headless H2Optim batch runner.")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Log progress")
+    parser.add_argument("--profile", action="store_true",
+                        help="Print call counts and latencies of the hot paths to stderr at the end")
+    parser.add_argument("--trace", metavar="FILE",
+                        help="Write a Chrome trace (or speedscope, for FILE.speedscope.json) of the hot paths")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", help="Run the jobs of a TOML or JSON spec file")
+    run.add_argument("spec", help="Spec file")
+    run.add_argument("-j", "--workers", type=int, help="Worker processes per job (overrides the spec)")
+    run.add_argument("--chunk-size", type=int, help="Rows per evaluated chunk (overrides the spec)")
+    run.add_argument("--format", choices=("csv", "columnar"), help="Output format of every job")
+    run.add_argument("-o", "--output-dir", help="Write every output into this directory")
+    run.add_argument("--job", action="append", help="Only run this job (repeatable)")
+    run.set_defaults(handler=_run)
+
+    models = commands.add_parser("models", help="List the models and their input units")
+    models.set_defaults(handler=_models)
+
+    coordinate = commands.add_parser("coordinate", help="Run the sweeps of a spec file on remote workers")
+    coordinate.add_argument("spec", help="Spec file")
+    coordinate.add_argument("--bind", default=f"127.0.0.1:{DISTRIBUTED_PORT}",
+                            help=f"host:port to accept workers on (default 127.0.0.1:{DISTRIBUTED_PORT})")
+    coordinate.add_argument("--lease", type=float, default=300.0,
+                            help="Seconds before the task of a silent worker is reassigned")
+    coordinate.add_argument("--worker-timeout", type=float, default=600.0,
+                            help="Seconds without any connected worker before a sweep fails")
+    coordinate.add_argument("--local-workers", type=int, default=0, help="Also start workers on this host")
+    coordinate.add_argument("--chunk-size", type=int, help="Grid points per task (overrides the spec)")
+    coordinate.add_argument("--format", choices=("csv", "columnar"), help="Output format of every job")
+    coordinate.add_argument("-o", "--output-dir", help="Write every output into this directory")
+    coordinate.add_argument("--job", action="append", help="Only run this job (repeatable)")
+    coordinate.set_defaults(handler=_coordinate)
+
+    worker = commands.add_parser("worker", help="Evaluate tasks of a coordinator")
+    worker.add_argument("coordinator", help="host:port of the coordinator")
+    worker.add_argument("-j", "--workers", type=int, default=os.cpu_count() or 1,
+                        help="Worker processes (default: one per core)")
+    worker.add_argument("--wait", type=float, default=30.0,
+                        help="Seconds to wait for a coordinator before exiting")
+    worker.set_defaults(handler=_worker)
+
+    ingest_files = commands.add_parser("ingest", help="Merge data files by timestamp into a columnar dataset")
+    ingest_files.add_argument("sources", nargs="+", help="Directory, glob pattern or files")
+    ingest_files.add_argument("output", help="Directory of the merged dataset")
+    ingest_files.add_argument("--time-column", help="Timestamp column (detected by name by default)")
+    ingest_files.add_argument("--time-format", help="strptime format of non-ISO timestamps")
+    ingest_files.add_argument("--unit", action="append", metavar="NAME=UNIT", help="Unit of a column (repeatable)")
+    ingest_files.add_argument("--mode", choices=("process", "thread", "serial"), default="process",
+                              help="Parse the files in processes (default), threads or serially")
+    ingest_files.add_argument("-j", "--workers", type=int, help="Pool size (default: one per core)")
+    ingest_files.set_defaults(handler=_ingest)
+
+    serve = commands.add_parser("serve", help="Serve the models over HTTP on localhost")
+    serve.add_argument("--host", default=DEFAULT_HOST, help=f"Interface to listen on (default {DEFAULT_HOST})")
+    serve.add_argument("--port", type=int, default=DEFAULT_PORT, help=f"Port (default {DEFAULT_PORT})")
+    serve.add_argument("-j", "--workers", type=int, default=2, help="Worker processes")
+    serve.add_argument("--max-delay", type=float, default=2.0,
+                       help="Milliseconds a request may wait to be batched with others")
+    serve.set_defaults(handler=_serve)
+    return parser
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    arguments = build_parser().parse_args(argv)
+    logging.basicConfig(level=logging.INFO if arguments.verbose else logging.WARNING,
+                        format="%(asctime)s %(levelname)s %(message)s")
+    if not (arguments.profile or arguments.trace):
+        return arguments.handler(arguments)
+    instrumentation.enable(trace=arguments.trace is not None)
+    try:
+        return arguments.handler(arguments)
+    finally:
+        if arguments.profile:
+            print(instrumentation.report(), file=sys.stderr)
+        if arguments.trace:
+            instrumentation.export_trace(arguments.trace)
+        instrumentation.disable()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
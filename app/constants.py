@@ -1,6 +1,8 @@
+import numpy as np
 import pint
 from typing import Union
-from app.helpers import closest_key_binary_search
+from app.helpers import closest_key_binary_search, closest_key_indices
+from app.instrumentation import instrumented
 from app.units import ureg
 
 # --- Physical Constants ---
@@ -207,6 +209,7 @@ WATER_PROPERTIES = {
 }
 
 
+@instrumented
 def get_water_density(temperature: Union[int, float, pint.Quantity]) -> pint.Quantity:
     """Gets the density of water at a given temperature.
         Temperature must be in Celsius. The result is in g/cm^3
@@ -228,6 +231,7 @@ def get_water_density(temperature: Union[int, float, pint.Quantity]) -> pint.Qua
         return 0.9982 * ureg.gram / ureg.centimeter ** 3
 
 
+@instrumented
 def get_water_dynamic_viscosity(temperature: Union[int, float, pint.Quantity]) -> pint.Quantity:
     """
     Gets the dynamic viscosity of water at a given temperature.
@@ -251,6 +255,7 @@ def get_water_dynamic_viscosity(temperature: Union[int, float, pint.Quantity]) -
         return 1.0016 * ureg.mPa * ureg.s
 
 
+@instrumented
 def get_water_kinematic_viscosity(temperature: Union[int, float, pint.Quantity]) -> pint.Quantity:
     """
     Gets the kinematic viscosity of water at a given temperature.
@@ -271,3 +276,41 @@ def get_water_kinematic_viscosity(temperature: Union[int, float, pint.Quantity])
     else:
         # Return default density for 20 °C
         return 1.0034 * ureg.millimeter**2 / ureg.second
+
+
+@instrumented
+def _water_property_array(property_name: str,
+                          temperature: Union[float, np.ndarray, pint.Quantity],
+                          default: pint.Quantity) -> pint.Quantity:
+    """Vectorized look-up of a water property over an array of temperatures.
+
+    Follows the same rules as the scalar getters: the closest tabulated
+    temperature is used inside 1.6-80 °C and the 20 °C value outside of it.
+    """
+    if isinstance(temperature, pint.Quantity):
+        temperature = temperature.to(ureg.degC).magnitude
+    temperature = np.asarray(temperature, dtype=float)
+
+    table = WATER_PROPERTIES[property_name]
+    keys = np.array(sorted(table.keys()), dtype=float)
+    units = default.units
+    values = np.array([table[key].to(units).magnitude for key in sorted(table.keys())])
+
+    result = values[closest_key_indices(keys, temperature)]
+    in_range = (temperature >= 1.6) & (temperature <= 80)
+    return ureg.Quantity(np.where(in_range, result, default.magnitude), units)
+
+
+def get_water_density_array(temperature: Union[float, np.ndarray, pint.Quantity]) -> pint.Quantity:
+    """Array version of `get_water_density`. The result is in g/cm^3."""
+    return _water_property_array("density", temperature, 0.9982 * ureg.gram / ureg.centimeter ** 3)
+
+
+def get_water_dynamic_viscosity_array(temperature: Union[float, np.ndarray, pint.Quantity]) -> pint.Quantity:
+    """Array version of `get_water_dynamic_viscosity`. The result is in mPa.s"""
+    return _water_property_array("dynamic_viscosity", temperature, 1.0016 * ureg.mPa * ureg.s)
+
+
+def get_water_kinematic_viscosity_array(temperature: Union[float, np.ndarray, pint.Quantity]) -> pint.Quantity:
+    """Array version of `get_water_kinematic_viscosity`. The result is in mm^2/s"""
+    return _water_property_array("kinematic_viscosity", temperature, 1.0034 * ureg.millimeter ** 2 / ureg.second)
@@ -0,0 +1,202 @@
+import logging
+from collections import deque
+from typing import Any, Callable, Iterable, Optional, Set
+
+import numpy as np
+import pint
+
+# Incremental recomputation of design quantities.
+# A design is a graph of named quantities: inputs set by the user and derived
+# nodes computed from other nodes by a function. Editing an input only marks
+# its downstream nodes dirty; they are recomputed lazily when read, and a node
+# whose dependencies came out unchanged is not recomputed (early cutoff), so
+# a what-if edit costs time proportional to the affected part of the graph.
+# Several unit processes are chained by linking a node of one to an input of
+# the next, e.g. graph.link("aeration.influent_bod", "primary.effluent_bod").
+
+
+def _same(a: Any, b: Any) -> bool:
+    """Value equality that also handles quantities and arrays."""
+    if a is b:
+        return True
+    if isinstance(a, pint.Quantity) or isinstance(b, pint.Quantity):
+        if not (isinstance(a, pint.Quantity) and isinstance(b, pint.Quantity)) or a.units != b.units:
+            return False
+        return np.array_equal(np.asarray(a.magnitude), np.asarray(b.magnitude), equal_nan=True)
+    if isinstance(a, np.ndarray) or isinstance(b, np.ndarray):
+        return np.array_equal(np.asarray(a), np.asarray(b))
+    try:
+        return bool(a == b)
+    except (TypeError, ValueError):
+        return False
+
+
+class DependencyGraph:
+    """Lazily evaluated graph of design quantities with memoized nodes."""
+
+    def __init__(self):
+        self._functions: dict[str, Optional[Callable]] = {}
+        self._dependencies: dict[str, tuple[str, ...]] = {}
+        self._dependents: dict[str, list[str]] = {}
+        self._values: dict[str, Any] = {}
+        self._dirty: set[str] = set()
+        # Revision at which each value last changed, and at which each node was last computed
+        self._changed: dict[str, int] = {}
+        self._computed: dict[str, int] = {}
+        self._revision = 0
+        self.recomputations = 0
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._functions
+
+    @property
+    def names(self) -> list[str]:
+        return list(self._functions)
+
+    def add_input(self, name: str, value: Any = None):
+        """Declares an input quantity."""
+        if name in self._functions:
+            raise ValueError(f"Node already defined: {name}")
+        self._functions[name] = None
+        self._dependencies[name] = ()
+        self._dependents.setdefault(name, [])
+        self._values[name] = value
+        self._changed[name] = self._revision
+
+    def add_node(self, name: str, dependencies: Iterable[str], function: Callable):
+        """Declares a derived quantity, `function(*dependency values)`."""
+        if name in self._functions:
+            raise ValueError(f"Node already defined: {name}")
+        dependencies = tuple(dependencies)
+        missing = [dependency for dependency in dependencies if dependency not in self._functions]
+        if missing:
+            raise ValueError(f"Unknown dependencies of {name}: {missing}")
+        self._functions[name] = function
+        self._dependencies[name] = dependencies
+        self._dependents.setdefault(name, [])
+        for dependency in dependencies:
+            self._dependents[dependency].append(name)
+        self._changed[name] = -1
+        self._computed[name] = -1
+        self._dirty.add(name)
+
+    def node(self, name: str, dependencies: Iterable[str]):
+        """Decorator form of `add_node`."""
+        def decorator(function):
+            self.add_node(name, dependencies, function)
+            return function
+        return decorator
+
+    def link(self, target: str, source: str):
+        """Turns the input `target` into a copy of `source` (chains unit processes)."""
+        if target not in self._functions or self._functions[target] is not None:
+            raise ValueError(f"{target} is not an input")
+        if source == target or target in self.upstream(source):
+            raise ValueError(f"Linking {target} to {source} would create a cycle")
+        self._revision += 1
+        self._functions[target] = lambda value: value
+        self._dependencies[target] = (source,)
+        self._dependents[source].append(target)
+        self._computed[target] = -1
+        self._mark_dirty([target], include_names=True)
+
+    def set(self, name: str, value: Any):
+        """Edits an input; its dependents are recomputed when next read."""
+        self.update({name: value})
+
+    def update(self, values: dict[str, Any]):
+        """Edits several inputs at once."""
+        self._revision += 1
+        edited = []
+        for name, value in values.items():
+            if name not in self._functions:
+                raise KeyError(name)
+            if self._functions[name] is not None:
+                raise ValueError(f"{name} is computed and cannot be set")
+            if not _same(self._values[name], value):
+                self._values[name] = value
+                self._changed[name] = self._revision
+                edited.append(name)
+        self._mark_dirty(edited)
+
+    def _mark_dirty(self, names: list[str], include_names: bool = False):
+        queue = deque(dependent for name in names for dependent in self._dependents[name])
+        if include_names:
+            queue.extend(names)
+        while queue:
+            name = queue.popleft()
+            if name not in self._dirty:
+                self._dirty.add(name)
+                queue.extend(self._dependents[name])
+
+    def get(self, name: str) -> Any:
+        """Value of a quantity, recomputing the dirty nodes it depends on."""
+        if name not in self._functions:
+            raise KeyError(name)
+        if name in self._dirty:
+            self._refresh(name)
+        return self._values[name]
+
+    def __getitem__(self, name: str) -> Any:
+        return self.get(name)
+
+    def __setitem__(self, name: str, value: Any):
+        self.set(name, value)
+
+    def values(self, names: Optional[Iterable[str]] = None) -> dict[str, Any]:
+        return {name: self.get(name) for name in (self.names if names is None else names)}
+
+    def _refresh(self, name: str):
+        # Iterative post-order over the dirty ancestors, so deep chains do not hit the recursion limit
+        stack = [(name, False)]
+        while stack:
+            node, ready = stack.pop()
+            if node not in self._dirty:
+                continue
+            if not ready:
+                stack.append((node, True))
+                stack.extend((dependency, False) for dependency in self._dependencies[node]
+                             if dependency in self._dirty)
+                continue
+            dependencies = self._dependencies[node]
+            if any(self._changed[dependency] > self._computed[node] for dependency in dependencies):
+                value = self._functions[node](*(self._values[dependency] for dependency in dependencies))
+                self.recomputations += 1
+                if self._changed[node] < 0 or not _same(value, self._values.get(node)):
+                    self._values[node] = value
+                    self._changed[node] = self._revision
+            self._computed[node] = self._revision
+            self._dirty.discard(node)
+
+    def upstream(self, name: str) -> Set[str]:
+        """All quantities `name` depends on."""
+        seen, queue = set(), deque(self._dependencies[name])
+        while queue:
+            node = queue.popleft()
+            if node not in seen:
+                seen.add(node)
+                queue.extend(self._dependencies[node])
+        return seen
+
+    def downstream(self, name: str) -> Set[str]:
+        """All quantities depending on `name`."""
+        seen, queue = set(), deque(self._dependents[name])
+        while queue:
+            node = queue.popleft()
+            if node not in seen:
+                seen.add(node)
+                queue.extend(self._dependents[node])
+        return seen
+
+    def add_graph(self, other: "DependencyGraph", prefix: str = ""):
+        """Copies the nodes of another graph under `prefix` (e.g. "primary.").
+
+        Links of `other` are copied as nodes, so they must point to earlier nodes.
+        """
+        for name in other.names:
+            if other._functions[name] is None:
+                self.add_input(prefix + name, other._values[name])
+            else:
+                self.add_node(prefix + name, [prefix + dependency for dependency in other._dependencies[name]],
+                              other._functions[name])
+        logging.debug(f"Added {len(other.names)} nodes under {prefix!r}")
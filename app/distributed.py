@@ -0,0 +1,312 @@
+import logging
+import os
+import queue
+import socket
+import threading
+import time
+from collections import deque
+from multiprocessing import Process, get_context
+from multiprocessing.connection import Client, Connection, Listener, wait
+from typing import Any, Optional
+
+import numpy as np
+
+from app.sweep import MODELS, Columns, evaluate_chunk, grid_size, grid_slice, open_sink, sweep_inputs
+
+# Distributed sweeps: a coordinator shards the grid of a sweep into tasks
+# (ranges of flat grid indices, see app/sweep.py) and workers on other hosts
+# pull them over TCP (multiprocessing.connection: pickled messages, HMAC
+# authentication with a shared key).
+#
+#     coordinator:  python -m app.cli coordinate jobs.toml --bind 0.0.0.0:5757
+#     every node:   H2OPTIM_AUTHKEY=... python -m app.cli worker coordinator-host:5757 -j 8
+#
+# Protocol (worker -> coordinator, then the coordinator's reply):
+#     ("hello", host, pid)            -> ("job", model, grid, options)
+#     ("ready",)                      -> ("task", id, start, stop) or ("done",)
+#     ("result", id, columns)         -> same as "ready"
+#     ("error", id, message)          -> same as "ready"
+# A worker with nothing to do gets no reply until a task is available again.
+#
+# A task assigned to a worker is leased for `lease_timeout` seconds. When the
+# worker's connection drops, or the lease expires (a hung or very slow node),
+# the task goes back to the front of the queue; a late result of a reassigned
+# task is ignored. Results are written to the sink in task order, so the output
+# is identical to that of a local sweep.
+#
+# A task whose evaluation raises (e.g. a design sweep without a detention
+# time or depth) is reported by the worker, which goes on; after
+# `max_attempts` failures the sweep fails with the worker's message, like a
+# local sweep would. The sweep also fails when no worker has been connected
+# for `worker_timeout` seconds.
+
+DEFAULT_PORT = 5757
+AUTHKEY_ENVIRONMENT = "H2OPTIM_AUTHKEY"
+
+
+class SweepFailed(ValueError):
+    """Raised by the coordinator when a task keeps failing or no worker is left."""
+
+
+def parse_address(text: str, default_host: str = "127.0.0.1") -> tuple[str, int]:
+    """("host", port) from "host:port", ":port" or "host"."""
+    host, _, port = text.rpartition(":") if ":" in text else (text, "", "")
+    return host or default_host, int(port) if port else DEFAULT_PORT
+
+
+def default_authkey(host: str) -> bytes:
+    """The shared key from the environment; a fixed key is only accepted on the loopback interface.
+
+    Raises:
+        ValueError: If no key is set and `host` is not a loopback address.
+    """
+    key = os.environ.get(AUTHKEY_ENVIRONMENT)
+    if key:
+        return key.encode()
+    if host in ("localhost", "127.0.0.1", "::1"):
+        return b"h2optim-local"
+    raise ValueError(f"Set {AUTHKEY_ENVIRONMENT} to a shared secret to accept workers on {host}")
+
+
+class Coordinator:
+    """Serves the tasks of one sweep to workers and collects their results.
+
+    The listener is bound on construction, so `address` is known (port 0 picks a free port).
+
+    Args:
+        model: Name of a registered model.
+        grid: Values of the swept inputs (spec entries, see `parse_values`).
+        fixed: Inputs held constant over the sweep.
+        chunk_size: Grid points per task.
+        address: Interface and port to listen on.
+        authkey: Shared key of the workers.
+        lease_timeout: Seconds after which an unfinished task is assigned again.
+        max_attempts: Failed evaluations of a task after which the sweep fails.
+        worker_timeout: Seconds without any connected worker after which the sweep fails.
+    """
+
+    def __init__(self, model: str, grid: dict[str, Any], fixed: Optional[dict[str, Any]] = None,
+                 chunk_size: int = 65536, address: tuple[str, int] = ("127.0.0.1", DEFAULT_PORT),
+                 authkey: Optional[bytes] = None, lease_timeout: float = 300.0, max_attempts: int = 3,
+                 worker_timeout: float = 600.0):
+        if model not in MODELS:
+            raise KeyError(f"Unknown model {model!r}, expected one of {sorted(MODELS)}")
+        if chunk_size <= 0:
+            raise ValueError("chunk_size must be greater than zero")
+        self.model = model
+        self.grid, self.options = sweep_inputs(model, grid, fixed)
+        self.total = grid_size(self.grid)
+        self.chunk_size = chunk_size
+        self.tasks = -(-self.total // chunk_size)
+        self.lease_timeout = lease_timeout
+        self.max_attempts = max_attempts
+        self.worker_timeout = worker_timeout
+        self.reassigned = 0
+        self.workers_seen = 0
+        self._listener = Listener(address, authkey=authkey or default_authkey(address[0]))
+        self._incoming: queue.SimpleQueue[Connection] = queue.SimpleQueue()
+        self._closing = False
+
+    @property
+    def address(self) -> tuple[str, int]:
+        return self._listener.address
+
+    def _accept(self):
+        while not self._closing:
+            try:
+                self._incoming.put(self._listener.accept())
+            except (OSError, EOFError) as error:  # Includes failed authentication
+                if not self._closing:
+                    logging.debug(f"Rejected a worker connection: {error}")
+
+    def _close(self, acceptor: threading.Thread):
+        # Closing a socket does not interrupt a blocked accept(): connect once to wake the acceptor
+        self._closing = True
+        try:
+            socket.create_connection(self.address, timeout=1).close()
+        except OSError:
+            pass
+        acceptor.join(timeout=5)
+        self._listener.close()
+        while not self._incoming.empty():  # Workers that reconnected for a next job
+            self._incoming.get().close()
+
+    def run(self, output: str, output_format: Optional[str] = None) -> int:
+        """Serves the tasks until every result is written to `output`; returns the number of rows.
+
+        Raises:
+            SweepFailed: If a task failed `max_attempts` times, or no worker was connected for
+                `worker_timeout` seconds.
+        """
+        acceptor = threading.Thread(target=self._accept, name="coordinator-accept", daemon=True)
+        acceptor.start()
+        pending = deque(range(self.tasks))
+        leases: dict[int, tuple[Connection, float]] = {}
+        results: dict[int, Columns] = {}
+        idle: list[Connection] = []
+        connections: list[Connection] = []
+        failures: dict[int, int] = {}
+        written = 0
+        last_worker = time.monotonic()
+
+        def assign(connection: Connection):
+            while pending and (pending[0] in results or pending[0] < written):
+                pending.popleft()
+            if not pending:
+                idle.append(connection)
+                return
+            task = pending.popleft()
+            start = task * self.chunk_size
+            try:
+                connection.send(("task", task, start, min(start + self.chunk_size, self.total)))
+            except OSError:
+                pending.appendleft(task)
+                return
+            leases[task] = (connection, time.monotonic() + self.lease_timeout)
+
+        def drop(connection: Connection):
+            connections.remove(connection)
+            if connection in idle:
+                idle.remove(connection)
+            for task, (holder, _) in list(leases.items()):
+                if holder is connection:
+                    del leases[task]
+                    pending.appendleft(task)
+                    self.reassigned += 1
+                    logging.info(f"Worker lost, task {task} reassigned")
+            connection.close()
+
+        with open_sink(output, output_format) as sink:
+            try:
+                while written < self.tasks:
+                    while not self._incoming.empty():
+                        connections.append(self._incoming.get())
+                    if connections:
+                        last_worker = time.monotonic()
+                    elif time.monotonic() - last_worker > self.worker_timeout:
+                        raise SweepFailed(f"No worker connected for {self.worker_timeout:g} s, "
+                                          f"{self.tasks - written} of {self.tasks} tasks left")
+                    for connection in wait(connections, timeout=0.1):
+                        try:
+                            message = connection.recv()
+                        except (EOFError, OSError):
+                            drop(connection)
+                            continue
+                        if message[0] == "hello":
+                            self.workers_seen += 1
+                            logging.info(f"Worker {message[1]}:{message[2]} connected")
+                            connection.send(("job", self.model, self.grid, self.options))
+                            continue
+                        if message[0] == "result":
+                            task, columns = message[1], message[2]
+                            leases.pop(task, None)
+                            if task >= written:
+                                results.setdefault(task, columns)
+                        elif message[0] == "error":
+                            task, error = message[1], message[2]
+                            if leases.pop(task, None) is not None:
+                                failures[task] = failures.get(task, 0) + 1
+                                if failures[task] >= self.max_attempts:
+                                    raise SweepFailed(f"Task {task} failed {failures[task]} times: {error}")
+                                logging.info(f"Task {task} failed ({error}), reassigned")
+                                pending.appendleft(task)
+                        assign(connection)
+                    now = time.monotonic()
+                    for task, (holder, deadline) in list(leases.items()):
+                        if now > deadline:
+                            del leases[task]
+                            pending.appendleft(task)
+                            self.reassigned += 1
+                            logging.info(f"Lease of task {task} expired, reassigned")
+                    while idle and pending:
+                        assign(idle.pop())
+                    while written in results:
+                        sink.write(results.pop(written))
+                        written += 1
+                for connection in connections:
+                    try:
+                        connection.send(("done",))
+                    except OSError:
+                        pass
+            finally:
+                self._close(acceptor)
+                for connection in connections:
+                    connection.close()
+        return sink.rows
+
+
+def run_distributed_sweep(model: str, grid: dict[str, Any], output: str, fixed: Optional[dict[str, Any]] = None,
+                          chunk_size: int = 65536, address: tuple[str, int] = ("127.0.0.1", DEFAULT_PORT),
+                          authkey: Optional[bytes] = None, lease_timeout: float = 300.0,
+                          output_format: Optional[str] = None, max_attempts: int = 3,
+                          worker_timeout: float = 600.0) -> int:
+    """Like `run_sweep`, with the chunks evaluated by remote workers (see `run_worker`)."""
+    coordinator = Coordinator(model, grid, fixed, chunk_size, address, authkey, lease_timeout, max_attempts,
+                              worker_timeout)
+    logging.info(f"Coordinating {coordinator.tasks} tasks on {coordinator.address[0]}:{coordinator.address[1]}")
+    return coordinator.run(output, output_format)
+
+
+def _connect(address: tuple[str, int], authkey: bytes, wait_s: float) -> Optional[Connection]:
+    deadline = time.monotonic() + wait_s
+    while True:
+        try:
+            return Client(address, authkey=authkey)
+        except (ConnectionRefusedError, ConnectionResetError, EOFError):
+            if time.monotonic() > deadline:
+                return None
+            time.sleep(0.2)
+
+
+def run_worker(address: tuple[str, int], authkey: Optional[bytes] = None, wait_s: float = 30.0) -> int:
+    """Evaluates tasks of coordinators at `address`, job after job; returns the number of tasks done.
+
+    The worker exits once no coordinator has been reachable for `wait_s` seconds.
+    """
+    authkey = authkey or default_authkey(address[0])
+    done = 0
+    while True:
+        connection = _connect(address, authkey, wait_s)
+        if connection is None:
+            return done
+        try:
+            connection.send(("hello", socket.gethostname(), os.getpid()))
+            _, model, grid, options = connection.recv()
+            connection.send(("ready",))
+            while True:
+                message = connection.recv()
+                if message[0] == "done":
+                    break
+                _, task, start, stop = message
+                try:
+                    columns = evaluate_chunk(model, grid_slice(grid, start, stop), options)
+                except Exception as error:  # Reported to the coordinator; this worker goes on
+                    logging.debug(f"Task {task} failed: {error}")
+                    connection.send(("error", task, f"{type(error).__name__}: {error}"))
+                    continue
+                connection.send(("result", task, {name: (np.ascontiguousarray(values), unit)
+                                                  for name, (values, unit) in columns.items()}))
+                done += 1
+        except (EOFError, OSError) as error:
+            logging.debug(f"Coordinator connection closed: {error}")
+        finally:
+            connection.close()
+
+
+def run_workers(address: tuple[str, int], processes: int, authkey: Optional[bytes] = None,
+                wait_s: float = 30.0) -> list[Process]:
+    """Starts `processes` worker processes (one per core of a node) and returns them."""
+    # Spawned, not forked: a forked worker would inherit (and keep open) the listener of a local coordinator
+    context = get_context("spawn")
+    workers = [context.Process(target=run_worker, args=(address, authkey, wait_s), daemon=True)
+               for _ in range(processes)]
+    for worker in workers:
+        worker.start()
+    return workers
+
+
+def join_workers(workers: list[Process], timeout: Optional[float] = None) -> Optional[int]:
+    """Waits for the workers; returns the first non-zero exit code, if any."""
+    for worker in workers:
+        worker.join(timeout)
+    return next((worker.exitcode for worker in workers if worker.exitcode), None)
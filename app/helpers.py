@@ -1,5 +1,10 @@
 import bisect
 
+import numpy as np
+import pint
+
+from app.quantity_column import QuantityColumn
+
 
 def closest_key_binary_search(data_dict, temperature):
     # Extract sorted keys from the dictionary
@@ -21,3 +26,57 @@ def closest_key_binary_search(data_dict, temperature):
 
         # Return the key closest to the temperature
         return left if abs(left - temperature) <= abs(right - temperature) else right
+
+
+def closest_key_indices(sorted_keys: np.ndarray, values: np.ndarray) -> np.ndarray:
+    """Vectorized counterpart of `closest_key_binary_search`.
+
+    Args:
+        sorted_keys: Ascending array of lookup keys.
+        values: Values to look up.
+
+    Returns:
+        Indices into `sorted_keys` of the closest key for every value. Ties go
+        to the lower key, as in the scalar version.
+    """
+    idx = np.searchsorted(sorted_keys, values, side="left")
+    idx = np.clip(idx, 1, len(sorted_keys) - 1)
+    left = sorted_keys[idx - 1]
+    right = sorted_keys[idx]
+    return np.where(np.abs(left - values) <= np.abs(right - values), idx - 1, idx)
+
+
+def as_magnitude_array(value, unit) -> np.ndarray:
+    """Returns the magnitude of `value` in `unit` as a float array.
+
+    Plain numbers and arrays are assumed to already be expressed in `unit`.
+    Quantity columns are converted without copying when already in `unit`.
+    """
+    if isinstance(value, QuantityColumn):
+        return value.m_as(unit)
+    if isinstance(value, pint.Quantity):
+        value = value.to(unit).magnitude
+    return np.asarray(value, dtype=float)
+
+
+def vectorized_newton(func, derivative, start, tolerance: float = 1e-12, max_iterations: int = 50) -> np.ndarray:
+    """Finds roots of `func` element-wise with Newton's method.
+
+    Args:
+        func: Vectorized function of one array argument.
+        derivative: Its derivative.
+        start: Starting points (one per root).
+        tolerance: Stops once every step is below this value.
+        max_iterations: Upper bound on the number of steps.
+
+    Returns:
+        The roots, NaN where the iteration did not converge.
+    """
+    x = np.array(start, dtype=float)
+    step = np.full(x.shape, np.inf)
+    for _ in range(max_iterations):
+        step = func(x) / derivative(x)
+        x = x - step
+        if not np.any(np.abs(step) > tolerance):
+            break
+    return np.where(np.abs(step) <= tolerance, x, np.nan)
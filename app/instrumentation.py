@@ -0,0 +1,300 @@
+import json
+import os
+import random
+import threading
+import time
+from collections import deque
+from functools import wraps
+from itertools import groupby
+from typing import Any, Callable, Optional
+
+# Opt-in instrumentation of the hot paths (conversions, property lookups,
+# settling iterations, validation, loaders, chart and table rendering).
+#
+#     @instrumented                          # named "module.function"
+#     def get_water_density(...): ...
+#
+#     with span("ingest.merge"): ...
+#     count("settling.iterations", iterations)
+#
+# Disabled (the default), a decorated function costs one global lookup and a
+# branch per call, and `span` returns a shared no-op context manager. Enabled
+# with `enable()`, the H2OPTIM_PROFILE environment variable ("1", or "trace"
+# to also keep trace events) or `python -m app.cli --profile`, every call is
+# timed with perf_counter_ns into an in-process registry: call count, total,
+# minimum and maximum, and a reservoir sample of the durations (or counted
+# values) for percentiles. Trace events (start and duration of every call, by
+# process and thread) are kept in a bounded buffer and export to the Chrome
+# trace format (chrome://tracing, Perfetto) or to speedscope.
+#
+# Worker processes record into their own registry; the process pools of the
+# sweeps (app/sweep.py, app/shared_results.py) drain it with each chunk and
+# merge it into the parent's. `enable()` sets the environment variable, so
+# spawned processes start enabled.
+
+ENVIRONMENT = "H2OPTIM_PROFILE"
+
+_ENABLED = False
+_TRACING = False
+
+
+class _Stat:
+    """Observations of one instrumented name: durations (ns) or counted values."""
+
+    __slots__ = ("kind", "calls", "total", "minimum", "maximum", "samples")
+
+    def __init__(self, kind: str):
+        self.kind = kind
+        self.calls = 0
+        self.total = 0
+        self.minimum = None
+        self.maximum = None
+        self.samples = []
+
+    def add(self, value, capacity: int, rng: random.Random):
+        self.calls += 1
+        self.total += value
+        self.minimum = value if self.minimum is None or value < self.minimum else self.minimum
+        self.maximum = value if self.maximum is None or value > self.maximum else self.maximum
+        if len(self.samples) < capacity:
+            self.samples.append(value)
+        else:  # Reservoir sampling: every observation is kept with the same probability
+            slot = rng.randrange(self.calls)
+            if slot < capacity:
+                self.samples[slot] = value
+
+    def merge(self, other: "_Stat", capacity: int, rng: random.Random):
+        calls = self.calls + other.calls
+        if len(self.samples) + len(other.samples) <= capacity:
+            self.samples += other.samples
+        elif calls:  # Each side contributes in proportion to its observations
+            take = round(capacity * self.calls / calls)
+            self.samples = (rng.sample(self.samples, min(take, len(self.samples)))
+                            + rng.sample(other.samples, min(capacity - take, len(other.samples))))
+        self.calls = calls
+        self.total += other.total
+        for bound, pick in (("minimum", min), ("maximum", max)):
+            values = [value for value in (getattr(self, bound), getattr(other, bound)) if value is not None]
+            setattr(self, bound, pick(values) if values else None)
+
+
+class Registry:
+    """Thread-safe store of the observations and trace events of this process.
+
+    Args:
+        samples: Size of the reservoir kept per name for percentiles.
+        trace_events: Trace events kept (the oldest are dropped).
+    """
+
+    def __init__(self, samples: int = 2048, trace_events: int = 1_000_000):
+        self.capacity = samples
+        self.stats: dict[str, _Stat] = {}
+        self.events: deque = deque(maxlen=trace_events)
+        self._lock = threading.Lock()
+        self._rng = random.Random(0)
+
+    def record_time(self, name: str, start_ns: int, duration_ns: int):
+        with self._lock:
+            stat = self.stats.get(name)
+            if stat is None:
+                stat = self.stats[name] = _Stat("time")
+            stat.add(duration_ns, self.capacity, self._rng)
+            if _TRACING:
+                self.events.append((name, start_ns, duration_ns, os.getpid(), threading.get_ident()))
+
+    def record_count(self, name: str, value: float):
+        with self._lock:
+            stat = self.stats.get(name)
+            if stat is None:
+                stat = self.stats[name] = _Stat("count")
+            stat.add(value, self.capacity, self._rng)
+
+    def reset(self):
+        with self._lock:
+            self.stats.clear()
+            self.events.clear()
+
+    def drain(self) -> dict[str, Any]:
+        """Takes the recorded state (picklable) and resets the registry, e.g. in a worker process."""
+        with self._lock:
+            state = {"stats": self.stats, "events": list(self.events)}
+            self.stats = {}
+            self.events.clear()
+        return state
+
+    def merge(self, state: dict[str, Any]):
+        """Adds a drained state, e.g. of a worker process."""
+        with self._lock:
+            for name, other in state["stats"].items():
+                stat = self.stats.get(name)
+                if stat is None:
+                    self.stats[name] = other
+                else:
+                    stat.merge(other, self.capacity, self._rng)
+            self.events.extend(state["events"])
+
+    def snapshot(self) -> dict[str, dict[str, Any]]:
+        """Statistics per name; durations in milliseconds."""
+        with self._lock:
+            stats = [(name, stat.kind, stat.calls, stat.total, stat.minimum, stat.maximum, list(stat.samples))
+                     for name, stat in self.stats.items()]
+        snapshot = {}
+        for name, kind, calls, total, minimum, maximum, samples in stats:
+            scale = 1e-6 if kind == "time" else 1
+            ordered = sorted(samples)
+            entry = {"kind": kind, "calls": calls, "total": total * scale, "mean": total * scale / calls,
+                     "min": minimum * scale, "max": maximum * scale}
+            for label, fraction in (("p50", 0.5), ("p90", 0.9), ("p99", 0.99)):
+                entry[label] = ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] * scale
+            snapshot[name] = entry
+        return snapshot
+
+
+REGISTRY = Registry()
+
+
+def enabled() -> bool:
+    return _ENABLED
+
+
+def enable(trace: bool = False):
+    """Starts recording (and keeping trace events if `trace`), in this process and spawned ones."""
+    global _ENABLED, _TRACING
+    _ENABLED, _TRACING = True, trace
+    os.environ[ENVIRONMENT] = "trace" if trace else "1"
+
+
+def disable():
+    global _ENABLED, _TRACING
+    _ENABLED = _TRACING = False
+    os.environ.pop(ENVIRONMENT, None)
+
+
+def instrumented(name=None):
+    """Decorator timing every call of a function (named "module.qualname" by default)."""
+    def decorate(function: Callable) -> Callable:
+        label = name if isinstance(name, str) else f"{function.__module__}.{function.__qualname__}"
+
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _ENABLED:
+                return function(*args, **kwargs)
+            start = time.perf_counter_ns()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                REGISTRY.record_time(label, start, time.perf_counter_ns() - start)
+
+        return wrapper
+
+    return decorate(name) if callable(name) else decorate
+
+
+class _Span:
+    __slots__ = ("name", "start")
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        REGISTRY.record_time(self.name, self.start, time.perf_counter_ns() - self.start)
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def span(name: str):
+    """Context manager timing its block under `name`."""
+    return _Span(name) if _ENABLED else _NULL_SPAN
+
+
+def count(name: str, value: float = 1):
+    """Records a counted value, e.g. the iterations of a solver."""
+    if _ENABLED:
+        REGISTRY.record_count(name, value)
+
+
+def snapshot() -> dict[str, dict[str, Any]]:
+    return REGISTRY.snapshot()
+
+
+def report(sort: str = "total") -> str:
+    """The statistics as a text table, by decreasing `sort` (a snapshot key)."""
+    entries = snapshot()
+    if not entries:
+        return "No instrumentation data (enable it with --profile or H2OPTIM_PROFILE=1)"
+    width = max(len(name) for name in entries)
+    lines = [f"{'name':<{width}} {'calls':>9} {'total':>11} {'mean':>10} {'p50':>10} {'p90':>10} "
+             f"{'p99':>10} {'max':>10}"]
+    for kind, unit in (("time", "ms"), ("count", "")):
+        rows = sorted(((name, entry) for name, entry in entries.items() if entry["kind"] == kind),
+                      key=lambda item: -item[1][sort])
+        for name, entry in rows:
+            values = " ".join(f"{entry[key]:>10.4g}" for key in ("mean", "p50", "p90", "p99", "max"))
+            lines.append(f"{name:<{width}} {entry['calls']:>9} {entry['total']:>9.4g}{unit:<2} {values}")
+    return "\n".join(lines)
+
+
+def chrome_trace() -> dict[str, Any]:
+    """The trace events in the Chrome trace event format (complete "X" events, microseconds)."""
+    events = list(REGISTRY.events)
+    origin = min((event[1] for event in events), default=0)
+    return {"displayTimeUnit": "ms", "traceEvents": [
+        {"name": name, "cat": name.split(".")[0], "ph": "X", "ts": (start - origin) / 1000,
+         "dur": duration / 1000, "pid": pid, "tid": tid} for name, start, duration, pid, tid in events]}
+
+
+def speedscope(name: str = "H2Optim") -> dict[str, Any]:
+    """The trace events as a speedscope file: one evented profile per process and thread."""
+    events = sorted(REGISTRY.events, key=lambda event: (event[3], event[4], event[1], -event[2]))
+    origin = min((event[1] for event in events), default=0)
+    frames: dict[str, int] = {}
+    profiles = []
+    for (pid, tid), thread_events in groupby(events, key=lambda event: event[3:5]):
+        opened, stack = [], []
+        for label, start, duration, _, _ in thread_events:
+            start -= origin
+            while stack and stack[-1][1] <= start:
+                frame, end = stack.pop()
+                opened.append({"type": "C", "frame": frame, "at": end / 1000})
+            end = start + duration
+            if stack:
+                end = min(end, stack[-1][1])  # Keep the events nested
+            frame = frames.setdefault(label, len(frames))
+            opened.append({"type": "O", "frame": frame, "at": start / 1000})
+            stack.append((frame, end))
+        while stack:
+            frame, end = stack.pop()
+            opened.append({"type": "C", "frame": frame, "at": end / 1000})
+        profiles.append({"type": "evented", "name": f"pid {pid} thread {tid}", "unit": "microseconds",
+                         "startValue": opened[0]["at"], "endValue": opened[-1]["at"], "events": opened})
+    return {"$schema": "https://www.speedscope.app/file-format-schema.json", "name": name,
+            "shared": {"frames": [{"name": label} for label in frames]}, "profiles": profiles}
+
+
+def export_trace(path: str, format: Optional[str] = None):
+    """Writes the trace events as Chrome trace JSON, or speedscope JSON (format "speedscope",
+    or a path ending in .speedscope.json)."""
+    if format is None:
+        format = "speedscope" if str(path).endswith(".speedscope.json") else "chrome"
+    data = speedscope() if format == "speedscope" else chrome_trace()
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump(data, file)
+
+
+if os.environ.get(ENVIRONMENT):
+    enable(trace=os.environ[ENVIRONMENT] == "trace")
@@ -0,0 +1,175 @@
+import operator
+from functools import lru_cache
+from typing import Union
+
+import numpy as np
+import pint
+
+from app.instrumentation import instrumented
+from app.units import ureg
+
+# Unit-aware column of plant data: one contiguous float64 array and one unit
+# of the shared registry, instead of a Quantity per value.
+#
+# Slicing returns views (no copy); conversion and arithmetic work on the whole
+# array at once. The scale and offset between two units are computed once by
+# pint and cached, so a conversion costs one multiply (and one add for
+# degC/degF) over the array. A column can be passed wherever the kernels
+# accept a quantity (see `as_magnitude_array`), or wrapped as a pint Quantity
+# sharing its array.
+
+ColumnLike = Union["QuantityColumn", pint.Quantity, np.ndarray, float]
+
+
+@lru_cache(maxsize=256)
+def _conversion(source: pint.Unit, target: pint.Unit) -> tuple[float, float]:
+    """Scale and offset converting magnitudes from `source` to `target` (offset 0 unless degC/degF)."""
+    offset, one = ureg.convert(np.array([0.0, 1.0]), source, target)
+    return float(one - offset), float(offset)
+
+
+@instrumented
+def convert_magnitude(magnitude: np.ndarray, source: pint.Unit, target: pint.Unit) -> np.ndarray:
+    """Magnitudes converted between units with the cached scale and offset.
+
+    Raises:
+        pint.DimensionalityError: If the units are not compatible.
+    """
+    if source == target:
+        return magnitude
+    scale, offset = _conversion(source, target)
+    return magnitude * scale + offset if offset else magnitude * scale
+
+
+def _unit(unit: Union[str, pint.Unit, None]) -> pint.Unit:
+    if unit is None:
+        return ureg.dimensionless
+    return ureg.Unit(unit) if isinstance(unit, str) else unit
+
+
+class QuantityColumn:
+    """A 1-D float array with one unit.
+
+    Args:
+        values: Magnitudes; float64 arrays (including memory maps) are used without copying.
+        unit: Unit of the magnitudes (a unit string such as "m^3/day", or a pint unit).
+    """
+
+    __slots__ = ("magnitude", "units")
+    __array_ufunc__ = None  # numpy operands defer to the column's operators
+
+    def __init__(self, values, unit: Union[str, pint.Unit, None] = None):
+        magnitude = np.asanyarray(values)
+        if magnitude.dtype != np.float64:
+            magnitude = magnitude.astype(np.float64)
+        if magnitude.ndim != 1:
+            raise ValueError("A quantity column must be one-dimensional")
+        self.magnitude = magnitude
+        self.units = _unit(unit)
+
+    @classmethod
+    def from_dataset(cls, dataset, name: str, unit: Union[str, pint.Unit, None] = None) -> "QuantityColumn":
+        """Column of a ColumnarDataset in its recorded unit, or converted to `unit`."""
+        column = cls(dataset[name], dataset.units.get(name))
+        return column if unit is None else column.to(unit)
+
+    def __len__(self) -> int:
+        return len(self.magnitude)
+
+    def __repr__(self) -> str:
+        return f"QuantityColumn({self.magnitude!r}, {str(self.units)!r})"
+
+    @property
+    def quantity(self) -> pint.Quantity:
+        """The column as a pint Quantity sharing the same array."""
+        return ureg.Quantity(self.magnitude, self.units)
+
+    @property
+    def dimensionality(self):
+        return self.units.dimensionality
+
+    def __getitem__(self, index) -> Union["QuantityColumn", pint.Quantity]:
+        """A scalar Quantity for an integer index, a column otherwise (a view for slices)."""
+        if isinstance(index, (int, np.integer)):
+            return ureg.Quantity(float(self.magnitude[index]), self.units)
+        return QuantityColumn(self.magnitude[index], self.units)
+
+    def m_as(self, unit: Union[str, pint.Unit]) -> np.ndarray:
+        """Magnitudes in `unit` (the array itself when the unit is unchanged)."""
+        return convert_magnitude(self.magnitude, self.units, _unit(unit))
+
+    def to(self, unit: Union[str, pint.Unit]) -> "QuantityColumn":
+        """The column converted to `unit`."""
+        unit = _unit(unit)
+        return self if unit == self.units else QuantityColumn(self.m_as(unit), unit)
+
+    def sum(self) -> pint.Quantity:
+        return ureg.Quantity(float(np.nansum(self.magnitude)), self.units)
+
+    def mean(self) -> pint.Quantity:
+        return ureg.Quantity(float(np.nanmean(self.magnitude)), self.units)
+
+    def min(self) -> pint.Quantity:
+        return ureg.Quantity(float(np.nanmin(self.magnitude)), self.units)
+
+    def max(self) -> pint.Quantity:
+        return ureg.Quantity(float(np.nanmax(self.magnitude)), self.units)
+
+    def _other(self, other: ColumnLike) -> tuple[np.ndarray, pint.Unit]:
+        if isinstance(other, QuantityColumn):
+            return other.magnitude, other.units
+        if isinstance(other, pint.Quantity):
+            return np.asarray(other.magnitude, dtype=float), other.units
+        return np.asarray(other, dtype=float), ureg.dimensionless
+
+    def _additive(self, other: ColumnLike, operation) -> "QuantityColumn":
+        magnitude, unit = self._other(other)
+        return QuantityColumn(operation(self.magnitude, convert_magnitude(magnitude, unit, self.units)), self.units)
+
+    def __add__(self, other: ColumnLike) -> "QuantityColumn":
+        return self._additive(other, operator.add)
+
+    def __sub__(self, other: ColumnLike) -> "QuantityColumn":
+        return self._additive(other, operator.sub)
+
+    def __radd__(self, other: ColumnLike) -> "QuantityColumn":
+        return self._additive(other, operator.add)
+
+    def __rsub__(self, other: ColumnLike) -> "QuantityColumn":
+        return -self._additive(other, operator.sub)
+
+    def __mul__(self, other: ColumnLike) -> "QuantityColumn":
+        magnitude, unit = self._other(other)
+        return QuantityColumn(self.magnitude * magnitude, self.units * unit)
+
+    __rmul__ = __mul__
+
+    def __truediv__(self, other: ColumnLike) -> "QuantityColumn":
+        magnitude, unit = self._other(other)
+        return QuantityColumn(self.magnitude / magnitude, self.units / unit)
+
+    def __rtruediv__(self, other: ColumnLike) -> "QuantityColumn":
+        magnitude, unit = self._other(other)
+        return QuantityColumn(magnitude / self.magnitude, unit / self.units)
+
+    def __pow__(self, exponent: float) -> "QuantityColumn":
+        return QuantityColumn(self.magnitude ** exponent, self.units ** exponent)
+
+    def __neg__(self) -> "QuantityColumn":
+        return QuantityColumn(-self.magnitude, self.units)
+
+    def _compare(self, other: ColumnLike, operation) -> np.ndarray:
+        magnitude, unit = self._other(other)
+        return operation(self.magnitude, convert_magnitude(magnitude, unit, self.units))
+
+    def __lt__(self, other: ColumnLike) -> np.ndarray:
+        return self._compare(other, operator.lt)
+
+    def __le__(self, other: ColumnLike) -> np.ndarray:
+        return self._compare(other, operator.le)
+
+    def __gt__(self, other: ColumnLike) -> np.ndarray:
+        return self._compare(other, operator.gt)
+
+    def __ge__(self, other: ColumnLike) -> np.ndarray:
+        return self._compare(other, operator.ge)
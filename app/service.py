@@ -0,0 +1,438 @@
+import json
+import logging
+import math
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, TimeoutError
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, NamedTuple, Optional, get_args
+
+import numpy as np
+import pint
+
+from app.quantity_schema import QuantitySchema
+from app.sweep import MODELS, Chunk, Columns, evaluate_chunk, parse_values
+from app.wastewater_treatment.primary_treatment import SedimentationTank
+
+# Local compute service: JSON over HTTP, on the loopback interface only.
+#
+#     python -m app.cli serve --workers 4            # http://127.0.0.1:8765
+#
+#     POST /v1/design    {"inputs": {"flow_rate": "10 L/s", "surface_overflow_velocity": 40,
+#                                    "detention_time": "2 h"}}
+#     -> {"outputs": {"surface_area": {"value": 21.6, "unit": "m**2"}, ...}}
+#     POST /v1/settling  {"requests": [{...}, {...}]}    -> {"results": [{"outputs": ...}, {"error": ...}]}
+#     GET  /v1/models, /health, /metrics
+#
+# Inputs follow the spec entries of app/sweep.py (numbers in the model units,
+# quantity strings, lists of row values). Models run in a process pool that is
+# started with the service and warmed up (modules imported, unit registry and
+# kernels exercised once), so the first request pays no start-up cost.
+#
+# Requests are coalesced: a dispatcher thread per model takes every request
+# queued within `max_delay` (or until `max_batch_rows` rows), concatenates the
+# requests that have the same input names into one chunk and runs the
+# vectorized kernel once. While all workers are busy, requests keep queueing,
+# so batches grow with the load instead of the queue. The kernels do not
+# check their inputs, so each request is checked against the domain rules of
+# the models (positive flows and dimensions, known tank types, see
+# `input_rules`) before it joins a batch, and rejected alone (400). If a batch
+# still fails, its requests are retried one by one so that a request the
+# kernel cannot evaluate only fails itself.
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+
+
+TANK_TYPES = ("circular", "rectangular")
+
+
+def _quantity_schema(field) -> Optional[QuantitySchema]:
+    candidates = list(field.metadata) + list(get_args(field.annotation))
+    while candidates:
+        candidate = candidates.pop()
+        if isinstance(candidate, QuantitySchema):
+            return candidate
+        candidates += get_args(candidate)
+    return None
+
+
+def input_rules() -> dict[str, QuantitySchema]:
+    """Bounds of the model inputs: those of the SedimentationTank fields, and of the particles."""
+    rules = {"length_to_width_ratio": QuantitySchema("dimensionless", gt=0),
+             "particle_diameter": QuantitySchema("m", gt=0), "particle_density": QuantitySchema("kg/m^3", gt=0),
+             "shape_factor": QuantitySchema("dimensionless", gt=0)}
+    for name, field in SedimentationTank.model_fields.items():
+        schema = _quantity_schema(field)
+        if schema is not None and (schema.gt is not None or schema.ge is not None):
+            rules[name] = schema
+    return rules
+
+
+_INPUT_RULES = input_rules()
+
+
+def _warm_up():
+    """Worker initializer: evaluates every model once on nominal inputs."""
+    nominal = {"design": {"flow_rate": np.array([1000.0]), "surface_overflow_velocity": np.array([40.0]),
+                          "detention_time": np.array([2.0])},
+               "settling": {"particle_diameter": np.array([1e-4]), "particle_density": np.array([2650.0])},
+               "clarifier": {"flow_rate": np.array([1000.0])}}
+    for model, chunk in nominal.items():
+        evaluate_chunk(model, chunk)
+
+
+class ServiceMetrics:
+    """Request counters, latencies (last `window` requests) and queue depth, thread-safe."""
+
+    def __init__(self, window: int = 10000):
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=window)
+        self.requests = 0
+        self.rows = 0
+        self.errors = 0
+        self.batches = 0
+        self.batched_requests = 0
+        self.queue_depth = 0
+        self.max_queue_depth = 0
+        self.in_flight = 0
+        self.started = time.time()
+
+    def queued(self, count: int = 1):
+        with self._lock:
+            self.queue_depth += count
+            self.max_queue_depth = max(self.max_queue_depth, self.queue_depth)
+
+    def dispatched(self, requests: int):
+        with self._lock:
+            self.queue_depth -= requests
+            self.batches += 1
+            self.batched_requests += requests
+            self.in_flight += 1
+
+    def batch_done(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    def completed(self, latency: float, rows: int, failed: bool):
+        with self._lock:
+            self.requests += 1
+            self.rows += rows
+            self.errors += failed
+            self._latencies.append(latency)
+
+    def snapshot(self) -> dict[str, Any]:
+        with self._lock:
+            latencies = np.array(self._latencies)
+            snapshot = {
+                "uptime_s": time.time() - self.started, "requests": self.requests, "rows": self.rows,
+                "errors": self.errors, "batches": self.batches, "queue_depth": self.queue_depth,
+                "max_queue_depth": self.max_queue_depth, "batches_in_flight": self.in_flight,
+                "mean_batch_requests": self.batched_requests / self.batches if self.batches else 0.0,
+            }
+        if latencies.size:
+            p50, p90, p99 = np.percentile(latencies, [50, 90, 99]) * 1000
+            snapshot["latency_ms"] = {"p50": p50, "p90": p90, "p99": p99, "max": latencies.max() * 1000}
+        return snapshot
+
+
+class _Pending(NamedTuple):
+    inputs: Chunk
+    rows: int
+    future: Future
+    received: float
+
+
+class Coalescer:
+    """Queues the requests of one model and evaluates them in batches on the pool.
+
+    Args:
+        model: Name of a registered model.
+        executor: Process pool the batches run on.
+        metrics: Metrics of the service.
+        max_batch_rows: Rows above which a batch is dispatched without waiting.
+        max_delay: Seconds a request may wait for others to join its batch.
+        max_in_flight: Batches submitted to the pool at once.
+    """
+
+    def __init__(self, model: str, executor: ProcessPoolExecutor, metrics: ServiceMetrics,
+                 max_batch_rows: int = 65536, max_delay: float = 0.002, max_in_flight: int = 2):
+        self.model = model
+        self.executor = executor
+        self.metrics = metrics
+        self.max_batch_rows = max_batch_rows
+        self.max_delay = max_delay
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+        self._queue: list[_Pending] = []
+        self._condition = threading.Condition()
+        self._closed = False
+        self._thread = threading.Thread(target=self._dispatch, name=f"coalescer-{model}", daemon=True)
+        self._thread.start()
+
+    def submit(self, inputs: Chunk, rows: int) -> Future:
+        """Queues a request of `rows` rows; the future resolves to its Columns."""
+        pending = _Pending(inputs, rows, Future(), time.perf_counter())
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("The service is closed")
+            self._queue.append(pending)
+            self.metrics.queued()
+            self._condition.notify()
+        return pending.future
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        self._thread.join()
+
+    def _take(self) -> list[_Pending]:
+        """Waits for a request, then for others to join it; returns the batch (empty once closed)."""
+        with self._condition:
+            while not self._queue and not self._closed:
+                self._condition.wait()
+            deadline = self._queue[0].received + self.max_delay if self._queue else 0
+            while not self._closed and sum(item.rows for item in self._queue) < self.max_batch_rows:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+            batch, rows = [], 0
+            while self._queue and (not batch or rows + self._queue[0].rows <= self.max_batch_rows):
+                rows += self._queue[0].rows
+                batch.append(self._queue.pop(0))
+            return batch
+
+    def _dispatch(self):
+        while True:
+            self._slots.acquire()  # While the pool is busy, requests keep joining the queue
+            batch = self._take()
+            if not batch:
+                self._slots.release()
+                return
+            groups: dict[tuple, list[_Pending]] = {}
+            for item in batch:
+                groups.setdefault(tuple(item.inputs), []).append(item)
+            self.metrics.dispatched(len(batch))
+            outstanding = [len(groups)]
+            for items in groups.values():
+                chunk = {name: np.concatenate([item.inputs[name] for item in items]) for name in items[0].inputs}
+                future = self.executor.submit(evaluate_chunk, self.model, chunk)
+                future.add_done_callback(lambda done, items=items, outstanding=outstanding:
+                                         self._resolve(done, items, outstanding))
+
+    def _resolve(self, done: Future, items: list[_Pending], outstanding: Optional[list[int]]):
+        try:
+            columns = done.result()
+        except Exception as error:
+            if len(items) == 1:
+                self._finish(items[0], error=error)
+            else:
+                logging.debug(f"{self.model}: batch of {len(items)} requests failed ({error}), retrying one by one")
+                for item in items:
+                    retry = self.executor.submit(evaluate_chunk, self.model, item.inputs)
+                    retry.add_done_callback(lambda retried, item=item: self._resolve(retried, [item], None))
+        else:
+            start = 0
+            for item in items:
+                stop = start + item.rows
+                self._finish(item, columns={name: (values[start:stop], unit)
+                                            for name, (values, unit) in columns.items()})
+                start = stop
+        if outstanding is not None:
+            outstanding[0] -= 1
+            if not outstanding[0]:
+                self.metrics.batch_done()
+                self._slots.release()
+
+    def _finish(self, item: _Pending, columns: Optional[Columns] = None, error: Optional[Exception] = None):
+        self.metrics.completed(time.perf_counter() - item.received, item.rows, error is not None)
+        if error is None:
+            item.future.set_result(columns)
+        else:
+            item.future.set_exception(error)
+
+
+class RequestError(ValueError):
+    """Raised for a request that cannot be evaluated (unknown model or inputs, bad shapes)."""
+
+
+class ComputeService:
+    """A warm process pool with a request coalescer per model.
+
+    Args:
+        workers: Worker processes.
+        max_batch_rows: Rows above which a batch is dispatched without waiting.
+        max_delay: Seconds a request may wait for others to join its batch.
+    """
+
+    def __init__(self, workers: int = 2, max_batch_rows: int = 65536, max_delay: float = 0.002):
+        self.workers = workers
+        self.metrics = ServiceMetrics()
+        self.executor = ProcessPoolExecutor(max_workers=workers, initializer=_warm_up)
+        # Start (and warm) every worker now, before the server threads exist
+        for future in [self.executor.submit(time.sleep, 0) for _ in range(workers)]:
+            future.result()
+        self.coalescers = {model: Coalescer(model, self.executor, self.metrics, max_batch_rows, max_delay,
+                                            max_in_flight=2 * workers)
+                           for model in MODELS}
+
+    def submit(self, model: str, inputs: dict[str, Any]) -> tuple[Future, bool]:
+        """Queues one request; returns its future and whether all its inputs were scalars.
+
+        Raises:
+            RequestError: If the model or an input is unknown, an input breaks the domain rules of the
+                model (see `input_rules`), or the inputs do not broadcast.
+        """
+        if model not in MODELS:
+            raise RequestError(f"Unknown model {model!r}, expected one of {sorted(MODELS)}")
+        units = MODELS[model].input_units
+        if not isinstance(inputs, dict) or not inputs:
+            raise RequestError("Expected an object of inputs")
+        unknown = sorted(set(inputs) - set(units) - ({"tank_type"} if model == "design" else set()))
+        if unknown:
+            raise RequestError(f"Unknown inputs for {model}: {', '.join(unknown)}")
+        try:
+            values = {name: np.atleast_1d(parse_values(value, units.get(name))) for name, value in inputs.items()}
+            scalar = not any(isinstance(value, (list, tuple, dict)) for value in inputs.values())
+            rows = np.broadcast_shapes(*(value.shape for value in values.values()))
+        # Unknown units raise pint's UndefinedUnitError, an AttributeError
+        except (ValueError, TypeError, KeyError, AttributeError, pint.errors.PintError) as error:
+            raise RequestError(f"Invalid inputs: {error}") from None
+        if len(rows) != 1:
+            raise RequestError("Inputs must be scalars or lists of row values")
+        text = sorted(name for name, value in values.items() if name in units and value.dtype.kind not in "fiu")
+        if text:
+            raise RequestError(f"Expected numbers or quantities for {', '.join(text)}")
+        for name, value in values.items():
+            if name in _INPUT_RULES:
+                try:
+                    _INPUT_RULES[name].validate(value.astype(float))
+                except ValueError as error:
+                    raise RequestError(f"Invalid {name}: {error}") from None
+        if "tank_type" in values and not np.isin(values["tank_type"], TANK_TYPES).all():
+            raise RequestError(f"Invalid tank_type: expected one of {', '.join(TANK_TYPES)}")
+        chunk = {name: np.broadcast_to(value, rows) for name, value in sorted(values.items())}
+        return self.coalescers[model].submit(chunk, rows[0]), scalar
+
+    def close(self):
+        for coalescer in self.coalescers.values():
+            coalescer.close()
+        self.executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _json_values(values: np.ndarray, scalar: bool) -> Any:
+    """Values as JSON numbers (NaN as null)."""
+    values = [None if isinstance(value, float) and math.isnan(value) else value for value in values.tolist()]
+    return values[0] if scalar else values
+
+
+def _outputs(columns: Columns, model: str, scalar: bool) -> dict[str, dict[str, Any]]:
+    inputs = MODELS[model].input_units
+    return {name: {"value": _json_values(values, scalar), "unit": unit}
+            for name, (values, unit) in columns.items() if name not in inputs and name != "tank_type"}
+
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    """JSON endpoints of a ComputeService (set as the `service` attribute of the server)."""
+
+    server_version = "H2Optim"
+    timeout_s = 60.0
+
+    def log_message(self, format, *args):
+        logging.debug(f"{self.address_string()} {format % args}")
+
+    def _send(self, status: HTTPStatus, body: dict[str, Any]):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        service: ComputeService = self.server.service
+        if self.path == "/health":
+            self._send(HTTPStatus.OK, {"status": "ok", "workers": service.workers})
+        elif self.path == "/metrics":
+            self._send(HTTPStatus.OK, service.metrics.snapshot())
+        elif self.path == "/v1/models":
+            self._send(HTTPStatus.OK, {name: {"description": model.description, "inputs": model.input_units}
+                                       for name, model in MODELS.items()})
+        else:
+            self._send(HTTPStatus.NOT_FOUND, {"error": f"No such endpoint: {self.path}"})
+
+    def do_POST(self):
+        service: ComputeService = self.server.service
+        model = self.path.removeprefix("/v1/")
+        if model == self.path or model not in MODELS:
+            self._send(HTTPStatus.NOT_FOUND, {"error": f"No such endpoint: {self.path}"})
+            return
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        except (ValueError, UnicodeDecodeError):
+            self._send(HTTPStatus.BAD_REQUEST, {"error": "The body is not valid JSON"})
+            return
+        if isinstance(body, dict) and isinstance(body.get("requests"), list):
+            submitted = []
+            for inputs in body["requests"]:
+                try:
+                    submitted.append(service.submit(model, inputs))
+                except RequestError as error:
+                    submitted.append(error)
+            self._send(HTTPStatus.OK, {"results": [self._result(model, item)[1] for item in submitted]})
+            return
+        try:
+            submitted = service.submit(model, body.get("inputs") if isinstance(body, dict) else None)
+        except RequestError as error:
+            self._send(HTTPStatus.BAD_REQUEST, {"error": str(error)})
+            return
+        self._send(*self._result(model, submitted))
+
+    def _result(self, model: str, submitted) -> tuple[HTTPStatus, dict[str, Any]]:
+        if isinstance(submitted, RequestError):
+            return HTTPStatus.BAD_REQUEST, {"error": str(submitted)}
+        future, scalar = submitted
+        try:
+            return HTTPStatus.OK, {"outputs": _outputs(future.result(timeout=self.timeout_s), model, scalar)}
+        except TimeoutError:
+            return HTTPStatus.GATEWAY_TIMEOUT, {"error": f"No result within {self.timeout_s} s"}
+        except Exception as error:
+            return HTTPStatus.UNPROCESSABLE_ENTITY, {"error": f"{type(error).__name__}: {error}"}
+
+
+class ServiceServer(ThreadingHTTPServer):
+    """Threaded HTTP server of a ComputeService, with a backlog for bursts of clients."""
+
+    daemon_threads = True
+    request_queue_size = 256
+
+    def __init__(self, service: ComputeService, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT):
+        super().__init__((host, port), ServiceHandler)
+        self.service = service
+
+
+def make_server(service: ComputeService, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT) -> ServiceServer:
+    """An HTTP server for the service (port 0 picks a free port); call `serve_forever` to run it."""
+    return ServiceServer(service, host, port)
+
+
+def serve(host: str = DEFAULT_HOST, port: int = DEFAULT_PORT, workers: int = 2, max_delay: float = 0.002):
+    """Runs the service until interrupted."""
+    with ComputeService(workers, max_delay=max_delay) as service:
+        server = make_server(service, host, port)
+        logging.info(f"Serving on http://{server.server_address[0]}:{server.server_address[1]}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
@@ -0,0 +1,266 @@
+import logging
+import os
+import uuid
+import weakref
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from multiprocessing.shared_memory import SharedMemory
+from typing import Any, Iterable, NamedTuple, Optional
+
+import numpy as np
+
+from app.instrumentation import REGISTRY
+from app.sweep import Chunk, Columns, evaluate_chunk, grid_chunks, grid_size, sweep_inputs
+from models.data_models import ColumnarDataset
+
+# Batch results handed from worker processes to the GUI through shared memory.
+#
+# The parent (GUI) process evaluates the first chunk itself to learn the output
+# columns, then allocates ONE shared-memory segment holding every column of
+# the whole result (64-byte aligned, one after the other). Workers receive a
+# small descriptor (segment name, rows, column dtypes and offsets) with each
+# chunk, attach to the segment, write their rows in place and return only a
+# row count: no result array is pickled, and the GUI reads the columns as
+# NumPy views of the segment (`SharedResult.dataset()`), with no second copy.
+#
+# Lifetime: the process that creates a segment owns it and must `release()`
+# it (or use it as a context manager); a finalizer releases forgotten results
+# when they are garbage-collected or at exit. Releasing unlinks the segment
+# right away; its memory is returned once the last NumPy view of it is gone,
+# so a table still showing the old result never reads freed memory. Segments
+# are named "h2optim_<owner pid>_...", so `remove_stale_segments` can delete
+# those left behind by a process that crashed.
+
+SEGMENT_PREFIX = "h2optim_"
+_ALIGNMENT = 64
+_SHM_DIRECTORY = "/dev/shm"  # Where POSIX systems list the segments (Linux)
+
+
+class ColumnLayout(NamedTuple):
+    name: str
+    dtype: str
+    offset: int
+    unit: Optional[str]
+
+
+class SharedResultDescriptor(NamedTuple):
+    """What a worker needs to find the columns of a result: sent instead of the arrays."""
+
+    segment: str
+    rows: int
+    columns: tuple[ColumnLayout, ...]
+
+
+class _Segment(SharedMemory):
+    """A SharedMemory that may be closed while NumPy views of it remain (they keep the mapping alive)."""
+
+    def close(self):
+        try:
+            super().close()
+        except BufferError:
+            # The mapping is unmapped with its last view; the file descriptor is not needed for that
+            if getattr(self, "_fd", -1) >= 0:
+                os.close(self._fd)
+                self._fd = -1
+            raise
+
+    def __del__(self):
+        try:
+            self.close()
+        except (OSError, BufferError):
+            pass
+
+
+def _attach(name: str) -> SharedMemory:
+    try:
+        return _Segment(name, track=False)  # Python 3.13+: only the owner registers the segment
+    except TypeError:
+        return _Segment(name)
+
+
+def _unlink(memory: SharedMemory):
+    try:
+        memory.unlink()
+    except FileNotFoundError:
+        pass
+    try:
+        memory.close()
+    except BufferError:
+        logging.debug(f"{memory.name} is still viewed, it is unmapped with its last view")
+
+
+class SharedResult:
+    """Named, equal-length columns stored in a shared-memory segment.
+
+    Use `create` in the owning process and `attach` in workers.
+    """
+
+    def __init__(self, descriptor: SharedResultDescriptor, memory: SharedMemory, owner: bool):
+        self.descriptor = descriptor
+        self._memory = memory
+        self.owner = owner
+        self._finalizer = weakref.finalize(self, _unlink, memory) if owner else None
+
+    @classmethod
+    def create(cls, layout: dict[str, tuple[np.dtype, Optional[str]]], rows: int) -> "SharedResult":
+        """Allocates a segment for `rows` rows of the columns {name: (dtype, unit)}."""
+        columns, offset = [], 0
+        for name, (dtype, unit) in layout.items():
+            dtype = np.dtype(dtype)
+            if dtype.hasobject:
+                raise ValueError(f"Column {name} has objects, which cannot be shared")
+            columns.append(ColumnLayout(name, dtype.str, offset, unit))
+            offset += -(-dtype.itemsize * rows // _ALIGNMENT) * _ALIGNMENT
+        name = f"{SEGMENT_PREFIX}{os.getpid()}_{uuid.uuid4().hex[:12]}"
+        memory = _Segment(name, create=True, size=max(offset, 1))
+        return cls(SharedResultDescriptor(name, rows, tuple(columns)), memory, owner=True)
+
+    @classmethod
+    def attach(cls, descriptor: SharedResultDescriptor) -> "SharedResult":
+        """Maps the segment of a result created by another process."""
+        return cls(descriptor, _attach(descriptor.segment), owner=False)
+
+    @property
+    def name(self) -> str:
+        return self.descriptor.segment
+
+    @property
+    def nbytes(self) -> int:
+        return self._memory.size
+
+    def __len__(self) -> int:
+        return self.descriptor.rows
+
+    def column(self, name: str) -> np.ndarray:
+        entry = next(column for column in self.descriptor.columns if column.name == name)
+        # frombuffer keeps an export of the buffer, so the segment cannot be unmapped under the view
+        return np.frombuffer(self._memory.buf, np.dtype(entry.dtype), self.descriptor.rows, entry.offset)
+
+    @property
+    def columns(self) -> dict[str, np.ndarray]:
+        """The columns, as views of the segment."""
+        return {entry.name: self.column(entry.name) for entry in self.descriptor.columns}
+
+    @property
+    def units(self) -> dict[str, str]:
+        return {entry.name: entry.unit for entry in self.descriptor.columns if entry.unit}
+
+    def dataset(self) -> ColumnarDataset:
+        """A ColumnarDataset over the segment (no copy)."""
+        return ColumnarDataset(self.columns, self.units)
+
+    def write(self, start: int, columns: Columns):
+        """Writes evaluated columns (see `evaluate_chunk`) from row `start` on."""
+        for entry in self.descriptor.columns:
+            values, _ = columns[entry.name]
+            self.column(entry.name)[start:start + len(values)] = values
+
+    def close(self):
+        """Unmaps the segment in this process (views of it must be gone); the owner also unlinks it."""
+        if self.owner:
+            self.release()
+        else:
+            self._memory.close()
+
+    def release(self):
+        """Frees the segment (owner only): unlinked now, unmapped once its views are gone."""
+        if self._finalizer is not None:
+            self._finalizer()
+
+    @property
+    def released(self) -> bool:
+        return self._finalizer is not None and not self._finalizer.alive
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _evaluate_into(descriptor: SharedResultDescriptor, model: str, chunk: Chunk, options: Optional[dict],
+                   start: int) -> dict:
+    """Worker task: evaluates a chunk straight into the shared result; returns what the worker recorded
+    (see app/instrumentation.py)."""
+    result = SharedResult.attach(descriptor)
+    try:
+        result.write(start, evaluate_chunk(model, chunk, options))
+        return REGISTRY.drain()
+    finally:
+        result.close()
+
+
+def _layout(columns: Columns) -> dict[str, tuple[np.dtype, Optional[str]]]:
+    return {name: (values.dtype if values.dtype.kind in "fiubM" else np.dtype("<U32"), unit)
+            for name, (values, unit) in columns.items()}
+
+
+def evaluate_shared(model: str, chunks: Iterable[Chunk], rows: int, options: Optional[dict[str, Any]] = None,
+                    workers: int = 1) -> SharedResult:
+    """Evaluates the chunks (`rows` rows in all) into a SharedResult owned by the caller.
+
+    Raises:
+        ValueError: If there is no chunk.
+    """
+    chunks = iter(chunks)
+    first = next(chunks, None)
+    if first is None:
+        raise ValueError("Nothing to evaluate")
+    probe = evaluate_chunk(model, first, options)  # Also gives the output columns
+    result = SharedResult.create(_layout(probe), rows)
+    try:
+        result.write(0, probe)
+        start = len(next(iter(probe.values()))[0])
+        if workers <= 1:
+            for chunk in chunks:
+                columns = evaluate_chunk(model, chunk, options)
+                result.write(start, columns)
+                start += len(next(iter(columns.values()))[0])
+            return result
+        # Created after the segment, so the workers share this process's resource tracker. Spawned,
+        # not forked: this runs from the GUI process, whose threads must not be forked
+        with ProcessPoolExecutor(max_workers=workers, mp_context=get_context("spawn")) as executor:
+            pending = deque()
+            for chunk in chunks:
+                pending.append(executor.submit(_evaluate_into, result.descriptor, model, chunk, options, start))
+                start += len(next(iter(chunk.values())))
+                if len(pending) >= 2 * workers:
+                    REGISTRY.merge(pending.popleft().result())
+            while pending:
+                REGISTRY.merge(pending.popleft().result())
+        return result
+    except BaseException:
+        result.release()
+        raise
+
+
+def run_sweep_shared(model: str, grid: dict[str, Any], fixed: Optional[dict[str, Any]] = None,
+                     chunk_size: int = 65536, workers: int = 1) -> SharedResult:
+    """Like `run_sweep` (app/sweep.py), with the results kept in shared memory for the GUI."""
+    values, options = sweep_inputs(model, grid, fixed)
+    return evaluate_shared(model, grid_chunks(values, chunk_size), grid_size(values), options, workers)
+
+
+def remove_stale_segments() -> list[str]:
+    """Unlinks the result segments of processes that no longer run; returns their names."""
+    if not os.path.isdir(_SHM_DIRECTORY):
+        return []
+    removed = []
+    for name in os.listdir(_SHM_DIRECTORY):
+        if not name.startswith(SEGMENT_PREFIX):
+            continue
+        try:
+            pid = int(name[len(SEGMENT_PREFIX):].split("_")[0])
+            os.kill(pid, 0)
+        except ValueError:
+            continue
+        except ProcessLookupError:
+            try:
+                os.unlink(os.path.join(_SHM_DIRECTORY, name))
+                removed.append(name)
+            except OSError:
+                pass
+        except PermissionError:
+            continue  # Running, under another user
+    return removed
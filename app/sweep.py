@@ -0,0 +1,309 @@
+import csv
+import logging
+import os
+import re
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Iterable, Iterator, NamedTuple, Optional, Union
+
+import numpy as np
+import pint
+
+from app.analysis.sensitivity import CLARIFIER_NOMINAL_INPUTS, clarifier_model
+from app.instrumentation import REGISTRY, enabled, instrumented
+from app.units import ureg
+from app.wastewater_treatment.parameters import terminal_settling_velocity_batch
+from app.wastewater_treatment.primary_treatment import calculate_design_batch
+from models.data_models import ColumnarDatasetWriter
+
+# Headless batch evaluation of the vectorized kernels (no GUI imports).
+#
+# A job feeds chunks of input columns to a registered batch model:
+# - a sweep takes the cartesian product of a grid of values; the grid is never
+#   materialized, each chunk unravels a range of flat indices into the input
+#   columns, so a sweep of 10^8 points streams in constant memory;
+# - a table broadcasts its inputs against each other (or reads them from a data
+#   file, see app/cli.py).
+# Chunks are evaluated in a process pool, at most 2 per worker in flight, and
+# come back in order. Results are streamed to a CSV file, whose header carries
+# the units ("surface_area (m**2)", read back by utils/schema.py), or to a
+# columnar dataset directory (models/data_models.py).
+
+Chunk = dict[str, np.ndarray]
+# Columns of an evaluated chunk: magnitudes and their unit (None for plain values)
+Columns = dict[str, tuple[np.ndarray, Optional[str]]]
+
+
+class BatchModel(NamedTuple):
+    """A batch kernel and the units its plain-number inputs are read in."""
+
+    function: Callable[[dict[str, Any]], dict[str, Union[np.ndarray, pint.Quantity]]]
+    input_units: dict[str, str]
+    description: str
+
+
+def design_model(inputs: dict[str, Any]) -> dict[str, pint.Quantity]:
+    """Primary clarifier designs (`calculate_design_batch`)."""
+    return calculate_design_batch(**inputs)
+
+
+def settling_model(inputs: dict[str, Any]) -> dict[str, pint.Quantity]:
+    """Terminal settling velocities of discrete particles (`terminal_settling_velocity_batch`)."""
+    inputs = dict(inputs)
+    diameter = inputs.pop("particle_diameter") * ureg.meter
+    density = inputs.pop("particle_density") * ureg.kg / ureg.meter ** 3
+    velocity = terminal_settling_velocity_batch(diameter, density, **inputs)
+    return {"settling_velocity": velocity.to(ureg.meter / ureg.day)}
+
+
+_CLARIFIER_OUTPUT_UNITS = {
+    "surface_area": "m^2", "volume": "m^3", "effluent_tss": "mg/L", "effluent_bod": "mg/L",
+    "peak_overflow_rate": "m/day", "settling_velocity": "m/day", "particle_removal": "dimensionless",
+}
+
+
+def clarifier_sweep_model(inputs: dict[str, Any]) -> dict[str, pint.Quantity]:
+    """Primary clarifier design and design-particle removal (`clarifier_model`)."""
+    return {name: ureg.Quantity(values, _CLARIFIER_OUTPUT_UNITS[name])
+            for name, values in clarifier_model(inputs).items()}
+
+
+_DESIGN_INPUT_UNITS = {
+    "flow_rate": "m^3/day", "surface_overflow_velocity": "m/day", "detention_time": "hour",
+    "side_water_depth": "m", "length_to_width_ratio": "dimensionless", "influent_tss": "mg/L",
+    "influent_bod": "mg/L", "tss_removal_efficiency": "dimensionless", "bod_removal_efficiency": "dimensionless",
+    "peaking_factor": "dimensionless",
+}
+
+MODELS: dict[str, BatchModel] = {
+    "design": BatchModel(design_model, _DESIGN_INPUT_UNITS, design_model.__doc__),
+    "settling": BatchModel(settling_model, {
+        "particle_diameter": "m", "particle_density": "kg/m^3", "temperature": "degC",
+        "shape_factor": "dimensionless"}, settling_model.__doc__),
+    "clarifier": BatchModel(clarifier_sweep_model, {
+        **{name: _DESIGN_INPUT_UNITS.get(name, "dimensionless") for name in CLARIFIER_NOMINAL_INPUTS},
+        "temperature": "degC", "particle_diameter": "m", "particle_density": "kg/m^3"},
+        clarifier_sweep_model.__doc__),
+}
+
+
+def parse_values(value: Any, unit: Optional[str] = None) -> Union[np.ndarray, str]:
+    """Values of an input in `unit`, from a spec entry.
+
+    Accepted entries: a number, a quantity string ("10 L/s"), a list of either,
+    or a range {start, stop, num, unit, log}. Plain numbers are read in `unit`.
+    Other strings (e.g. tank_type = "circular") are returned unchanged.
+    """
+    if isinstance(value, dict):
+        start, stop = value["start"], value["stop"]
+        num = int(value.get("num", 50))
+        values = np.geomspace(start, stop, num) if value.get("log") else np.linspace(start, stop, num)
+        return parse_values([f"{number} {value['unit']}" if "unit" in value else number for number in values], unit)
+    if isinstance(value, (list, tuple)):
+        if all(isinstance(item, str) and not _is_quantity(item) for item in value):
+            return np.array(value)
+        return np.array([parse_values(item, unit) for item in value], dtype=float).ravel()
+    if isinstance(value, str):
+        if not _is_quantity(value):
+            return value
+        match = _QUANTITY.match(value)
+        quantity = ureg.Quantity(float(match["number"]), match["unit"] or "dimensionless")  # "15 degC" as well
+        return np.asarray(quantity.m_as(unit) if unit else quantity.magnitude, dtype=float)
+    return np.asarray(value, dtype=float)
+
+
+_QUANTITY = re.compile(r"^\s*(?P<number>[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)\s*(?P<unit>.*?)\s*$")
+
+
+def _is_quantity(text: str) -> bool:
+    return _QUANTITY.match(text) is not None
+
+
+def grid_size(grid: dict[str, np.ndarray]) -> int:
+    return int(np.prod([len(values) for values in grid.values()], dtype=np.int64)) if grid else 0
+
+
+def grid_chunks(grid: dict[str, np.ndarray], chunk_size: int = 65536) -> Iterator[Chunk]:
+    """Chunks of the cartesian product of the grid values (last input varying fastest)."""
+    if chunk_size <= 0:
+        raise ValueError("chunk_size must be greater than zero")
+    total = grid_size(grid)
+    for start in range(0, total, chunk_size):
+        yield grid_slice(grid, start, min(start + chunk_size, total))
+
+
+def grid_slice(grid: dict[str, np.ndarray], start: int, stop: int) -> Chunk:
+    """Points `start` to `stop` (exclusive) of the cartesian product of the grid values."""
+    indices = np.unravel_index(np.arange(start, stop), tuple(len(values) for values in grid.values()))
+    return {name: values[index] for (name, values), index in zip(grid.items(), indices)}
+
+
+def table_chunks(inputs: dict[str, np.ndarray], chunk_size: int = 65536) -> Iterator[Chunk]:
+    """Chunks of inputs broadcast against each other (scalars repeat on every row)."""
+    arrays = {name: values for name, values in inputs.items() if np.ndim(values)}
+    length = np.broadcast_shapes(*(np.shape(values) for values in arrays.values())) if arrays else (1,)
+    for start in range(0, length[0], chunk_size):
+        stop = min(start + chunk_size, length[0])
+        yield {name: np.broadcast_to(values, length)[start:stop] for name, values in arrays.items()}
+
+
+@instrumented
+def evaluate_chunk(model: str, chunk: Chunk, options: Optional[dict] = None) -> Columns:
+    """Runs a registered model on one chunk; returns the inputs and outputs with their units."""
+    registered = MODELS[model]
+    outputs = registered.function({**(options or {}), **chunk})
+    rows = len(next(iter(chunk.values()))) if chunk else 1
+    columns: Columns = {name: (np.asarray(values), registered.input_units.get(name)) for name, values in chunk.items()}
+    for name, value in outputs.items():
+        if isinstance(value, pint.Quantity):
+            columns[name] = (np.broadcast_to(value.magnitude, (rows,)), f"{value.units:~C}")
+        else:
+            columns[name] = (np.broadcast_to(value, (rows,)), None)
+    return columns
+
+
+def _evaluate_profiled(model: str, chunk: Chunk, options: Optional[dict]) -> tuple[Columns, dict]:
+    """Worker task: the columns, with what the worker recorded for them (see app/instrumentation.py)."""
+    return evaluate_chunk(model, chunk, options), REGISTRY.drain()
+
+
+def evaluate(model: str, chunks: Iterable[Chunk], options: Optional[dict] = None,
+             workers: int = 1) -> Iterator[Columns]:
+    """Evaluates the chunks in order, in a process pool when `workers` > 1.
+
+    Raises:
+        KeyError: If the model is not registered.
+    """
+    if model not in MODELS:
+        raise KeyError(f"Unknown model {model!r}, expected one of {sorted(MODELS)}")
+    if workers <= 1:
+        for chunk in chunks:
+            yield evaluate_chunk(model, chunk, options)
+        return
+    if enabled():  # The workers' records are merged into this process's registry
+        with ProcessPoolExecutor(max_workers=workers, initializer=REGISTRY.reset) as executor:
+            for columns, state in _in_order(executor, _evaluate_profiled, model, chunks, options, workers):
+                REGISTRY.merge(state)
+                yield columns
+        return
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        yield from _in_order(executor, evaluate_chunk, model, chunks, options, workers)
+
+
+def _in_order(executor: ProcessPoolExecutor, task, model: str, chunks: Iterable[Chunk], options: Optional[dict],
+              workers: int) -> Iterator:
+    pending = deque()
+    for chunk in chunks:
+        pending.append(executor.submit(task, model, chunk, options))
+        if len(pending) >= 2 * workers:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+class CsvSink:
+    """Streams columns to a CSV file; the header holds "name (unit)" labels."""
+
+    def __init__(self, path: str):
+        self.path = os.fspath(path)
+        self.rows = 0
+        self._file = None
+
+    def write(self, columns: Columns):
+        if self._file is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self._file = open(self.path, "w", newline="", encoding="utf-8")
+            csv.writer(self._file).writerow(
+                [f"{name} ({unit})" if unit and unit != "dimensionless" else name
+                 for name, (_, unit) in columns.items()])
+        values = [magnitude for magnitude, _ in columns.values()]
+        if all(magnitude.dtype.kind in "fiub" for magnitude in values):
+            np.savetxt(self._file, np.column_stack(values), delimiter=",", fmt="%.12g")
+        else:
+            text = [np.datetime_as_string(magnitude) if magnitude.dtype.kind == "M" else magnitude.astype(str)
+                    for magnitude in values]
+            csv.writer(self._file).writerows(zip(*text))
+        self.rows += len(values[0]) if values else 0
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ColumnarSink:
+    """Streams columns to a columnar dataset directory (memory-mappable .npy files)."""
+
+    def __init__(self, directory: str):
+        self.directory = os.fspath(directory)
+        self.rows = 0
+        self._writer: Optional[ColumnarDatasetWriter] = None
+
+    def write(self, columns: Columns):
+        if self._writer is None:
+            dtypes = {name: magnitude.dtype if magnitude.dtype.kind in "fM" else
+                      (np.dtype(float) if magnitude.dtype.kind in "iub" else np.dtype("<U32"))
+                      for name, (magnitude, _) in columns.items()}
+            units = {name: unit for name, (_, unit) in columns.items() if unit}
+            self._writer = ColumnarDatasetWriter(self.directory, dtypes, units)
+        self._writer.append({name: magnitude for name, (magnitude, _) in columns.items()})
+        self.rows += len(next(iter(columns.values()))[0]) if columns else 0
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def open_sink(path: str, output_format: Optional[str] = None) -> Union[CsvSink, ColumnarSink]:
+    """CSV sink for .csv paths (or format "csv"), columnar dataset directory otherwise."""
+    output_format = output_format or ("csv" if Path(path).suffix.lower() == ".csv" else "columnar")
+    if output_format == "csv":
+        return CsvSink(path)
+    if output_format == "columnar":
+        return ColumnarSink(path)
+    raise ValueError(f"Unknown output format: {output_format}")
+
+
+def sweep_inputs(model: str, grid: dict[str, Any],
+                 fixed: Optional[dict[str, Any]] = None) -> tuple[dict[str, np.ndarray], dict[str, Any]]:
+    """Grid values and fixed inputs of a sweep, parsed from spec entries into the model units."""
+    units = MODELS[model].input_units if model in MODELS else {}
+    values = {name: np.atleast_1d(parse_values(value, units.get(name))) for name, value in grid.items()}
+    options = {name: parse_values(value, units.get(name)) for name, value in (fixed or {}).items()}
+    return values, options
+
+
+def run_sweep(model: str, grid: dict[str, Any], output: str, fixed: Optional[dict[str, Any]] = None,
+              chunk_size: int = 65536, workers: int = 1, output_format: Optional[str] = None) -> int:
+    """Evaluates a model over the cartesian product of `grid` and streams the results to `output`.
+
+    Args:
+        model: Name of a registered model (see MODELS).
+        grid: Values of the swept inputs (see `parse_values` for the accepted entries).
+        output: CSV file or columnar dataset directory.
+        fixed: Inputs held constant over the sweep.
+        chunk_size: Grid points per chunk.
+        workers: Worker processes.
+        output_format: "csv" or "columnar" (by default, from the output path).
+
+    Returns:
+        The number of evaluated points.
+    """
+    values, options = sweep_inputs(model, grid, fixed)
+    logging.debug(f"Sweeping {model} over {grid_size(values)} points")
+    with open_sink(output, output_format) as sink:
+        for columns in evaluate(model, grid_chunks(values, chunk_size), options, workers):
+            sink.write(columns)
+    return sink.rows
@@ -1,6 +1,8 @@
 import pint
 
 ureg = pint.UnitRegistry()
+# Quantities unpickled in worker processes must belong to the same registry
+pint.set_application_registry(ureg)
 
 
 DEFAULT_LENGTH_UNIT = ureg.meter
@@ -0,0 +1,345 @@
+import logging
+from typing import Optional, Union
+
+import numpy as np
+import pint
+from pydantic import BaseModel, Field
+
+from app.constants import (ACTIVATED_SLUDGE_F_M_RATIO_RANGE,
+                           ACTIVATED_SLUDGE_MLSS_RANGE,
+                           ACTIVATED_SLUDGE_SRT_RANGE,
+                           )
+from app.dependency_graph import DependencyGraph
+from app.helpers import as_magnitude_array
+from app.instrumentation import instrumented
+from app.units import ureg
+
+# Steady-state design of a complete-mix activated sludge aeration basin
+# (Metcalf and Eddy, 2003, chapter 8), on a BOD basis:
+#   effluent soluble BOD    S = Ks (1 + kd SRT) / (SRT (Y k - kd) - 1)
+#   biomass production      P_X,bio = Q Y (S0 - S) / (1 + kd SRT) * (1 + fd kd SRT)
+#   solids production       P_X,TSS = P_X,bio / (VSS/TSS) + Q X_inert
+#   basin volume            V = P_X,TSS SRT / MLSS
+#   oxygen demand           R_O = Q (S0 - S) / f - 1.42 P_X,bio (+ 4.57 Q NOx when nitrifying)
+# The return ratio follows from the basin solids balance, R = X / (X_r - X), so
+# the outputs (mlss, return_ratio, flow_rate) feed the secondary clarifier state
+# point analysis directly.
+
+_FLOW_UNIT = ureg.meter ** 3 / ureg.day
+_CONCENTRATION_UNIT = ureg.milligram / ureg.liter  # = g/m^3
+
+# Heterotroph kinetics at 20 °C on a BOD basis (Metcalf and Eddy, 2003, Table 7-9)
+# with their Arrhenius temperature coefficients.
+ACTIVATED_SLUDGE_KINETICS = {
+    "max_substrate_utilization_rate": 5.0 * ureg.day ** -1,  # k, g BOD / g VSS d
+    "half_velocity_constant": 60.0 * _CONCENTRATION_UNIT,  # Ks, mg BOD/L
+    "yield_coefficient": 0.6,  # Y, g VSS / g BOD
+    "decay_coefficient": 0.06 * ureg.day ** -1,  # kd
+    "debris_fraction": 0.15,  # fd, fraction of the decayed biomass left as cell debris
+    "k_temperature_coefficient": 1.07,
+    "kd_temperature_coefficient": 1.04,
+}
+BOD5_TO_BODU_RATIO = 0.68
+OXYGEN_PER_BIOMASS = 1.42  # g O2 / g VSS
+OXYGEN_PER_NITRATE = 4.57  # g O2 / g N nitrified
+NITROGEN_IN_BIOMASS = 0.12  # g N / g VSS
+
+ArrayLike = Union[float, np.ndarray, pint.Quantity]
+_KG_PER_DAY = ureg.kg / ureg.day
+
+
+# Kernels shared by `calculate_design_batch` and the nodes of `aeration_basin_graph`,
+# on magnitudes in m^3/day, mg/L (g/m^3), days and °C; mass rates in g/day.
+
+def _check_design_inputs(q, srt, x, x_r=None):
+    if np.any(srt <= 0) or np.any(q <= 0) or np.any(x <= 0):
+        raise ValueError("flow_rate, solids_retention_time and mlss must be greater than zero")
+    if x_r is not None and np.any(x_r <= x):
+        raise ValueError("return_sludge_concentration must be greater than mlss")
+
+
+def _kinetic_rates(t, params: dict):
+    """Substrate utilization rate k and decay rate kd (1/day) at `t` °C."""
+    k = (as_magnitude_array(params["max_substrate_utilization_rate"], ureg.day ** -1)
+         * params["k_temperature_coefficient"] ** (t - 20))
+    kd = (as_magnitude_array(params["decay_coefficient"], ureg.day ** -1)
+          * params["kd_temperature_coefficient"] ** (t - 20))
+    return k, kd
+
+
+def _effluent_bod(s0, srt, k, kd, params: dict):
+    """Effluent soluble BOD and washout flags; below the minimum SRT the biomass washes out (S = S0)."""
+    ks = as_magnitude_array(params["half_velocity_constant"], _CONCENTRATION_UNIT)
+    growth = srt * (params["yield_coefficient"] * k - kd) - 1
+    with np.errstate(divide="ignore", invalid="ignore"):
+        s = np.where(growth > 0, ks * (1 + kd * srt) / growth, s0)
+    return np.minimum(s, s0), s >= s0
+
+
+def _biomass_production(q, s0, s, srt, kd, params: dict):
+    heterotrophs = params["yield_coefficient"] * q * (s0 - s) / (1 + kd * srt)
+    return heterotrophs * (1 + params["debris_fraction"] * kd * srt)
+
+
+def _oxygen_demand(q, s0, s, biomass, tkn=None, effluent_nh4=None):
+    oxygen = q * (s0 - s) / BOD5_TO_BODU_RATIO - OXYGEN_PER_BIOMASS * biomass
+    if tkn is not None:
+        nitrified = np.maximum(q * (tkn - effluent_nh4) - NITROGEN_IN_BIOMASS * biomass, 0)
+        oxygen = oxygen + OXYGEN_PER_NITRATE * nitrified
+    return oxygen
+
+
+@instrumented
+def calculate_design_batch(
+        flow_rate: ArrayLike,
+        influent_bod: ArrayLike,
+        solids_retention_time: ArrayLike,
+        mlss: ArrayLike = 3000.0,
+        temperature: ArrayLike = 20.0,
+        return_sludge_concentration: ArrayLike = 8000.0,
+        vss_to_tss_ratio: ArrayLike = 0.8,
+        influent_inert_tss: ArrayLike = 0.0,
+        influent_tkn: Optional[ArrayLike] = None,
+        effluent_ammonia: ArrayLike = 1.0,
+        kinetics: Optional[dict] = None,
+) -> dict[str, pint.Quantity]:
+    """Vectorized steady-state design of many aeration basins at once.
+
+    Inputs are broadcast against each other (struct of arrays). Plain numbers
+    and arrays are read in m^3/day, mg/L, days and °C.
+
+    Args:
+        flow_rate: Influent flow.
+        influent_bod: Influent (settled) BOD5.
+        solids_retention_time: Design SRT (sludge age).
+        mlss: Design mixed liquor suspended solids.
+        temperature: Mixed liquor temperature.
+        return_sludge_concentration: Solids concentration of the return sludge.
+        vss_to_tss_ratio: Volatile fraction of the biological solids.
+        influent_inert_tss: Nonbiodegradable and inorganic influent solids,
+            accumulating in the sludge.
+        influent_tkn: Influent TKN; when given, the basin is assumed to nitrify
+            down to `effluent_ammonia` and the nitrification oxygen is included.
+        effluent_ammonia: Effluent ammonia of a nitrifying basin.
+        kinetics: Overrides of `ACTIVATED_SLUDGE_KINETICS`.
+
+    Returns:
+        A dict of array-valued quantities: effluent soluble BOD, biomass and total
+        sludge production, volume, hydraulic retention time, F/M ratio, volumetric
+        loading, oxygen demand, return ratio, waste sludge flow, the clarifier feed
+        ("flow_rate", "mlss", "return_ratio"), and the boolean "washout",
+        "f_m_ratio_in_range", "mlss_in_range" and "srt_in_range".
+    """
+    params = dict(ACTIVATED_SLUDGE_KINETICS)
+    if kinetics:
+        unknown = set(kinetics) - set(params)
+        if unknown:
+            raise ValueError(f"Unknown kinetic parameters: {sorted(unknown)}")
+        params.update(kinetics)
+
+    q = as_magnitude_array(flow_rate, _FLOW_UNIT)
+    s0 = as_magnitude_array(influent_bod, _CONCENTRATION_UNIT)
+    srt = as_magnitude_array(solids_retention_time, ureg.day)
+    x = as_magnitude_array(mlss, _CONCENTRATION_UNIT)
+    x_r = as_magnitude_array(return_sludge_concentration, _CONCENTRATION_UNIT)
+    t = as_magnitude_array(temperature, ureg.degC)
+    vss_ratio = as_magnitude_array(vss_to_tss_ratio, ureg.dimensionless)
+    inert = as_magnitude_array(influent_inert_tss, _CONCENTRATION_UNIT)
+    _check_design_inputs(q, srt, x, x_r)
+
+    k, kd = _kinetic_rates(t, params)
+    s, washout = _effluent_bod(s0, srt, k, kd, params)
+
+    # Mass rates in g/day (mg/L * m^3/day)
+    biomass = _biomass_production(q, s0, s, srt, kd, params)
+    sludge = biomass / vss_ratio + q * inert
+    volume = sludge * srt / x
+    hrt = volume / q
+    mlvss = x * vss_ratio
+    with np.errstate(divide="ignore"):  # No volume at washout
+        f_m = q * s0 / (volume * mlvss)
+        loading = q * s0 / volume / 1000
+    if influent_tkn is None:
+        oxygen = _oxygen_demand(q, s0, s, biomass)
+    else:
+        oxygen = _oxygen_demand(q, s0, s, biomass, as_magnitude_array(influent_tkn, _CONCENTRATION_UNIT),
+                                as_magnitude_array(effluent_ammonia, _CONCENTRATION_UNIT))
+    return_ratio = x / (x_r - x)
+    # Wasted from the return line, neglecting the effluent solids
+    waste_flow = volume * x / (srt * x_r)
+
+    f_m_range = as_magnitude_array(ACTIVATED_SLUDGE_F_M_RATIO_RANGE, ureg.day ** -1)
+    mlss_range = as_magnitude_array(ACTIVATED_SLUDGE_MLSS_RANGE, _CONCENTRATION_UNIT)
+    srt_range = as_magnitude_array(ACTIVATED_SLUDGE_SRT_RANGE, ureg.day)
+    shape = np.broadcast_shapes(*(np.shape(a) for a in (q, s0, srt, x, x_r, t, vss_ratio, inert, oxygen)))
+
+    def _quantity(values, units):
+        return ureg.Quantity(np.broadcast_to(values, shape).astype(float), units)
+
+    def _flag(values):
+        return np.broadcast_to(values, shape).copy()
+
+    return {
+        "effluent_soluble_bod": _quantity(s, _CONCENTRATION_UNIT),
+        "biomass_production": _quantity(biomass / 1000, ureg.kg / ureg.day),
+        "sludge_production": _quantity(sludge / 1000, ureg.kg / ureg.day),
+        "volume": _quantity(volume, ureg.meter ** 3),
+        "hydraulic_retention_time": _quantity(hrt * 24, ureg.hour),
+        "f_m_ratio": _quantity(f_m, ureg.day ** -1),
+        "volumetric_loading": _quantity(loading, ureg.kg / (ureg.meter ** 3 * ureg.day)),
+        "oxygen_demand": _quantity(oxygen / 1000, ureg.kg / ureg.day),
+        "waste_sludge_flow": _quantity(waste_flow, _FLOW_UNIT),
+        "flow_rate": _quantity(q, _FLOW_UNIT),
+        "mlss": _quantity(x, _CONCENTRATION_UNIT),
+        "return_ratio": _quantity(return_ratio, ureg.dimensionless),
+        "washout": _flag(washout),
+        "f_m_ratio_in_range": _flag((f_m >= f_m_range[0]) & (f_m <= f_m_range[1])),
+        "mlss_in_range": _flag((x >= mlss_range[0]) & (x <= mlss_range[1])),
+        "srt_in_range": _flag((srt >= srt_range[0]) & (srt <= srt_range[1])),
+    }
+
+
+class AerationBasin(BaseModel):
+    """Represents a complete-mix activated sludge aeration basin."""
+
+    flow_rate: pint.Quantity = Field(..., gt=0)
+    influent_bod: pint.Quantity = Field(..., gt=0)
+    solids_retention_time: pint.Quantity = Field(..., gt=0)
+    mlss: pint.Quantity = Field(3000 * _CONCENTRATION_UNIT, gt=0)
+    temperature: pint.Quantity = Field(ureg.Quantity(20, ureg.degC))
+    return_sludge_concentration: pint.Quantity = Field(8000 * _CONCENTRATION_UNIT, gt=0)
+    vss_to_tss_ratio: float = Field(0.8, gt=0, le=1)
+    influent_inert_tss: pint.Quantity = Field(0 * _CONCENTRATION_UNIT, ge=0)
+    # When given, the basin is designed to nitrify down to effluent_ammonia
+    influent_tkn: Optional[pint.Quantity] = Field(None, gt=0)
+    effluent_ammonia: pint.Quantity = Field(1 * _CONCENTRATION_UNIT, ge=0)
+
+    volume: Optional[pint.Quantity] = None
+    hydraulic_retention_time: Optional[pint.Quantity] = None
+    effluent_soluble_bod: Optional[pint.Quantity] = None
+    biomass_production: Optional[pint.Quantity] = None
+    sludge_production: Optional[pint.Quantity] = None
+    f_m_ratio: Optional[pint.Quantity] = None
+    volumetric_loading: Optional[pint.Quantity] = None
+    oxygen_demand: Optional[pint.Quantity] = None
+    return_ratio: Optional[pint.Quantity] = None
+    waste_sludge_flow: Optional[pint.Quantity] = None
+
+    @instrumented
+    def calculate_design(self):
+        """Calculates the steady-state design of the aeration basin (from its `design_graph`)."""
+        graph = self.design_graph()
+        for name in AERATION_BASIN_GRAPH_OUTPUTS:
+            setattr(self, name, graph[name])
+        low, high = ACTIVATED_SLUDGE_F_M_RATIO_RANGE
+        if not low <= self.f_m_ratio <= high:
+            logging.warning(f"F/M ratio {self.f_m_ratio:.2f} outside the typical range "
+                            f"{ACTIVATED_SLUDGE_F_M_RATIO_RANGE}")
+        return self
+
+    def design_graph(self) -> DependencyGraph:
+        """Dependency graph of the design, seeded with this basin's inputs."""
+        return aeration_basin_graph(**{name: getattr(self, name) for name in AERATION_BASIN_GRAPH_INPUTS})
+
+    class Config:
+        arbitrary_types_allowed = True  # Allow pint.Quantity
+
+
+AERATION_BASIN_GRAPH_INPUTS = (
+    "flow_rate", "influent_bod", "solids_retention_time", "mlss", "temperature", "return_sludge_concentration",
+    "vss_to_tss_ratio", "influent_inert_tss", "influent_tkn", "effluent_ammonia",
+)
+AERATION_BASIN_GRAPH_OUTPUTS = (
+    "volume", "hydraulic_retention_time", "effluent_soluble_bod", "biomass_production", "sludge_production",
+    "f_m_ratio", "volumetric_loading", "oxygen_demand", "return_ratio", "waste_sludge_flow",
+)
+
+
+def aeration_basin_graph(**inputs) -> DependencyGraph:
+    """The design of `AerationBasin.calculate_design` as a dependency graph.
+
+    The inputs are the basin's (see `AERATION_BASIN_GRAPH_INPUTS`), missing ones
+    take the model defaults. Every result (`AERATION_BASIN_GRAPH_OUTPUTS`) is a
+    node of the quantities it is computed from, with the kinetic rates at the
+    basin temperature ("substrate_utilization_rate", "decay_rate") in between,
+    so an edit only recomputes the results depending on it: a new return sludge
+    concentration, for instance, only the return ratio and the waste sludge flow.
+    """
+    unknown = set(inputs) - set(AERATION_BASIN_GRAPH_INPUTS)
+    if unknown:
+        raise ValueError(f"Unknown inputs: {sorted(unknown)}")
+    graph = DependencyGraph()
+    for name in AERATION_BASIN_GRAPH_INPUTS:
+        graph.add_input(name, inputs.get(name, AerationBasin.model_fields[name].default))
+    params = ACTIVATED_SLUDGE_KINETICS
+    per_day = ureg.day ** -1
+
+    def flow(value):
+        return as_magnitude_array(value, _FLOW_UNIT)
+
+    def concentration(value):
+        return as_magnitude_array(value, _CONCENTRATION_UNIT)
+
+    def days(value):
+        return as_magnitude_array(value, ureg.day)
+
+    def quantity(value, units):
+        return ureg.Quantity(float(value), units)
+
+    graph.add_node("substrate_utilization_rate", ["temperature"],
+                   lambda t: quantity(_kinetic_rates(as_magnitude_array(t, ureg.degC), params)[0], per_day))
+    graph.add_node("decay_rate", ["temperature"],
+                   lambda t: quantity(_kinetic_rates(as_magnitude_array(t, ureg.degC), params)[1], per_day))
+
+    @graph.node("effluent_soluble_bod", ["influent_bod", "solids_retention_time", "substrate_utilization_rate",
+                                         "decay_rate"])
+    def _effluent_soluble_bod(s0, srt, k, kd):
+        s, washout = _effluent_bod(concentration(s0), days(srt), k.m_as(per_day), kd.m_as(per_day), params)
+        if washout:
+            raise ValueError("The solids retention time is below the washout limit.")
+        return quantity(s, _CONCENTRATION_UNIT)
+
+    graph.add_node("biomass_production",
+                   ["flow_rate", "influent_bod", "effluent_soluble_bod", "solids_retention_time", "decay_rate"],
+                   lambda q, s0, s, srt, kd: quantity(_biomass_production(
+                       flow(q), concentration(s0), concentration(s), days(srt), kd.m_as(per_day), params) / 1000,
+                       _KG_PER_DAY))
+    graph.add_node("sludge_production", ["biomass_production", "vss_to_tss_ratio", "flow_rate", "influent_inert_tss"],
+                   lambda biomass, ratio, q, inert: quantity(
+                       biomass.m_as(_KG_PER_DAY) / as_magnitude_array(ratio, ureg.dimensionless)
+                       + flow(q) * concentration(inert) / 1000, _KG_PER_DAY))
+
+    @graph.node("volume", ["sludge_production", "solids_retention_time", "flow_rate", "mlss"])
+    def _volume(sludge, srt, q, x):
+        _check_design_inputs(flow(q), days(srt), concentration(x))
+        return quantity(sludge.m_as(_KG_PER_DAY) * 1000 * days(srt) / concentration(x), ureg.meter ** 3)
+
+    graph.add_node("hydraulic_retention_time", ["volume", "flow_rate"],
+                   lambda volume, q: quantity(volume.m_as(ureg.meter ** 3) / flow(q) * 24, ureg.hour))
+    graph.add_node("f_m_ratio", ["flow_rate", "influent_bod", "volume", "mlss", "vss_to_tss_ratio"],
+                   lambda q, s0, volume, x, ratio: quantity(
+                       flow(q) * concentration(s0) / (volume.m_as(ureg.meter ** 3) * concentration(x)
+                                                      * as_magnitude_array(ratio, ureg.dimensionless)), per_day))
+    graph.add_node("volumetric_loading", ["flow_rate", "influent_bod", "volume"],
+                   lambda q, s0, volume: quantity(flow(q) * concentration(s0) / volume.m_as(ureg.meter ** 3) / 1000,
+                                                  ureg.kg / (ureg.meter ** 3 * ureg.day)))
+
+    @graph.node("oxygen_demand", ["flow_rate", "influent_bod", "effluent_soluble_bod", "biomass_production",
+                                  "influent_tkn", "effluent_ammonia"])
+    def _oxygen(q, s0, s, biomass, tkn, effluent_nh4):
+        nitrogen = () if tkn is None else (concentration(tkn), concentration(effluent_nh4))
+        return quantity(_oxygen_demand(flow(q), concentration(s0), concentration(s),
+                                       biomass.m_as(_KG_PER_DAY) * 1000, *nitrogen) / 1000, _KG_PER_DAY)
+
+    @graph.node("return_ratio", ["mlss", "return_sludge_concentration"])
+    def _return_ratio(x, x_r):
+        x, x_r = concentration(x), concentration(x_r)
+        if x_r <= x:
+            raise ValueError("return_sludge_concentration must be greater than mlss")
+        return quantity(x / (x_r - x), ureg.dimensionless)
+
+    # Wasted from the return line, neglecting the effluent solids
+    graph.add_node("waste_sludge_flow", ["volume", "mlss", "solids_retention_time", "return_sludge_concentration"],
+                   lambda volume, x, srt, x_r: quantity(
+                       volume.m_as(ureg.meter ** 3) * concentration(x) / (days(srt) * concentration(x_r)), _FLOW_UNIT))
+    return graph
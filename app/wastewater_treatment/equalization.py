@@ -0,0 +1,188 @@
+import logging
+from typing import Iterable, Optional, Union
+
+import numpy as np
+import pint
+
+from app.helpers import as_magnitude_array
+from app.units import ureg
+
+# Flow equalization basin sizing.
+# Flow equalization is a method of damping the variations in flow rates, so
+# that the unit processes receive nearly constant flow rates (Metcalf and Eddy, 2003).
+#
+# 1. Mass diagram: the storage needed to deliver a constant outflow is the spread
+#    (max - min) of the cumulative inflow minus the cumulative outflow volume.
+# 2. Peak attenuation: with the outflow capped at Q_cap, the stored volume follows
+#    the Lindley recursion S_t = max(0, S_t-1 + (Q_t - Q_cap) dt), which has the
+#    closed form S_t = X_t + max(S_0, -min(0, min_{s<=t} X_s)) with X the cumulative
+#    sum of (Q - Q_cap) dt. Evaluating it for a grid of caps gives the basin volume
+#    needed for every damped peak flow.
+#
+# Every function accepts either a whole flow record (array) or an iterable of
+# flow chunks, in which case the record is streamed. When the average flow is
+# needed first, a streamed source must be re-iterable (e.g. a list of files or a
+# class with __iter__), since it is read twice.
+
+_FLOW_UNIT = ureg.meter ** 3 / ureg.day
+FlowSource = Union[np.ndarray, pint.Quantity, Iterable[Union[np.ndarray, pint.Quantity]]]
+
+
+def _iter_flow_chunks(flow: FlowSource):
+    if isinstance(flow, (np.ndarray, pint.Quantity)):
+        yield as_magnitude_array(flow, _FLOW_UNIT).ravel()
+    else:
+        for chunk in flow:
+            yield as_magnitude_array(chunk, _FLOW_UNIT).ravel()
+
+
+def _check_reiterable(flow: FlowSource):
+    if not isinstance(flow, (np.ndarray, pint.Quantity)) and iter(flow) is flow:
+        raise ValueError("A one-shot iterator can only be read once: provide the outflow rate "
+                         "or a re-iterable source.")
+
+
+def flow_statistics(flow: FlowSource) -> dict[str, pint.Quantity]:
+    """Average, minimum and peak flow of a record, in one streaming pass."""
+    count, total, minimum, peak = 0, 0.0, np.inf, -np.inf
+    for chunk in _iter_flow_chunks(flow):
+        if chunk.size == 0:
+            continue
+        if np.any(chunk < 0):
+            raise ValueError("flow must not be negative")
+        count += chunk.size
+        total += float(chunk.sum())
+        minimum = min(minimum, float(chunk.min()))
+        peak = max(peak, float(chunk.max()))
+    if count == 0:
+        raise ValueError("The flow record is empty")
+    return {
+        "average_flow": total / count * _FLOW_UNIT,
+        "minimum_flow": minimum * _FLOW_UNIT,
+        "peak_flow": peak * _FLOW_UNIT,
+        "samples": count,
+    }
+
+
+def equalization_volume(flow: FlowSource,
+                        time_step: pint.Quantity = 1 * ureg.minute,
+                        outflow_rate: Optional[pint.Quantity] = None) -> pint.Quantity:
+    """Required equalization storage by the cumulative-volume (mass diagram) method.
+
+    Args:
+        flow: Inflow record in m^3/day (array, quantity or iterable of chunks).
+        time_step: Duration of one record.
+        outflow_rate: Constant outflow rate. Defaults to the average inflow.
+
+    Returns:
+        The storage volume in m^3 (without any safety allowance).
+    """
+    if outflow_rate is None:
+        _check_reiterable(flow)
+        outflow_rate = flow_statistics(flow)["average_flow"]
+    q_out = float(as_magnitude_array(outflow_rate, _FLOW_UNIT))
+    step_days = float(as_magnitude_array(time_step, ureg.day))
+
+    # Running deviation between cumulative inflow and outflow, starting at zero
+    deviation, highest, lowest = 0.0, 0.0, 0.0
+    for chunk in _iter_flow_chunks(flow):
+        if chunk.size == 0:
+            continue
+        cumulative = deviation + np.cumsum((chunk - q_out) * step_days)
+        highest = max(highest, float(cumulative.max()))
+        lowest = min(lowest, float(cumulative.min()))
+        deviation = float(cumulative[-1])
+    return (highest - lowest) * ureg.meter ** 3
+
+
+def _capped_storage_chunk(flow: np.ndarray, caps: np.ndarray, storage: np.ndarray, step_days: float):
+    """Advances the Lindley recursion for every cap over one chunk.
+
+    Returns the storage at the end of the chunk and the peak storage within it.
+    """
+    cumulative = np.cumsum((flow[None, :] - caps[:, None]) * step_days, axis=1)
+    running_min = np.minimum(np.minimum.accumulate(cumulative, axis=1), 0)
+    stored = cumulative + np.maximum(storage[:, None], -running_min)
+    return stored[:, -1], stored.max(axis=1)
+
+
+def attenuation_sweep(flow: FlowSource,
+                      time_step: pint.Quantity = 1 * ureg.minute,
+                      n_points: int = 50,
+                      peak_flows: Optional[pint.Quantity] = None,
+                      max_cells: int = 2 ** 22) -> dict[str, pint.Quantity]:
+    """Sweeps basin volume against the damped peak flow.
+
+    Args:
+        flow: Inflow record in m^3/day (array, quantity or iterable of chunks).
+        time_step: Duration of one record.
+        n_points: Number of capped peak flows between the average and the peak inflow.
+        peak_flows: Explicit capped peak flows, instead of the default grid.
+        max_cells: Bound on n_points * chunk length held in memory at once.
+
+    Returns:
+        A dict with "peak_flow" (the damped peak flows), "volume" (the basin
+        volume needed for each), "attenuation" (fractional reduction of the
+        peak inflow), "peaking_factor" (damped peak over average flow),
+        and the scalar "average_flow" and "inflow_peak".
+    """
+    _check_reiterable(flow)
+    stats = flow_statistics(flow)
+    average = stats["average_flow"].magnitude
+    inflow_peak = stats["peak_flow"].magnitude
+    if peak_flows is None:
+        caps = np.linspace(average, inflow_peak, n_points)
+    else:
+        caps = np.sort(as_magnitude_array(peak_flows, _FLOW_UNIT).ravel())
+    step_days = float(as_magnitude_array(time_step, ureg.day))
+
+    storage = np.zeros(len(caps))
+    required = np.zeros(len(caps))
+    block = max(1, max_cells // max(1, len(caps)))
+    for chunk in _iter_flow_chunks(flow):
+        for start in range(0, chunk.size, block):
+            storage, chunk_peak = _capped_storage_chunk(chunk[start:start + block], caps, storage, step_days)
+            required = np.maximum(required, chunk_peak)
+
+    logging.debug(f"Equalization sweep over {stats['samples']} samples and {len(caps)} peak flows")
+    return {
+        "peak_flow": caps * _FLOW_UNIT,
+        "volume": required * ureg.meter ** 3,
+        "attenuation": (1 - caps / inflow_peak) * ureg.dimensionless,
+        "peaking_factor": caps / average * ureg.dimensionless,
+        "average_flow": average * _FLOW_UNIT,
+        "inflow_peak": inflow_peak * _FLOW_UNIT,
+    }
+
+
+def damped_peak_flow(sweep: dict[str, pint.Quantity], volume: pint.Quantity) -> pint.Quantity:
+    """Interpolates the damped peak flow a basin of `volume` achieves.
+
+    Args:
+        sweep: Result of `attenuation_sweep`.
+        volume: Basin volume.
+
+    Returns:
+        The damped peak flow in m^3/day.
+    """
+    caps = sweep["peak_flow"].to(_FLOW_UNIT).magnitude
+    required = sweep["volume"].to(ureg.meter ** 3).magnitude
+    v = as_magnitude_array(volume, ureg.meter ** 3)
+    # The required volume decreases with the cap: interpolate on reversed arrays
+    return np.interp(v, required[::-1], caps[::-1]) * _FLOW_UNIT
+
+
+def equalized_design_flows(sweep: dict[str, pint.Quantity], volume: pint.Quantity) -> dict[str, pint.Quantity]:
+    """Design flows seen by the downstream clarifier behind a basin of `volume`.
+
+    Returns:
+        "average_flow_rate", "peak_flow_rate" and "peaking_factor", ready to be
+        passed to `SedimentationTank`.
+    """
+    peak = damped_peak_flow(sweep, volume)
+    average = sweep["average_flow"].to(_FLOW_UNIT)
+    return {
+        "average_flow_rate": average,
+        "peak_flow_rate": peak,
+        "peaking_factor": (peak / average).to(ureg.dimensionless),
+    }
@@ -0,0 +1,363 @@
+import copy
+import logging
+from typing import Iterable, Optional, Union
+
+import numpy as np
+import pint
+from numpy.lib.stride_tricks import sliding_window_view
+
+from app.helpers import as_magnitude_array
+from app.units import ureg
+
+# Streaming flow record analysis: design flows and peaking factor from raw
+# (e.g. SCADA) flow data, in one pass and bounded memory.
+#
+# Records arrive in chunks, either with a time column (datetime64, sorted) or
+# at a fixed time step. Each chunk is resampled to every requested interval
+# (hourly, daily, ...) with NumPy group reductions; the last, possibly partial
+# interval is carried over to the next chunk. Completed intervals update
+# running statistics: peak and minimum interval means, rolling means over
+# several consecutive intervals (e.g. the maximum 3-day flow) and a quantile
+# sketch. Only the resampled series are kept, never the raw records, so years
+# of 1-second data fit in memory.
+#
+# Percentiles come from a logarithmic-bucket sketch (as in DDSketch): every
+# positive value is counted in the bucket ceil(log_gamma(x)), with
+# gamma = (1 + a) / (1 - a), so each percentile is within the relative
+# accuracy `a` of the exact one, whatever the length of the record.
+#
+# The peaking factor is the ratio of the peak hourly flow to the average flow
+# (Metcalf and Eddy, 2003); `design_flows` returns it with the average and
+# peak flow rates, ready to be passed to `SedimentationTank`.
+
+_FLOW_UNIT = ureg.meter ** 3 / ureg.day
+DEFAULT_INTERVALS = {"hourly": 1 * ureg.hour, "daily": 1 * ureg.day}
+DEFAULT_PERCENTILES = (5, 10, 50, 90, 95, 99)
+FlowChunk = Union[dict, np.ndarray, pint.Quantity]
+
+
+def _nanoseconds(duration: pint.Quantity) -> int:
+    value = int(round(float(as_magnitude_array(duration, ureg.second)) * 1e9))
+    if value <= 0:
+        raise ValueError("Durations must be greater than zero")
+    return value
+
+
+class QuantileSketch:
+    """Mergeable quantile sketch with a bounded relative error.
+
+    Args:
+        relative_accuracy: Relative error bound of the returned quantiles.
+    """
+
+    def __init__(self, relative_accuracy: float = 0.005):
+        if not 0 < relative_accuracy < 1:
+            raise ValueError("relative_accuracy must be between 0 and 1")
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = np.log(self.gamma)
+        self._offset = 0  # Bucket index of counts[0]
+        self.counts = np.zeros(0, dtype=np.int64)
+        self.zeros = 0
+
+    @property
+    def count(self) -> int:
+        return int(self.counts.sum()) + self.zeros
+
+    def add(self, values: np.ndarray):
+        values = np.asarray(values, dtype=float).ravel()
+        positive = values[values > 0]
+        self.zeros += values.size - positive.size
+        if positive.size == 0:
+            return
+        indices = np.ceil(np.log(positive) / self._log_gamma).astype(np.int64)
+        self._grow(int(indices.min()), int(indices.max()))
+        self.counts += np.bincount(indices - self._offset, minlength=self.counts.size)
+
+    def _grow(self, low: int, high: int):
+        if self.counts.size == 0:
+            self._offset, self.counts = low, np.zeros(high - low + 1, dtype=np.int64)
+            return
+        start, stop = min(low, self._offset), max(high + 1, self._offset + self.counts.size)
+        if start < self._offset or stop > self._offset + self.counts.size:
+            counts = np.zeros(stop - start, dtype=np.int64)
+            counts[self._offset - start:self._offset - start + self.counts.size] = self.counts
+            self._offset, self.counts = start, counts
+
+    def merge(self, other: "QuantileSketch"):
+        if other.gamma != self.gamma:
+            raise ValueError("Sketches of different accuracies cannot be merged")
+        self.zeros += other.zeros
+        if other.counts.size:
+            self._grow(other._offset, other._offset + other.counts.size - 1)
+            start = other._offset - self._offset
+            self.counts[start:start + other.counts.size] += other.counts
+
+    def quantiles(self, q) -> np.ndarray:
+        """Values at the quantiles `q` (fractions between 0 and 1)."""
+        q = np.atleast_1d(np.asarray(q, dtype=float))
+        if self.count == 0:
+            return np.full(q.shape, np.nan)
+        ranks = q * (self.count - 1)
+        cumulative = self.zeros + np.cumsum(self.counts)
+        buckets = np.searchsorted(cumulative, ranks, side="right")
+        values = 2 * self.gamma ** (self._offset + np.minimum(buckets, self.counts.size - 1)) / (self.gamma + 1)
+        return np.where(ranks < self.zeros, 0.0, values)
+
+
+class _Resampler:
+    """One-pass resampling to a fixed interval with running statistics of the interval means."""
+
+    def __init__(self, width: int, windows: tuple[int, ...], keep_series: bool, relative_accuracy: float):
+        self.width = width
+        self.windows = windows
+        self.keep_series = keep_series
+        self.partial = None  # (key, sum, count, min, max) of the interval still receiving records
+        self.series: list[tuple[np.ndarray, ...]] = []
+        self.intervals = 0
+        self.peak = (-np.inf, None)
+        self.minimum = (np.inf, None)
+        self.sketch = QuantileSketch(relative_accuracy)
+        # Last means before the current batch, for windows spanning batches
+        self._tail = (np.empty(0, dtype=np.int64), np.empty(0))
+        self.rolling_peak = {window: (-np.inf, None) for window in windows}
+
+    def add(self, times: np.ndarray, flow: np.ndarray):
+        keys = times // self.width
+        starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+        groups = (keys[starts], np.add.reduceat(flow, starts), np.diff(np.r_[starts, len(keys)]),
+                  np.minimum.reduceat(flow, starts), np.maximum.reduceat(flow, starts))
+        if self.partial is not None:
+            key, total, count, low, high = self.partial
+            if groups[0][0] == key:
+                groups[1][0] += total
+                groups[2][0] += count
+                groups[3][0] = min(groups[3][0], low)
+                groups[4][0] = max(groups[4][0], high)
+            else:
+                groups = tuple(np.r_[[value], column] for value, column in zip(self.partial, groups))
+        self.partial = tuple(column[-1] for column in groups)
+        if len(groups[0]) > 1:
+            self._complete(tuple(column[:-1] for column in groups))
+
+    def finish(self):
+        if self.partial is not None:
+            self._complete(tuple(np.array([value]) for value in self.partial))
+            self.partial = None
+
+    def _complete(self, groups: tuple[np.ndarray, ...]):
+        keys, totals, counts, lows, highs = groups
+        means = totals / counts
+        self.intervals += len(keys)
+        self.sketch.add(means)
+        if self.keep_series:
+            self.series.append((keys, means, lows, highs, counts))
+        top, bottom = int(np.argmax(means)), int(np.argmin(means))
+        if means[top] > self.peak[0]:
+            self.peak = (float(means[top]), int(keys[top]))
+        if means[bottom] < self.minimum[0]:
+            self.minimum = (float(means[bottom]), int(keys[bottom]))
+
+        # Rolling means over consecutive intervals; windows spanning a gap are skipped
+        keys = np.r_[self._tail[0], keys]
+        means = np.r_[self._tail[1], means]
+        for window in self.windows:
+            if len(keys) < window:
+                continue
+            rolling = sliding_window_view(means, window).mean(axis=1)
+            contiguous = keys[window - 1:] - keys[:len(keys) - window + 1] == window - 1
+            if np.any(contiguous):
+                best = int(np.argmax(np.where(contiguous, rolling, -np.inf)))
+                if rolling[best] > self.rolling_peak[window][0]:
+                    self.rolling_peak[window] = (float(rolling[best]), int(keys[best]))
+        keep = max(self.windows, default=1) - 1
+        self._tail = (keys[len(keys) - keep:], means[len(means) - keep:]) if keep else self._tail
+
+
+class FlowAnalyzer:
+    """Streaming resampling and statistics of a flow record.
+
+    Args:
+        intervals: Resampling intervals by name, e.g. {"hourly": 1 * ureg.hour}.
+        rolling_windows: Numbers of consecutive intervals whose mean flow is
+            tracked, per interval name, e.g. {"daily": (3, 7)}.
+        time_step: Duration of one record, for chunks without a time column.
+        start: Time of the first record, for chunks without a time column.
+        keep_series: Keep the resampled series (not the raw records).
+        relative_accuracy: Relative accuracy of the percentiles.
+        flow_column: Key of the flows in dict chunks.
+        time_column: Key of the record times in dict chunks.
+    """
+
+    def __init__(self, intervals: Optional[dict[str, pint.Quantity]] = None,
+                 rolling_windows: Optional[dict[str, Iterable[int]]] = None,
+                 time_step: Optional[pint.Quantity] = None,
+                 start: Union[str, np.datetime64] = "1970-01-01",
+                 keep_series: bool = True,
+                 relative_accuracy: float = 0.005,
+                 flow_column: str = "flow",
+                 time_column: str = "time"):
+        self.flow_column = flow_column
+        self.time_column = time_column
+        self.intervals = dict(DEFAULT_INTERVALS if intervals is None else intervals)
+        rolling_windows = rolling_windows or {}
+        unknown = set(rolling_windows) - set(self.intervals)
+        if unknown:
+            raise ValueError(f"Rolling windows of unknown intervals: {sorted(unknown)}")
+        self._resamplers = {
+            name: _Resampler(_nanoseconds(interval), tuple(int(w) for w in rolling_windows.get(name, ())),
+                             keep_series, relative_accuracy)
+            for name, interval in self.intervals.items()
+        }
+        self._step = None if time_step is None else _nanoseconds(time_step)
+        self._next_time = int(np.datetime64(start, "ns").astype(np.int64))
+        self._last_time = None
+        self.samples = 0
+        self.missing = 0
+        self._mean = 0.0
+        self._m2 = 0.0  # Sum of squared deviations (Chan et al. parallel update)
+        self.minimum = np.inf
+        self.peak = -np.inf
+        self.sketch = QuantileSketch(relative_accuracy)
+
+    def update(self, flow: FlowChunk, time: Optional[np.ndarray] = None):
+        """Adds a chunk of records.
+
+        Args:
+            flow: Flows in m^3/day (array or quantity), or a dict with flow
+                and optionally time arrays (e.g. a `ColumnarDataset` chunk).
+            time: Record times (datetime64), sorted. Without them, the records
+                are `time_step` apart.
+        """
+        if isinstance(flow, dict):
+            time = flow.get(self.time_column, time)
+            flow = flow[self.flow_column]
+        flow = as_magnitude_array(flow, _FLOW_UNIT).ravel()
+        if time is None:
+            if self._step is None:
+                raise ValueError("Either record times or a time_step is needed")
+            times = self._next_time + self._step * np.arange(flow.size, dtype=np.int64)
+            self._next_time += self._step * flow.size
+        else:
+            time = np.asarray(time)
+            if time.shape != flow.shape:
+                raise ValueError("time and flow must have the same length")
+            valid_time = ~np.isnat(time)
+            times = time.astype("datetime64[ns]").view(np.int64)
+            flow = np.where(valid_time, flow, np.nan)
+        valid = ~np.isnan(flow)
+        self.missing += int(flow.size - valid.sum())
+        times, flow = times[valid], flow[valid]
+        if flow.size == 0:
+            return
+        if np.any(flow < 0):
+            raise ValueError("flow must not be negative")
+        if np.any(np.diff(times) < 0) or (self._last_time is not None and times[0] < self._last_time):
+            raise ValueError("Records must be sorted by time")
+        self._last_time = int(times[-1])
+
+        count, mean = flow.size, float(flow.mean())
+        total = self.samples + count
+        delta = mean - self._mean
+        self._m2 += float(((flow - mean) ** 2).sum()) + delta ** 2 * self.samples * count / total
+        self._mean += delta * count / total
+        self.samples = total
+        self.minimum = min(self.minimum, float(flow.min()))
+        self.peak = max(self.peak, float(flow.max()))
+        self.sketch.add(flow)
+        for resampler in self._resamplers.values():
+            resampler.add(times, flow)
+
+    def result(self, percentiles: Iterable[float] = DEFAULT_PERCENTILES) -> dict:
+        """Statistics of the records added so far.
+
+        Returns:
+            A dict with "samples", "missing", the raw "average_flow",
+            "std_flow", "minimum_flow", "peak_flow" and "percentiles" (by
+            percent), and, per interval name, a dict with "intervals", "peak_flow",
+            "peak_time", "minimum_flow", "minimum_time", "percentiles",
+            "rolling_peak" (by window length) and, when kept, the resampled
+            "time", "mean", "min", "max" and "count" series.
+        """
+        if self.samples == 0:
+            raise ValueError("The flow record is empty")
+        percentiles = tuple(percentiles)
+        fractions = np.asarray(percentiles, dtype=float) / 100
+
+        def to_time(key, width):
+            return None if key is None else np.datetime64(int(key) * width, "ns")
+
+        result = {
+            "samples": self.samples,
+            "missing": self.missing,
+            "average_flow": self._mean * _FLOW_UNIT,
+            "std_flow": np.sqrt(self._m2 / self.samples) * _FLOW_UNIT,
+            "minimum_flow": self.minimum * _FLOW_UNIT,
+            "peak_flow": self.peak * _FLOW_UNIT,
+            "percentiles": dict(zip(percentiles, self.sketch.quantiles(fractions) * _FLOW_UNIT)),
+        }
+        for name, resampler in self._resamplers.items():
+            # Flush a copy, so more chunks can still be added afterwards
+            resampler = copy.deepcopy(resampler)
+            resampler.finish()
+            stats = {
+                "intervals": resampler.intervals,
+                "peak_flow": resampler.peak[0] * _FLOW_UNIT,
+                "peak_time": to_time(resampler.peak[1], resampler.width),
+                "minimum_flow": resampler.minimum[0] * _FLOW_UNIT,
+                "minimum_time": to_time(resampler.minimum[1], resampler.width),
+                "percentiles": dict(zip(percentiles, resampler.sketch.quantiles(fractions) * _FLOW_UNIT)),
+                "rolling_peak": {window: (value * _FLOW_UNIT, to_time(key, resampler.width))
+                                 for window, (value, key) in resampler.rolling_peak.items() if key is not None},
+            }
+            if resampler.keep_series:
+                keys, means, lows, highs, counts = (np.concatenate(column) for column in zip(*resampler.series))
+                stats.update(time=(keys * resampler.width).astype("datetime64[ns]"), mean=means * _FLOW_UNIT,
+                             min=lows * _FLOW_UNIT, max=highs * _FLOW_UNIT, count=counts)
+            result[name] = stats
+        return result
+
+
+def analyze_flow(chunks: Iterable[FlowChunk], **options) -> dict:
+    """Streams flow chunks through a `FlowAnalyzer` and returns its result.
+
+    Args:
+        chunks: Flow arrays, or dicts with "flow" (and "time") arrays such as
+            `ColumnarDataset.iter_chunks()`. A single array is one chunk.
+        **options: `FlowAnalyzer` arguments, plus "percentiles".
+
+    Returns:
+        See `FlowAnalyzer.result`.
+    """
+    percentiles = options.pop("percentiles", DEFAULT_PERCENTILES)
+    analyzer = FlowAnalyzer(**options)
+    if isinstance(chunks, (np.ndarray, pint.Quantity, dict)):
+        chunks = [chunks]
+    for chunk in chunks:
+        analyzer.update(chunk)
+    logging.debug(f"Analyzed {analyzer.samples} flow records")
+    return analyzer.result(percentiles)
+
+
+def design_flows(analysis: dict, peak_interval: str = "hourly") -> dict[str, pint.Quantity]:
+    """Design flows of a record analyzed by `analyze_flow`.
+
+    Args:
+        analysis: Result of `analyze_flow` or `FlowAnalyzer.result`.
+        peak_interval: Interval whose peak mean flow is the design peak flow.
+
+    Returns:
+        "flow_rate" and "average_flow_rate" (the average flow), "peak_flow_rate"
+        and "peaking_factor" (peak over average flow), ready to be passed to
+        `SedimentationTank`.
+    """
+    if peak_interval not in analysis:
+        raise KeyError(f"The analysis has no {peak_interval!r} interval")
+    average = analysis["average_flow"].to(_FLOW_UNIT)
+    peak = analysis[peak_interval]["peak_flow"].to(_FLOW_UNIT)
+    return {
+        "flow_rate": average,
+        "average_flow_rate": average,
+        "peak_flow_rate": peak,
+        "peaking_factor": (peak / average).to(ureg.dimensionless),
+    }
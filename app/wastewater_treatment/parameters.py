@@ -1,11 +1,16 @@
 import logging
 
+import numpy as np
 import pint
 from typing import Union, Optional
 from app.constants import (get_water_dynamic_viscosity,
                            get_water_density,
+                           get_water_dynamic_viscosity_array,
+                           get_water_density_array,
                            _gravity,
                            )
+from app.helpers import as_magnitude_array
+from app.instrumentation import count, instrumented
 
 from app.units import (
     DEFAULT_TEMPERATURE_UNIT,
@@ -14,6 +19,7 @@ from app.units import (
 
 
 
+@instrumented
 def terminal_settling_velocity(
         particle_diameter: pint.Quantity,
         particle_density: pint.Quantity,
@@ -105,7 +111,7 @@ def terminal_settling_velocity(
     v_t = v_stokes  # Initial guess
 
     # 2. Iteration Loop
-    for _ in range(max_iterations):
+    for iteration in range(1, max_iterations + 1):
         reynolds_number = find_reynolds_number(
             v_t, particle_diameter, water_dyn_viscosity, water_density, shape_factor
         )
@@ -113,6 +119,7 @@ def terminal_settling_velocity(
         # Calculate drag coefficient based on Reynolds number
         if reynolds_number < 1:
             v_t_new = v_stokes  # Keep stokes velocity
+            count("settling.iterations", iteration)
             return v_t_new.to(ureg.m / ureg.s)
         elif 1 <= reynolds_number <= 10 ** 3:
             drag_coefficient = 24 / reynolds_number + 3 / reynolds_number ** 0.5 + 0.34
@@ -129,6 +136,7 @@ def terminal_settling_velocity(
         relative_difference = abs(v_t_new - v_t) / abs(v_t)  # Avoid division by zero
         if relative_difference < tolerance:
             logging.debug(f"Terminal velocity: {v_t_new.to(ureg.m / ureg.s)}")
+            count("settling.iterations", iteration)
             return v_t_new.to(ureg.m / ureg.s)
 
         v_t = v_t_new  # Update vt for the next iteration
@@ -139,6 +147,118 @@ def terminal_settling_velocity(
     )
 
 
+@instrumented
+def terminal_settling_velocity_batch(
+        particle_diameter: pint.Quantity,
+        particle_density: pint.Quantity,
+        water_density: Optional[pint.Quantity] = None,
+        gravity: pint.Quantity = _gravity,
+        water_dyn_viscosity: Optional[pint.Quantity] = None,
+        temperature: Union[float, np.ndarray, pint.Quantity] = 20,
+        shape_factor: Union[float, np.ndarray] = 1.0,
+        tolerance: float = 0.001,
+        max_iterations: int = 100,
+) -> pint.Quantity:
+    """Vectorized version of `terminal_settling_velocity`.
+
+    All arguments may be arrays (or array-valued quantities) and are broadcast
+    against each other. Every element goes through the same Stokes guess and
+    drag-coefficient iteration as the scalar function; elements drop out of the
+    iteration as soon as they converge.
+
+    Args:
+        particle_diameter: Particle diameters.
+        particle_density: Particle densities.
+        water_density: Water densities. Defaults to the density at `temperature`.
+        gravity: Acceleration due to gravity.
+        water_dyn_viscosity: Dynamic viscosities of water. Defaults to the
+            viscosity at `temperature`.
+        temperature: Temperatures, in Celsius if plain numbers.
+        shape_factor: Shape factors of the particles (dimensionless).
+        tolerance: Relative tolerance for convergence.
+        max_iterations: Maximum number of iterations.
+
+    Returns:
+        Terminal settling velocities in m/s, with the broadcast shape of the inputs.
+
+    Raises:
+        TypeError: If the particle properties are not pint quantities.
+        ValueError: If physically impossible values are provided or an element
+            does not converge.
+    """
+    if not isinstance(particle_diameter, pint.Quantity):
+        raise TypeError("particle_diameter must be a pint.Quantity")
+    if not isinstance(particle_density, pint.Quantity):
+        raise TypeError("particle_density must be a pint.Quantity")
+    if max_iterations <= 0:
+        raise ValueError("Max iteration must be greater than zero")
+    if not 0 < tolerance < 1:
+        raise ValueError("Tolerance must be between 0 and 1")
+
+    if water_density is None:
+        water_density = get_water_density_array(temperature)
+    if water_dyn_viscosity is None:
+        water_dyn_viscosity = get_water_dynamic_viscosity_array(temperature)
+
+    # Work on plain SI magnitudes, units are only re-attached to the result
+    d = as_magnitude_array(particle_diameter, ureg.meter)
+    rho_p = as_magnitude_array(particle_density, ureg.kg / ureg.meter ** 3)
+    rho_w = as_magnitude_array(water_density, ureg.kg / ureg.meter ** 3)
+    g = as_magnitude_array(gravity, ureg.meter / ureg.second ** 2)
+    mu = as_magnitude_array(water_dyn_viscosity, ureg.pascal * ureg.second)
+    sf = np.asarray(shape_factor, dtype=float)
+    d, rho_p, rho_w, g, mu, sf = np.broadcast_arrays(d, rho_p, rho_w, g, mu, sf)
+
+    # --- Input Value Validation ---
+    for name, values in (("particle_diameter", d), ("particle_density", rho_p),
+                         ("water_density", rho_w), ("gravity", g),
+                         ("water_dyn_viscosity", mu)):
+        if np.any(values <= 0):
+            raise ValueError(f"{name} must be greater than zero")
+    if np.any(rho_p <= rho_w):
+        raise ValueError("Particle density must be greater than water density for settling.")
+
+    v_stokes = g * (rho_p - rho_w) * d ** 2 / (18 * mu)
+    newton_numerator = 4 * g * d * (rho_p - rho_w) / (3 * rho_w)
+
+    result = np.full(d.shape, np.nan)
+    v_t = v_stokes.copy()
+    active = np.ones(d.shape, dtype=bool)
+
+    for iteration in range(1, max_iterations + 1):
+        reynolds_number = find_reynolds_number(v_t, d, mu, rho_w, sf)
+
+        # Laminar elements keep the Stokes velocity
+        laminar = active & (reynolds_number < 1)
+        result[laminar] = v_stokes[laminar]
+        active &= ~laminar
+        if not active.any():
+            break
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            drag_coefficient = np.where(
+                reynolds_number <= 10 ** 3,
+                24 / reynolds_number + 3 / reynolds_number ** 0.5 + 0.34,
+                0.4,
+            )
+            v_t_new = np.sqrt(newton_numerator / drag_coefficient)
+
+        converged = active & (np.abs(v_t_new - v_t) / np.abs(v_t) < tolerance)
+        result[converged] = v_t_new[converged]
+        active &= ~converged
+        if not active.any():
+            break
+
+        v_t = np.where(active, v_t_new, v_t)
+    else:
+        raise ValueError(
+            f"Settling velocity calculation did not converge within {max_iterations} iterations."
+        )
+
+    count("settling.batch_iterations", iteration)
+    return ureg.Quantity(result, ureg.m / ureg.s)
+
+
 def find_reynolds_number(velocity: pint.Quantity,
                          particle_diameter: pint.Quantity,
                          water_dyn_viscosity: pint.Quantity,
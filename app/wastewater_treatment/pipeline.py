@@ -0,0 +1,362 @@
+import logging
+from abc import ABC, abstractmethod
+import multiprocessing
+import queue
+import threading
+import time
+import traceback
+from typing import Callable, Iterable, Iterator, Literal, Optional
+
+import numpy as np
+import pint
+from pydantic import BaseModel, Field
+
+from app.constants import PRIMARY_CLARIFIER_OVERFLOW_RATE_RANGE
+from app.helpers import as_magnitude_array
+from app.units import ureg
+from app.wastewater_treatment.activated_sludge import AerationBasin, calculate_design_batch
+from app.wastewater_treatment.primary_treatment import SedimentationTank
+from app.wastewater_treatment.secondary_clarifier import LayeredSettler
+from app.wastewater_treatment.simulation import Chunk, clarifier_geometry, simulate_chunk
+
+# Plant process chains.
+# A plant is a sequence of stages; every stage consumes and produces columnar
+# chunks of the plant stream (the STREAM_COLUMNS, in m^3/day and mg/L, plus an
+# optional "time" column). A stage replaces the stream columns with its effluent
+# and adds its own diagnostics as "<stage name>.<column>", so the final chunks
+# carry the whole plant's results and a long record is simulated in one pass.
+#
+# Stages run one after the other in the calling thread ("serial"), or each in
+# its own thread or process connected by bounded queues ("thread", "process").
+# A full queue blocks the stage feeding it, which bounds memory (backpressure);
+# the time stages spend blocked is reported next to their processing time.
+
+STREAM_COLUMNS = ("flow", "tss", "bod", "tkn", "tp")
+
+_FLOW_UNIT = ureg.meter ** 3 / ureg.day
+_CONCENTRATION_UNIT = ureg.milligram / ureg.liter
+
+
+class StageTiming(BaseModel):
+    """Work done by one stage during a pipeline run."""
+
+    name: str
+    chunks: int = 0
+    rows: int = 0
+    processing_seconds: float = 0.0
+    # Time spent waiting for a full downstream queue (parallel modes only)
+    blocked_seconds: float = 0.0
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows / self.processing_seconds if self.processing_seconds > 0 else float("inf")
+
+
+class Stage(BaseModel, ABC):
+    """Base class of the pipeline stages; subclasses implement `process`."""
+
+    name: str
+
+    class Config:
+        arbitrary_types_allowed = True  # Allow pint.Quantity
+
+    @abstractmethod
+    def process(self, chunk: Chunk) -> Chunk:
+        """Returns the effluent chunk of an influent chunk."""
+
+    def _effluent(self, chunk: Chunk, stream: dict, diagnostics: dict) -> Chunk:
+        """Replaces the stream columns of `chunk` and adds the prefixed diagnostics."""
+        result = dict(chunk)
+        result.update(stream)
+        result.update({f"{self.name}.{column}": values for column, values in diagnostics.items()})
+        return result
+
+
+class FunctionStage(Stage):
+    """Wraps a function of a chunk. Use a module-level function in process mode."""
+
+    function: Callable[[Chunk], Chunk]
+
+    def process(self, chunk: Chunk) -> Chunk:
+        return self.function(chunk)
+
+
+class PrimaryClarifierStage(Stage):
+    """Primary clarifier removing TSS and BOD with the quasi-steady removal curves.
+
+    TKN and TP pass through unchanged.
+    """
+
+    name: str = "primary"
+    tank: Optional[SedimentationTank] = None
+    surface_area: Optional[pint.Quantity] = None
+    volume: Optional[pint.Quantity] = None
+    overflow_limit: pint.Quantity = PRIMARY_CLARIFIER_OVERFLOW_RATE_RANGE[1]
+
+    def process(self, chunk: Chunk) -> Chunk:
+        area, volume = clarifier_geometry(self.tank, self.surface_area, self.volume)
+        limit = float(as_magnitude_array(self.overflow_limit, ureg.meter / ureg.day))
+        effluent = simulate_chunk(chunk, area, volume, limit)
+        stream = {"tss": effluent["effluent_tss"], "bod": effluent["effluent_bod"]}
+        diagnostics = {column: effluent[column] for column in ("overflow_rate", "detention_time", "exceedance")}
+        return self._effluent(chunk, stream, diagnostics)
+
+
+class ActivatedSludgeStage(Stage):
+    """Aeration basin held at its design SRT and MLSS (quasi-steady).
+
+    The effluent is the mixed liquor sent to the secondary clarifier: the
+    influent plus the return flow, at the basin MLSS and effluent soluble BOD.
+    A nitrifying basin (designed with an influent TKN) leaves its effluent
+    ammonia as TKN; TP passes through unchanged.
+    """
+
+    name: str = "aeration"
+    basin: AerationBasin
+
+    def process(self, chunk: Chunk) -> Chunk:
+        basin = self.basin
+        if basin.volume is None:
+            raise ValueError("The aeration basin must be designed first (calculate_design).")
+        flow = as_magnitude_array(chunk["flow"], _FLOW_UNIT)
+        nitrifying = basin.influent_tkn is not None and "tkn" in chunk
+        steady = calculate_design_batch(
+            flow, chunk["bod"], basin.solids_retention_time,
+            mlss=basin.mlss,
+            temperature=basin.temperature,
+            return_sludge_concentration=basin.return_sludge_concentration,
+            vss_to_tss_ratio=basin.vss_to_tss_ratio,
+            influent_inert_tss=basin.influent_inert_tss,
+            influent_tkn=chunk["tkn"] if nitrifying else None,
+            effluent_ammonia=basin.effluent_ammonia,
+        )
+        mlss = float(as_magnitude_array(basin.mlss, _CONCENTRATION_UNIT))
+        ratio = float(basin.return_ratio.to(ureg.dimensionless).magnitude)
+        volume = float(as_magnitude_array(basin.volume, ureg.meter ** 3))
+        bod = as_magnitude_array(chunk["bod"], _CONCENTRATION_UNIT)
+
+        stream = {
+            "flow": flow * (1 + ratio),
+            "tss": np.full(len(flow), mlss),
+            "bod": steady["effluent_soluble_bod"].magnitude,
+        }
+        if nitrifying:
+            stream["tkn"] = np.minimum(as_magnitude_array(chunk["tkn"], _CONCENTRATION_UNIT),
+                                       float(as_magnitude_array(basin.effluent_ammonia, _CONCENTRATION_UNIT)))
+        diagnostics = {
+            "f_m_ratio": flow * bod / (volume * mlss * basin.vss_to_tss_ratio),
+            "oxygen_demand": steady["oxygen_demand"].magnitude,
+            "return_flow": flow * ratio,
+        }
+        return self._effluent(chunk, stream, diagnostics)
+
+
+class SecondaryClarifierStage(Stage):
+    """Layered secondary clarifier; the effluent flow is the feed minus the underflow.
+
+    The settler only separates suspended solids: BOD, TKN and TP pass through
+    unchanged. The settler state carries over from one chunk to the next (in
+    process mode it lives in the worker process).
+    """
+
+    name: str = "secondary"
+    settler: LayeredSettler
+    time_step: pint.Quantity = 15 * ureg.minute
+    # Underflow (return + waste) as a constant rate, or as a fraction of the feed
+    underflow_rate: Optional[pint.Quantity] = None
+    underflow_ratio: Optional[float] = Field(None, ge=0, lt=1)
+
+    def process(self, chunk: Chunk) -> Chunk:
+        flow = as_magnitude_array(chunk["flow"], _FLOW_UNIT)
+        if self.underflow_ratio is not None:
+            underflow = self.underflow_ratio * flow
+        elif self.underflow_rate is not None:
+            underflow = np.full(len(flow), float(as_magnitude_array(self.underflow_rate, _FLOW_UNIT)))
+        else:
+            raise ValueError("Either underflow_rate or underflow_ratio must be provided.")
+
+        feed = {"flow": flow, "tss": chunk["tss"], "underflow": underflow}
+        effluent = next(self.settler.simulate([feed], time_step=self.time_step))
+        stream = {"flow": flow - underflow, "tss": effluent["effluent_tss"]}
+        diagnostics = {
+            "underflow": underflow,
+            "underflow_tss": effluent["underflow_tss"],
+            "sludge_blanket": effluent["sludge_blanket"],
+        }
+        return self._effluent(chunk, stream, diagnostics)
+
+
+class _EndOfStream:
+    """Sentinel closing a stream; collects the timings of the stages it passed."""
+
+    def __init__(self, timings: list[StageTiming]):
+        self.timings = timings
+
+
+class _StageFailure:
+    """Carries an exception raised in a stage to the consumer."""
+
+    def __init__(self, stage: str, error: BaseException):
+        self.stage = stage
+        self.error = error
+        self.trace = traceback.format_exc()
+
+
+def _rows(chunk: Chunk) -> int:
+    return len(chunk["flow"]) if "flow" in chunk else len(next(iter(chunk.values()), ()))
+
+
+def _put(outbox, item, stop) -> float:
+    """Puts `item` on a bounded queue, returning the time spent blocked."""
+    start = time.perf_counter()
+    while not stop.is_set():
+        try:
+            outbox.put(item, timeout=0.1)
+            break
+        except queue.Full:
+            continue
+    return time.perf_counter() - start
+
+
+def _get(inbox, stop):
+    while not stop.is_set():
+        try:
+            return inbox.get(timeout=0.1)
+        except queue.Empty:
+            continue
+    return None
+
+
+def _run_stage(stage: Stage, inbox, outbox, stop):
+    """Worker loop of a stage running in its own thread or process."""
+    timing = StageTiming(name=stage.name)
+    while True:
+        item = _get(inbox, stop)
+        if item is None:  # Stopped by the consumer
+            return
+        if isinstance(item, (_EndOfStream, _StageFailure)):
+            if isinstance(item, _EndOfStream):
+                item.timings.append(timing)
+            _put(outbox, item, stop)
+            return
+        try:
+            start = time.perf_counter()
+            result = stage.process(item)
+            timing.processing_seconds += time.perf_counter() - start
+        except Exception as error:
+            _put(outbox, _StageFailure(stage.name, error), stop)
+            return
+        timing.chunks += 1
+        timing.rows += _rows(result)
+        timing.blocked_seconds += _put(outbox, result, stop)
+
+
+def _feed_source(chunks: Iterable[Chunk], outbox, stop):
+    try:
+        for chunk in chunks:
+            _put(outbox, chunk, stop)
+            if stop.is_set():
+                return
+    except Exception as error:
+        _put(outbox, _StageFailure("source", error), stop)
+        return
+    _put(outbox, _EndOfStream([]), stop)
+
+
+class Pipeline:
+    """Chains stages over a stream of columnar chunks.
+
+    Args:
+        stages: The unit processes, in flow order. Stage names must be unique.
+        mode: "serial", "thread" or "process". Stages in process mode must be
+            picklable, and their state (e.g. the settler's layers) stays in the
+            worker processes.
+        max_queued_chunks: Capacity of each queue between parallel stages.
+    """
+
+    def __init__(self,
+                 stages: list[Stage],
+                 mode: Literal["serial", "thread", "process"] = "serial",
+                 max_queued_chunks: int = 4):
+        names = [stage.name for stage in stages]
+        if len(set(names)) != len(names):
+            raise ValueError("Stage names must be unique")
+        if mode not in ("serial", "thread", "process"):
+            raise ValueError(f"Unknown pipeline mode: {mode}")
+        if max_queued_chunks < 1:
+            raise ValueError("max_queued_chunks must be at least 1")
+        self.stages = stages
+        self.mode = mode
+        self.max_queued_chunks = max_queued_chunks
+        self.timings: dict[str, StageTiming] = {}
+
+    def run(self, chunks: Iterable[Chunk]) -> Iterator[Chunk]:
+        """Streams the influent chunks through the plant, yielding the final effluent chunks.
+
+        `timings` is filled once the stream is exhausted.
+        """
+        self.timings = {stage.name: StageTiming(name=stage.name) for stage in self.stages}
+        if self.mode == "serial":
+            yield from self._run_serial(chunks)
+        else:
+            yield from self._run_parallel(chunks)
+
+    def run_all(self, chunks: Iterable[Chunk], on_chunk: Optional[Callable[[Chunk], None]] = None
+                ) -> dict[str, StageTiming]:
+        """Runs the pipeline to the end, passing every effluent chunk to `on_chunk`."""
+        for chunk in self.run(chunks):
+            if on_chunk is not None:
+                on_chunk(chunk)
+        return self.timings
+
+    def _run_serial(self, chunks: Iterable[Chunk]) -> Iterator[Chunk]:
+        for chunk in chunks:
+            for stage in self.stages:
+                start = time.perf_counter()
+                chunk = stage.process(chunk)
+                timing = self.timings[stage.name]
+                timing.processing_seconds += time.perf_counter() - start
+                timing.chunks += 1
+                timing.rows += _rows(chunk)
+            yield chunk
+        self._log_timings()
+
+    def _run_parallel(self, chunks: Iterable[Chunk]) -> Iterator[Chunk]:
+        if self.mode == "thread":
+            make_queue, stop = (lambda: queue.Queue(self.max_queued_chunks)), threading.Event()
+            make_worker = threading.Thread
+        else:
+            context = multiprocessing.get_context()
+            make_queue, stop = (lambda: context.Queue(self.max_queued_chunks)), context.Event()
+            make_worker = context.Process
+
+        queues = [make_queue() for _ in range(len(self.stages) + 1)]
+        feeder = threading.Thread(target=_feed_source, args=(chunks, queues[0], stop), daemon=True)
+        workers = [make_worker(target=_run_stage, args=(stage, queues[i], queues[i + 1], stop), daemon=True)
+                   for i, stage in enumerate(self.stages)]
+        for worker in workers:
+            worker.start()
+        feeder.start()
+        try:
+            while True:
+                item = _get(queues[-1], stop)
+                if isinstance(item, _EndOfStream):
+                    self.timings = {timing.name: timing for timing in item.timings}
+                    break
+                if isinstance(item, _StageFailure):
+                    logging.error(f"Pipeline stage {item.stage} failed:\n{item.trace}")
+                    raise item.error
+                yield item
+        finally:
+            stop.set()
+            for worker in workers:
+                worker.join(timeout=5)
+                if self.mode == "process" and worker.is_alive():
+                    worker.terminate()  # Still flushing a queue nobody reads any more
+            feeder.join(timeout=5)
+        self._log_timings()
+
+    def _log_timings(self):
+        for timing in self.timings.values():
+            logging.debug(f"Stage {timing.name}: {timing.chunks} chunks, {timing.rows} rows, "
+                          f"{timing.processing_seconds:.3f} s processing, {timing.blocked_seconds:.3f} s blocked")
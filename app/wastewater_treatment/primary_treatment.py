@@ -1,6 +1,11 @@
+import numpy as np
 import pint
-from pydantic import BaseModel, Field, ValidationError, field_validator
-from typing import Literal, Union, Optional
+from pydantic import BaseModel, ConfigDict, Field, ValidationError, field_validator
+from typing import Annotated, Literal, Union, Optional
+from app.dependency_graph import DependencyGraph
+from app.helpers import as_magnitude_array
+from app.instrumentation import instrumented
+from app.quantity_schema import QuantitySchema
 from app.units import ureg
 import math
 
@@ -13,34 +18,63 @@ import math
 # 2. Particles settle in the sludge zone and are not resuspended.
 # 3. Plug flow conditions exist.
 
+# Empirical removal constants (Crites and Tchobanoglous, 1998) for the
+# primary clarifier removal curve R = t / (a + b * t), R in percent and t
+# being the detention time in hours.
+REMOVAL_CONSTANTS = {
+    "bod": (0.018, 0.020),
+    "tss": (0.0075, 0.014),
+}
+
+
+def removal_efficiency(detention_time: Union[float, np.ndarray, pint.Quantity],
+                       constituent: Literal["tss", "bod"] = "tss") -> pint.Quantity:
+    """Estimates the BOD or TSS removal efficiency of a primary clarifier.
+
+    Args:
+        detention_time: Detention time (in hours if a number). Arrays are accepted.
+        constituent: Either "tss" or "bod".
+
+    Returns:
+        The removal efficiency as a dimensionless fraction.
+    """
+    if constituent not in REMOVAL_CONSTANTS:
+        raise ValueError(f"Unknown constituent: {constituent}")
+    a, b = REMOVAL_CONSTANTS[constituent]
+    t = as_magnitude_array(detention_time, ureg.hour)
+    return ureg.Quantity(t / (a + b * t) / 100, ureg.dimensionless)
+
 
 class SedimentationTank(BaseModel):
     """Represents a sedimentation tank (clarifier)."""
 
-    flow_rate: pint.Quantity = Field(..., gt=0)
-    peaking_factor: pint.Quantity = Field(..., gt=0)
-    influent_tss: pint.Quantity = Field(..., gt=0)
-    influent_bod: pint.Quantity = Field(..., gt=0)
-    surface_overflow_velocity: pint.Quantity = Field(..., gt=0)
+    # Results are validated when set, i.e. converted to their declared units and bounds checked
+    model_config = ConfigDict(validate_assignment=True)
+
+    flow_rate: Annotated[pint.Quantity, QuantitySchema("m^3/day", gt=0)]
+    peaking_factor: Annotated[pint.Quantity, QuantitySchema("dimensionless", gt=0)]
+    influent_tss: Annotated[pint.Quantity, QuantitySchema("mg/L", gt=0)]
+    influent_bod: Annotated[pint.Quantity, QuantitySchema("mg/L", gt=0)]
+    surface_overflow_velocity: Annotated[pint.Quantity, QuantitySchema("m/day", gt=0)]
     # The rate vo at which the particles settle in the tank is equal to the rate at
     # which clarified water flows out from the tank.
-    # This rate is a design parameter and is called the surface overflow rate.
+    # This rate is a design parameter and is called the surface overflow rate.
     tank_type: Literal["circular", "rectangular"] = Field(default="rectangular")
-    detention_time: pint.Quantity = Field(..., gt=0)
-    weir_length: pint.Quantity = Field(..., gt=0)
-    weir_loading_rate: pint.Quantity = Field(..., gt=0)
+    detention_time: Annotated[pint.Quantity, QuantitySchema("hour", gt=0)]
+    weir_length: Annotated[pint.Quantity, QuantitySchema("m", gt=0)]
+    weir_loading_rate: Annotated[pint.Quantity, QuantitySchema("m^2/day", gt=0)]
     # The weir loading rate:
     # is the effluent flow rate over the weir divided by the weir length.
 
-    # # To add average flow rate and peak flow rate design parameters
-    # # This encompasses the use of equalization which is not yet implemented
-    # average_flow_rate: pint.Quantity = Field(..., gt=0)
-    # peak_flow_rate: pint.Quantity = Field(..., gt=0)
-    # # Flow equalization is a method of damping the variations in flow rates,
-    # # so that the unit processes receive nearly constant flow rates (Metcalf and
-    # # Eddy, 2003).
+    # Average and peak flow rates behind flow equalization, see
+    # app/wastewater_treatment/equalization.py (`equalized_design_flows`).
+    # Flow equalization is a method of damping the variations in flow rates,
+    # so that the unit processes receive nearly constant flow rates (Metcalf and
+    # Eddy, 2003).
+    average_flow_rate: Optional[Annotated[pint.Quantity, QuantitySchema("m^3/day", gt=0)]] = None
+    peak_flow_rate: Optional[Annotated[pint.Quantity, QuantitySchema("m^3/day", gt=0)]] = None
     length_to_width_ratio: float = Field(4.0, gt=0)  # For rectangular tanks, default 4:1
-    side_water_depth: Optional[pint.Quantity] = Field(None, gt=0)
+    side_water_depth: Optional[Annotated[pint.Quantity, QuantitySchema("m", gt=0)]] = None
 
     # if on of these values are true we have to account for that and
     # modify the design parameters
@@ -48,64 +82,207 @@ class SedimentationTank(BaseModel):
     inlet_turbulence: bool = Field(default=False)
     outlet_turbulence: bool = Field(default=False)
 
-    length: Optional[pint.Quantity]
-    width: Optional[pint.Quantity]
-    height: Optional[pint.Quantity]
-    diameter: Optional[pint.Quantity]
-    depth: Optional[pint.Quantity]
-    volume: Optional[pint.Quantity]
-    surface_area: Optional[pint.Quantity]
-    effluent_tss: Optional[pint.Quantity] = None
-    effluent_bod: Optional[pint.Quantity] = None
-    tss_removal_efficiency: Optional[pint.Quantity] = None
-    bod_removal_efficiency: Optional[pint.Quantity] = None
+    # Design results (set by calculate_design)
+    length: Optional[Annotated[pint.Quantity, QuantitySchema("m")]]
+    width: Optional[Annotated[pint.Quantity, QuantitySchema("m")]]
+    height: Optional[Annotated[pint.Quantity, QuantitySchema("m")]]
+    diameter: Optional[Annotated[pint.Quantity, QuantitySchema("m")]]
+    depth: Optional[Annotated[pint.Quantity, QuantitySchema("m")]]
+    volume: Optional[Annotated[pint.Quantity, QuantitySchema("m^3")]]
+    surface_area: Optional[Annotated[pint.Quantity, QuantitySchema("m^2")]]
+    effluent_tss: Optional[Annotated[pint.Quantity, QuantitySchema("mg/L")]] = None
+    effluent_bod: Optional[Annotated[pint.Quantity, QuantitySchema("mg/L")]] = None
+    tss_removal_efficiency: Optional[Annotated[pint.Quantity, QuantitySchema("dimensionless", ge=0)]] = None
+    bod_removal_efficiency: Optional[Annotated[pint.Quantity, QuantitySchema("dimensionless", ge=0)]] = None
 
     @field_validator("tank_type")
-    def _check_tank_type(self, value):
+    @classmethod
+    def _check_tank_type(cls, value):
         if value not in ("rectangular", "circular"):  # Not needed with Literal
             raise ValueError("Invalid tank type")
         return value
 
+    @instrumented
     def calculate_design(self):
-        """Calculates the design parameters of the sedimentation tank."""
-
-        # Ensure we have an over_flow_rate
-        if self.surface_overflow_velocity is None:
-            if self.detention_time is not None and self.side_water_depth is not None:
-                self.surface_overflow_velocity = self.side_water_depth / self.detention_time
-            else:  # No overflow rate, no detention time
-                raise ValueError("Either overflow_rate or detention_time and side_water_depth must be provided.")
-        # Calculate surface area
-        self.surface_area = (self.flow_rate / self.surface_overflow_velocity).to("m^2")
-
-        # Calculate dimensions based on tank type
-        if self.tank_type == "rectangular":
-            self.width = (self.surface_area / self.length_to_width_ratio) ** 0.5
-            self.length = self.width * self.length_to_width_ratio
-            self.diameter = None  # Clear diameter
-        elif self.tank_type == "circular":
-            self.diameter = (4 * self.surface_area / math.pi) ** 0.5
-            self.length = None  # Clear length/width
-            self.width = None
-
-        # calculate volume
-        if self.detention_time is None:
-            if self.side_water_depth is not None:
-                self.volume = self.surface_area * self.side_water_depth
-                self.detention_time = (self.volume / self.flow_rate).to(ureg.hour)  # Calculate the detention time
-            else:
-                raise ValueError("Either side_water_depth or detention_time must be provided.")
-
-        else:  # Detention time given
-            self.volume = self.flow_rate * self.detention_time
-            if self.side_water_depth is None:  # Calculate  side_water_depth
-                self.side_water_depth = (self.volume / self.surface_area).to(ureg.meter)
-
-        # Calculate effluent concentrations
-        self.effluent_tss = self.influent_tss * (1 - self.tss_removal_efficiency)
-        self.effluent_bod = self.influent_bod * (1 - self.bod_removal_efficiency)
-
-        return self  
-
-    class Config:
-        arbitrary_types_allowed = True  # Allow pint.Quantity
+        """Calculates the design parameters of the sedimentation tank (from its `design_graph`)."""
+        graph = self.design_graph()
+        self.surface_overflow_velocity = graph["overflow_rate"]
+        self.surface_area = graph["surface_area"]
+        # Dimensions based on tank type (None for the other type)
+        self.width = graph["width"]
+        self.length = graph["length"]
+        self.diameter = graph["diameter"]
+        self.volume = graph["volume"]
+        self.detention_time = graph["design_detention_time"]
+        self.side_water_depth = graph["design_side_water_depth"]
+        # Removal efficiencies estimated from the detention time when not given
+        self.tss_removal_efficiency = graph["design_tss_removal_efficiency"]
+        self.bod_removal_efficiency = graph["design_bod_removal_efficiency"]
+        self.effluent_tss = graph["effluent_tss"]
+        self.effluent_bod = graph["effluent_bod"]
+        return self
+
+    def design_graph(self) -> DependencyGraph:
+        """Dependency graph of the design, seeded with this tank's inputs."""
+        return sedimentation_tank_graph(**{name: getattr(self, name) for name in SEDIMENTATION_TANK_GRAPH_INPUTS})
+
+
+SEDIMENTATION_TANK_GRAPH_INPUTS = (
+    "flow_rate", "surface_overflow_velocity", "detention_time", "side_water_depth", "tank_type",
+    "length_to_width_ratio", "influent_tss", "influent_bod", "tss_removal_efficiency", "bod_removal_efficiency",
+)
+
+
+def _graph_overflow_rate(overflow, detention_time, side_water_depth):
+    if overflow is not None:
+        return overflow
+    if detention_time is None or side_water_depth is None:
+        raise ValueError("Either overflow_rate or detention_time and side_water_depth must be provided.")
+    return (side_water_depth / detention_time).to(ureg.meter / ureg.day)
+
+
+def _graph_volume(flow_rate, surface_area, detention_time, side_water_depth):
+    if detention_time is not None:
+        return (flow_rate * detention_time).to(ureg.meter ** 3)
+    if side_water_depth is None:
+        raise ValueError("Either side_water_depth or detention_time must be provided.")
+    return (surface_area * side_water_depth).to(ureg.meter ** 3)
+
+
+def sedimentation_tank_graph(**inputs) -> DependencyGraph:
+    """The design of `SedimentationTank.calculate_design` as a dependency graph.
+
+    The inputs are the tank's (see `SEDIMENTATION_TANK_GRAPH_INPUTS`), missing ones
+    default to None. The derived nodes are "overflow_rate", "surface_area",
+    "width", "length", "diameter", "volume", "design_detention_time",
+    "design_side_water_depth", "design_tss_removal_efficiency",
+    "design_bod_removal_efficiency", "effluent_tss" and "effluent_bod".
+    """
+    unknown = set(inputs) - set(SEDIMENTATION_TANK_GRAPH_INPUTS)
+    if unknown:
+        raise ValueError(f"Unknown inputs: {sorted(unknown)}")
+    defaults = {"tank_type": "rectangular", "length_to_width_ratio": 4.0}
+    graph = DependencyGraph()
+    for name in SEDIMENTATION_TANK_GRAPH_INPUTS:
+        graph.add_input(name, inputs.get(name, defaults.get(name)))
+
+    graph.add_node("overflow_rate", ["surface_overflow_velocity", "detention_time", "side_water_depth"],
+                   _graph_overflow_rate)
+    graph.add_node("surface_area", ["flow_rate", "overflow_rate"],
+                   lambda flow, overflow: (flow / overflow).to("m^2"))
+    graph.add_node("width", ["surface_area", "tank_type", "length_to_width_ratio"],
+                   lambda area, kind, ratio: (area / ratio) ** 0.5 if kind == "rectangular" else None)
+    graph.add_node("length", ["width", "length_to_width_ratio"],
+                   lambda width, ratio: None if width is None else width * ratio)
+    graph.add_node("diameter", ["surface_area", "tank_type"],
+                   lambda area, kind: (4 * area / math.pi) ** 0.5 if kind == "circular" else None)
+    graph.add_node("volume", ["flow_rate", "surface_area", "detention_time", "side_water_depth"], _graph_volume)
+    graph.add_node("design_detention_time", ["volume", "flow_rate"],
+                   lambda volume, flow: (volume / flow).to(ureg.hour))
+    graph.add_node("design_side_water_depth", ["volume", "surface_area", "side_water_depth"],
+                   lambda volume, area, depth: (volume / area).to(ureg.meter) if depth is None else depth)
+    for constituent in ("tss", "bod"):
+        graph.add_node(f"design_{constituent}_removal_efficiency",
+                       ["design_detention_time", f"{constituent}_removal_efficiency"],
+                       lambda hours, given, c=constituent: removal_efficiency(hours, c) if given is None else given)
+        graph.add_node(f"effluent_{constituent}",
+                       [f"influent_{constituent}", f"design_{constituent}_removal_efficiency"],
+                       lambda influent, removal: None if influent is None else influent * (1 - removal))
+    return graph
+
+
+@instrumented
+def calculate_design_batch(
+        flow_rate: Union[np.ndarray, pint.Quantity],
+        surface_overflow_velocity: Optional[Union[np.ndarray, pint.Quantity]] = None,
+        detention_time: Optional[Union[np.ndarray, pint.Quantity]] = None,
+        side_water_depth: Optional[Union[np.ndarray, pint.Quantity]] = None,
+        tank_type: Union[str, np.ndarray] = "rectangular",
+        length_to_width_ratio: Union[float, np.ndarray] = 4.0,
+        influent_tss: Optional[Union[np.ndarray, pint.Quantity]] = None,
+        influent_bod: Optional[Union[np.ndarray, pint.Quantity]] = None,
+        tss_removal_efficiency: Optional[Union[np.ndarray, pint.Quantity]] = None,
+        bod_removal_efficiency: Optional[Union[np.ndarray, pint.Quantity]] = None,
+        peaking_factor: Optional[Union[np.ndarray, pint.Quantity]] = None,
+) -> dict[str, pint.Quantity]:
+    """Vectorized version of `SedimentationTank.calculate_design`.
+
+    Evaluates many tank designs at once. Inputs are broadcast against each other
+    and follow the same rules as the model: the overflow rate may be derived from
+    the side water depth and detention time, and either the detention time or the
+    side water depth must be given. Plain numbers and arrays are read in
+    m^3/day, m/day, hours, meters and mg/L.
+
+    Returns:
+        A dict of array-valued quantities (struct of arrays). Length and width are
+        NaN for circular tanks, the diameter is NaN for rectangular ones.
+        `peak_overflow_rate` is included when a peaking factor is given.
+    """
+    q = as_magnitude_array(flow_rate, ureg.meter ** 3 / ureg.day)
+
+    if surface_overflow_velocity is None:
+        if detention_time is None or side_water_depth is None:
+            raise ValueError("Either overflow_rate or detention_time and side_water_depth must be provided.")
+        overflow = (as_magnitude_array(side_water_depth, ureg.meter)
+                    / as_magnitude_array(detention_time, ureg.day))
+    else:
+        overflow = as_magnitude_array(surface_overflow_velocity, ureg.meter / ureg.day)
+
+    area = q / overflow
+
+    ratio = np.asarray(length_to_width_ratio, dtype=float)
+    circular = np.asarray(tank_type) == "circular"
+    width = np.where(circular, np.nan, np.sqrt(area / ratio))
+    length = width * ratio
+    diameter = np.where(circular, np.sqrt(4 * area / math.pi), np.nan)
+
+    if detention_time is None:
+        if side_water_depth is None:
+            raise ValueError("Either side_water_depth or detention_time must be provided.")
+        depth = as_magnitude_array(side_water_depth, ureg.meter)
+        volume = area * depth
+        hours = volume / q * 24
+    else:
+        hours = as_magnitude_array(detention_time, ureg.hour)
+        volume = q * hours / 24
+        if side_water_depth is None:
+            depth = volume / area
+        else:
+            depth = as_magnitude_array(side_water_depth, ureg.meter)
+
+    if tss_removal_efficiency is None:
+        tss_removal_efficiency = removal_efficiency(hours, "tss")
+    if bod_removal_efficiency is None:
+        bod_removal_efficiency = removal_efficiency(hours, "bod")
+    tss_removal = as_magnitude_array(tss_removal_efficiency, ureg.dimensionless)
+    bod_removal = as_magnitude_array(bod_removal_efficiency, ureg.dimensionless)
+
+    tss = None if influent_tss is None else as_magnitude_array(influent_tss, ureg.milligram / ureg.liter)
+    bod = None if influent_bod is None else as_magnitude_array(influent_bod, ureg.milligram / ureg.liter)
+    peak = None if peaking_factor is None else as_magnitude_array(peaking_factor, ureg.dimensionless)
+
+    arrays = [area, depth, ratio, circular, tss_removal, bod_removal, tss, bod, peak]
+    shape = np.broadcast_shapes(*(np.shape(a) for a in arrays if a is not None))
+
+    def _quantity(values, units):
+        return ureg.Quantity(np.broadcast_to(values, shape).astype(float), units)
+
+    result = {
+        "surface_overflow_velocity": _quantity(overflow, ureg.meter / ureg.day),
+        "surface_area": _quantity(area, ureg.meter ** 2),
+        "width": _quantity(width, ureg.meter),
+        "length": _quantity(length, ureg.meter),
+        "diameter": _quantity(diameter, ureg.meter),
+        "volume": _quantity(volume, ureg.meter ** 3),
+        "detention_time": _quantity(hours, ureg.hour),
+        "side_water_depth": _quantity(depth, ureg.meter),
+        "tss_removal_efficiency": _quantity(tss_removal, ureg.dimensionless),
+        "bod_removal_efficiency": _quantity(bod_removal, ureg.dimensionless),
+    }
+    if tss is not None:
+        result["effluent_tss"] = _quantity(tss * (1 - tss_removal), ureg.milligram / ureg.liter)
+    if bod is not None:
+        result["effluent_bod"] = _quantity(bod * (1 - bod_removal), ureg.milligram / ureg.liter)
+    if peak is not None:
+        result["peak_overflow_rate"] = _quantity(overflow * peak, ureg.meter / ureg.day)
+    return result
@@ -0,0 +1,189 @@
+import logging
+from typing import Iterable, Iterator, Optional, Union
+
+import numpy as np
+import pint
+from pydantic import BaseModel
+
+from app.constants import PRIMARY_CLARIFIER_OVERFLOW_RATE_RANGE
+from app.helpers import as_magnitude_array
+from app.units import ureg
+from app.wastewater_treatment.primary_treatment import SedimentationTank, REMOVAL_CONSTANTS
+
+# Quasi-steady dynamic simulation of a primary clarifier.
+# The tank geometry is fixed; at every time step the removal is recomputed from
+# the instantaneous overflow rate Q/A and detention time V/Q (plug flow, no
+# storage in the tank). Influent records are consumed as a stream of columnar
+# chunks so memory stays proportional to the chunk size.
+
+# A chunk maps column names to equal-length arrays. Plain arrays are read in
+# m^3/day for "flow" and mg/L for "tss" and "bod"; an optional "time" column is
+# passed through untouched.
+Chunk = dict[str, np.ndarray]
+
+_FLOW_UNIT = ureg.meter ** 3 / ureg.day
+_CONCENTRATION_UNIT = ureg.milligram / ureg.liter
+
+
+class ClarifierSimulationSummary(BaseModel):
+    """Aggregates of a dynamic clarifier simulation."""
+
+    steps: int = 0
+    exceedance_steps: int = 0
+    exceedance_duration: pint.Quantity = 0 * ureg.hour
+    max_overflow_rate: pint.Quantity = 0 * ureg.meter / ureg.day
+    influent_volume: pint.Quantity = 0 * ureg.meter ** 3
+    tss_removed: pint.Quantity = 0 * ureg.kg
+    bod_removed: pint.Quantity = 0 * ureg.kg
+    mean_effluent_tss: Optional[pint.Quantity] = None
+    mean_effluent_bod: Optional[pint.Quantity] = None
+
+    class Config:
+        arbitrary_types_allowed = True  # Allow pint.Quantity
+
+
+def iter_chunks(columns: dict[str, Union[np.ndarray, pint.Quantity]], chunk_size: int = 100000) -> Iterator[Chunk]:
+    """Splits in-memory columns into chunks (views, no copies)."""
+    if chunk_size <= 0:
+        raise ValueError("chunk_size must be greater than zero")
+    length = len(next(iter(columns.values())))
+    for start in range(0, length, chunk_size):
+        yield {name: values[start:start + chunk_size] for name, values in columns.items()}
+
+
+def clarifier_geometry(tank: Optional[SedimentationTank], surface_area: Optional[pint.Quantity] = None,
+                       volume: Optional[pint.Quantity] = None) -> tuple[float, float]:
+    """Surface area (m^2) and volume (m^3) of a clarifier, given explicitly or taken from a designed tank."""
+    if surface_area is None:
+        if tank is None or tank.surface_area is None:
+            raise ValueError("Either a designed tank or surface_area must be provided.")
+        surface_area = tank.surface_area
+    if volume is None:
+        if tank is None or tank.volume is None:
+            raise ValueError("Either a designed tank or volume must be provided.")
+        volume = tank.volume
+
+    area = float(as_magnitude_array(surface_area, ureg.meter ** 2))
+    vol = float(as_magnitude_array(volume, ureg.meter ** 3))
+    if area <= 0 or vol <= 0:
+        raise ValueError("surface_area and volume must be greater than zero")
+    return area, vol
+
+
+def simulate_chunk(chunk: Chunk, area: float, volume: float, limit: float) -> Chunk:
+    """Effluent chunk of a clarifier of `area` (m^2) and `volume` (m^3); see `simulate_clarifier`.
+
+    `limit` is the overflow rate (m/day) above which a step counts as an exceedance.
+    """
+    flow = as_magnitude_array(chunk["flow"], _FLOW_UNIT)
+    if np.any(flow < 0):
+        raise ValueError("flow must not be negative")
+    (a_tss, b_tss), (a_bod, b_bod) = REMOVAL_CONSTANTS["tss"], REMOVAL_CONSTANTS["bod"]
+
+    overflow_rate = flow / area
+    with np.errstate(divide="ignore"):
+        hours = volume * 24 / flow
+    # R = t / (a + b t) in percent, written as 1 / (a / t + b) so that zero flow stays finite
+    tss_removal = 1 / (a_tss / hours + b_tss) / 100
+    bod_removal = 1 / (a_bod / hours + b_bod) / 100
+
+    result = {
+        "overflow_rate": overflow_rate,
+        "detention_time": hours,
+        "effluent_tss": as_magnitude_array(chunk["tss"], _CONCENTRATION_UNIT) * (1 - tss_removal),
+        "effluent_bod": as_magnitude_array(chunk["bod"], _CONCENTRATION_UNIT) * (1 - bod_removal),
+        "exceedance": overflow_rate > limit,
+    }
+    if "time" in chunk:
+        result["time"] = chunk["time"]
+    return result
+
+
+def simulate_clarifier(
+        tank: Optional[SedimentationTank],
+        chunks: Iterable[Chunk],
+        surface_area: Optional[pint.Quantity] = None,
+        volume: Optional[pint.Quantity] = None,
+        overflow_limit: pint.Quantity = PRIMARY_CLARIFIER_OVERFLOW_RATE_RANGE[1],
+) -> Iterator[Chunk]:
+    """Streams influent records through a primary clarifier.
+
+    Args:
+        tank: A designed tank (after `calculate_design`). Its surface area and
+            volume are used unless given explicitly.
+        chunks: Iterable of influent chunks with "flow", "tss" and "bod" columns.
+        surface_area: Surface area, overrides the tank's.
+        volume: Volume, overrides the tank's.
+        overflow_limit: Overflow rate above which a step counts as an exceedance.
+
+    Yields:
+        One effluent chunk per influent chunk, with the columns "overflow_rate"
+        (m/day), "detention_time" (hours), "effluent_tss" and "effluent_bod" (mg/L),
+        "exceedance" (bool) and "time" when present in the influent.
+    """
+    area, vol = clarifier_geometry(tank, surface_area, volume)
+    limit = float(as_magnitude_array(overflow_limit, ureg.meter / ureg.day))
+    for chunk in chunks:
+        yield simulate_chunk(chunk, area, vol, limit)
+
+
+def run_clarifier_simulation(
+        tank: Optional[SedimentationTank],
+        chunks: Iterable[Chunk],
+        time_step: pint.Quantity = 1 * ureg.minute,
+        surface_area: Optional[pint.Quantity] = None,
+        volume: Optional[pint.Quantity] = None,
+        overflow_limit: pint.Quantity = PRIMARY_CLARIFIER_OVERFLOW_RATE_RANGE[1],
+        on_chunk=None,
+) -> ClarifierSimulationSummary:
+    """Runs the clarifier simulation over a whole record and summarizes it.
+
+    Args:
+        tank: A designed tank (see `simulate_clarifier`).
+        chunks: Iterable of influent chunks.
+        time_step: Duration of one record.
+        surface_area: Surface area, overrides the tank's.
+        volume: Volume, overrides the tank's.
+        overflow_limit: Overflow rate above which a step counts as an exceedance.
+        on_chunk: Optional callable receiving every (influent, effluent) chunk
+            pair, e.g. to write the effluent series to disk.
+
+    Returns:
+        The simulation summary.
+    """
+    area, vol = clarifier_geometry(tank, surface_area, volume)
+    limit = float(as_magnitude_array(overflow_limit, ureg.meter / ureg.day))
+    step_days = float(as_magnitude_array(time_step, ureg.day))
+    steps = exceedances = 0
+    max_overflow = flow_volume = tss_in = bod_in = tss_out = bod_out = 0.0
+
+    for influent in chunks:
+        effluent = simulate_chunk(influent, area, vol, limit)
+        flow = as_magnitude_array(influent["flow"], _FLOW_UNIT)
+        steps += len(flow)
+        exceedances += int(np.count_nonzero(effluent["exceedance"]))
+        if len(flow):
+            max_overflow = max(max_overflow, float(effluent["overflow_rate"].max()))
+        flow_volume += float(flow.sum()) * step_days
+        # mg/L * m^3 = g
+        tss_in += float(flow @ as_magnitude_array(influent["tss"], _CONCENTRATION_UNIT)) * step_days
+        bod_in += float(flow @ as_magnitude_array(influent["bod"], _CONCENTRATION_UNIT)) * step_days
+        tss_out += float(flow @ effluent["effluent_tss"]) * step_days
+        bod_out += float(flow @ effluent["effluent_bod"]) * step_days
+        if on_chunk is not None:
+            on_chunk(influent, effluent)
+
+    summary = ClarifierSimulationSummary(
+        steps=steps,
+        exceedance_steps=exceedances,
+        exceedance_duration=(exceedances * step_days * ureg.day).to(ureg.hour),
+        max_overflow_rate=max_overflow * ureg.meter / ureg.day,
+        influent_volume=flow_volume * ureg.meter ** 3,
+        tss_removed=((tss_in - tss_out) * ureg.gram).to(ureg.kg),
+        bod_removed=((bod_in - bod_out) * ureg.gram).to(ureg.kg),
+    )
+    if flow_volume > 0:
+        summary.mean_effluent_tss = tss_out / flow_volume * _CONCENTRATION_UNIT
+        summary.mean_effluent_bod = bod_out / flow_volume * _CONCENTRATION_UNIT
+    logging.debug(f"Clarifier simulation: {steps} steps, {exceedances} overflow exceedances")
+    return summary
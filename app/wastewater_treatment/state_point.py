@@ -0,0 +1,205 @@
+from typing import Union
+
+import numpy as np
+import pint
+
+from app.constants import (ACTIVATED_SLUDGE_MLSS_RANGE,
+                           SECONDARY_CLARIFIER_OVERFLOW_RATE_RANGE,
+                           SECONDARY_CLARIFIER_SLR_RANGE,
+                           )
+from app.helpers import as_magnitude_array, vectorized_newton
+from app.units import ureg
+from app.wastewater_treatment.secondary_clarifier import BSM1_SETTLING_PARAMETERS
+
+# State point analysis of secondary clarifiers (solids flux theory).
+# Hindered settling follows Vesilind, v = v0 exp(-k X), so the gravity flux is
+# G(X) = v0 X exp(-k X). With an underflow velocity u = Q_r / A the total flux is
+# G(X) + u X, and the limiting flux G_L is its local minimum on the descending
+# limb: with z = k X_L it solves exp(-z) (z - 1) = u / v0 for z > 2. When
+# u >= v0 exp(-2) the total flux has no minimum and thickening never limits.
+# The limiting underflow concentration G_L / u simplifies to z^2 / (k (z - 1)).
+#
+# Every function broadcasts its inputs, so whole operating envelopes
+# (MLSS x return ratio x flow) are evaluated as NumPy arrays. Plain numbers are
+# read in mg/L, m^3/day, m^2, m/day and m^3/kg (= L/g).
+
+_FLOW_UNIT = ureg.meter ** 3 / ureg.day
+_VELOCITY_UNIT = ureg.meter / ureg.day
+_SOLIDS_UNIT = ureg.kg / ureg.meter ** 3
+_FLUX_UNIT = ureg.kg / (ureg.meter ** 2 * ureg.day)
+_K_UNIT = ureg.meter ** 3 / ureg.kg
+
+DEFAULT_VESILIND_VELOCITY = BSM1_SETTLING_PARAMETERS["vesilind_velocity"]
+DEFAULT_VESILIND_COEFFICIENT = BSM1_SETTLING_PARAMETERS["hindered_settling_parameter"].to(_K_UNIT)
+
+QuantityLike = Union[float, np.ndarray, pint.Quantity]
+
+
+def _concentration(value: QuantityLike) -> np.ndarray:
+    """Solids concentration in kg/m^3; plain numbers are read in mg/L."""
+    if isinstance(value, pint.Quantity):
+        return value.to(_SOLIDS_UNIT).magnitude
+    return np.asarray(value, dtype=float) * 1e-3
+
+
+def gravity_flux(mlss: QuantityLike,
+                 vesilind_velocity: QuantityLike = DEFAULT_VESILIND_VELOCITY,
+                 vesilind_coefficient: QuantityLike = DEFAULT_VESILIND_COEFFICIENT) -> pint.Quantity:
+    """Gravity (settling) flux v0 X exp(-k X)."""
+    x = _concentration(mlss)
+    v0 = as_magnitude_array(vesilind_velocity, _VELOCITY_UNIT)
+    k = as_magnitude_array(vesilind_coefficient, _K_UNIT)
+    return ureg.Quantity(v0 * x * np.exp(-k * x), _FLUX_UNIT)
+
+
+def _limiting_depth(u: np.ndarray, v0: np.ndarray) -> np.ndarray:
+    """Solves exp(-z) (z - 1) = u / v0 for z > 2 (NaN when thickening never limits).
+
+    In log form, g(z) = log(z - 1) - z - log(u / v0) is concave and decreasing
+    for z > 2, so Newton's method started right of the root converges
+    monotonically. With L = -log(u / v0), z = L + log(L) + 1 is such a start.
+    """
+    target = u / v0
+    limited = (target < np.exp(-2.0)) & (target > 0)
+    log_target = np.log(np.where(limited, target, np.exp(-3.0)))
+    start = -log_target + np.log(-log_target) + 1
+    z = vectorized_newton(lambda z: np.log(z - 1) - z - log_target,
+                          lambda z: 1 / (z - 1) - 1,
+                          start, tolerance=1e-10)
+    return np.where(limited, z, np.nan)
+
+
+def limiting_flux(underflow_velocity: QuantityLike,
+                  vesilind_velocity: QuantityLike = DEFAULT_VESILIND_VELOCITY,
+                  vesilind_coefficient: QuantityLike = DEFAULT_VESILIND_COEFFICIENT) -> dict[str, pint.Quantity]:
+    """Limiting solids flux for the given underflow velocities.
+
+    Returns:
+        "limiting_flux" (inf where thickening never limits, 0 without underflow),
+        "limiting_concentration" (the concentration X_L at the minimum) and
+        "limiting_underflow_concentration" (G_L / u).
+    """
+    u = as_magnitude_array(underflow_velocity, _VELOCITY_UNIT)
+    v0 = as_magnitude_array(vesilind_velocity, _VELOCITY_UNIT)
+    k = as_magnitude_array(vesilind_coefficient, _K_UNIT)
+    u, v0, k = np.broadcast_arrays(u, v0, k)
+
+    z = _limiting_depth(u, v0)
+    x_limit = z / k
+    flux = x_limit * (v0 * np.exp(-z) + u)
+    flux = np.where(u <= 0, 0.0, np.where(np.isnan(z), np.inf, flux))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        underflow_concentration = np.where(np.isnan(z), np.inf, z ** 2 / (k * (z - 1)))
+    return {
+        "limiting_flux": ureg.Quantity(flux, _FLUX_UNIT),
+        "limiting_concentration": ureg.Quantity(np.where(np.isnan(z), np.nan, x_limit), _SOLIDS_UNIT),
+        "limiting_underflow_concentration": ureg.Quantity(underflow_concentration, _SOLIDS_UNIT),
+    }
+
+
+def state_point_analysis(mlss: QuantityLike,
+                         return_ratio: Union[float, np.ndarray],
+                         flow_rate: QuantityLike,
+                         surface_area: QuantityLike,
+                         vesilind_velocity: QuantityLike = DEFAULT_VESILIND_VELOCITY,
+                         vesilind_coefficient: QuantityLike = DEFAULT_VESILIND_COEFFICIENT,
+                         ) -> dict[str, pint.Quantity]:
+    """State point analysis of many operating scenarios at once.
+
+    Args:
+        mlss: Mixed liquor suspended solids entering the clarifier.
+        return_ratio: Return sludge ratio Q_r / Q.
+        flow_rate: Influent flow Q (without the return flow).
+        surface_area: Clarifier surface area.
+        vesilind_velocity: Vesilind v0.
+        vesilind_coefficient: Vesilind k.
+
+    Returns:
+        Array-valued quantities with the broadcast shape of the inputs:
+        overflow and underflow velocities, applied solids loading rate, limiting
+        flux, state point flux (overflow rate x MLSS), underflow concentration,
+        critical MLSS and flow (the largest values before clarification or
+        thickening failure), the area required for the scenario, and the
+        boolean "thickening_ok", "clarification_ok" and "within_design_ranges".
+    """
+    x = _concentration(mlss)
+    r = as_magnitude_array(return_ratio, ureg.dimensionless)
+    q = as_magnitude_array(flow_rate, _FLOW_UNIT)
+    area = as_magnitude_array(surface_area, ureg.meter ** 2)
+    v0 = as_magnitude_array(vesilind_velocity, _VELOCITY_UNIT)
+    k = as_magnitude_array(vesilind_coefficient, _K_UNIT)
+    x, r, q, area, v0, k = np.broadcast_arrays(x, r, q, area, v0, k)
+    if np.any(r <= 0):
+        raise ValueError("return_ratio must be greater than zero")
+
+    overflow = q / area
+    underflow = r * q / area
+    loading = (1 + r) * q * x / area
+    limits = limiting_flux(underflow, v0, k)
+    g_limit = limits["limiting_flux"].magnitude
+    x_u_limit = limits["limiting_underflow_concentration"].magnitude
+    settling_velocity = v0 * np.exp(-k * x)
+
+    # Thickening fails when the underflow line crosses the descending limb of the
+    # gravity flux curve, clarification when the overflow rate beats settling.
+    thickening_ok = loading <= g_limit
+    clarification_ok = overflow <= settling_velocity
+
+    # Critical MLSS at this flow and return ratio
+    with np.errstate(divide="ignore", invalid="ignore"):
+        clarification_mlss = np.where(overflow < v0, np.log(v0 / overflow) / k, 0.0)
+    critical_mlss = np.minimum(x_u_limit * r / (1 + r), clarification_mlss)
+
+    # Critical flow at this MLSS and return ratio: thickening limits once the
+    # underflow concentration (1 + R) / R X exceeds z^2 / (k (z - 1)), i.e. for
+    # z above the larger root of z^2 - w z + w = 0 with w = k X_u (needs w > 4).
+    w = k * x * (1 + r) / r
+    with np.errstate(invalid="ignore"):
+        z_star = 0.5 * (w + np.sqrt(np.maximum(w * w - 4 * w, 0.0)))
+    u_star = np.where(w > 4, v0 * np.exp(-z_star) * (z_star - 1), np.inf)
+    thickening_flow = u_star * area / r
+    clarification_flow = area * settling_velocity
+    critical_flow = np.minimum(thickening_flow, clarification_flow)
+    required_area = np.maximum(r * q / u_star, q / settling_velocity)
+
+    slr_range = as_magnitude_array(SECONDARY_CLARIFIER_SLR_RANGE, _FLUX_UNIT)
+    overflow_range = as_magnitude_array(SECONDARY_CLARIFIER_OVERFLOW_RATE_RANGE, _VELOCITY_UNIT)
+    mlss_range = as_magnitude_array(ACTIVATED_SLUDGE_MLSS_RANGE, _SOLIDS_UNIT)
+    within_ranges = ((loading <= slr_range[1]) & (overflow <= overflow_range[1])
+                     & (x >= mlss_range[0]) & (x <= mlss_range[1]))
+
+    return {
+        "overflow_rate": ureg.Quantity(overflow, _VELOCITY_UNIT),
+        "underflow_velocity": ureg.Quantity(underflow, _VELOCITY_UNIT),
+        "solids_loading_rate": ureg.Quantity(loading, _FLUX_UNIT),
+        "limiting_flux": limits["limiting_flux"],
+        "state_point_flux": ureg.Quantity(overflow * x, _FLUX_UNIT),
+        "underflow_concentration": ureg.Quantity(x * (1 + r) / r, _SOLIDS_UNIT),
+        "critical_mlss": ureg.Quantity(critical_mlss, _SOLIDS_UNIT),
+        "critical_flow_rate": ureg.Quantity(critical_flow, _FLOW_UNIT),
+        "required_area": ureg.Quantity(required_area, ureg.meter ** 2),
+        "thickening_ok": thickening_ok,
+        "clarification_ok": clarification_ok,
+        "within_design_ranges": within_ranges,
+    }
+
+
+def operating_envelope(mlss: QuantityLike,
+                       return_ratio: np.ndarray,
+                       flow_rate: QuantityLike,
+                       surface_area: QuantityLike,
+                       **kwargs) -> dict[str, pint.Quantity]:
+    """Runs `state_point_analysis` on the full grid of 1-D MLSS, return ratio and flow axes.
+
+    Returns:
+        The analysis with arrays of shape (len(mlss), len(return_ratio), len(flow_rate)).
+    """
+    def _axis(values, position):
+        shape = [1, 1, 1]
+        shape[position] = -1
+        if isinstance(values, pint.Quantity):
+            return values.reshape(shape)
+        return np.asarray(values, dtype=float).reshape(shape)
+
+    return state_point_analysis(_axis(mlss, 0), _axis(return_ratio, 1), _axis(flow_rate, 2),
+                                surface_area, **kwargs)
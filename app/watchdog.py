@@ -0,0 +1,121 @@
+import logging
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from typing import Callable, NamedTuple, Optional
+
+from app.instrumentation import count
+
+# Event-loop stall watchdog (no Qt import: the GUI drives it, see
+# views/responsiveness.py).
+#
+# The event loop calls `beat()` from a timer every `interval` seconds. The
+# lateness of each beat (time since the previous one, minus the interval) is
+# the event-loop latency: how long an input event would have waited. A monitor
+# thread wakes up every `interval` too; when the last beat is more than
+# `threshold` seconds late, the loop is stalled and the monitor captures the
+# Python stack of the watched (GUI) thread with sys._current_frames() and logs
+# it as a warning: the stack points at the slot doing synchronous work. The
+# stall ends with the next beat, which logs its total duration. Latencies and
+# stall durations are also recorded by the instrumentation (milliseconds,
+# "event_loop.latency_ms" and "event_loop.stall_ms", see app/instrumentation.py).
+
+logger = logging.getLogger(__name__)
+
+
+class Stall(NamedTuple):
+    """A stall of the event loop: when it started (time.time()), how long it lasted and where."""
+
+    started: float
+    duration: float  # Seconds
+    stack: str  # Stack of the watched thread, captured `threshold` seconds into the stall
+
+
+class StallWatchdog:
+    """Measures the latency of an event loop and captures the stack of its thread when it stalls.
+
+    Args:
+        threshold: Seconds of lateness after which the loop is stalled.
+        interval: Seconds between the beats of the event loop (and checks of the monitor).
+        thread_id: Thread running the event loop (default: the thread creating the watchdog).
+        on_stall: Called from the monitor thread with each captured stall (duration so far).
+        history: Stalls and latencies kept.
+    """
+
+    def __init__(self, threshold: float = 0.25, interval: float = 0.05, thread_id: Optional[int] = None,
+                 on_stall: Optional[Callable[[Stall], None]] = None, history: int = 100):
+        if interval <= 0 or threshold <= 0:
+            raise ValueError("threshold and interval must be greater than zero")
+        self.threshold = threshold
+        self.interval = interval
+        self.thread_id = thread_id if thread_id is not None else threading.get_ident()
+        self.on_stall = on_stall
+        self.stalls: deque[Stall] = deque(maxlen=history)
+        self.latencies: deque[float] = deque(maxlen=history)
+        self._last_beat = time.monotonic()
+        self._stall: Optional[tuple[float, float, str]] = None  # (monotonic start, wall start, stack)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._monitor: Optional[threading.Thread] = None
+
+    def start(self):
+        if self._monitor is not None:
+            return
+        self._stop.clear()
+        self._last_beat = time.monotonic()
+        self._monitor = threading.Thread(target=self._watch, name="stall-watchdog", daemon=True)
+        self._monitor.start()
+
+    def stop(self):
+        if self._monitor is not None:
+            self._stop.set()
+            self._monitor.join()
+            self._monitor = None
+
+    def beat(self):
+        """Called by the event loop every `interval` seconds."""
+        now = time.monotonic()
+        with self._lock:
+            latency = max(0.0, now - self._last_beat - self.interval)
+            self._last_beat = now
+            stall, self._stall = self._stall, None
+            self.latencies.append(latency)
+        count("event_loop.latency_ms", latency * 1000)
+        if stall is not None:
+            start, started, stack = stall
+            self.stalls.append(Stall(started, now - start, stack))
+            count("event_loop.stall_ms", (now - start) * 1000)
+            logger.warning(f"Event loop stalled for {(now - start) * 1000:.0f} ms")
+
+    @property
+    def latency(self) -> float:
+        """Worst latency of the last second of beats, or how late the next beat already is (seconds)."""
+        with self._lock:
+            recent = list(self.latencies)[-max(1, round(1 / self.interval)):]
+            late = time.monotonic() - self._last_beat - self.interval
+        return max([late, 0.0, *recent])
+
+    @property
+    def stalled(self) -> bool:
+        return self._stall is not None
+
+    def capture(self) -> str:
+        """The current Python stack of the watched thread."""
+        frame = sys._current_frames().get(self.thread_id)
+        return "".join(traceback.format_stack(frame)) if frame is not None else "(thread not running)"
+
+    def _watch(self):
+        while not self._stop.wait(self.interval):
+            with self._lock:
+                start = self._last_beat + self.interval
+                if self._stall is not None or time.monotonic() - start <= self.threshold:
+                    continue
+                stack = self.capture()
+                elapsed = time.monotonic() - start
+                started = time.time() - elapsed
+                self._stall = (start, started, stack)
+            logger.warning(f"Event loop stalled for more than {self.threshold * 1000:.0f} ms in:\n{stack}")
+            if self.on_stall is not None:
+                self.on_stall(Stall(started, elapsed, stack))
@@ -0,0 +1,182 @@
+import json
+import os
+from typing import Iterator, Optional
+
+import numpy as np
+
+# In-memory columnar table of plant records: an ordered mapping of column names
+# to equal-length 1-D NumPy arrays, with optional unit strings (e.g. "m^3/day").
+# Saved as a directory holding one .npy file per column and a dataset.json
+# describing them, so large columns can be memory-mapped back instead of read.
+# ColumnarDatasetWriter writes the same layout chunk by chunk, for datasets
+# that do not fit in memory: the .npy headers are rewritten with the final
+# row count when the writer is closed.
+
+_METADATA_FILE = "dataset.json"
+
+
+class ColumnarDataset:
+    """Named, equal-length NumPy columns."""
+
+    def __init__(self, columns: Optional[dict[str, np.ndarray]] = None, units: Optional[dict[str, str]] = None):
+        self._columns: dict[str, np.ndarray] = {}
+        self.units: dict[str, str] = {}
+        for name, values in (columns or {}).items():
+            self[name] = values
+        for name, unit in (units or {}).items():
+            if name not in self._columns:
+                raise KeyError(name)
+            self.units[name] = unit
+
+    @property
+    def names(self) -> list[str]:
+        return list(self._columns)
+
+    @property
+    def columns(self) -> dict[str, np.ndarray]:
+        return dict(self._columns)
+
+    def __len__(self) -> int:
+        """Number of rows."""
+        return len(next(iter(self._columns.values()))) if self._columns else 0
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._columns
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        return self._columns[name]
+
+    def __setitem__(self, name: str, values):
+        values = np.asanyarray(values)  # Keeps memory maps
+        if values.ndim != 1:
+            raise ValueError(f"Column {name} must be one-dimensional")
+        other = next((column for column in self._columns if column != name), None)
+        if other is not None and len(values) != len(self._columns[other]):
+            raise ValueError(f"Column {name} has {len(values)} rows, the dataset {len(self._columns[other])}")
+        self._columns[name] = values
+
+    def __delitem__(self, name: str):
+        del self._columns[name]
+        self.units.pop(name, None)
+
+    def quantity(self, name: str, unit: Optional[str] = None):
+        """A column as a QuantityColumn (app/quantity_column.py), a view unless converted to `unit`."""
+        from app.quantity_column import QuantityColumn
+
+        return QuantityColumn.from_dataset(self, name, unit)
+
+    def iter_chunks(self, chunk_size: int = 100000) -> Iterator[dict[str, np.ndarray]]:
+        """Yields row chunks as dicts of column views (see app/wastewater_treatment/simulation.py)."""
+        if chunk_size <= 0:
+            raise ValueError("chunk_size must be greater than zero")
+        for start in range(0, len(self), chunk_size):
+            yield {name: values[start:start + chunk_size] for name, values in self._columns.items()}
+
+    def save(self, directory: str):
+        """Writes the dataset as one .npy file per column plus dataset.json."""
+        os.makedirs(directory, exist_ok=True)
+        entries = []
+        for index, (name, values) in enumerate(self._columns.items()):
+            if values.dtype == object:
+                values = values.astype(str)
+            file_name = f"{index:04d}.npy"
+            np.save(os.path.join(directory, file_name), values, allow_pickle=False)
+            entries.append({"name": name, "file": file_name, "dtype": values.dtype.str,
+                            "unit": self.units.get(name)})
+        metadata = {"rows": len(self), "columns": entries}
+        with open(os.path.join(directory, _METADATA_FILE), "w", encoding="utf-8") as file:
+            json.dump(metadata, file, indent=2)
+
+    @classmethod
+    def load(cls, directory: str, mmap_mode: Optional[str] = "r") -> "ColumnarDataset":
+        """Reads a saved dataset; columns are memory-mapped unless mmap_mode is None."""
+        with open(os.path.join(directory, _METADATA_FILE), encoding="utf-8") as file:
+            metadata = json.load(file)
+        dataset = cls()
+        for entry in metadata["columns"]:
+            dataset[entry["name"]] = np.load(os.path.join(directory, entry["file"]), mmap_mode=mmap_mode,
+                                             allow_pickle=False)
+            if entry.get("unit"):
+                dataset.units[entry["name"]] = entry["unit"]
+        return dataset
+
+
+# Fixed .npy header size, so the header can be rewritten in place with the final shape
+_NPY_HEADER_BYTES = 128
+
+
+def _npy_header(dtype: np.dtype, rows: int) -> bytes:
+    header = repr({"descr": np.lib.format.dtype_to_descr(dtype), "fortran_order": False, "shape": (rows,)})
+    magic = np.lib.format.magic(1, 0)
+    padding = _NPY_HEADER_BYTES - len(magic) - 2 - len(header) - 1
+    return magic + (_NPY_HEADER_BYTES - len(magic) - 2).to_bytes(2, "little") + \
+        (header + " " * padding + "\n").encode("latin1")
+
+
+class ColumnarDatasetWriter:
+    """Writes a dataset to a directory chunk by chunk (same layout as `ColumnarDataset.save`).
+
+    Args:
+        directory: Output directory.
+        dtypes: Column names and dtypes, in order. Text columns need a
+            fixed-width unicode dtype (e.g. "<U16").
+        units: Optional unit of each column.
+    """
+
+    def __init__(self, directory: str, dtypes: dict[str, np.dtype], units: Optional[dict[str, str]] = None):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.dtypes = {name: np.dtype(dtype) for name, dtype in dtypes.items()}
+        if any(dtype == object for dtype in self.dtypes.values()):
+            raise ValueError("Object columns cannot be written in chunks: use a unicode dtype")
+        self.units = dict(units or {})
+        self.rows = 0
+        self._files = {}
+        for index, (name, dtype) in enumerate(self.dtypes.items()):
+            file = open(os.path.join(directory, f"{index:04d}.npy"), "wb")
+            file.write(_npy_header(dtype, 0))
+            self._files[name] = file
+
+    def append(self, chunk: dict[str, np.ndarray]):
+        """Appends rows; missing columns are filled with NaN (NaT, "", 0, False)."""
+        if self._files is None:
+            raise ValueError("The writer is closed")
+        lengths = {len(values) for values in chunk.values()}
+        if len(lengths) > 1:
+            raise ValueError("Chunk columns must have equal lengths")
+        unknown = set(chunk) - set(self.dtypes)
+        if unknown:
+            raise KeyError(f"Unknown columns: {sorted(unknown)}")
+        rows = lengths.pop() if lengths else 0
+        for name, dtype in self.dtypes.items():
+            if name in chunk:
+                values = np.asarray(chunk[name]).astype(dtype, copy=False)
+            elif dtype.kind in "iub":  # No missing value for integers and booleans
+                values = np.zeros(rows, dtype=dtype)
+            else:
+                values = np.full(rows, np.nan if dtype.kind in "fc" else "NaT" if dtype.kind in "mM" else "",
+                                 dtype=dtype)
+            self._files[name].write(np.ascontiguousarray(values).tobytes())
+        self.rows += rows
+
+    def close(self):
+        """Writes the final headers and dataset.json."""
+        if self._files is None:
+            return
+        entries = []
+        for index, (name, dtype) in enumerate(self.dtypes.items()):
+            file = self._files[name]
+            file.seek(0)
+            file.write(_npy_header(dtype, self.rows))
+            file.close()
+            entries.append({"name": name, "file": f"{index:04d}.npy", "dtype": dtype.str,
+                            "unit": self.units.get(name)})
+        self._files = None
+        with open(os.path.join(self.directory, _METADATA_FILE), "w", encoding="utf-8") as file:
+            json.dump({"rows": self.rows, "columns": entries}, file, indent=2)
+
+    def __enter__(self) -> "ColumnarDatasetWriter":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,627 @@
+import ast
+import logging
+import re
+import threading
+from collections import deque
+from typing import Callable, Optional
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from app.wastewater_treatment.parameters import terminal_settling_velocity_batch
+from app.wastewater_treatment.primary_treatment import removal_efficiency
+from app.units import ureg
+from models.data_models import ColumnarDataset
+from models.zone_map import ZoneMap
+
+# Spreadsheet formulas over a ColumnarDataset.
+# A column formula ("=A * 2", "=rolling_mean(flow, 24)") computes a whole column
+# as NumPy array operations; a cell formula ("=SUM(A1:A100)", "=B5 / 2") computes
+# one value, stored in its cell. Columns are referenced by their Excel letter
+# (position in the table) or by their name, cells as A1 (rows count from 1).
+#
+# Formulas are parsed with `ast` into a whitelisted expression tree. Each
+# reference becomes an edge of the dependency DAG, labeled with the rows it
+# reads: row-aligned references (with the look-back of rolling windows and the
+# look-ahead of negative shifts) or a fixed row range (cells, ranges and
+# aggregates). After an edit only the dirty row ranges are recomputed: a
+# row-aligned formula is evaluated on the dirty slice widened by its look-back
+# and look-ahead, everything else in full.
+
+
+class FormulaError(ValueError):
+    """Raised for formulas that cannot be parsed or evaluated."""
+
+
+_CELL = re.compile(r"^([A-Z]+)([1-9][0-9]*)$")
+_LETTERS = re.compile(r"^[A-Z]+$")
+_RANGE = re.compile(r"\b([A-Z]+[1-9][0-9]*):([A-Z]+[1-9][0-9]*)\b")
+_RANGE_FUNCTION = "_RANGE_"
+
+
+def column_letter(index: int) -> str:
+    """Zero-based index to Excel-like column name (see ExcelLikeTable.column_name)."""
+    name = ""
+    while index >= 0:
+        name = chr(index % 26 + ord("A")) + name
+        index = index // 26 - 1
+    return name
+
+
+def column_index(letters: str) -> int:
+    """Excel-like column name to zero-based index."""
+    index = 0
+    for letter in letters:
+        index = index * 26 + ord(letter) - ord("A") + 1
+    return index - 1
+
+
+def _rolling(reducer):
+    def rolling(values, window):
+        values = np.asarray(values, dtype=float)
+        window = int(window)
+        result = np.full(len(values), np.nan)
+        if len(values) >= window:
+            result[window - 1:] = reducer(sliding_window_view(values, window), axis=-1)
+        return result
+    return rolling
+
+
+def _rolling_sum(values, window):
+    values = np.asarray(values, dtype=float)
+    window = int(window)
+    cumulative = np.concatenate(([0.0], np.cumsum(values)))
+    result = np.full(len(values), np.nan)
+    if len(values) >= window:
+        result[window - 1:] = cumulative[window:] - cumulative[:-window]
+    return result
+
+
+def _shift(values, periods):
+    values = np.asarray(values, dtype=float)
+    periods = int(periods)
+    result = np.full(len(values), np.nan)
+    if periods >= 0:
+        result[periods:] = values[:len(values) - periods]
+    else:
+        result[:periods] = values[-periods:]
+    return result
+
+
+def _settling_velocity(diameter, density, temperature=20.0):
+    """Terminal settling velocity (m/s) of particles in mm with densities in kg/m^3."""
+    diameter, density, temperature = np.broadcast_arrays(*(np.asarray(v, dtype=float)
+                                                           for v in (diameter, density, temperature)))
+    velocity = np.full(diameter.shape, np.nan)
+    valid = (diameter > 0) & (density > 0) & np.isfinite(temperature)
+    if valid.any():
+        velocity[valid] = terminal_settling_velocity_batch(
+            diameter[valid] * ureg.mm, density[valid] * ureg.kg / ureg.meter ** 3,
+            temperature=temperature[valid]).to(ureg.meter / ureg.second).magnitude
+    return velocity
+
+
+# name -> (function, kind); kinds: "elementwise", "aggregate" (array -> scalar),
+# "window" (second argument: literal window length) and "shift" (literal periods)
+FUNCTIONS: dict[str, tuple[Callable, str]] = {
+    "abs": (np.abs, "elementwise"),
+    "sqrt": (np.sqrt, "elementwise"),
+    "exp": (np.exp, "elementwise"),
+    "log": (np.log, "elementwise"),
+    "log10": (np.log10, "elementwise"),
+    "round": (np.round, "elementwise"),
+    "minimum": (np.minimum, "elementwise"),
+    "maximum": (np.maximum, "elementwise"),
+    "clip": (np.clip, "elementwise"),
+    "isnan": (np.isnan, "elementwise"),
+    "IF": (np.where, "elementwise"),
+    "where": (np.where, "elementwise"),
+    "SUM": (np.nansum, "aggregate"),
+    "MEAN": (np.nanmean, "aggregate"),
+    "AVERAGE": (np.nanmean, "aggregate"),
+    "MIN": (np.nanmin, "aggregate"),
+    "MAX": (np.nanmax, "aggregate"),
+    "MEDIAN": (np.nanmedian, "aggregate"),
+    "STD": (np.nanstd, "aggregate"),
+    "COUNT": (lambda values: np.count_nonzero(~np.isnan(np.asarray(values, dtype=float))), "aggregate"),
+    "rolling_mean": (_rolling(np.mean), "window"),
+    "rolling_sum": (_rolling_sum, "window"),
+    "rolling_min": (_rolling(np.min), "window"),
+    "rolling_max": (_rolling(np.max), "window"),
+    "shift": (_shift, "shift"),
+    # Design helpers; plain numbers in m^3/day, m^2, m^3, hours, mm and kg/m^3
+    "settling_velocity": (_settling_velocity, "elementwise"),
+    "overflow_rate": (lambda flow, area: np.asarray(flow, dtype=float) / area, "elementwise"),
+    "detention_time": (lambda volume, flow: 24 * np.asarray(volume, dtype=float) / flow, "elementwise"),
+    "removal_efficiency": (lambda hours, constituent="tss": removal_efficiency(hours, constituent).magnitude,
+                           "elementwise"),
+}
+CONSTANTS = {"pi": np.pi, "e": np.e, "nan": np.nan}
+
+_BINARY = {ast.Add: np.add, ast.Sub: np.subtract, ast.Mult: np.multiply, ast.Div: np.divide,
+           ast.Pow: np.power, ast.Mod: np.mod, ast.FloorDiv: np.floor_divide}
+_COMPARE = {ast.Lt: np.less, ast.LtE: np.less_equal, ast.Gt: np.greater, ast.GtE: np.greater_equal,
+            ast.Eq: np.equal, ast.NotEq: np.not_equal}
+_UNARY = {ast.USub: np.negative, ast.UAdd: np.positive, ast.Not: np.logical_not}
+
+ALL_ROWS = (0, None)
+
+
+def _literal_int(node) -> Optional[int]:
+    """Value of an integer literal such as 24 or -3, None for anything else."""
+    sign = 1
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.USub, ast.UAdd)):
+        sign = -1 if isinstance(node.op, ast.USub) else 1
+        node = node.operand
+    if isinstance(node, ast.Constant) and isinstance(node.value, int) and not isinstance(node.value, bool):
+        return sign * node.value
+    return None
+
+
+class Dependency:
+    """Edge of the formula DAG: `source` is read row-aligned or over fixed rows."""
+
+    __slots__ = ("source", "aligned", "lookback", "lookahead", "rows")
+
+    def __init__(self, source: str, aligned: bool, lookback: int = 0, lookahead: int = 0,
+                 rows: tuple = ALL_ROWS):
+        self.source = source
+        self.aligned = aligned
+        self.lookback = lookback
+        self.lookahead = lookahead
+        self.rows = rows
+
+
+class Formula:
+    """A parsed formula bound to its target column or cell."""
+
+    def __init__(self, target: str, text: str, tree: ast.Expression, dependencies: list[Dependency],
+                 lookback: int, lookahead: int):
+        self.target = target
+        self.text = text
+        self.tree = tree
+        self.dependencies = dependencies
+        self.lookback = lookback
+        self.lookahead = lookahead
+
+
+class FormulaEngine:
+    """Evaluates column and cell formulas over a dataset, recalculating dirty ranges only.
+
+    Args:
+        dataset: The data columns. Formula columns are added to it.
+        zone_map: Optional block statistics index of the dataset, kept up to
+            date with edits and recalculations (see models/zone_map.py).
+    """
+
+    def __init__(self, dataset: ColumnarDataset, zone_map: Optional[ZoneMap] = None):
+        self.dataset = dataset
+        self.zone_map = zone_map
+        self.formulas: dict[str, Formula] = {}  # Column names and cell refs -> formula
+        self.cell_values: dict[str, float] = {}
+        self._dirty: dict[str, tuple[int, int]] = {}
+        self._order: list[str] = []
+        # Serializes edits and recalculations when the GUI runs them on a worker thread
+        self.lock = threading.RLock()
+
+    @property
+    def rows(self) -> int:
+        return len(self.dataset)
+
+    # --- References ---
+
+    def resolve_column(self, reference: str) -> Optional[str]:
+        """Column name of a column name or letter, None when there is no such column."""
+        if reference in self.dataset:
+            return reference
+        if _LETTERS.match(reference):
+            index = column_index(reference)
+            if index < len(self.dataset.names):
+                return self.dataset.names[index]
+        return None
+
+    def _resolve_cell(self, reference: str) -> Optional[tuple[str, int]]:
+        match = _CELL.match(reference)
+        if not match:
+            return None
+        column = self.resolve_column(match.group(1))
+        if column is None:
+            raise FormulaError(f"Unknown column in {reference}")
+        row = int(match.group(2)) - 1
+        if row >= self.rows:
+            raise FormulaError(f"Row out of range in {reference}")
+        return column, row
+
+    def _cell_key(self, column: str, row: int) -> str:
+        return f"{column}!{row}"
+
+    # --- Parsing ---
+
+    def _parse(self, target: str, text: str, cell: Optional[tuple[str, int]]) -> Formula:
+        source = text.strip()
+        if source.startswith("="):
+            source = source[1:]
+        source = _RANGE.sub(lambda match: f"{_RANGE_FUNCTION}({match.group(1)}, {match.group(2)})", source)
+        try:
+            tree = ast.parse(source, mode="eval")
+        except SyntaxError as error:
+            raise FormulaError(f"Invalid formula {text!r}: {error.msg}") from None
+
+        dependencies: list[Dependency] = []
+        state = {"lookback": 0, "lookahead": 0}
+
+        def visit(node, lookback: int, lookahead: int, whole: bool):
+            if isinstance(node, ast.Expression):
+                return visit(node.body, lookback, lookahead, whole)
+            if isinstance(node, ast.Constant):
+                if not isinstance(node.value, (int, float, str, bool)):
+                    raise FormulaError(f"Unsupported constant in {text!r}")
+                return
+            if isinstance(node, ast.Name):
+                name = node.id
+                if name in CONSTANTS:
+                    return
+                column = self.resolve_column(name)
+                if column is not None:
+                    if whole:
+                        dependencies.append(Dependency(column, False))
+                    else:
+                        dependencies.append(Dependency(column, True, lookback, lookahead))
+                        state["lookback"] = max(state["lookback"], lookback)
+                        state["lookahead"] = max(state["lookahead"], lookahead)
+                    return
+                referenced = self._resolve_cell(name)
+                if referenced is None:
+                    raise FormulaError(f"Unknown name {name!r} in {text!r}")
+                column, row = referenced
+                dependencies.append(Dependency(column, False, rows=(row, row + 1)))
+                key = self._cell_key(column, row)
+                if key in self.formulas:
+                    dependencies.append(Dependency(key, False))
+                return
+            if isinstance(node, ast.BinOp) and type(node.op) in _BINARY:
+                visit(node.left, lookback, lookahead, whole)
+                visit(node.right, lookback, lookahead, whole)
+                return
+            if isinstance(node, ast.UnaryOp) and type(node.op) in _UNARY:
+                return visit(node.operand, lookback, lookahead, whole)
+            if isinstance(node, ast.Compare) and all(type(op) in _COMPARE for op in node.ops):
+                for child in [node.left, *node.comparators]:
+                    visit(child, lookback, lookahead, whole)
+                return
+            if isinstance(node, ast.BoolOp):
+                for child in node.values:
+                    visit(child, lookback, lookahead, whole)
+                return
+            if isinstance(node, ast.IfExp):
+                for child in (node.test, node.body, node.orelse):
+                    visit(child, lookback, lookahead, whole)
+                return
+            if isinstance(node, ast.Call) and isinstance(node.func, ast.Name):
+                name = node.func.id
+                if name == _RANGE_FUNCTION:
+                    first, last = (self._resolve_cell(arg.id) for arg in node.args)
+                    columns = self.dataset.names
+                    start, stop = sorted((columns.index(first[0]), columns.index(last[0])))
+                    rows = (min(first[1], last[1]), max(first[1], last[1]) + 1)
+                    for column in columns[start:stop + 1]:
+                        dependencies.append(Dependency(column, False, rows=rows))
+                    return
+                if name not in FUNCTIONS:
+                    raise FormulaError(f"Unknown function {name!r} in {text!r}")
+                kind = FUNCTIONS[name][1]
+                arguments = [*node.args, *(keyword.value for keyword in node.keywords)]
+                if kind == "aggregate":
+                    for argument in arguments:
+                        visit(argument, 0, 0, True)
+                    return
+                if kind in ("window", "shift"):
+                    size = _literal_int(node.args[1]) if len(node.args) == 2 else None
+                    if size is None:
+                        raise FormulaError(f"{name} needs a literal integer as second argument")
+                    if kind == "window":
+                        if size < 1:
+                            raise FormulaError(f"{name} needs a window of at least one row")
+                        return visit(node.args[0], lookback + size - 1, lookahead, whole)
+                    if size >= 0:
+                        return visit(node.args[0], lookback + size, lookahead, whole)
+                    return visit(node.args[0], lookback, lookahead - size, whole)
+                for argument in arguments:
+                    visit(argument, lookback, lookahead, whole)
+                return
+            raise FormulaError(f"Unsupported expression {type(node).__name__} in {text!r}")
+
+        visit(tree, 0, 0, False)
+        if cell is not None:
+            # A column reference in a cell formula reads the cell's row (implicit intersection)
+            row = cell[1]
+            for dependency in dependencies:
+                if dependency.aligned:
+                    dependency.aligned = False
+                    dependency.rows = (max(0, row - dependency.lookback), row + 1 + dependency.lookahead)
+        return Formula(target, text, tree, dependencies, state["lookback"], state["lookahead"])
+
+    # --- Evaluation ---
+
+    def _evaluate(self, formula: Formula, start: int, stop: int):
+        """Evaluates a formula on rows [start, stop) (row-aligned references are sliced)."""
+
+        def column_values(column: str, whole: bool):
+            values = self.dataset[column]
+            return np.asarray(values if whole else values[start:stop], dtype=float)
+
+        def evaluate(node, whole: bool):
+            if isinstance(node, ast.Expression):
+                return evaluate(node.body, whole)
+            if isinstance(node, ast.Constant):
+                return node.value
+            if isinstance(node, ast.Name):
+                if node.id in CONSTANTS:
+                    return CONSTANTS[node.id]
+                column = self.resolve_column(node.id)
+                if column is not None:
+                    return column_values(column, whole)
+                column, row = self._resolve_cell(node.id)
+                return float(self.dataset[column][row])
+            if isinstance(node, ast.BinOp):
+                return _BINARY[type(node.op)](evaluate(node.left, whole), evaluate(node.right, whole))
+            if isinstance(node, ast.UnaryOp):
+                return _UNARY[type(node.op)](evaluate(node.operand, whole))
+            if isinstance(node, ast.Compare):
+                left = evaluate(node.left, whole)
+                result = True
+                for op, comparator in zip(node.ops, node.comparators):
+                    right = evaluate(comparator, whole)
+                    result = np.logical_and(result, _COMPARE[type(op)](left, right))
+                    left = right
+                return result
+            if isinstance(node, ast.BoolOp):
+                combine = np.logical_and if isinstance(node.op, ast.And) else np.logical_or
+                result = evaluate(node.values[0], whole)
+                for value in node.values[1:]:
+                    result = combine(result, evaluate(value, whole))
+                return result
+            if isinstance(node, ast.IfExp):
+                return np.where(evaluate(node.test, whole), evaluate(node.body, whole), evaluate(node.orelse, whole))
+            if isinstance(node, ast.Call):
+                name = node.func.id
+                if name == _RANGE_FUNCTION:
+                    (first_column, first_row), (last_column, last_row) = (self._resolve_cell(arg.id)
+                                                                          for arg in node.args)
+                    names = self.dataset.names
+                    first, last = sorted((names.index(first_column), names.index(last_column)))
+                    rows = slice(min(first_row, last_row), max(first_row, last_row) + 1)
+                    return np.concatenate([np.asarray(self.dataset[column][rows], dtype=float)
+                                           for column in names[first:last + 1]])
+                function, kind = FUNCTIONS[name]
+                inner_whole = whole or kind == "aggregate"
+                arguments = [evaluate(argument, inner_whole) for argument in node.args]
+                keywords = {keyword.arg: evaluate(keyword.value, inner_whole) for keyword in node.keywords}
+                return function(*arguments, **keywords)
+            raise FormulaError(f"Unsupported expression in {formula.text!r}")
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return evaluate(formula.tree, False)
+
+    # --- Editing ---
+
+    def set_formula(self, target: str, text: str) -> Formula:
+        """Sets a column formula (target: column letter or name) or a cell formula (target: A1).
+
+        A new column name, or the letter right after the last column, adds a column.
+        """
+        with self.lock:
+            cell = self._resolve_cell(target) if _CELL.match(target) and target not in self.dataset else None
+            if cell is not None:
+                column, row = cell
+                if column in self.formulas:
+                    raise FormulaError(f"Column {column} is computed by a formula")
+                key = self._cell_key(column, row)
+            else:
+                key = self.resolve_column(target)
+                if key is None:
+                    if _LETTERS.match(target) and column_index(target) != len(self.dataset.names):
+                        raise FormulaError(f"Column {target} would leave a gap after the last column")
+                    key = column_letter(len(self.dataset.names)) if _LETTERS.match(target) else target
+                elif key not in self.formulas:
+                    raise FormulaError(f"Column {key} holds data; add the formula as a new column")
+                if any(name.startswith(f"{key}!") for name in self.formulas):
+                    raise FormulaError(f"Column {key} has cell formulas")
+
+            formula = self._parse(key, text, cell)
+            previous = self.formulas.get(key)
+            self.formulas[key] = formula
+            try:
+                self._order = self._topological_order()
+            except FormulaError:
+                if previous is None:
+                    del self.formulas[key]
+                else:
+                    self.formulas[key] = previous
+                raise
+            if cell is None and key not in self.dataset:
+                self.dataset[key] = np.full(self.rows, np.nan)
+            self._dirty[key] = (0, self.rows)
+            return formula
+
+    def remove_formula(self, target: str):
+        """Removes a formula; a formula column keeps its last values as data."""
+        with self.lock:
+            cell = self._resolve_cell(target) if _CELL.match(target) and target not in self.dataset else None
+            key = self._cell_key(*cell) if cell else self.resolve_column(target)
+            if key not in self.formulas:
+                raise KeyError(target)
+            self.recalculate()
+            del self.formulas[key]
+            self.cell_values.pop(key, None)
+            self._order = self._topological_order()
+
+    def set_values(self, column: str, start: int, values):
+        """Edits data rows [start, start + len(values)) of a data column."""
+        with self.lock:
+            name = self.resolve_column(column)
+            if name is None:
+                raise KeyError(column)
+            if name in self.formulas:
+                raise FormulaError(f"Column {name} is computed by a formula")
+            values = np.atleast_1d(values)
+            stop = start + len(values)
+            if start < 0 or stop > self.rows:
+                raise IndexError("Rows out of range")
+            data = self.dataset[name]
+            if not data.flags.writeable:  # e.g. memory-mapped read-only
+                data = data.copy()
+                self.dataset[name] = data
+            if data.dtype.kind in "iub" and np.asarray(values).dtype.kind == "f":
+                data = data.astype(float)
+                self.dataset[name] = data
+            data[start:stop] = values
+            self._mark(name, start, stop)
+
+    def set_value(self, cell: str, value):
+        """Edits one data cell (e.g. "B7")."""
+        column, row = self._resolve_cell(cell)
+        self.set_values(column, row, [value])
+
+    def _mark(self, name: str, start: int, stop: int):
+        previous = self._dirty.get(name)
+        self._dirty[name] = (start, stop) if previous is None else (min(start, previous[0]), max(stop, previous[1]))
+
+    # --- Dependency graph ---
+
+    def _node_dependencies(self, key: str) -> set[str]:
+        return {dependency.source for dependency in self.formulas[key].dependencies}
+
+    def _topological_order(self) -> list[str]:
+        nodes = set(self.formulas)
+        incoming = {key: {source for source in self._node_dependencies(key) if source in nodes} for key in nodes}
+        # A cell formula writes into its column, which every reader of that column depends on
+        for key in nodes:
+            for dependency in self.formulas[key].dependencies:
+                incoming[key] |= {cell for cell in nodes if cell.startswith(f"{dependency.source}!")}
+        order, ready = [], deque(sorted(key for key, sources in incoming.items() if not sources))
+        while ready:
+            key = ready.popleft()
+            order.append(key)
+            for other in nodes:
+                if key in incoming[other]:
+                    incoming[other].discard(key)
+                    if not incoming[other]:
+                        ready.append(other)
+        if len(order) != len(nodes):
+            raise FormulaError("Circular reference between formulas: "
+                               + ", ".join(sorted(key for key in nodes if key not in order)))
+        return order
+
+    def _dirty_range_of(self, formula: Formula) -> Optional[tuple[int, int]]:
+        """Rows of `formula`'s target invalidated by the current dirty sources."""
+        start, stop = None, None
+        for dependency in formula.dependencies:
+            source = dependency.source
+            if source not in self._dirty:
+                # Cell formulas dirty their column's row
+                continue
+            source_start, source_stop = self._dirty[source]
+            if dependency.aligned:
+                affected = (max(0, source_start - dependency.lookahead),
+                            min(self.rows, source_stop + dependency.lookback))
+            else:
+                row_start, row_stop = dependency.rows
+                row_stop = self.rows if row_stop is None else row_stop
+                if source_stop <= row_start or source_start >= row_stop:
+                    continue
+                affected = (0, self.rows)
+            start = affected[0] if start is None else min(start, affected[0])
+            stop = affected[1] if stop is None else max(stop, affected[1])
+        return None if start is None else (start, stop)
+
+    def recalculate(self) -> dict[str, tuple[int, int]]:
+        """Recomputes the dirty ranges of every formula.
+
+        Returns:
+            The recomputed row ranges, per column name or cell ("column!row").
+        """
+        with self.lock:
+            recomputed: dict[str, tuple[int, int]] = {}
+            for key in self._order:
+                formula = self.formulas[key]
+                own = self._dirty.get(key)
+                affected = self._dirty_range_of(formula)
+                if own is not None:
+                    affected = own if affected is None else (min(own[0], affected[0]), max(own[1], affected[1]))
+                if affected is None:
+                    continue
+                if "!" in key:
+                    self._recalculate_cell(key, formula)
+                    recomputed[key] = self._dirty[key]
+                    continue
+                # Aggregates and cells are evaluated in full, row-aligned references on the widened slice
+                start, stop = affected
+                low, high = max(0, start - formula.lookback), min(self.rows, stop + formula.lookahead)
+                values = np.broadcast_to(self._evaluate(formula, low, high), (high - low,))
+                self.dataset[key][start:stop] = values[start - low:stop - low]
+                self._dirty[key] = (start, stop)
+                recomputed[key] = (start, stop)
+            if self.zone_map is not None:
+                for key, (start, stop) in self._dirty.items():
+                    if "!" not in key:
+                        self.zone_map.update_rows(self.dataset, key, start, stop)
+            self._dirty.clear()
+            logging.debug(f"Recalculated {len(recomputed)} formulas")
+            return recomputed
+
+    def _recalculate_cell(self, key: str, formula: Formula):
+        column, row = key.split("!")
+        row = int(row)
+        low, high = max(0, row - formula.lookback), min(self.rows, row + 1 + formula.lookahead)
+        value = np.asarray(self._evaluate(formula, low, high), dtype=float)
+        if value.ndim == 1 and value.size == high - low:
+            value = value[row - low]
+        elif value.size != 1:
+            raise FormulaError(f"Cell formula {formula.text!r} must give a single value")
+        value = float(value.ravel()[0]) if np.ndim(value) else float(value)
+        self.cell_values[key] = value
+        data = self.dataset[column]
+        if not data.flags.writeable or data.dtype.kind != "f":
+            data = data.astype(float)
+            self.dataset[column] = data
+        data[row] = value
+        self._dirty[key] = (row, row + 1)
+        self._mark(column, row, row + 1)
+
+    def column(self, name: str) -> np.ndarray:
+        """Up-to-date values of a column (name or letter)."""
+        with self.lock:
+            if self._dirty:
+                self.recalculate()
+            resolved = self.resolve_column(name)
+            if resolved is None:
+                raise KeyError(name)
+            return self.dataset[resolved]
+
+    def cell(self, reference: str) -> float:
+        """Up-to-date value of a cell (e.g. "C12")."""
+        with self.lock:
+            if self._dirty:
+                self.recalculate()
+            column, row = self._resolve_cell(reference)
+            return float(self.dataset[column][row])
+
+    def filter_rows(self, predicates: dict[str, tuple]) -> np.ndarray:
+        """Rows satisfying every `low <= column <= high` predicate, through the zone map.
+
+        Columns are names or letters, bounds as in `ZoneMap.filter`. The zone map
+        is built on first use when the engine has none.
+        """
+        with self.lock:
+            if self._dirty:
+                self.recalculate()
+            resolved = {}
+            for column, bounds in predicates.items():
+                name = self.resolve_column(column)
+                if name is None:
+                    raise KeyError(column)
+                resolved[name] = bounds
+            if self.zone_map is None:
+                self.zone_map = ZoneMap.build(self.dataset)
+            return self.zone_map.filter(self.dataset, resolved)
@@ -0,0 +1,263 @@
+import json
+import logging
+import os
+import warnings
+from typing import Optional, Union
+
+import numpy as np
+import pint
+
+from app.units import ureg
+from models.data_models import ColumnarDataset
+
+# Zone map (block statistics index) of a ColumnarDataset.
+# Every numeric or datetime column is split into blocks of `block_size` rows,
+# and the min, max, null count and sum of each block are kept. A range
+# predicate only scans the blocks whose [min, max] overlaps the range; blocks
+# lying entirely inside it match without being read. Column summaries (count,
+# mean, std, min, max and percentiles) are computed once and cached until the
+# column is edited. The index is saved next to the column files
+# (zone_map.npz + zone_map.json) with the size and modification time of each
+# of them, and reloaded with the dataset unless a file changed since.
+
+_ARRAYS_FILE = "zone_map.npz"
+_SUMMARY_FILE = "zone_map.json"
+SUMMARY_PERCENTILES = (1, 5, 25, 50, 75, 95, 99)
+
+Bound = Union[None, float, np.datetime64, pint.Quantity]
+
+
+def _numeric(values: np.ndarray) -> Optional[np.ndarray]:
+    """Float view of a column for statistics (datetimes as int64 with NaT as NaN), None if not numeric."""
+    if values.dtype.kind in "fiub":
+        return np.asarray(values, dtype=float)
+    if values.dtype.kind == "M":
+        numbers = values.view("int64").astype(float)
+        numbers[np.isnat(values)] = np.nan
+        return numbers
+    return None
+
+
+def data_fingerprint(directory: str) -> list[list]:
+    """Name, size and modification time (ns) of the files of a saved dataset, to detect re-saves."""
+    names = sorted(name for name in os.listdir(directory)
+                   if name.endswith(".npy") or name == "dataset.json")
+    return [[name, stat.st_size, stat.st_mtime_ns]
+            for name, stat in ((name, os.stat(os.path.join(directory, name))) for name in names)]
+
+
+class ZoneMap:
+    """Per-block min/max/null statistics of the numeric columns of a dataset."""
+
+    def __init__(self, rows: int, block_size: int = 65536):
+        if block_size <= 0:
+            raise ValueError("block_size must be greater than zero")
+        self.rows = rows
+        self.block_size = block_size
+        self.blocks: dict[str, dict[str, np.ndarray]] = {}
+        self.dtypes: dict[str, str] = {}
+        self._summaries: dict[str, dict] = {}
+        self.fingerprint: Optional[list] = None  # Of the dataset files the index was saved with
+        self.blocks_scanned = 0  # Blocks read by predicates, for diagnostics
+
+    @property
+    def n_blocks(self) -> int:
+        return -(-self.rows // self.block_size)
+
+    @classmethod
+    def build(cls, dataset: ColumnarDataset, block_size: int = 65536) -> "ZoneMap":
+        """Indexes every numeric and datetime column of the dataset."""
+        zone_map = cls(len(dataset), block_size)
+        for name in dataset.names:
+            zone_map.index_column(name, dataset[name])
+        logging.debug(f"Zone map of {len(zone_map.blocks)} columns, {zone_map.n_blocks} blocks each")
+        return zone_map
+
+    def index_column(self, name: str, values: np.ndarray):
+        numbers = _numeric(values)
+        if numbers is None:
+            return
+        if len(numbers) != self.rows:
+            raise ValueError(f"Column {name} has {len(numbers)} rows, the index {self.rows}")
+        self.dtypes[name] = values.dtype.str
+        n_blocks = self.n_blocks
+        self.blocks[name] = {
+            "min": np.full(n_blocks, np.nan),
+            "max": np.full(n_blocks, np.nan),
+            "nulls": np.zeros(n_blocks, dtype=np.int64),
+            "sum": np.zeros(n_blocks),
+        }
+        self._update_blocks(name, numbers, 0, n_blocks)
+        self._summaries.pop(name, None)
+
+    def _update_blocks(self, name: str, numbers: np.ndarray, first: int, last: int):
+        """Recomputes the statistics of blocks [first, last)."""
+        stats = self.blocks[name]
+        size = self.block_size
+        start, stop = first * size, min(last * size, self.rows)
+        segment = numbers[start:stop]
+        padded = np.full((last - first) * size, np.nan)
+        padded[:len(segment)] = segment
+        blocks = padded.reshape(last - first, size)
+        nulls = np.isnan(blocks)
+        # The padding of the last block is not a null
+        nulls_count = nulls.sum(axis=1)
+        nulls_count[-1] -= (last - first) * size - len(segment)
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)  # All-NaN blocks
+            stats["min"][first:last] = np.nanmin(blocks, axis=1)
+            stats["max"][first:last] = np.nanmax(blocks, axis=1)
+        stats["nulls"][first:last] = nulls_count
+        stats["sum"][first:last] = np.nansum(blocks, axis=1)
+
+    def update_rows(self, dataset: ColumnarDataset, name: str, start: int, stop: int):
+        """Refreshes the blocks covering rows [start, stop) of an edited column."""
+        if name not in dataset:
+            return
+        if name not in self.blocks:
+            self.index_column(name, dataset[name])
+            return
+        numbers = _numeric(dataset[name])
+        self.dtypes[name] = dataset[name].dtype.str
+        first, last = start // self.block_size, -(-stop // self.block_size)
+        if last > first:
+            self._update_blocks(name, numbers, first, last)
+        self._summaries.pop(name, None)
+
+    # --- Predicates ---
+
+    def _bound(self, dataset: Optional[ColumnarDataset], name: str, bound: Bound) -> Optional[float]:
+        if bound is None:
+            return None
+        if isinstance(bound, pint.Quantity):
+            unit = dataset.units.get(name) if dataset is not None else None
+            if unit is None:
+                raise ValueError(f"Column {name} has no unit to compare {bound} with")
+            return float(bound.to(ureg(unit).units).magnitude)
+        if isinstance(bound, (np.datetime64, str)) and np.dtype(self.dtypes[name]).kind == "M":
+            return float(np.datetime64(bound).astype(np.dtype(self.dtypes[name])).view("int64"))
+        return float(bound)
+
+    def candidate_blocks(self, name: str, low: Optional[float], high: Optional[float]):
+        """Blocks that may contain values in [low, high], and those entirely inside it."""
+        stats = self.blocks[name]
+        block_min, block_max = stats["min"], stats["max"]
+        with np.errstate(invalid="ignore"):
+            overlap = ~np.isnan(block_min)
+            inside = overlap & (stats["nulls"] == 0)
+            if low is not None:
+                overlap &= block_max >= low
+                inside &= block_min >= low
+            if high is not None:
+                overlap &= block_min <= high
+                inside &= block_max <= high
+        return overlap, inside
+
+    def filter(self, dataset: ColumnarDataset, predicates: dict[str, tuple[Bound, Bound]]) -> np.ndarray:
+        """Rows satisfying every `low <= column <= high` predicate (None for open bounds).
+
+        Args:
+            dataset: The indexed dataset.
+            predicates: Column name -> (low, high). Quantities are converted to
+                the column's unit (dataset.units).
+
+        Returns:
+            The sorted indices of the matching rows.
+        """
+        if not predicates:
+            return np.arange(self.rows)
+        bounds = {}
+        candidates = np.ones(self.n_blocks, dtype=bool)
+        for name, (low, high) in predicates.items():
+            if name not in self.blocks:
+                raise KeyError(f"Column {name} is not indexed")
+            bounds[name] = (self._bound(dataset, name, low), self._bound(dataset, name, high))
+            overlap, _ = self.candidate_blocks(name, *bounds[name])
+            candidates &= overlap
+
+        matches = []
+        size = self.block_size
+        for block in np.flatnonzero(candidates):
+            start, stop = block * size, min((block + 1) * size, self.rows)
+            mask = np.ones(stop - start, dtype=bool)
+            for name, (low, high) in bounds.items():
+                if self.candidate_blocks(name, low, high)[1][block]:
+                    continue  # Whole block inside the range: no need to read it
+                self.blocks_scanned += 1
+                values = _numeric(dataset[name][start:stop])
+                with np.errstate(invalid="ignore"):
+                    if low is not None:
+                        mask &= values >= low
+                    if high is not None:
+                        mask &= values <= high
+                    if low is None and high is None:
+                        mask &= ~np.isnan(values)
+            matches.append(start + np.flatnonzero(mask))
+        return np.concatenate(matches) if matches else np.empty(0, dtype=np.int64)
+
+    # --- Summaries ---
+
+    def summary(self, dataset: ColumnarDataset, name: str) -> dict:
+        """Cached count, nulls, mean, std, min, max and percentiles of a column."""
+        if name not in self.blocks:
+            raise KeyError(f"Column {name} is not indexed")
+        if name not in self._summaries:
+            stats = self.blocks[name]
+            nulls = int(stats["nulls"].sum())
+            count = self.rows - nulls
+            numbers = _numeric(dataset[name])
+            valid = numbers[~np.isnan(numbers)]
+            summary = {"count": count, "nulls": nulls}
+            if count:
+                mean = float(stats["sum"].sum() / count)
+                summary.update(
+                    mean=mean,
+                    std=float(np.sqrt(np.mean((valid - mean) ** 2))),
+                    min=float(np.nanmin(stats["min"])),
+                    max=float(np.nanmax(stats["max"])),
+                    percentiles={str(p): float(v) for p, v in
+                                 zip(SUMMARY_PERCENTILES, np.percentile(valid, SUMMARY_PERCENTILES))},
+                )
+            self._summaries[name] = summary
+        return self._summaries[name]
+
+    # --- Persistence ---
+
+    def save(self, directory: str):
+        """Writes the index next to the dataset's column files, with their fingerprint."""
+        os.makedirs(directory, exist_ok=True)
+        self.fingerprint = data_fingerprint(directory)
+        arrays = {f"{index}:{kind}": values
+                  for index, name in enumerate(self.blocks)
+                  for kind, values in self.blocks[name].items()}
+        np.savez(os.path.join(directory, _ARRAYS_FILE), **arrays)
+        metadata = {"rows": self.rows, "block_size": self.block_size, "columns": list(self.blocks),
+                    "dtypes": self.dtypes, "summaries": self._summaries, "fingerprint": self.fingerprint}
+        with open(os.path.join(directory, _SUMMARY_FILE), "w", encoding="utf-8") as file:
+            json.dump(metadata, file, indent=2)
+
+    @classmethod
+    def load(cls, directory: str) -> "ZoneMap":
+        with open(os.path.join(directory, _SUMMARY_FILE), encoding="utf-8") as file:
+            metadata = json.load(file)
+        zone_map = cls(metadata["rows"], metadata["block_size"])
+        zone_map.dtypes = metadata["dtypes"]
+        zone_map._summaries = metadata["summaries"]
+        zone_map.fingerprint = metadata.get("fingerprint")
+        with np.load(os.path.join(directory, _ARRAYS_FILE)) as arrays:
+            for index, name in enumerate(metadata["columns"]):
+                zone_map.blocks[name] = {kind: arrays[f"{index}:{kind}"] for kind in ("min", "max", "nulls", "sum")}
+        return zone_map
+
+
+def load_indexed_dataset(directory: str, block_size: int = 65536) -> tuple[ColumnarDataset, ZoneMap]:
+    """Loads a saved dataset with its zone map, building and saving the index when missing or stale."""
+    dataset = ColumnarDataset.load(directory)
+    try:
+        zone_map = ZoneMap.load(directory)
+        if zone_map.fingerprint != data_fingerprint(directory):
+            raise ValueError("stale zone map")
+    except (OSError, ValueError, KeyError):
+        zone_map = ZoneMap.build(dataset, block_size)
+        zone_map.save(directory)
+    return dataset, zone_map
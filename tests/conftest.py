@@ -0,0 +1,26 @@
+import pytest
+
+from app.units import ureg
+from app.wastewater_treatment.primary_treatment import SedimentationTank
+
+
+@pytest.fixture
+def make_tank():
+    """Factory of a 1000 m3/d sedimentation tank to design; keyword arguments override its inputs."""
+    def make(**overrides):
+        values = dict(
+            flow_rate=1000 * ureg.meter ** 3 / ureg.day,
+            peaking_factor=2.5 * ureg.dimensionless,
+            influent_tss=200 * ureg.milligram / ureg.liter,
+            influent_bod=200 * ureg.milligram / ureg.liter,
+            surface_overflow_velocity=40 * ureg.meter / ureg.day,
+            detention_time=2 * ureg.hour,
+            weir_length=10 * ureg.meter,
+            weir_loading_rate=200 * ureg.meter ** 2 / ureg.day,
+            length=None, width=None, height=None, diameter=None,
+            depth=None, volume=None, surface_area=None,
+        )
+        values.update(overrides)
+        return SedimentationTank(**values)
+
+    return make
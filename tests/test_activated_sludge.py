@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+
+from app.units import ureg
+from app.wastewater_treatment.activated_sludge import AerationBasin, calculate_design_batch
+from app.wastewater_treatment.state_point import state_point_analysis
+
+
+def make_basin(**overrides):
+    values = dict(
+        flow_rate=10000 * ureg.meter ** 3 / ureg.day,
+        influent_bod=150 * ureg.milligram / ureg.liter,
+        solids_retention_time=8 * ureg.day,
+    )
+    values.update(overrides)
+    return AerationBasin(**values)
+
+
+def test_steady_state_design():
+    """Effluent BOD and volume follow the complete-mix equations."""
+    basin = make_basin().calculate_design()
+    # S = Ks (1 + kd SRT) / (SRT (Y k - kd) - 1)
+    s = 60 * (1 + 0.06 * 8) / (8 * (0.6 * 5 - 0.06) - 1)
+    assert basin.effluent_soluble_bod.to("mg/L").magnitude == pytest.approx(s)
+    biomass = 0.6 * 10000 * (150 - s) / (1 + 0.06 * 8) * (1 + 0.15 * 0.06 * 8)
+    assert basin.volume.to("m^3").magnitude == pytest.approx(biomass / 0.8 * 8 / 3000)
+    assert basin.return_ratio.magnitude == pytest.approx(3000 / 5000)
+    # Solids balance: the wasted solids equal the sludge production
+    wasted = (basin.waste_sludge_flow * basin.return_sludge_concentration).to("kg/day")
+    assert wasted.magnitude == pytest.approx(basin.sludge_production.to("kg/day").magnitude)
+
+
+def test_nitrification_raises_oxygen_demand():
+    """Nitrifying the influent TKN adds 4.57 g O2 per g N."""
+    carbon = make_basin().calculate_design()
+    nitrifying = make_basin(influent_tkn=35 * ureg.milligram / ureg.liter).calculate_design()
+    assert nitrifying.oxygen_demand > carbon.oxygen_demand
+    assert nitrifying.volume.magnitude == pytest.approx(carbon.volume.magnitude)
+
+
+def test_batch_matches_model_and_flags():
+    """The batch kernel reproduces the model and flags washout and ranges."""
+    basin = make_basin(temperature=ureg.Quantity(12, ureg.degC)).calculate_design()
+    batch = calculate_design_batch(10000, 150, np.array([0.2, 8.0, 30.0]), temperature=12)
+    assert batch["volume"].magnitude[1] == pytest.approx(basin.volume.magnitude)
+    assert batch["oxygen_demand"].magnitude[1] == pytest.approx(basin.oxygen_demand.magnitude)
+    assert batch["washout"].tolist() == [True, False, False]
+    assert batch["srt_in_range"].tolist() == [False, True, False]
+    with pytest.raises(ValueError):
+        make_basin(solids_retention_time=0.2 * ureg.day).calculate_design()
+
+
+def test_outputs_feed_state_point_analysis():
+    """MLSS, return ratio and flow go straight into the clarifier check."""
+    design = calculate_design_batch(np.linspace(5000, 20000, 4), 180, 10, mlss=3500)
+    check = state_point_analysis(design["mlss"], design["return_ratio"], design["flow_rate"],
+                                 800 * ureg.meter ** 2)
+    assert check["thickening_ok"].shape == (4,)
+    assert check["solids_loading_rate"].magnitude[0] < check["solids_loading_rate"].magnitude[-1]
@@ -0,0 +1,124 @@
+import importlib
+import sqlite3
+import sys
+import types
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+
+from app.cache import MISSING, ResultCache, cache_key, code_version
+from app.units import ureg
+from app.wastewater_treatment.parameters import terminal_settling_velocity
+
+
+def test_keys_are_unit_normalized():
+    """Equal quantities in different units, and ints and floats, share a key."""
+    assert cache_key("f", {"q": 1 * ureg.meter ** 3, "n": 2}) == cache_key("f", {"q": 1000 * ureg.liter, "n": 2.0})
+    assert cache_key("f", {"q": 1 * ureg.meter ** 3}) != cache_key("f", {"q": 1 * ureg.meter ** 3}, version="2")
+
+
+def test_evaluate_many_skips_cached_points(tmp_path):
+    """Only the missing points are computed, and results persist across instances."""
+    calls = []
+
+    def velocity(diameter):
+        calls.append(diameter)
+        return terminal_settling_velocity(diameter * ureg.mm, 2650 * ureg.kg / ureg.meter ** 3)
+
+    points = [{"diameter": d} for d in (0.1, 0.2, 0.3)]
+    with ResultCache(tmp_path / "cache.sqlite") as cache:
+        first = cache.evaluate_many(velocity, points[:2])
+        assert len(calls) == 2
+    with ResultCache(tmp_path / "cache.sqlite") as cache:
+        results = cache.evaluate_many(velocity, points)
+        assert len(calls) == 3
+        assert results[0].magnitude == pytest.approx(first[0].magnitude)
+        assert cache.stats().hit_ratio == pytest.approx(2 / 3)
+
+
+def test_cached_tank_designs(tmp_path, monkeypatch, make_tank):
+    """A cached design restores every computed field of the tank, until a module it runs on changes."""
+    cache = ResultCache(tmp_path / "cache.sqlite")
+    designed = cache.calculate_designs([make_tank()])[0]
+    restored = cache.calculate_designs([make_tank()])[0]
+    assert restored.surface_area.magnitude == pytest.approx(designed.surface_area.magnitude)
+    assert restored.effluent_tss.magnitude == pytest.approx(designed.effluent_tss.magnitude)
+    assert cache.stats().hits == 1
+
+    monkeypatch.setattr("app.cache.constants", types.ModuleType("app.constants"))  # Another version
+    cache.calculate_designs([make_tank()])
+    assert cache.stats().hits == 1 and cache.stats().misses == 2
+
+
+def test_size_based_eviction(tmp_path):
+    """The least recently used entries are evicted beyond max_bytes."""
+    cache = ResultCache(tmp_path / "cache.sqlite", max_bytes=10000)
+    for i in range(20):
+        cache.put(f"key{i}", b"x" * 1000)
+        cache.get("key0")  # Keep the first entry in use
+    stats = cache.stats()
+    assert stats.size_bytes <= 10000 and stats.evictions > 0
+    assert cache.get("key0") is not None
+    assert cache.get_many(["key1"]) == [MISSING]
+
+
+def test_running_totals(tmp_path):
+    """The entry count and size follow inserts, replacements and deletions without summing the table."""
+    cache = ResultCache(tmp_path / "cache.sqlite")
+    cache.put_many(["a", "b"], [b"x" * 100, b"y" * 100], namespace="first")
+    cache.put("a", b"x" * 500, namespace="second")  # Replaces the entry of "a"
+    cache.put("c", b"z" * 10, namespace="second")
+    cache.clear("first")
+
+    def totals():
+        stats = cache.stats()
+        return stats.entries, stats.size_bytes
+
+    with sqlite3.connect(tmp_path / "cache.sqlite") as connection:
+        assert totals() == connection.execute("SELECT COUNT(*), SUM(size) FROM results").fetchone()
+    assert totals()[0] == 2
+    cache.clear()
+    assert totals() == (0, 0)
+
+
+def test_version_covers_the_module(tmp_path, monkeypatch):
+    """Editing a helper of the memoized function's module changes its version."""
+    module = tmp_path / "design_helpers.py"
+    module.write_text("def _factor():\n    return 2\n\n\ndef design(x):\n    return x * _factor()\n")
+    monkeypatch.syspath_prepend(str(tmp_path))
+    monkeypatch.setattr(sys, "dont_write_bytecode", True)
+    helpers = importlib.import_module("design_helpers")
+    try:
+        cache = ResultCache(tmp_path / "cache.sqlite")
+        design = cache.memoize(helpers.design)
+        assert design(3) == 6
+        assert design.__name__ == "design" and design.__module__ == "design_helpers"
+        assert design.__wrapped__ is helpers.design
+        version = code_version(helpers.design)
+
+        module.write_text(module.read_text().replace("return 2", "return 20"))
+        helpers = importlib.reload(helpers)
+        assert code_version(helpers.design) != version
+        assert cache.memoize(helpers.design)(3) == 60
+    finally:
+        sys.modules.pop("design_helpers", None)
+
+
+def _write_points(args):
+    path, worker = args
+    cache = ResultCache(path)
+    keys = [f"{worker}-{i}" for i in range(200)]
+    for start in range(0, 200, 20):
+        cache.put_many(keys[start:start + 20], [worker * i for i in range(start, start + 20)])
+    return worker
+
+
+def test_concurrent_processes(tmp_path):
+    """Several processes can write to the same cache file at once."""
+    path = str(tmp_path / "cache.sqlite")
+    ResultCache(path).close()
+    with ProcessPoolExecutor(max_workers=4) as executor:
+        list(executor.map(_write_points, [(path, worker) for worker in range(4)]))
+    cache = ResultCache(path)
+    assert cache.stats().entries == 800
+    assert cache.get("3-199") == 3 * 199
@@ -0,0 +1,90 @@
+import itertools
+import subprocess
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from app.cli import main
+from app.sweep import grid_chunks, parse_values, run_sweep
+from models.data_models import ColumnarDataset
+from utils.ingest import read_table
+from utils.schema import infer_schema
+
+ROOT = Path(__file__).resolve().parent.parent
+
+SPEC = """
+workers = 2
+chunk_size = 7
+
+[[jobs]]
+name = "designs"
+type = "design"
+output = "out/designs.csv"
+inputs = { flow_rate = ["500 m^3/day", "10 L/s"], surface_overflow_velocity = "40 m/day", detention_time = "120 min" }
+
+[[jobs]]
+name = "sweep"
+type = "sweep"
+output = "out/sweep"
+grid = { flow_rate = { start = 1000, stop = 5000, num = 5, unit = "m^3/day" }, temperature = [10, 20, 30] }
+inputs = { particle_diameter = "0.1 mm" }
+"""
+
+
+def test_compute_core_is_headless():
+    """The compute core, the CLI and the file helpers import without loading Qt."""
+    modules = [f"app.{path.stem}" for path in (ROOT / "app").glob("*.py")]
+    modules += [f"app.{path.parent.name}.{path.stem}" for path in (ROOT / "app").glob("*/*.py")]
+    modules += ["utils.helpers", "utils.ingest"]
+    code = "import sys\n" + "".join(f"import {module}\n" for module in modules) + \
+        "assert not [name for name in sys.modules if name.startswith('PySide6')]"
+    subprocess.run([sys.executable, "-c", code], cwd=ROOT, check=True)
+
+
+def test_grid_chunks_and_values():
+    """Grid chunks stream the cartesian product in order; spec values convert to the model units."""
+    grid = {"a": np.arange(3.0), "b": np.arange(4.0), "c": np.arange(5.0)}
+    rows = np.column_stack([np.concatenate([chunk[name] for chunk in grid_chunks(grid, 7)]) for name in grid])
+    np.testing.assert_array_equal(rows, list(itertools.product(range(3), range(4), range(5))))
+    assert parse_values("10 L/s", "m^3/day") == pytest.approx(864)
+    assert parse_values("15 degC", "K") == pytest.approx(288.15)
+    assert parse_values({"start": 1, "stop": 100, "num": 3, "log": True}).tolist() == pytest.approx([1, 10, 100])
+    assert parse_values("circular") == "circular"
+
+
+def test_run_spec(tmp_path, capsys):
+    """Jobs of a TOML spec stream CSV (units in the header) and columnar outputs."""
+    (tmp_path / "jobs.toml").write_text(SPEC)
+    assert main(["run", str(tmp_path / "jobs.toml")]) == 0
+    assert "designs: 2 rows" in capsys.readouterr().out
+
+    designs = read_table(str(tmp_path / "out" / "designs.csv"), schema=infer_schema(tmp_path / "out" / "designs.csv"))
+    np.testing.assert_allclose(designs["surface_area"], [12.5, 21.6])
+    assert designs.units["surface_area"] == "m**2"
+
+    sweep = ColumnarDataset.load(tmp_path / "out" / "sweep")
+    assert len(sweep) == 15
+    np.testing.assert_array_equal(sweep["temperature"][:3], [10, 20, 30])
+    assert sweep["settling_velocity"][2] > sweep["settling_velocity"][0]  # Less viscous water
+
+    assert main(["run", str(tmp_path / "jobs.toml"), "--job", "sweep", "--format", "csv", "-j", "1",
+                 "-o", str(tmp_path / "again")]) == 0
+    again = read_table(str(tmp_path / "again" / "sweep.csv"), delimiter=",")
+    np.testing.assert_allclose(again["settling_velocity (m/d)"], sweep["settling_velocity"], rtol=1e-9)
+
+    (tmp_path / "bad.toml").write_text('[[jobs]]\ntype = "tank"\noutput = "x.csv"\n')
+    assert main(["run", str(tmp_path / "bad.toml")]) == 2
+
+    (tmp_path / "units.toml").write_text(SPEC.replace('"40 m/day"', '"40 furlongx/day"'))
+    assert main(["run", str(tmp_path / "units.toml"), "--job", "designs"]) == 1
+    assert "designs failed" in capsys.readouterr().err
+
+
+def test_run_sweep_in_processes(tmp_path):
+    """A parallel sweep gives the same rows as a serial one."""
+    grid = {"flow_rate": {"start": 1000, "stop": 20000, "num": 40}, "detention_time": [1.5, 2.0, 2.5]}
+    assert run_sweep("clarifier", grid, tmp_path / "serial.csv", chunk_size=16) == 120
+    assert run_sweep("clarifier", grid, tmp_path / "parallel.csv", chunk_size=16, workers=2) == 120
+    assert (tmp_path / "serial.csv").read_text() == (tmp_path / "parallel.csv").read_text()
@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+
+from models.data_models import ColumnarDataset, ColumnarDatasetWriter
+
+
+def test_save_and_memory_mapped_load(tmp_path):
+    """Columns, dtypes and units survive a round trip through .npy files."""
+    dataset = ColumnarDataset({
+        "time": np.arange("2024-01-01", "2024-01-03", dtype="datetime64[h]"),
+        "flow": np.linspace(1000, 2000, 48),
+        "site": np.array(["north"] * 48, dtype=object),
+    }, units={"flow": "m^3/day"})
+    dataset.save(tmp_path / "plant")
+    loaded = ColumnarDataset.load(tmp_path / "plant")
+    assert loaded.names == ["time", "flow", "site"]
+    assert isinstance(loaded["flow"], np.memmap)
+    np.testing.assert_array_equal(loaded["time"], dataset["time"])
+    assert loaded["site"][0] == "north" and loaded.units == {"flow": "m^3/day"}
+
+
+def test_columns_must_have_equal_length():
+    """A column of another length is rejected, and chunks are views."""
+    dataset = ColumnarDataset({"flow": np.zeros(10)})
+    with pytest.raises(ValueError):
+        dataset["tss"] = np.zeros(5)
+    chunks = list(dataset.iter_chunks(4))
+    assert [len(chunk["flow"]) for chunk in chunks] == [4, 4, 2]
+
+
+def test_writer_fills_missing_columns(tmp_path):
+    """Columns missing from a chunk are written as NaN, NaT, "", 0 or False."""
+    dtypes = {"flow": float, "time": "datetime64[s]", "site": "<U8", "count": np.int64, "alarm": bool}
+    with ColumnarDatasetWriter(tmp_path / "out", dtypes) as writer:
+        writer.append({"flow": [1.0, 2.0]})
+        writer.append({"count": [7], "alarm": [True], "site": ["north"]})
+    dataset = ColumnarDataset.load(tmp_path / "out")
+    np.testing.assert_array_equal(dataset["flow"], [1.0, 2.0, np.nan])
+    assert np.isnat(dataset["time"]).all() and list(dataset["site"]) == ["", "", "north"]
+    assert dataset["count"].tolist() == [0, 0, 7] and dataset["alarm"].tolist() == [False, False, True]
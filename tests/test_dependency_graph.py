@@ -0,0 +1,92 @@
+import pytest
+
+from app.dependency_graph import DependencyGraph
+from app.units import ureg
+from app.wastewater_treatment.activated_sludge import AerationBasin, aeration_basin_graph
+from app.wastewater_treatment.primary_treatment import sedimentation_tank_graph
+
+
+def test_graph_matches_calculate_design(make_tank):
+    """The graph reproduces the model's design."""
+    graph = make_tank().design_graph()
+    tank = make_tank().calculate_design()
+    assert graph["surface_area"].magnitude == pytest.approx(tank.surface_area.magnitude)
+    assert graph["length"].to("m").magnitude == pytest.approx(tank.length.to("m").magnitude)
+    assert graph["volume"].to("m^3").magnitude == pytest.approx(tank.volume.to("m^3").magnitude)
+    assert graph["effluent_tss"].magnitude == pytest.approx(tank.effluent_tss.magnitude)
+    assert graph["diameter"] is None
+
+
+def test_edits_recompute_only_dependents(make_tank):
+    """Editing an input recomputes its downstream nodes only."""
+    graph = make_tank().design_graph()
+    graph.values()
+    graph.recomputations = 0
+
+    graph["influent_tss"] = 250 * ureg.milligram / ureg.liter
+    graph.values()
+    assert graph.recomputations == 1  # effluent_tss
+
+    graph["tank_type"] = "circular"
+    graph.values()
+    assert graph.recomputations == 4  # width, length and diameter
+    assert graph["diameter"].magnitude > 0 and graph["width"] is None
+
+    # Setting an equal value (in other units) changes nothing
+    graph["influent_tss"] = 0.25 * ureg.gram / ureg.liter
+    graph.values()
+    assert graph.recomputations == 4 + 1
+
+
+def test_early_cutoff():
+    """Nodes whose dependencies recompute to the same value are skipped."""
+    graph = DependencyGraph()
+    graph.add_input("x", 3)
+    graph.add_node("sign", ["x"], lambda x: x > 0)
+    graph.add_node("label", ["sign"], lambda positive: "positive" if positive else "negative")
+    assert graph["label"] == "positive"
+    graph["x"] = 5
+    assert graph["label"] == "positive"
+    assert graph.recomputations == 3  # label was not recomputed after the edit
+    with pytest.raises(ValueError):
+        graph["sign"] = False
+
+
+def test_aeration_basin_results_are_separate_nodes():
+    """An edit of the basin only recomputes the results computed from it."""
+    basin = AerationBasin(flow_rate=10000 * ureg.meter ** 3 / ureg.day,
+                          influent_bod=150 * ureg.milligram / ureg.liter,
+                          solids_retention_time=8 * ureg.day).calculate_design()
+    graph = basin.design_graph()
+    assert graph["volume"].to("m^3").magnitude == pytest.approx(basin.volume.to("m^3").magnitude)
+    graph.values()
+    graph.recomputations = 0
+
+    graph["return_sludge_concentration"] = 10000 * ureg.milligram / ureg.liter
+    graph.values()
+    assert graph.recomputations == 2  # return_ratio and waste_sludge_flow
+    assert graph["volume"] == basin.volume and graph["return_ratio"] < basin.return_ratio
+
+    graph["solids_retention_time"] = 0.2 * ureg.day
+    with pytest.raises(ValueError, match="washout"):
+        graph["volume"]
+    assert graph["return_ratio"] is not None
+
+
+def test_chained_unit_processes():
+    """The aeration basin follows edits of the primary clarifier it is linked to."""
+    graph = DependencyGraph()
+    graph.add_graph(sedimentation_tank_graph(
+        flow_rate=10000 * ureg.meter ** 3 / ureg.day,
+        surface_overflow_velocity=40 * ureg.meter / ureg.day,
+        detention_time=2 * ureg.hour,
+        influent_bod=250 * ureg.milligram / ureg.liter), prefix="primary.")
+    graph.add_graph(aeration_basin_graph(solids_retention_time=8 * ureg.day), prefix="aeration.")
+    graph.link("aeration.flow_rate", "primary.flow_rate")
+    graph.link("aeration.influent_bod", "primary.effluent_bod")
+
+    volume = graph["aeration.volume"]
+    graph["primary.detention_time"] = 2.5 * ureg.hour  # Longer settling, less BOD to the basin
+    assert graph["aeration.volume"] < volume
+    with pytest.raises(ValueError):
+        graph.link("primary.flow_rate", "aeration.volume")
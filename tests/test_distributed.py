@@ -0,0 +1,73 @@
+import threading
+from multiprocessing.connection import Client
+
+import pytest
+
+from app.distributed import (Coordinator, SweepFailed, default_authkey, join_workers, parse_address,
+                             run_workers)
+from app.sweep import run_sweep
+
+GRID = {"flow_rate": {"start": 1000, "stop": 20000, "num": 30}, "particle_diameter": [5e-5, 1e-4, 2e-4],
+        "temperature": [10, 20]}
+
+
+def test_lost_and_hung_workers(tmp_path):
+    """Tasks of a crashed and of a hung worker are reassigned; the output matches a local sweep."""
+    coordinator = Coordinator("clarifier", GRID, {"peaking_factor": 3}, chunk_size=16, address=("127.0.0.1", 0),
+                              lease_timeout=1.0)
+    assert coordinator.tasks == 12
+    result = {}
+    thread = threading.Thread(target=lambda: result.update(rows=coordinator.run(str(tmp_path / "remote.csv"))))
+    thread.start()
+
+    crashed, hung = (Client(coordinator.address, authkey=default_authkey("127.0.0.1")) for _ in range(2))
+    for connection in (crashed, hung):
+        connection.send(("hello", "test", 0))
+        assert connection.recv()[0] == "job"
+        connection.send(("ready",))
+        assert connection.recv()[0] == "task"
+    crashed.close()
+
+    workers = run_workers(coordinator.address, 2, wait_s=1.0)
+    thread.join(timeout=60)
+    hung.close()
+    assert join_workers(workers, timeout=30) is None
+    assert result["rows"] == 180
+    assert coordinator.reassigned >= 2
+
+    run_sweep("clarifier", GRID, tmp_path / "local.csv", {"peaking_factor": 3}, chunk_size=16)
+    assert (tmp_path / "remote.csv").read_text() == (tmp_path / "local.csv").read_text()
+
+
+def test_failing_tasks_end_the_sweep(tmp_path):
+    """A task that fails on every worker fails the sweep without killing the workers."""
+    # Neither a detention time nor a side water depth: every chunk raises
+    coordinator = Coordinator("design", {"flow_rate": [1000, 2000, 3000]}, {"surface_overflow_velocity": 40},
+                              chunk_size=2, address=("127.0.0.1", 0), max_attempts=2)
+    workers = run_workers(coordinator.address, 2, wait_s=1.0)
+    with pytest.raises(SweepFailed, match="failed 2 times: ValueError"):
+        coordinator.run(str(tmp_path / "design.csv"))
+    assert join_workers(workers, timeout=30) is None
+
+    with pytest.raises(ValueError):
+        run_sweep("design", {"flow_rate": [1000, 2000, 3000]}, tmp_path / "local.csv",
+                  {"surface_overflow_velocity": 40})
+
+
+def test_no_worker_ends_the_sweep(tmp_path):
+    """Without any worker connected for `worker_timeout` seconds, the sweep fails."""
+    coordinator = Coordinator("clarifier", GRID, chunk_size=16, address=("127.0.0.1", 0), worker_timeout=0.5)
+    with pytest.raises(SweepFailed, match="No worker connected"):
+        coordinator.run(str(tmp_path / "sweep.csv"))
+
+
+def test_addresses_and_keys(monkeypatch):
+    """Addresses default the host and port; remote interfaces need a shared key."""
+    assert parse_address("node-1:6000") == ("node-1", 6000)
+    assert parse_address(":6000") == ("127.0.0.1", 6000)
+    assert parse_address("node-1") == ("node-1", 5757)
+    monkeypatch.delenv("H2OPTIM_AUTHKEY", raising=False)
+    with pytest.raises(ValueError, match="H2OPTIM_AUTHKEY"):
+        default_authkey("0.0.0.0")
+    monkeypatch.setenv("H2OPTIM_AUTHKEY", "secret")
+    assert default_authkey("0.0.0.0") == b"secret"
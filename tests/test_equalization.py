@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+
+from app.units import ureg
+from app.wastewater_treatment.equalization import (attenuation_sweep,
+                                                   damped_peak_flow,
+                                                   equalization_volume,
+                                                   equalized_design_flows)
+
+
+def square_wave(days=4, flow=1000.0):
+    """12 h at twice the average flow followed by 12 h without flow, hourly records."""
+    day = np.r_[np.full(12, 2 * flow), np.zeros(12)]
+    return np.tile(day, days)
+
+
+def test_mass_diagram_volume_square_wave():
+    """Equalizing the square wave stores half a day of average flow."""
+    volume = equalization_volume(square_wave(), time_step=1 * ureg.hour)
+    assert volume.to("m^3").magnitude == pytest.approx(500.0)
+
+
+def test_streaming_matches_whole_record():
+    """Chunked sources give the same results as the in-memory record."""
+    rng = np.random.default_rng(0)
+    flow = 1000 * (1 + 0.5 * np.sin(np.arange(5000) / 50)) + rng.normal(0, 50, 5000)
+    chunks = [flow[i:i + 777] for i in range(0, len(flow), 777)]
+
+    assert equalization_volume(chunks).magnitude == pytest.approx(equalization_volume(flow).magnitude)
+    whole = attenuation_sweep(flow, n_points=10)
+    streamed = attenuation_sweep(chunks, n_points=10, max_cells=1000)
+    np.testing.assert_allclose(streamed["volume"].magnitude, whole["volume"].magnitude)
+
+
+def test_one_shot_iterator_needs_outflow_rate():
+    """A generator can only be read once, so the average flow must be given."""
+    chunks = (chunk for chunk in np.array_split(square_wave(), 4))
+    with pytest.raises(ValueError):
+        equalization_volume(chunks)
+
+    chunks = (chunk for chunk in np.array_split(square_wave(), 4))
+    volume = equalization_volume(chunks, time_step=1 * ureg.hour, outflow_rate=1000 * ureg.meter ** 3 / ureg.day)
+    assert volume.magnitude == pytest.approx(500.0)
+
+
+def test_attenuation_sweep_and_design_flows():
+    """Bigger basins damp the peak further, down to the average flow."""
+    sweep = attenuation_sweep(square_wave(), time_step=1 * ureg.hour, n_points=11)
+    volumes = sweep["volume"].magnitude
+
+    assert np.all(np.diff(volumes) <= 0)
+    assert volumes[0] == pytest.approx(500.0)
+    assert volumes[-1] == pytest.approx(0.0)
+    assert damped_peak_flow(sweep, 500 * ureg.meter ** 3).magnitude == pytest.approx(1000.0)
+
+    flows = equalized_design_flows(sweep, 250 * ureg.meter ** 3)
+    assert flows["peak_flow_rate"].magnitude == pytest.approx(1500.0)
+    assert flows["peaking_factor"].magnitude == pytest.approx(1.5)
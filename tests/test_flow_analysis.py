@@ -0,0 +1,78 @@
+import numpy as np
+import pytest
+
+from app.units import ureg
+from app.wastewater_treatment.flow_analysis import (FlowAnalyzer, QuantileSketch,
+                                                    analyze_flow, design_flows)
+from models.data_models import ColumnarDataset
+
+
+def diurnal_record(days=10, step_seconds=60):
+    """Diurnal flow around 1000 m^3/day with noise, one record per step."""
+    rng = np.random.default_rng(1)
+    seconds = np.arange(0, days * 86400, step_seconds)
+    flow = 1000 * (1 + 0.5 * np.sin(2 * np.pi * seconds / 86400)) + rng.normal(0, 30, seconds.size)
+    times = np.datetime64("2024-01-01", "s") + seconds.astype("timedelta64[s]")
+    return times, flow
+
+
+def test_streamed_resampling_matches_whole_record():
+    """Chunk boundaries inside intervals do not change the hourly and daily statistics."""
+    times, flow = diurnal_record()
+    analyzer = FlowAnalyzer(rolling_windows={"hourly": (4,), "daily": (3,)})
+    for start in range(0, flow.size, 1001):
+        analyzer.update(flow[start:start + 1001], times[start:start + 1001])
+    result = analyzer.result()
+
+    hourly = flow.reshape(-1, 60).mean(axis=1)
+    daily = flow.reshape(-1, 1440).mean(axis=1)
+    assert result["samples"] == flow.size
+    assert result["average_flow"].magnitude == pytest.approx(flow.mean())
+    assert result["std_flow"].magnitude == pytest.approx(flow.std())
+    np.testing.assert_allclose(result["hourly"]["mean"].magnitude, hourly)
+    assert result["hourly"]["peak_flow"].magnitude == pytest.approx(hourly.max())
+    assert result["daily"]["minimum_flow"].magnitude == pytest.approx(daily.min())
+    rolling = np.convolve(hourly, np.ones(4) / 4, "valid")
+    assert result["hourly"]["rolling_peak"][4][0].magnitude == pytest.approx(rolling.max())
+    assert result["daily"]["rolling_peak"][3][0].magnitude == pytest.approx(
+        np.convolve(daily, np.ones(3) / 3, "valid").max())
+    assert result["hourly"]["peak_time"] == result["hourly"]["time"][np.argmax(hourly)]
+
+
+def test_percentiles_within_relative_accuracy():
+    """Sketch percentiles are within the relative accuracy of the exact ones."""
+    values = np.random.default_rng(2).lognormal(7, 1, 200000)
+    sketch = QuantileSketch(relative_accuracy=0.01)
+    for chunk in np.array_split(values, 7):
+        sketch.add(chunk)
+    exact = np.quantile(values, [0.05, 0.5, 0.95, 0.99], method="lower")
+    np.testing.assert_allclose(sketch.quantiles([0.05, 0.5, 0.95, 0.99]), exact, rtol=0.01)
+
+
+def test_design_flows_from_dataset_with_gaps():
+    """Missing records are skipped and the peaking factor is peak hourly over average flow."""
+    times, flow = diurnal_record(days=3)
+    flow[100:200] = np.nan
+    dataset = ColumnarDataset({"time": times, "flow": flow})
+    analysis = analyze_flow(dataset.iter_chunks(500))
+    valid = flow[~np.isnan(flow)]
+    assert analysis["missing"] == 100
+
+    flows = design_flows(analysis)
+    assert flows["average_flow_rate"].magnitude == pytest.approx(valid.mean())
+    assert flows["peaking_factor"].magnitude == pytest.approx(
+        analysis["hourly"]["peak_flow"].magnitude / valid.mean())
+
+
+def test_fixed_time_step_and_sorted_records():
+    """Records without times are spaced by time_step; unsorted times are rejected."""
+    analysis = analyze_flow([np.full(90, 1000.0), np.full(30, 3000.0)], time_step=1 * ureg.minute,
+                            start="2024-01-01")
+    np.testing.assert_allclose(analysis["hourly"]["mean"].magnitude, [1000.0, 2000.0])
+
+    analyzer = FlowAnalyzer()
+    times = np.array(["2024-01-01T01", "2024-01-01T00"], dtype="datetime64[s]")
+    with pytest.raises(ValueError):
+        analyzer.update(np.ones(2), times)
+    with pytest.raises(ValueError):
+        analyzer.update(np.ones(2))
@@ -0,0 +1,79 @@
+import numpy as np
+import pytest
+
+from app.cli import main
+from models.data_models import ColumnarDataset, ColumnarDatasetWriter
+from utils.ingest import IngestError, ingest, merge_runs
+
+START = np.datetime64("2024-01-01T00:00:00", "s")
+
+
+def write_csv(path, header, times, *columns, delimiter=","):
+    """Writes a historian-like export with ISO timestamps."""
+    with open(path, "w") as file:
+        file.write(delimiter.join(header) + "\n")
+        for row in zip(times, *columns):
+            file.write(delimiter.join(str(value) for value in row) + "\n")
+
+
+@pytest.fixture
+def exports(tmp_path):
+    """Daily flow files overlapping by one hour, plus daily TSS files (';' separated, shuffled rows)."""
+    folder = tmp_path / "exports"
+    folder.mkdir()
+    rng = np.random.default_rng(0)
+    for day in range(3):
+        seconds = np.arange(day * 86400, (day + 1) * 86400 + 3600, 60)
+        write_csv(folder / f"flow_{day}.csv", ["timestamp", "flow"], START + seconds, 1000 + seconds % 500)
+        seconds = rng.permutation(np.arange(day * 86400, (day + 1) * 86400, 600))
+        write_csv(folder / f"tss_{day}.csv", ["time", "tss"], START + seconds, 200 + seconds % 7, delimiter=";")
+    return folder
+
+
+@pytest.mark.parametrize("mode", ["serial", "thread", "process"])
+def test_ingest_merges_and_deduplicates(exports, tmp_path, mode):
+    """Overlapping files collapse to one row per timestamp, sorted, with the sensors side by side."""
+    dataset = ingest(exports, tmp_path / "merged", mode=mode, max_workers=2, block_rows=500,
+                     units={"flow": "m^3/day"})
+    seconds = np.arange(0, 3 * 86400 + 3600, 60)
+    assert dataset.names == ["time", "flow", "tss"]
+    np.testing.assert_array_equal(dataset["time"], (START + seconds).astype("datetime64[ns]"))
+    np.testing.assert_array_equal(dataset["flow"], 1000 + seconds % 500)
+    tss = dataset["tss"]
+    assert np.isnan(tss[1])
+    np.testing.assert_array_equal(tss[::10][:432], 200 + seconds[::10][:432] % 7)
+    assert dataset.units == {"flow": "m^3/day"}
+
+
+def test_first_file_wins_on_conflicts(tmp_path):
+    """Rows of equal time keep the first non-missing value in file order, across merge blocks."""
+    times = (START + np.arange(10)).astype("datetime64[ns]")
+    runs = [ColumnarDataset({"time": times, "flow": np.r_[np.nan, np.arange(1.0, 10.0)]}),
+            ColumnarDataset({"time": times[::2], "flow": np.full(5, -1.0), "site": np.array(["north"] * 5)})]
+    with ColumnarDatasetWriter(tmp_path / "out", {"time": "datetime64[ns]", "flow": float, "site": "<U8"}) as writer:
+        assert merge_runs(runs, writer, block_rows=3) == 10
+    merged = ColumnarDataset.load(tmp_path / "out")
+    np.testing.assert_array_equal(merged["flow"], np.r_[-1.0, np.arange(1.0, 10.0)])
+    assert list(merged["site"][:3]) == ["north", "", "north"]
+
+
+def test_bad_timestamps_are_reported(tmp_path):
+    """Unparseable timestamps raise an IngestError naming the file."""
+    write_csv(tmp_path / "bad.csv", ["time", "flow"], ["01/02/2024 10:00"], [1.0])
+    with pytest.raises(IngestError, match="bad.csv"):
+        ingest([tmp_path / "bad.csv"], tmp_path / "out", mode="serial")
+    dataset = ingest([tmp_path / "bad.csv"], tmp_path / "out", mode="serial", time_format="%d/%m/%Y %H:%M")
+    assert dataset["time"][0] == np.datetime64("2024-02-01T10:00")
+
+
+def test_ingest_command(exports, tmp_path, capsys):
+    """The ingest command merges a folder into a columnar dataset, and reports unparseable files."""
+    assert main(["ingest", str(exports), str(tmp_path / "merged"), "--mode", "serial",
+                 "--unit", "flow=m^3/day"]) == 0
+    assert "4380 rows" in capsys.readouterr().out
+    dataset = ColumnarDataset.load(tmp_path / "merged")
+    assert dataset.names == ["time", "flow", "tss"] and dataset.units == {"flow": "m^3/day"}
+
+    (exports / "bad.csv").write_text("time,flow\nyesterday,1\n")
+    assert main(["ingest", str(exports), str(tmp_path / "again"), "--mode", "serial"]) == 1
+    assert "bad.csv" in capsys.readouterr().err
@@ -0,0 +1,110 @@
+import json
+
+import numpy as np
+import pytest
+
+from app import instrumentation
+from app.cli import main
+from app.instrumentation import REGISTRY, Registry, count, instrumented, span
+from app.sweep import evaluate, grid_chunks
+from app.units import ureg
+from app.wastewater_treatment.parameters import terminal_settling_velocity, terminal_settling_velocity_batch
+
+
+@pytest.fixture
+def profiling():
+    REGISTRY.reset()
+    yield
+    instrumentation.disable()
+    REGISTRY.reset()
+
+
+@instrumented
+def _square(value):
+    return value * value
+
+
+def test_disabled_records_nothing(profiling):
+    """Disabled, decorated functions run unchanged and spans are the shared no-op."""
+    assert _square(3) == 9
+    count("test.count", 5)
+    assert span("test.span") is span("test.other")
+    with span("test.span"):
+        pass
+    assert REGISTRY.snapshot() == {}
+
+
+def test_statistics_and_iterations(profiling):
+    """Enabled, calls are timed with percentiles and solver iterations are counted."""
+    instrumentation.enable()
+    for value in range(100):
+        _square(value)
+    with span("test.span"):
+        terminal_settling_velocity(ureg.Quantity(1e-3, "m"), ureg.Quantity(2650, "kg/m^3"))
+    terminal_settling_velocity_batch(ureg.Quantity(np.array([1e-5, 1e-3]), "m"), ureg.Quantity(2650, "kg/m^3"))
+
+    stats = instrumentation.snapshot()
+    square = stats[f"{__name__}._square"]
+    assert square["calls"] == 100 and square["kind"] == "time"
+    assert 0 < square["min"] <= square["p50"] <= square["p90"] <= square["p99"] <= square["max"]
+    assert stats["test.span"]["total"] >= stats["app.wastewater_treatment.parameters.terminal_settling_velocity"]["total"]
+    assert stats["settling.iterations"]["kind"] == "count"
+    assert stats["settling.iterations"]["calls"] == 1 and stats["settling.iterations"]["max"] > 1
+    assert stats["settling.batch_iterations"]["calls"] == 1
+    assert "_square" in instrumentation.report()
+
+
+def test_drain_and_merge():
+    """Drained registries (e.g. of worker processes) merge into one, keeping every call."""
+    first, second = Registry(samples=10), Registry(samples=10)
+    for value in range(30):
+        first.record_count("iterations", value)
+    second.record_count("iterations", 100)
+    first.merge(second.drain())
+    merged = first.snapshot()["iterations"]
+    assert merged["calls"] == 31 and merged["total"] == sum(range(30)) + 100
+    assert merged["min"] == 0 and merged["max"] == 100
+    assert len(first.stats["iterations"].samples) == 10
+    assert second.snapshot() == {}
+
+
+def test_worker_records_are_merged(profiling):
+    """The records of the process pool of a sweep reach the parent's registry."""
+    instrumentation.enable()
+    grid = {"flow_rate": np.linspace(1000, 5000, 40), "particle_diameter": np.array([1e-4, 2e-4])}
+    chunks = list(evaluate("clarifier", grid_chunks(grid, 16), workers=2))
+    assert len(chunks) == 5
+    assert instrumentation.snapshot()["app.sweep.evaluate_chunk"]["calls"] == 5
+
+
+def test_trace_export(profiling, tmp_path):
+    """Trace events export to Chrome trace and to speedscope, with nested spans."""
+    instrumentation.enable(trace=True)
+    with span("outer"):
+        _square(2)
+        _square(3)
+    instrumentation.export_trace(tmp_path / "trace.json")
+    instrumentation.export_trace(tmp_path / "trace.speedscope.json")
+
+    events = json.loads((tmp_path / "trace.json").read_text())["traceEvents"]
+    assert [event["name"] for event in events] == [f"{__name__}._square"] * 2 + ["outer"]
+    outer = events[-1]
+    assert all(outer["ts"] <= event["ts"] and event["ts"] + event["dur"] <= outer["ts"] + outer["dur"]
+               for event in events)
+
+    profile = json.loads((tmp_path / "trace.speedscope.json").read_text())
+    frames = [frame["name"] for frame in profile["shared"]["frames"]]
+    opened = [(event["type"], frames[event["frame"]]) for event in profile["profiles"][0]["events"]]
+    square = f"{__name__}._square"
+    assert opened == [("O", "outer"), ("O", square), ("C", square), ("O", square), ("C", square), ("C", "outer")]
+
+
+def test_cli_profile(tmp_path, capsys):
+    """--profile prints the statistics of a run and leaves the instrumentation off."""
+    (tmp_path / "jobs.toml").write_text('[[jobs]]\ntype = "sweep"\noutput = "sweep.csv"\n'
+                                        'grid = { flow_rate = [1000, 2000], temperature = [10, 20] }\n')
+    assert main(["--profile", "--trace", str(tmp_path / "run.json"), "run", str(tmp_path / "jobs.toml")]) == 0
+    assert "app.sweep.evaluate_chunk" in capsys.readouterr().err
+    assert json.loads((tmp_path / "run.json").read_text())["traceEvents"]
+    assert not instrumentation.enabled()
+    REGISTRY.reset()
@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+
+from app.analysis.optimization import (ClarifierDesignProblem,
+                                       evaluate_layouts,
+                                       optimize_clarifier,
+                                       pareto_mask)
+from app.units import ureg
+
+
+@pytest.fixture
+def problem():
+    return ClarifierDesignProblem(
+        flow_rate=20000 * ureg.meter ** 3 / ureg.day,
+        influent_tss=250 * ureg.milligram / ureg.liter,
+        influent_bod=200 * ureg.milligram / ureg.liter,
+    )
+
+
+def test_pareto_mask():
+    """Only points that no other point beats on both objectives are kept."""
+    footprint = np.array([1.0, 2.0, 3.0, 2.5, 1.0])
+    effluent = np.array([5.0, 3.0, 1.0, 4.0, 6.0])
+    np.testing.assert_array_equal(pareto_mask(footprint, effluent), [True, True, True, False, False])
+
+
+def test_evaluate_layouts_flags_violations(problem):
+    """An overflow rate outside PRIMARY_CLARIFIER_OVERFLOW_RATE_RANGE is infeasible."""
+    result = evaluate_layouts(problem, "circular", np.array([4.0, 4.0]), np.array([4.0, 4.0]),
+                              np.array([4, 4]), np.array([40.0, 100.0]))
+
+    assert result["violation"][0] == 0
+    assert result["violation"][1] > 0
+    assert result["footprint"][0] == pytest.approx(20000 / 40)
+
+
+def test_optimize_clarifier_returns_feasible_minimum(problem):
+    """The optimum sits at the largest allowed overflow rate and the front is sorted."""
+    result = optimize_clarifier(problem, n_starts=2, population_size=20, generations=40, n_workers=1, seed=0)
+
+    assert result.best_design["violation"] == 0
+    assert result.best_cost == pytest.approx(20000 / 60, rel=1e-3)
+    front = result.pareto_front
+    assert np.all(np.diff(front["footprint"]) >= 0)
+    assert np.all(np.diff(front["effluent_tss"]) < 0)
+    assert np.all(front["violation"] == 0)
+
+
+def test_optimize_clarifier_infeasible(problem):
+    """A detention time range that cannot be met raises an error."""
+    problem.detention_time_range = (10, 12) * ureg.hour
+    with pytest.raises(ValueError, match="No feasible"):
+        optimize_clarifier(problem, n_starts=1, population_size=8, generations=5, n_workers=1, seed=0)
@@ -0,0 +1,129 @@
+import time
+
+import numpy as np
+import pytest
+
+from app.units import ureg
+from app.wastewater_treatment.activated_sludge import AerationBasin
+from app.wastewater_treatment.pipeline import (ActivatedSludgeStage,
+                                               FunctionStage,
+                                               Pipeline,
+                                               PrimaryClarifierStage,
+                                               SecondaryClarifierStage,
+                                               Stage)
+from app.wastewater_treatment.secondary_clarifier import LayeredSettler
+from app.wastewater_treatment.simulation import iter_chunks
+
+
+def influent(n=2000):
+    steps = np.arange(n)
+    flow = 10000 * (1 + 0.4 * np.sin(2 * np.pi * steps / 96))
+    return {
+        "time": steps,
+        "flow": flow,
+        "tss": np.full(n, 250.0),
+        "bod": np.full(n, 200.0),
+        "tkn": np.full(n, 40.0),
+        "tp": np.full(n, 7.0),
+    }
+
+
+def add_biomass(chunk):
+    """Stand-in for the aeration tank: mixed liquor at 3000 mg/L."""
+    return {**chunk, "tss": np.full(len(chunk["flow"]), 3000.0)}
+
+
+def make_plant(mode="serial", **kwargs):
+    return Pipeline([
+        PrimaryClarifierStage(surface_area=250 * ureg.meter ** 2, volume=1000 * ureg.meter ** 3),
+        FunctionStage(name="aeration", function=add_biomass),
+        SecondaryClarifierStage(settler=LayeredSettler(surface_area=1500 * ureg.meter ** 2, depth=4 * ureg.meter),
+                                underflow_ratio=0.4),
+    ], mode=mode, **kwargs)
+
+
+def test_serial_plant_chain():
+    """Stages chain their effluents and add prefixed diagnostics."""
+    plant = make_plant()
+    record = influent()
+    result = list(plant.run(iter_chunks(record, 500)))
+    assert len(result) == 4
+    last = result[-1]
+    assert last["flow"] == pytest.approx(0.6 * record["flow"][-500:])
+    assert np.all(last["bod"] < 200) and np.all(last["tkn"] == 40)
+    assert np.all(last["tss"] < 100) and np.all(last["secondary.underflow_tss"] > 3000)
+    assert {"primary.overflow_rate", "secondary.sludge_blanket"} <= set(last)
+    assert plant.timings["secondary"].rows == len(record["flow"])
+
+
+@pytest.mark.parametrize("mode", ["thread", "process"])
+def test_parallel_modes_match_serial(mode):
+    """Running the stages concurrently does not change the results or their order."""
+    record = influent()
+    serial = list(make_plant().run(iter_chunks(record, 250)))
+    plant = make_plant(mode, max_queued_chunks=2)
+    parallel = list(plant.run(iter_chunks(record, 250)))
+    assert len(parallel) == len(serial)
+    for expected, chunk in zip(serial, parallel):
+        np.testing.assert_allclose(chunk["tss"], expected["tss"])
+        np.testing.assert_array_equal(chunk["time"], expected["time"])
+    assert set(plant.timings) == {"primary", "aeration", "secondary"}
+    assert plant.timings["primary"].chunks == len(serial)
+
+
+def test_backpressure_bounds_read_ahead():
+    """A slow consumer stops the source from being read far ahead."""
+    produced = []
+
+    def source():
+        for chunk in iter_chunks(influent(), 20):
+            produced.append(1)
+            yield chunk
+
+    stream = make_plant("thread", max_queued_chunks=1).run(source())
+    next(stream)
+    time.sleep(0.5)
+    # At most one chunk per queue, one per stage in flight and one in the feeder
+    assert len(produced) <= 9
+    stream.close()
+
+
+def test_plant_with_aeration_basin():
+    """Primary, aeration and secondary stages close the flow balance."""
+    basin = AerationBasin(flow_rate=10000 * ureg.meter ** 3 / ureg.day,
+                          influent_bod=150 * ureg.milligram / ureg.liter,
+                          solids_retention_time=8 * ureg.day,
+                          influent_tkn=40 * ureg.milligram / ureg.liter).calculate_design()
+    ratio = basin.return_ratio.magnitude
+    plant = Pipeline([
+        PrimaryClarifierStage(surface_area=250 * ureg.meter ** 2, volume=1000 * ureg.meter ** 3),
+        ActivatedSludgeStage(basin=basin),
+        SecondaryClarifierStage(settler=LayeredSettler(surface_area=1500 * ureg.meter ** 2, depth=4 * ureg.meter),
+                                underflow_ratio=ratio / (1 + ratio)),
+    ])
+    record = influent()
+    last = list(plant.run(iter_chunks(record, 500)))[-1]
+    assert last["flow"] == pytest.approx(record["flow"][-500:])
+    assert np.all(last["bod"] < 10) and np.all(last["tkn"] == 1)
+    assert np.all(last["aeration.oxygen_demand"] > 0)
+
+
+def failing(chunk):
+    raise RuntimeError("bad chunk")
+
+
+@pytest.mark.parametrize("mode", ["serial", "thread"])
+def test_stage_errors_reach_the_consumer(mode):
+    """An exception in a stage is raised by the consuming loop."""
+    plant = Pipeline([FunctionStage(name="broken", function=failing)], mode=mode)
+    with pytest.raises(RuntimeError, match="bad chunk"):
+        list(plant.run(iter_chunks(influent(), 500)))
+
+
+def test_stages_must_implement_process():
+    """A stage without `process` cannot be created."""
+    class Unfinished(Stage):
+        pass
+
+    with pytest.raises(TypeError, match="process"):
+        Unfinished(name="unfinished")
@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+
+from app.units import ureg
+from app.wastewater_treatment.primary_treatment import calculate_design_batch, removal_efficiency
+
+
+def test_removal_efficiency_curve():
+    """Removal follows R(%) = t / (a + b t) (Crites and Tchobanoglous)."""
+    assert removal_efficiency(2 * ureg.hour, "tss").magnitude == pytest.approx(0.5634, rel=1e-3)
+    assert removal_efficiency(2.0, "bod").magnitude == pytest.approx(0.3448, rel=1e-3)
+    with pytest.raises(ValueError):
+        removal_efficiency(2.0, "tkn")
+
+
+def test_calculate_design_rectangular(make_tank):
+    """A 1000 m3/d tank at 40 m/d and 2 h is 25 m2, 10 m x 2.5 m."""
+    tank = make_tank().calculate_design()
+
+    assert tank.surface_area.to("m^2").magnitude == pytest.approx(25)
+    assert tank.length.to("m").magnitude == pytest.approx(10)
+    assert tank.width.to("m").magnitude == pytest.approx(2.5)
+    # 56.3 % TSS removal at 2 h (Crites and Tchobanoglous): 200 mg/L in, 87.3 mg/L out
+    assert tank.effluent_tss.to("mg/L").magnitude == pytest.approx(87.3, abs=0.05)
+    assert 0 < tank.effluent_bod.to("mg/L").magnitude < 200
+
+
+def test_results_in_declared_units(make_tank):
+    """Design results are stored in the units of their fields, whatever units the inputs came in."""
+    tank = make_tank(flow_rate=1000 * ureg.liter / ureg.minute, detention_time=90 * ureg.minute,
+                     surface_overflow_velocity=2 * ureg.meter / ureg.hour).calculate_design()
+    assert tank.volume.units == ureg.meter ** 3 and tank.volume.magnitude == pytest.approx(90)
+    assert tank.surface_area.units == ureg.meter ** 2 and tank.surface_area.magnitude == pytest.approx(30)
+    assert tank.length.units == tank.width.units == tank.side_water_depth.units == ureg.meter
+    assert tank.detention_time.units == ureg.hour and tank.detention_time.magnitude == pytest.approx(1.5)
+    assert tank.surface_overflow_velocity.units == ureg.meter / ureg.day
+    assert tank.effluent_tss.units == ureg.milligram / ureg.liter
+    assert tank.tss_removal_efficiency.units == ureg.dimensionless
+    with pytest.raises(ValueError):
+        tank.volume = 3 * ureg.meter
+
+
+@pytest.mark.parametrize("tank_type", ["rectangular", "circular"])
+def test_calculate_design_batch_matches_model(tank_type, make_tank):
+    """The struct-of-arrays path reproduces `SedimentationTank.calculate_design`."""
+    flows = np.array([500.0, 1000.0, 4000.0])
+    batch = calculate_design_batch(
+        flow_rate=flows * ureg.meter ** 3 / ureg.day,
+        surface_overflow_velocity=40 * ureg.meter / ureg.day,
+        detention_time=2 * ureg.hour,
+        tank_type=tank_type,
+        influent_tss=200 * ureg.milligram / ureg.liter,
+        influent_bod=200 * ureg.milligram / ureg.liter,
+    )
+
+    for i, flow in enumerate(flows):
+        tank = make_tank(flow_rate=flow * ureg.meter ** 3 / ureg.day, tank_type=tank_type).calculate_design()
+        assert batch["surface_area"][i].to("m^2").magnitude == pytest.approx(tank.surface_area.to("m^2").magnitude)
+        assert batch["volume"][i].to("m^3").magnitude == pytest.approx(tank.volume.to("m^3").magnitude)
+        assert batch["side_water_depth"][i].to("m").magnitude == pytest.approx(tank.side_water_depth.to("m").magnitude)
+        assert batch["effluent_bod"][i].to("mg/L").magnitude == pytest.approx(tank.effluent_bod.to("mg/L").magnitude)
+        if tank_type == "circular":
+            assert batch["diameter"][i].to("m").magnitude == pytest.approx(tank.diameter.to("m").magnitude)
+        else:
+            assert batch["length"][i].to("m").magnitude == pytest.approx(tank.length.to("m").magnitude)
+
+
+def test_calculate_design_batch_requires_depth_or_detention_time():
+    """Missing both the detention time and side water depth is an error."""
+    with pytest.raises(ValueError):
+        calculate_design_batch(flow_rate=np.array([1000.0]), surface_overflow_velocity=40.0)
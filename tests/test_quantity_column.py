@@ -0,0 +1,57 @@
+import numpy as np
+import pint
+import pytest
+
+from app.quantity_column import QuantityColumn
+from app.units import ureg
+from app.wastewater_treatment.primary_treatment import calculate_design_batch
+from app.wastewater_treatment.simulation import iter_chunks, simulate_clarifier
+from models.data_models import ColumnarDataset
+
+
+def test_views_and_conversion():
+    """Slices share memory with the column; conversions use the array, including offset units."""
+    flow = QuantityColumn(np.arange(1_000_000, dtype=float), "m^3/day")
+    assert flow.magnitude.nbytes == 8_000_000
+    window = flow[10:20]
+    assert np.shares_memory(window.magnitude, flow.magnitude)
+    assert window.m_as("m^3/day") is window.magnitude
+    np.testing.assert_allclose(flow[:3].m_as("L/s"), np.arange(3) * 1000 / 86400)
+    assert flow[5] == 5 * ureg("m^3/day")
+    temperature = QuantityColumn([20.0, 100.0], "degC")
+    np.testing.assert_allclose(temperature.m_as("K"), [293.15, 373.15])
+    np.testing.assert_allclose(temperature.to("degF").magnitude, [68.0, 212.0])
+    with pytest.raises(pint.DimensionalityError):
+        flow.m_as("mg/L")
+
+
+def test_arithmetic():
+    """Sums convert the other operand to the column's unit; products combine units."""
+    flow = QuantityColumn([1.0, 2.0], "m^3/day")
+    total = flow + QuantityColumn([1000.0, 1000.0], "L/day")
+    np.testing.assert_allclose(total.magnitude, [2.0, 3.0])
+    load = flow * (200 * ureg("mg/L"))
+    np.testing.assert_allclose(load.m_as("kg/day"), [0.2, 0.4])
+    np.testing.assert_array_equal(flow > 1500 * ureg("L/day"), [False, True])
+    np.testing.assert_allclose((np.array([2.0, 4.0]) / flow).magnitude, [2.0, 2.0])
+    assert (flow / flow).units == ureg.dimensionless
+    assert flow.mean() == 1.5 * ureg("m^3/day")
+
+
+def test_columns_feed_batch_kernels(tmp_path):
+    """Dataset columns go straight into the batch design and the clarifier simulation."""
+    dataset = ColumnarDataset({"flow": np.linspace(100.0, 200.0, 10), "tss": np.full(10, 250.0),
+                               "bod": np.full(10, 180.0)}, units={"flow": "L/s", "tss": "mg/L", "bod": "mg/L"})
+    flow = dataset.quantity("flow")
+    assert flow.magnitude is dataset["flow"]
+    design = calculate_design_batch(flow, surface_overflow_velocity=40 * ureg("m/day"),
+                                    detention_time=2 * ureg.hour)
+    expected = calculate_design_batch(flow.quantity, surface_overflow_velocity=40 * ureg("m/day"),
+                                      detention_time=2 * ureg.hour)
+    np.testing.assert_allclose(design["surface_area"].magnitude, expected["surface_area"].magnitude)
+
+    columns = {name: dataset.quantity(name) for name in dataset.names}
+    chunks = list(simulate_clarifier(None, iter_chunks(columns, chunk_size=4), surface_area=500 * ureg("m^2"),
+                                     volume=2000 * ureg("m^3")))
+    np.testing.assert_allclose(np.concatenate([chunk["overflow_rate"] for chunk in chunks]),
+                               flow.m_as("m^3/day") / 500)
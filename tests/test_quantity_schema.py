@@ -0,0 +1,57 @@
+import time
+from typing import Annotated, Optional
+
+import numpy as np
+import pint
+import pytest
+from pydantic import BaseModel, ValidationError
+
+from app.quantity_column import QuantityColumn
+from app.quantity_schema import QuantitySchema
+from app.units import ureg
+
+
+class Influent(BaseModel):
+    """Array-valued fields: a flow series and an optional temperature."""
+
+    flow: Annotated[pint.Quantity, QuantitySchema("m^3/day", gt=0)]
+    temperature: Optional[Annotated[pint.Quantity, QuantitySchema("degC", ge=0)]] = None
+
+
+def test_canonical_units_and_inputs():
+    """Quantities, columns, strings and plain numbers end up in the field's unit."""
+    assert Influent(flow=10 * ureg("L/s")).flow.magnitude == pytest.approx(864.0)
+    assert Influent(flow="864 m^3/day").flow.units == ureg("m^3/day").units
+    assert Influent(flow=[1.0, 2.0]).flow.magnitude.tolist() == [1.0, 2.0]
+    column = QuantityColumn([1.0, 2.0], "m^3/day")
+    assert Influent(flow=column).flow.magnitude is column.magnitude
+    assert Influent(flow=1 * ureg("m^3/day"), temperature=300 * ureg.kelvin).temperature.magnitude == \
+        pytest.approx(26.85)
+
+
+def test_dimensionality_and_bounds(make_tank):
+    """Wrong dimensions, non-positive or NaN magnitudes and other types are rejected."""
+    with pytest.raises(ValidationError, match="meter"):
+        Influent(flow=10 * ureg("mg/L"))
+    with pytest.raises(ValidationError, match="greater than 0"):
+        Influent(flow=np.array([1.0, 0.0]) * ureg("m^3/day"))
+    with pytest.raises(ValidationError):
+        Influent(flow=np.array([1.0, np.nan]) * ureg("m^3/day"))
+    with pytest.raises(ValidationError):
+        Influent(flow=True)
+    with pytest.raises(ValidationError):
+        make_tank(detention_time=-2 * ureg.hour)
+    tank = make_tank(detention_time=120 * ureg.minute)
+    assert tank.detention_time.units == ureg.hour and tank.detention_time.magnitude == pytest.approx(2)
+
+
+def test_large_arrays_validate_quickly():
+    """A million-element field validates in milliseconds, converted or not."""
+    flows = np.random.default_rng(0).uniform(1.0, 2.0, 1_000_000)
+    Influent(flow=flows * ureg("L/s"))  # Warm the conversion cache
+    start = time.perf_counter()
+    same = Influent(flow=ureg.Quantity(flows, "m^3/day"))
+    converted = Influent(flow=flows * ureg("L/s"))
+    assert time.perf_counter() - start < 0.1
+    assert same.flow.magnitude is flows
+    assert converted.flow.magnitude[0] == pytest.approx(flows[0] * 86.4)
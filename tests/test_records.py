@@ -0,0 +1,105 @@
+import json
+from functools import partial
+
+import numpy as np
+import pytest
+
+from utils.ingest import TABLE_READERS, ingest, load_table, read_table
+from utils.records import iter_json_records, iter_xml_records, read_json_table
+
+RECORDS = [{"time": f"2024-01-01T{hour:02d}:00", "flow": 1000.0 + hour, "site": {"name": "north", "note": "a},b"}}
+           for hour in range(24)]
+
+
+@pytest.mark.parametrize("block_characters", [16, 100, 1 << 20])
+def test_json_records_across_blocks(tmp_path, block_characters):
+    """Arrays, arrays under a key and JSON Lines give the same records whatever the block size."""
+    (tmp_path / "array.json").write_text(json.dumps(RECORDS, indent=1))
+    (tmp_path / "keyed.json").write_text(json.dumps({"meta": {"plant": "A"}, "records": RECORDS}))
+    (tmp_path / "lines.jsonl").write_text("".join(json.dumps(record) + "\n" for record in RECORDS))
+    assert list(iter_json_records(str(tmp_path / "array.json"), block_characters=block_characters)) == RECORDS
+    assert list(iter_json_records(str(tmp_path / "keyed.json"), records_key="records",
+                                  block_characters=block_characters)) == RECORDS
+    assert list(iter_json_records(str(tmp_path / "lines.jsonl"), block_characters=block_characters)) == RECORDS
+
+
+@pytest.mark.parametrize("block_characters", [16, 1 << 20])
+def test_json_records_key_among_members(tmp_path, block_characters):
+    """Only a member of the top-level object is the records key, and the object may go on after it."""
+    layouts = [{"source": "records", "records": RECORDS},
+               {"meta": {"records": 1}, "records": RECORDS},
+               {"records": RECORDS, "meta": {"rows": 24, "tags": ["a]", "b"]}}]
+    for index, layout in enumerate(layouts):
+        (tmp_path / f"{index}.json").write_text(json.dumps(layout))
+        assert list(iter_json_records(str(tmp_path / f"{index}.json"), records_key="records",
+                                      block_characters=block_characters)) == RECORDS
+    with pytest.raises(ValueError, match="no 'rows' array"):
+        list(iter_json_records(str(tmp_path / "0.json"), records_key="rows"))
+    with pytest.raises(ValueError, match="not an array"):
+        list(iter_json_records(str(tmp_path / "0.json"), records_key="source"))
+    (tmp_path / "trailing.json").write_text(json.dumps(RECORDS) + ' {"more": 1}')
+    with pytest.raises(ValueError, match="unexpected data after the records"):
+        list(iter_json_records(str(tmp_path / "trailing.json")))
+
+
+def test_json_table_columns(tmp_path, monkeypatch):
+    """Nested fields become dotted columns; fields missing from earlier chunks are padded."""
+    monkeypatch.setitem(TABLE_READERS, ".json", partial(read_json_table, chunk_rows=2))
+    records = [{"flow": 1.0, "tags": ["a"]}, {"flow": None}] * 3 + [{"flow": 2.0, "tss": 210.0, "online": True}]
+    (tmp_path / "flows.json").write_text(json.dumps(records))
+    dataset = read_table(str(tmp_path / "flows.json"))
+    assert dataset.names == ["flow", "tags", "tss", "online"]
+    np.testing.assert_array_equal(dataset["flow"], [1.0, np.nan] * 3 + [2.0])
+    np.testing.assert_array_equal(dataset["tss"], [np.nan] * 6 + [210.0])
+    assert list(dataset["tags"][:2]) == ['["a"]', ""]
+
+    (tmp_path / "nested.json").write_text(json.dumps(RECORDS))
+    dataset = read_table(str(tmp_path / "nested.json"))
+    assert dataset.names == ["time", "flow", "site.name", "site.note"]
+    assert dataset["site.note"][0] == "a},b"
+
+    (tmp_path / "bad.json").write_text('{"flow": 1.0, "tss":')
+    with pytest.raises(ValueError):
+        read_table(str(tmp_path / "bad.json"))
+
+
+def test_load_table_is_memory_mapped(tmp_path, monkeypatch):
+    """Files are loaded chunk by chunk into a saved dataset equal to `read_table`'s, and memory-mapped."""
+    monkeypatch.setitem(TABLE_READERS, ".json", partial(read_json_table, chunk_rows=2))
+    records = [{"flow": 1.0, "level": 2.5}, {"flow": None, "level": 3.0}] * 3 + \
+        [{"flow": 2.0, "tss": 210.0, "level": "high"}]
+    (tmp_path / "flows.json").write_text(json.dumps(records))
+    dataset = load_table(str(tmp_path / "flows.json"), str(tmp_path / "loaded"), units={"flow": "m^3/day"})
+    expected = read_table(str(tmp_path / "flows.json"))
+    assert dataset.names == expected.names == ["flow", "level", "tss"]
+    for name in dataset.names:
+        np.testing.assert_array_equal(dataset[name], expected[name])
+    assert list(dataset["level"][:2]) == ["2.5", "3.0"] and dataset["level"][-1] == "high"
+    assert isinstance(dataset["flow"], np.memmap) and dataset.units == {"flow": "m^3/day"}
+    assert not any(path.name.startswith(".chunks-") for path in (tmp_path / "loaded").iterdir())
+
+
+def test_xml_records(tmp_path):
+    """Children of the root (or `record_tag` elements) are records of attributes and leaf elements."""
+    rows = "".join(f'<r:reading id="{i}"><flow>{i * 0.5}</flow><site code="N">north</site></r:reading>'
+                   for i in range(5))
+    (tmp_path / "flows.xml").write_text(f'<r:export xmlns:r="urn:plant"><r:meta>x</r:meta>'
+                                        f'<r:readings>{rows}</r:readings></r:export>')
+    records = list(iter_xml_records(str(tmp_path / "flows.xml"), record_tag="reading"))
+    assert records[1] == {"id": "1", "flow": "0.5", "site.code": "N", "site": "north"}
+    dataset = read_table(str(tmp_path / "flows.xml"), record_tag="reading")
+    np.testing.assert_array_equal(dataset["flow"], np.arange(5) * 0.5)
+    assert len(list(iter_xml_records(str(tmp_path / "flows.xml")))) == 2
+
+    (tmp_path / "truncated.xml").write_text(f'<r:export xmlns:r="urn:plant"><r:readings>{rows[:-20]}')
+    with pytest.raises(ValueError, match="truncated.xml"):
+        list(iter_xml_records(str(tmp_path / "truncated.xml"), record_tag="reading"))
+
+
+def test_json_ingest(tmp_path):
+    """JSON record dumps are ingested by timestamp like CSV exports."""
+    (tmp_path / "a.json").write_text(json.dumps(RECORDS[12:]))
+    (tmp_path / "b.jsonl").write_text("".join(json.dumps(record) + "\n" for record in RECORDS[:13]))
+    dataset = ingest(tmp_path, tmp_path / "merged", mode="serial")
+    assert len(dataset) == 24
+    np.testing.assert_array_equal(dataset["flow"], 1000.0 + np.arange(24))
@@ -0,0 +1,78 @@
+import numpy as np
+import pytest
+
+from utils.ingest import ingest, read_table
+from utils.schema import SchemaCache, infer_schema, parse_formatted_times, source_pattern, split_unit
+
+
+def write_scada(path, day, rows=48, encoding="cp1252"):
+    """Half-hourly SCADA export: ';' separated, day-first timestamps, units in the header."""
+    lines = ["Horodatage;Débit (m3/d);MES [mg/L];Etat"]
+    for index in range(rows):
+        minutes = index * 30
+        lines.append(f"{day:02d}/01/2024 {minutes // 60:02d}:{minutes % 60:02d};{1000 + index}.5;{200 + index};"
+                     f"{'ok' if index % 2 else 'arrêt'}")
+    path.write_bytes(("\r\n".join(lines) + "\r\n").encode(encoding))
+
+
+def test_infer_schema(tmp_path):
+    """Encoding, delimiter, header, types, timestamp formats and units come from a sample."""
+    write_scada(tmp_path / "scada_20240103.csv", day=3)
+    schema = infer_schema(str(tmp_path / "scada_20240103.csv"), sample_bytes=512)
+    assert (schema.encoding, schema.delimiter, schema.header) == ("cp1252", ";", True)
+    assert schema.names == ["Horodatage", "Débit", "MES", "Etat"]
+    assert [(column.kind, column.time_format) for column in schema.columns] == [
+        ("datetime", "%d/%m/%Y %H:%M"), ("float", None), ("float", None), ("text", None)]
+    assert schema.units == {"Débit": "m^3/d", "MES": "mg/L"}
+
+    (tmp_path / "plain.csv").write_text("2024-01-01T00:00,1.5\n2024-01-01T01:00,2.5\n")
+    schema = infer_schema(str(tmp_path / "plain.csv"))
+    assert not schema.header
+    assert [column.kind for column in schema.columns] == ["datetime", "float"]
+    assert split_unit("pH") == ("pH", None) and split_unit("Pump (P-2)")[1] is None
+
+
+def test_fixed_width_times():
+    """Fixed-width formats are parsed without strptime and agree with it; other values fall back."""
+    values = np.array(["31/12/2023 23:30", "", "01/01/2024 00:00"])
+    np.testing.assert_array_equal(parse_formatted_times(values, "%d/%m/%Y %H:%M"),
+                                  np.array(["2023-12-31T23:30", "NaT", "2024-01-01T00:00"], dtype="datetime64[ns]"))
+    assert parse_formatted_times(np.array(["1/2/2024 10:00"]), "%d/%m/%Y %H:%M")[0] == np.datetime64("2024-02-01T10:00")
+    with pytest.raises(ValueError):
+        parse_formatted_times(np.array(["32/01/2024 00:00"]), "%d/%m/%Y %H:%M")
+
+
+def test_schema_cache_by_source_pattern(tmp_path):
+    """Daily exports share one cached schema, persisted to disk, until their header changes."""
+    for day in (1, 2):
+        write_scada(tmp_path / f"scada_2024010{day}.csv", day=day)
+    assert source_pattern("exports/scada_20240101.csv") == "scada_#.csv"
+    schemas = SchemaCache(tmp_path / "cache" / "schemas.json")
+    first = schemas.schema_for(tmp_path / "scada_20240101.csv")
+    reloaded = SchemaCache(tmp_path / "cache" / "schemas.json")
+    assert reloaded.schema_for(tmp_path / "scada_20240102.csv") == first
+    assert (reloaded.hits, reloaded.misses) == (1, 0)
+
+    dataset = read_table(str(tmp_path / "scada_20240102.csv"), schema=first)
+    assert dataset["Horodatage"][1] == np.datetime64("2024-01-02T00:30")
+    assert dataset["Débit"][0] == 1000.5
+    assert dataset.units == {"Débit": "m^3/d", "MES": "mg/L"}
+
+    (tmp_path / "scada_20240104.csv").write_text("Horodatage;Débit (m3/d)\n04/01/2024 00:00;1\n")
+    assert reloaded.schema_for(tmp_path / "scada_20240104.csv").names == ["Horodatage", "Débit"]
+    assert reloaded.misses == 1
+    assert reloaded.schema_for(tmp_path / "other.xlsx") is None
+
+
+def test_ingest_with_schemas(tmp_path):
+    """Ingest parses known layouts with their schema and keeps the header units."""
+    folder = tmp_path / "exports"
+    folder.mkdir()
+    for day in (1, 2, 3):
+        write_scada(folder / f"scada_2024010{day}.csv", day=day)
+    schemas = SchemaCache()
+    dataset = ingest(folder, tmp_path / "merged", mode="thread", schemas=schemas, time_column="Horodatage")
+    assert len(dataset) == 144
+    assert dataset.units == {"Débit": "m^3/d", "MES": "mg/L"}
+    assert (schemas.hits, schemas.misses) == (2, 1)
+    assert list(dataset["Etat"][:2]) == ["arrêt", "ok"]
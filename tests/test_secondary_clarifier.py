@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+
+from app.units import ureg
+from app.wastewater_treatment.secondary_clarifier import LayeredSettler
+
+
+def constant_feed(steps, flow=36892.0, tss=3000.0, underflow=18831.0):
+    return {"flow": np.full(steps, flow), "tss": np.full(steps, tss), "underflow": np.full(steps, underflow)}
+
+
+@pytest.fixture
+def settler():
+    return LayeredSettler(surface_area=1500 * ureg.meter ** 2, depth=4 * ureg.meter)
+
+
+def test_steady_state_mass_balance(settler):
+    """At steady state the solids fed leave through the effluent and the underflow."""
+    result = next(settler.simulate([constant_feed(5000)], time_step=5 * ureg.minute))
+    effluent, underflow = result["effluent_tss"][-1], result["underflow_tss"][-1]
+
+    assert (36892 - 18831) * effluent + 18831 * underflow == pytest.approx(36892 * 3000, rel=1e-6)
+    assert effluent < 30
+    assert np.all(result["layers"] >= 0)
+
+
+def test_streaming_resumes_from_state(settler):
+    """Feeding a record in pieces or in one go gives the same trajectory."""
+    feed = constant_feed(400)
+    whole = next(settler.simulate([feed]))["effluent_tss"]
+
+    settler.reset()
+    first = next(settler.simulate([{k: v[:150] for k, v in feed.items()}]))["effluent_tss"]
+    second = next(settler.simulate([{k: v[150:] for k, v in feed.items()}]))["effluent_tss"]
+    np.testing.assert_allclose(np.r_[first, second], whole)
+
+
+def test_sludge_blanket_rises_with_low_underflow(settler):
+    """Cutting the underflow pushes the sludge blanket up."""
+    normal = next(settler.simulate([constant_feed(3000)]))["sludge_blanket"][-1]
+    settler.reset()
+    starved = next(settler.simulate([constant_feed(3000, underflow=5000.0)]))["sludge_blanket"][-1]
+    assert starved > normal
+    assert settler.sludge_blanket_height().to("m").magnitude == pytest.approx(starved)
+    profiles = np.array([[0.0] * 10, [0.0] * 6 + [4000.0] * 4])
+    np.testing.assert_allclose(settler.sludge_blanket_height(profiles).to("m").magnitude, [0.0, 1.6])
+
+
+def test_invalid_settler_input(settler):
+    """Layer counts, feed layers and underflows are validated."""
+    with pytest.raises(ValueError):
+        LayeredSettler(surface_area=1500 * ureg.meter ** 2, depth=4 * ureg.meter, n_layers=5)
+    with pytest.raises(ValueError):
+        LayeredSettler(surface_area=1500 * ureg.meter ** 2, depth=4 * ureg.meter, feed_layer=10)
+    with pytest.raises(ValueError):
+        next(settler.simulate([constant_feed(10, underflow=50000.0)]))
+    with pytest.raises(ValueError):
+        next(settler.simulate([{"flow": np.full(3, 100.0), "tss": np.full(3, 3000.0)}]))
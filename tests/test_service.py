@@ -0,0 +1,115 @@
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+
+import numpy as np
+import pytest
+
+from app.service import ComputeService, RequestError, make_server
+from app.sweep import evaluate_chunk
+
+
+@pytest.fixture(scope="module")
+def service():
+    with ComputeService(workers=2, max_delay=0.05) as service:
+        yield service
+
+
+def test_requests_are_coalesced(service):
+    """Concurrent requests with the same inputs run as one batch and get their own rows back."""
+    diameters = np.linspace(1e-5, 1e-3, 40)
+    batches = service.metrics.batches
+    submitted = [service.submit("settling", {"particle_diameter": diameter, "particle_density": "2.65 g/cm^3"})
+                 for diameter in diameters]
+    velocities = [future.result(timeout=30)["settling_velocity"][0] for future, scalar in submitted]
+    assert all(scalar for _, scalar in submitted)
+    assert service.metrics.batches - batches < 5
+    expected = evaluate_chunk("settling", {"particle_diameter": diameters, "particle_density": np.full(40, 2650.0)})
+    np.testing.assert_allclose(np.concatenate(velocities), expected["settling_velocity"][0])
+
+    with pytest.raises(RequestError, match="Unknown inputs"):
+        service.submit("settling", {"diameter": 1e-4})
+    with pytest.raises(RequestError, match="Invalid inputs"):
+        service.submit("design", {"flow_rate": [1, 2], "surface_overflow_velocity": [30, 40, 50]})
+    with pytest.raises(RequestError, match="Invalid flow_rate"):
+        service.submit("design", {"flow_rate": -5, "surface_overflow_velocity": 40, "detention_time": 2})
+    with pytest.raises(RequestError, match="Invalid tank_type"):
+        service.submit("design", {"flow_rate": 1000, "surface_overflow_velocity": 40, "detention_time": 2,
+                                  "tank_type": "square"})
+    with pytest.raises(RequestError, match="Invalid particle_diameter"):
+        service.submit("settling", {"particle_diameter": [1e-4, 0.0]})
+    with pytest.raises(RequestError, match="Invalid inputs"):
+        service.submit("design", {"flow_rate": "10 furlongx", "surface_overflow_velocity": 40})
+
+
+def test_slots_are_released_after_a_burst():
+    """Overlapping batches of a concurrent burst each give their pool slot back once answered."""
+    with ComputeService(workers=2, max_delay=0.001) as service:
+        coalescer = service.coalescers["settling"]
+        slots = coalescer._slots._value
+        submitted = []
+
+        def request(diameter):
+            inputs = {"particle_diameter": [diameter, 2 * diameter], "particle_density": 2650}
+            if diameter > 5e-4:
+                inputs["temperature"] = 15  # Another group of input names in the same batch
+            submitted.append(service.submit("settling", inputs))
+
+        threads = [threading.Thread(target=request, args=(diameter,)) for diameter in np.linspace(1e-5, 1e-3, 40)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        for future, _ in submitted:
+            future.result(timeout=30)
+        deadline = time.monotonic() + 5
+        while coalescer._slots._value != slots and time.monotonic() < deadline:
+            time.sleep(0.01)  # The last callbacks run just after the futures resolve
+        assert service.metrics.batches > 1
+        assert coalescer._slots._value == slots
+        assert service.metrics.in_flight == 0
+
+
+def test_http_endpoints(service):
+    """The HTTP endpoints answer single and batched requests, errors and metrics as JSON."""
+    server = make_server(service, port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    def post(path, body):
+        request = urllib.request.Request(url + path, json.dumps(body).encode(), {"Content-Type": "application/json"})
+        try:
+            with urllib.request.urlopen(request) as response:
+                return response.status, json.load(response)
+        except urllib.error.HTTPError as error:
+            return error.code, json.load(error)
+
+    try:
+        status, body = post("/v1/design", {"inputs": {"flow_rate": "10 L/s", "surface_overflow_velocity": 40,
+                                                      "detention_time": "2 h", "tank_type": "circular"}})
+        assert status == 200
+        assert body["outputs"]["surface_area"] == {"value": pytest.approx(21.6), "unit": "m**2"}
+        assert body["outputs"]["width"]["value"] is None
+
+        status, body = post("/v1/settling", {"requests": [
+            {"particle_diameter": [1e-4, 2e-4], "particle_density": 2650}, {"particle_diameter": "fine"},
+            {"particle_diameter": "0.1 furlongx"}]})
+        assert len(body["results"][0]["outputs"]["settling_velocity"]["value"]) == 2
+        assert "error" in body["results"][1] and "error" in body["results"][2]
+        status, body = post("/v1/design", {"inputs": {"flow_rate": "10 furlongx", "surface_overflow_velocity": 40}})
+        assert status == 400 and "furlongx" in body["error"]
+
+        assert post("/v1/design", {"inputs": {"flow_rate": 1000}})[0] == 422  # No overflow rate or depth
+        assert post("/v1/tank", {"inputs": {}})[0] == 404
+        status, body = post("/v1/design", {"inputs": {"flow_rate": -5, "surface_overflow_velocity": 40,
+                                                      "detention_time": 2, "tank_type": "square"}})
+        assert status == 400 and "flow_rate" in body["error"]
+        with urllib.request.urlopen(url + "/metrics") as response:
+            metrics = json.load(response)
+        assert metrics["requests"] >= 4 and metrics["errors"] >= 1 and metrics["queue_depth"] == 0
+        assert metrics["latency_ms"]["p50"] > 0
+    finally:
+        server.shutdown()
+        server.server_close()
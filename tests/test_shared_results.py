@@ -0,0 +1,58 @@
+import os
+import pickle
+
+import numpy as np
+import pytest
+
+from app.shared_results import SEGMENT_PREFIX, SharedResult, remove_stale_segments, run_sweep_shared
+from app.sweep import run_sweep
+from models.data_models import ColumnarDataset
+
+GRID = {"flow_rate": {"start": 1000, "stop": 20000, "num": 50}, "particle_diameter": [5e-5, 1e-4, 2e-4]}
+SHM = "/dev/shm"
+
+
+def _segments():
+    return {name for name in os.listdir(SHM) if name.startswith(SEGMENT_PREFIX)} if os.path.isdir(SHM) else set()
+
+
+def test_workers_write_into_shared_memory(tmp_path):
+    """Workers write their chunks in place; the dataset views the segment and matches a local sweep."""
+    before = _segments()
+    with run_sweep_shared("clarifier", GRID, {"temperature": 15}, chunk_size=32, workers=2) as result:
+        assert len(pickle.dumps(result.descriptor)) < 1000
+        dataset = result.dataset()
+        assert len(dataset) == 150 and dataset.units["surface_area"] == "m**2"
+        assert not dataset["surface_area"].flags.owndata
+        run_sweep("clarifier", GRID, tmp_path / "local", {"temperature": 15}, chunk_size=32)
+        expected = ColumnarDataset.load(tmp_path / "local")
+        for name in expected.names:
+            np.testing.assert_array_equal(dataset[name], expected[name])
+        del dataset
+    assert result.released and _segments() == before
+
+
+def test_release_while_viewed():
+    """A released result is unlinked at once; views stay readable until they are dropped."""
+    result = SharedResult.create({"a": (np.float64, "m"), "b": (np.int64, None), "c": ("<U8", None)}, 5)
+    result.write(0, {"a": (np.arange(5.0), "m"), "b": (np.arange(5), None), "c": (np.array(list("vwxyz")), None)})
+    other = SharedResult.attach(result.descriptor)
+    np.testing.assert_array_equal(other.column("c"), list("vwxyz"))
+    other.close()
+    view = result.column("a")
+    result.release()
+    assert result.name not in _segments()
+    np.testing.assert_array_equal(view, np.arange(5.0))
+    result.release()  # Idempotent
+    with pytest.raises(ValueError, match="objects"):
+        SharedResult.create({"a": (object, None)}, 5)
+
+
+@pytest.mark.skipif(not os.path.isdir(SHM), reason="No /dev/shm listing")
+def test_remove_stale_segments():
+    """Segments of processes that are gone are removed; those of running processes are kept."""
+    stale = f"{SEGMENT_PREFIX}999999999_test"
+    open(os.path.join(SHM, stale), "wb").close()
+    with SharedResult.create({"a": (np.float64, None)}, 10) as live:
+        assert remove_stale_segments() == [stale]
+        assert live.name in _segments()
@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+
+from app.units import ureg
+from app.wastewater_treatment.primary_treatment import removal_efficiency
+from app.wastewater_treatment.simulation import (iter_chunks,
+                                                 run_clarifier_simulation,
+                                                 simulate_clarifier)
+
+AREA = 250 * ureg.meter ** 2
+VOLUME = 1000 * ureg.meter ** 3
+
+
+def diurnal_record(n=3 * 1440):
+    minutes = np.arange(n)
+    return {
+        "time": minutes,
+        "flow": 10000 * (1 + 0.6 * np.sin(2 * np.pi * minutes / 1440)),
+        "tss": np.full(n, 250.0),
+        "bod": np.full(n, 200.0),
+    }
+
+
+def test_constant_flow_matches_steady_state():
+    """At constant flow every step reproduces the steady removal curve."""
+    record = {"flow": np.full(10, 12000.0), "tss": np.full(10, 250.0), "bod": np.full(10, 200.0)}
+    effluent = next(simulate_clarifier(None, [record], surface_area=AREA, volume=VOLUME))
+
+    hours = 1000 * 24 / 12000
+    assert effluent["overflow_rate"] == pytest.approx(np.full(10, 48.0))
+    assert effluent["effluent_tss"] == pytest.approx(
+        np.full(10, 250 * (1 - removal_efficiency(hours, "tss").magnitude)))
+
+
+def test_exceedances_and_chunk_invariance():
+    """Results do not depend on the chunk size and peaks above 60 m/d are counted."""
+    record = diurnal_record()
+    whole = run_clarifier_simulation(None, [record], surface_area=AREA, volume=VOLUME)
+    chunked = run_clarifier_simulation(None, iter_chunks(record, 1000), surface_area=AREA, volume=VOLUME)
+
+    expected = int(np.count_nonzero(record["flow"] / 250 > 60))
+    assert whole.exceedance_steps == chunked.exceedance_steps == expected
+    assert whole.exceedance_duration.to("minute").magnitude == pytest.approx(expected)
+    assert chunked.mean_effluent_tss.magnitude == pytest.approx(whole.mean_effluent_tss.magnitude)
+    assert chunked.tss_removed.magnitude == pytest.approx(whole.tss_removed.magnitude)
+
+
+def test_zero_flow_and_invalid_input():
+    """Zero flow keeps finite concentrations, negative flow is rejected."""
+    record = {"flow": np.array([0.0, 1000.0]), "tss": np.full(2, 200.0), "bod": np.full(2, 200.0)}
+    effluent = next(simulate_clarifier(None, [record], surface_area=AREA, volume=VOLUME))
+    assert np.all(np.isfinite(effluent["effluent_tss"]))
+
+    record["flow"] = np.array([-1.0, 1000.0])
+    with pytest.raises(ValueError):
+        next(simulate_clarifier(None, [record], surface_area=AREA, volume=VOLUME))
+    with pytest.raises(ValueError):
+        next(simulate_clarifier(None, [record]))
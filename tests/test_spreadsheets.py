@@ -0,0 +1,155 @@
+import zipfile
+from datetime import datetime
+
+import numpy as np
+import pytest
+
+from utils.ingest import IngestError, ingest, read_table
+from utils.spreadsheets import (SpreadsheetError, read_ods, read_xls, read_xlsx,
+                                read_xlsx_table, sheet_names)
+
+SPREADSHEET_NS = 'xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"'
+
+
+def write_xlsx(path, rows, with_references=True):
+    """Minimal workbook: strings are shared, ("date", serial) cells use a date format."""
+    strings, cells_xml = [], []
+    for number, row in enumerate(rows, start=1):
+        cells = []
+        for column, value in enumerate(row):
+            reference = f' r="{chr(65 + column)}{number}"' if with_references else ""
+            if value is None:
+                if not with_references:
+                    cells.append("<c/>")  # Without references, empty cells keep their place
+                continue
+            if isinstance(value, bool):
+                cells.append(f'<c{reference} t="b"><v>{int(value)}</v></c>')
+            elif isinstance(value, tuple):
+                cells.append(f'<c{reference} s="1"><v>{value[1]}</v></c>')
+            elif isinstance(value, str) and value.startswith("inline:"):
+                cells.append(f'<c{reference} t="inlineStr"><is><t>{value[7:]}</t></is></c>')
+            elif isinstance(value, str):
+                if value not in strings:
+                    strings.append(value)
+                cells.append(f'<c{reference} t="s"><v>{strings.index(value)}</v></c>')
+            else:
+                cells.append(f"<c{reference}><v>{value}</v></c>")
+        cells_xml.append(f'<row r="{number}">{"".join(cells)}</row>')
+    with zipfile.ZipFile(path, "w") as archive:
+        archive.writestr("xl/workbook.xml", f'<workbook {SPREADSHEET_NS} xmlns:r="http://schemas.openxmlformats.org/'
+                         'officeDocument/2006/relationships"><sheets><sheet name="Flows" sheetId="1" r:id="rId1"/>'
+                         '</sheets></workbook>')
+        archive.writestr("xl/_rels/workbook.xml.rels", '<Relationships xmlns="http://schemas.openxmlformats.org/'
+                         'package/2006/relationships"><Relationship Id="rId1" Target="worksheets/sheet1.xml"/>'
+                         '</Relationships>')
+        archive.writestr("xl/sharedStrings.xml", f"<sst {SPREADSHEET_NS}>"
+                         + "".join(f"<si><t>{text}</t></si>" for text in strings) + "</sst>")
+        archive.writestr("xl/styles.xml", f'<styleSheet {SPREADSHEET_NS}><numFmts><numFmt numFmtId="164" '
+                         'formatCode="dd/mm/yyyy\\ hh:mm"/></numFmts><cellXfs><xf numFmtId="0"/>'
+                         '<xf numFmtId="164"/></cellXfs></styleSheet>')
+        archive.writestr("xl/worksheets/sheet1.xml", f"<worksheet {SPREADSHEET_NS}><sheetData>"
+                         + "".join(cells_xml) + "</sheetData></worksheet>")
+
+
+def write_ods(path):
+    """Two tables; the second has repeated rows and a trailing run of empty cells."""
+    table = 'xmlns:table="urn:oasis:names:tc:opendocument:xmlns:table:1.0"'
+    office = 'xmlns:office="urn:oasis:names:tc:opendocument:xmlns:office:1.0"'
+    text = 'xmlns:text="urn:oasis:names:tc:opendocument:xmlns:text:1.0"'
+
+    def cell(value):
+        if isinstance(value, float):
+            return f'<table:table-cell office:value-type="float" office:value="{value}"/>'
+        if isinstance(value, datetime):
+            return f'<table:table-cell office:value-type="date" office:date-value="{value.isoformat()}"/>'
+        return f'<table:table-cell office:value-type="string"><text:p>{value}</text:p></table:table-cell>'
+
+    rows = "".join(f"<table:table-row>{''.join(cell(value) for value in row)}"
+                   '<table:table-cell table:number-columns-repeated="1000"/></table:table-row>'
+                   for row in [["time", "flow"], [datetime(2024, 1, 1), 1000.0]])
+    repeated = ('<table:table-row table:number-rows-repeated="3">' + cell(datetime(2024, 1, 2)) + cell(2000.0)
+                + "</table:table-row>")
+    content = (f"<office:document-content {table} {office} {text}><office:body><office:spreadsheet>"
+               '<table:table table:name="Notes"><table:table-row>' + cell("note") + "</table:table-row></table:table>"
+               f'<table:table table:name="Flows">{rows}{repeated}'
+               '<table:table-row table:number-rows-repeated="1048000"><table:table-cell/></table:table-row>'
+               "</table:table></office:spreadsheet></office:body></office:document-content>")
+    with zipfile.ZipFile(path, "w") as archive:
+        archive.writestr("content.xml", content)
+
+
+ROWS = [["time", "flow", "site", "online", "note"],
+        [("date", 45292.25), 1000.5, "north", True, "inline:ok"],
+        [("date", 45292.5), None, "south", False, 3.0],
+        [("date", 45292.75), 1200.0, "north", None, None]]
+
+
+def test_xlsx_typed_columns(tmp_path):
+    """Dates, numbers, shared strings and mixed columns are typed column by column."""
+    write_xlsx(tmp_path / "flows.xlsx", ROWS)
+    assert sheet_names(str(tmp_path / "flows.xlsx")) == ["Flows"]
+    dataset = read_table(str(tmp_path / "flows.xlsx"))
+    assert dataset.names == ["time", "flow", "site", "online", "note"]
+    np.testing.assert_array_equal(dataset["time"], np.array(["2024-01-01T06:00", "2024-01-01T12:00",
+                                                              "2024-01-01T18:00"], dtype="datetime64[ns]"))
+    np.testing.assert_array_equal(dataset["flow"], [1000.5, np.nan, 1200.0])
+    assert list(dataset["site"]) == ["north", "south", "north"]
+    np.testing.assert_array_equal(dataset["online"], [1.0, 0.0, np.nan])
+    assert list(dataset["note"]) == ["ok", "3.0", ""]
+
+
+def test_xlsx_blocks_and_row_fallback(tmp_path):
+    """Small scan blocks give the same columns, and cells without references use the row reader."""
+    rows = [["time", "flow"]] + [[("date", 45292 + i / 24), float(i)] for i in range(500)]
+    write_xlsx(tmp_path / "long.xlsx", rows)
+    chunks = list(read_xlsx_table(str(tmp_path / "long.xlsx"), block_bytes=256))
+    assert len(chunks) > 10
+    np.testing.assert_array_equal(np.concatenate([chunk["flow"] for chunk in chunks]), np.arange(500.0))
+
+    write_xlsx(tmp_path / "plain.xlsx", ROWS, with_references=False)
+    assert list(read_xlsx(str(tmp_path / "plain.xlsx")))[1][:3] == [datetime(2024, 1, 1, 6), 1000.5, "north"]
+    dataset = read_table(str(tmp_path / "plain.xlsx"))
+    assert list(dataset["site"]) == ["north", "south", "north"]
+
+
+def test_ods_sheets_and_repeats(tmp_path):
+    """ODS rows stream from the chosen table; repeated rows expand, trailing blank rows do not."""
+    write_ods(tmp_path / "flows.ods")
+    assert sheet_names(str(tmp_path / "flows.ods")) == ["Notes", "Flows"]
+    assert list(read_ods(str(tmp_path / "flows.ods"))) == [["note"]]
+    dataset = read_table(str(tmp_path / "flows.ods"), sheet="Flows")
+    np.testing.assert_array_equal(dataset["flow"], [1000.0, 2000.0, 2000.0, 2000.0])
+    assert dataset["time"].dtype == np.dtype("datetime64[ns]")
+    with pytest.raises(SpreadsheetError):
+        list(read_ods(str(tmp_path / "flows.ods"), sheet="Missing"))
+
+
+def test_xls_and_spreadsheet_ingest(tmp_path):
+    """Legacy .xls files fail clearly; workbooks can be ingested like CSV files."""
+    (tmp_path / "old.xls").write_bytes(b"\xd0\xcf\x11\xe0")
+    with pytest.raises(SpreadsheetError, match="xlsx"):
+        read_xls(str(tmp_path / "old.xls"))
+    with pytest.raises(IngestError):
+        ingest([tmp_path / "old.xls"], tmp_path / "out", mode="serial")
+
+    write_xlsx(tmp_path / "flows.xlsx", ROWS)
+    write_ods(tmp_path / "flows.ods")
+    dataset = ingest([tmp_path / "flows.xlsx", tmp_path / "flows.ods"], tmp_path / "merged", mode="serial",
+                     sheet="Flows")
+    assert len(dataset) == 5  # The three repeated ODS rows share a timestamp
+    assert dataset["time"][0] == np.datetime64("2024-01-01T00:00")
+
+
+def test_broken_archives(tmp_path):
+    """Archives with missing parts or malformed XML fail as SpreadsheetError."""
+    with zipfile.ZipFile(tmp_path / "empty.xlsx", "w") as archive:
+        archive.writestr("docProps/app.xml", "<Properties/>")
+    with zipfile.ZipFile(tmp_path / "empty.ods", "w") as archive:
+        archive.writestr("mimetype", "application/vnd.oasis.opendocument.spreadsheet")
+    with zipfile.ZipFile(tmp_path / "truncated.ods", "w") as archive:
+        archive.writestr("content.xml", '<office:document-content xmlns:office="urn:x"><office:body>')
+    for name in ("empty.xlsx", "empty.ods", "truncated.ods"):
+        with pytest.raises(SpreadsheetError, match="not a valid"):
+            read_table(str(tmp_path / name))
+        with pytest.raises(SpreadsheetError, match="not a valid"):
+            sheet_names(str(tmp_path / name))
@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+
+from app.units import ureg
+from app.wastewater_treatment.state_point import (gravity_flux,
+                                                  limiting_flux,
+                                                  operating_envelope,
+                                                  state_point_analysis)
+
+
+def test_limiting_flux_matches_brute_force_minimum():
+    """The limiting flux is the local minimum of the total flux curve."""
+    concentrations = np.linspace(0.01, 30, 300001) * ureg.kg / ureg.meter ** 3
+    for u in (2.0, 10.0, 40.0):
+        total = gravity_flux(concentrations).magnitude + u * concentrations.magnitude
+        minimum = np.argmax(np.diff(np.sign(np.diff(total))) > 0) + 1
+        result = limiting_flux(u * ureg.meter / ureg.day)
+        assert result["limiting_flux"].magnitude == pytest.approx(total[minimum], rel=1e-6)
+
+
+def test_fast_underflow_never_limits():
+    """Above v0 exp(-2) the total flux increases monotonically."""
+    result = limiting_flux(np.array([0.0, 100.0]))
+    assert result["limiting_flux"].magnitude[0] == 0
+    assert np.isinf(result["limiting_flux"].magnitude[1])
+
+
+def test_state_point_scenario():
+    """Loading, overflow and the critical values are consistent for one scenario."""
+    result = state_point_analysis(3000, 0.5, 10000, 500 * ureg.meter ** 2)
+    assert result["overflow_rate"].magnitude == pytest.approx(20.0)
+    assert result["solids_loading_rate"].magnitude == pytest.approx(90.0)
+    assert result["thickening_ok"] and result["clarification_ok"] and result["within_design_ranges"]
+
+    # At the critical flow (or MLSS) the scenario sits on the failure boundary
+    critical = state_point_analysis(3000, 0.5, result["critical_flow_rate"], 500)
+    assert critical["solids_loading_rate"].magnitude == pytest.approx(critical["limiting_flux"].magnitude)
+    critical = state_point_analysis(result["critical_mlss"], 0.5, 10000, 500)
+    assert critical["solids_loading_rate"].magnitude == pytest.approx(critical["limiting_flux"].magnitude)
+    # The required area scales with the flow margin
+    assert (result["required_area"] * result["critical_flow_rate"]).to("m^5/day").magnitude == pytest.approx(
+        500 * 10000)
+
+
+def test_operating_envelope_shape_and_failures():
+    """The envelope broadcasts over all axes and flags overloaded scenarios."""
+    mlss = np.array([2000.0, 8000.0])
+    envelope = operating_envelope(mlss, [0.25, 0.5], [5000.0, 50000.0], 500)
+    assert envelope["thickening_ok"].shape == (2, 2, 2)
+    assert envelope["thickening_ok"][0, :, 0].all()
+    assert not envelope["thickening_ok"][1, :, 1].any()
+    assert not envelope["within_design_ranges"][1].any()
+    with pytest.raises(ValueError):
+        state_point_analysis(3000, 0.0, 10000, 500)
@@ -1,4 +1,5 @@
-from app.wastewater_treatment.parameters import terminal_settling_velocity, ureg
+import numpy as np
+from app.wastewater_treatment.parameters import terminal_settling_velocity, terminal_settling_velocity_batch, ureg
 from app.units import DEFAULT_DENSITY_UNIT
 import pytest
 
@@ -90,3 +91,24 @@ def test_terminal_settling_velocity_no_convergence():
             max_iterations=3,  # Force non-convergence with low max_iterations
         )
 
+
+def test_terminal_settling_velocity_batch_matches_scalar():
+    """The vectorized solver agrees with the scalar one across flow regimes."""
+    diameters = np.array([0.0001, 0.0006, 0.002, 0.01]) * ureg.m
+    temperatures = np.array([10, 20, 25, 30])
+    particle_density = 2650 * DEFAULT_DENSITY_UNIT
+
+    batch = terminal_settling_velocity_batch(diameters, particle_density, temperature=temperatures)
+
+    for i in range(len(temperatures)):
+        expected = terminal_settling_velocity(diameters[i], particle_density, temperature=float(temperatures[i]))
+        assert batch[i].to(ureg.m / ureg.s).magnitude == pytest.approx(
+            expected.to(ureg.m / ureg.s).magnitude, rel=1e-9)
+
+
+def test_terminal_settling_velocity_batch_invalid_input():
+    """Batch inputs are validated element-wise."""
+    with pytest.raises(ValueError):
+        terminal_settling_velocity_batch(np.array([0.0006, -0.0006]) * ureg.m, 2650 * DEFAULT_DENSITY_UNIT)
+    with pytest.raises(TypeError):
+        terminal_settling_velocity_batch(np.array([0.0006]), 2650 * DEFAULT_DENSITY_UNIT)
@@ -0,0 +1,55 @@
+import logging
+import threading
+import time
+
+import pytest
+
+from app.watchdog import StallWatchdog
+
+
+def _synchronous_work(seconds):
+    time.sleep(seconds)
+
+
+def test_stall_captures_the_stack(caplog):
+    """A stall is logged with the stack of the watched thread and its duration once it ends."""
+    captured = []
+    watchdog = StallWatchdog(threshold=0.15, interval=0.02, on_stall=captured.append)
+    watchdog.start()
+    try:
+        with caplog.at_level(logging.WARNING, logger="app.watchdog"):
+            for _ in range(5):
+                time.sleep(0.02)
+                watchdog.beat()
+            assert not watchdog.stalls and not watchdog.stalled
+            _synchronous_work(0.4)  # The "event loop" (this thread) does not beat
+            assert watchdog.stalled and watchdog.latency > 0.3
+            watchdog.beat()
+    finally:
+        watchdog.stop()
+
+    assert len(captured) == 1 and "_synchronous_work" in captured[0].stack
+    stall, = watchdog.stalls
+    assert stall.duration == pytest.approx(0.4, abs=0.1)
+    assert "_synchronous_work" in stall.stack and not watchdog.stalled
+    assert "_synchronous_work" in caplog.text and "stalled for" in caplog.text
+
+
+def test_latency_without_stall():
+    """Regular beats give a small latency and no stall; other threads can be watched."""
+    ready = threading.Event()
+    thread = threading.Thread(target=lambda: ready.wait(5))
+    thread.start()
+    watchdog = StallWatchdog(threshold=0.2, interval=0.02, thread_id=thread.ident)
+    assert "wait" in watchdog.capture()
+    ready.set()
+    thread.join()
+    watchdog.start()
+    try:
+        for _ in range(10):
+            time.sleep(0.02)
+            watchdog.beat()
+    finally:
+        watchdog.stop()
+    assert len(watchdog.latencies) == 10 and watchdog.latency < 0.15
+    assert not watchdog.stalls
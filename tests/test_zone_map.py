@@ -0,0 +1,103 @@
+import numpy as np
+import pytest
+
+from app.constants import TYPICAL_TSS_RANGE
+from app.units import ureg
+from models.data_models import ColumnarDataset
+from models.formula_engine import FormulaEngine
+from models.zone_map import ZoneMap, load_indexed_dataset
+
+
+def _plant_dataset(rows=10000):
+    rng = np.random.default_rng(3)
+    flow = 1000 + 500 * np.sin(np.arange(rows) / 500) + rng.normal(0, 20, rows)
+    tss = np.linspace(50, 400, rows)
+    tss[::97] = np.nan
+    return ColumnarDataset({
+        "time": np.datetime64("2024-01-01T00", "h") + np.arange(rows),
+        "flow": flow,
+        "tss": tss,
+        "site": np.array(["north"] * rows, dtype=object),
+    }, units={"flow": "m^3/day", "tss": "mg/L"})
+
+
+def test_filter_matches_full_scan_and_skips_blocks():
+    """Range predicates give the same rows as a full scan while reading few blocks."""
+    dataset = _plant_dataset()
+    zone_map = ZoneMap.build(dataset, block_size=256)
+    assert "site" not in zone_map.blocks
+
+    low, high = TYPICAL_TSS_RANGE
+    rows = zone_map.filter(dataset, {"tss": (low, high)})
+    expected = np.flatnonzero((dataset["tss"] >= low.magnitude) & (dataset["tss"] <= high.magnitude))
+    np.testing.assert_array_equal(rows, expected)
+
+    zone_map.blocks_scanned = 0
+    rows = zone_map.filter(dataset, {"flow": (1400, None), "tss": (None, 200)})
+    expected = np.flatnonzero((dataset["flow"] >= 1400) & (dataset["tss"] <= 200))
+    np.testing.assert_array_equal(rows, expected)
+    assert zone_map.blocks_scanned < zone_map.n_blocks
+
+
+def test_datetime_predicates_and_summary():
+    """Datetime bounds filter by time and summaries match NumPy with nulls excluded."""
+    dataset = _plant_dataset()
+    zone_map = ZoneMap.build(dataset, block_size=1000)
+    rows = zone_map.filter(dataset, {"time": (np.datetime64("2024-01-02T00"), "2024-01-02T23")})
+    np.testing.assert_array_equal(rows, np.arange(24, 48))
+
+    summary = zone_map.summary(dataset, "tss")
+    valid = dataset["tss"][~np.isnan(dataset["tss"])]
+    assert summary["nulls"] == np.isnan(dataset["tss"]).sum()
+    assert summary["mean"] == pytest.approx(valid.mean())
+    assert summary["std"] == pytest.approx(valid.std())
+    assert summary["percentiles"]["95"] == pytest.approx(np.percentile(valid, 95))
+    assert zone_map.summary(dataset, "tss") is summary
+
+
+def test_persisted_index_and_formula_updates(tmp_path):
+    """The index is saved with the dataset and follows formula engine edits."""
+    _plant_dataset().save(tmp_path / "plant")
+    dataset, zone_map = load_indexed_dataset(tmp_path / "plant")
+    assert (tmp_path / "plant" / "zone_map.json").exists()
+    _, reloaded = load_indexed_dataset(tmp_path / "plant")
+    np.testing.assert_array_equal(reloaded.blocks["flow"]["max"], zone_map.blocks["flow"]["max"])
+
+    engine = FormulaEngine(dataset, zone_map=zone_map)
+    engine.set_formula("peak", "=flow * 2")
+    engine.set_values("flow", 5000, [1e6])
+    engine.recalculate()
+    assert zone_map.summary(dataset, "flow")["max"] == 1e6
+    np.testing.assert_array_equal(zone_map.filter(dataset, {"peak": (1.5e6, None)}), [5000])
+    rows = zone_map.filter(dataset, {"flow": (1e3 * ureg.m ** 3 / ureg.hour, None)})
+    np.testing.assert_array_equal(rows, [5000])
+
+
+def test_resaved_data_rebuilds_the_index(tmp_path):
+    """Data of the same shape saved again over an indexed dataset gets a new zone map."""
+    directory = tmp_path / "plant"
+    _plant_dataset(1000).save(directory)
+    _, zone_map = load_indexed_dataset(directory)
+    assert zone_map.filter(_plant_dataset(1000), {"tss": (1000, None)}).size == 0
+
+    changed = _plant_dataset(1000)
+    changed["tss"][500:] = 2000.0
+    changed.save(directory)
+    dataset, zone_map = load_indexed_dataset(directory)
+    assert zone_map.filter(dataset, {"tss": (1000, None)}).size == 500
+
+
+def test_engine_filters_through_the_zone_map():
+    """Range filters of the formula engine use (and build) the zone map, edits included."""
+    dataset = _plant_dataset()
+    engine = FormulaEngine(dataset)
+    engine.set_formula("peak", "=flow * 2")
+    rows = engine.filter_rows({"C": (390, None), "peak": (None, 2100)})
+    expected = np.flatnonzero((dataset["tss"] >= 390) & (dataset["peak"] <= 2100))
+    np.testing.assert_array_equal(rows, expected)
+    assert engine.zone_map is not None and "peak" in engine.zone_map.blocks
+
+    engine.set_values("flow", 10, [1e6])
+    np.testing.assert_array_equal(engine.filter_rows({"peak": (1e6, None)}), [10])
+    with pytest.raises(KeyError):
+        engine.filter_rows({"nope": (0, 1)})
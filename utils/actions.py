@@ -1,9 +1,17 @@
 from PySide6.QtGui import QIcon, QAction, QKeySequence, QFont
-from PySide6.QtWidgets import QMainWindow, QMessageBox
-from PySide6.QtCore import Slot
+from PySide6.QtWidgets import QApplication, QFileDialog, QMainWindow, QMessageBox
+from PySide6.QtCore import QObject, Qt, QThread, Signal, Slot
 import logging
+from tempfile import TemporaryDirectory
 from logging_config import setup_logging
-from utils.helpers import get_data_file, validate_file, SANS_SERIF
+from app.cli import load_spec
+from app.shared_results import SharedResult, remove_stale_segments, run_sweep_shared
+from utils.helpers import get_data_file, inspect_file, SANS_SERIF, SCHEMA_CACHE_PATH
+from utils.schema import SchemaCache
+from utils.ingest import ingest, load_table
+from models.zone_map import load_indexed_dataset
+from views.Pages.Dashboard.DataTab.excel_like_table import ExcelLikeTable
+from views.Pages.Dashboard.DashboardTab.dashboard_tab import Dashboard
 
 
 setup_logging()
@@ -45,25 +53,132 @@ class BaseAction(QAction):
         pass
 
 
+class FileLoadWorker(QObject):
+    """Reads a data file on a background thread into a memory-mapped dataset under `directory`, with its zone map."""
+
+    finished = Signal(object, object)  # ColumnarDataset, ZoneMap
+    failed = Signal(str)
+
+    def __init__(self, file_path: str, directory: str, schema=None):
+        super().__init__()
+        self.file_path = file_path
+        self.directory = directory
+        self.schema = schema
+
+    @Slot()
+    def run(self):
+        # Spreadsheets are binary: every format goes through the streaming readers
+        try:
+            load_table(self.file_path, self.directory, schema=self.schema)
+            # Block min/max index saved next to the columns: range filters skip the blocks out of range
+            dataset, zone_map = load_indexed_dataset(self.directory)
+        except Exception as error:  # Every failure is reported: the Open action stays busy until then
+            logger.debug(f"Could not read {self.file_path}", exc_info=True)
+            self.failed.emit(str(error) or type(error).__name__)
+            return
+        self.finished.emit(dataset, zone_map)
+
+
+class FolderLoadWorker(QObject):
+    """Merges the data files of a folder by timestamp (utils/ingest.py) into a dataset under `directory`."""
+
+    finished = Signal(object, object)  # ColumnarDataset, ZoneMap
+    failed = Signal(str)
+
+    def __init__(self, folder: str, directory: str, schemas: SchemaCache):
+        super().__init__()
+        self.folder = folder
+        self.directory = directory
+        self.schemas = schemas
+
+    @Slot()
+    def run(self):
+        try:
+            ingest(self.folder, self.directory, schemas=self.schemas)
+            dataset, zone_map = load_indexed_dataset(self.directory)
+        except Exception as error:  # Every failure is reported: the action stays busy until then
+            logger.debug(f"Could not merge {self.folder}", exc_info=True)
+            self.failed.emit(str(error) or type(error).__name__)
+            return
+        self.finished.emit(dataset, zone_map)
+
+
 class Open(BaseAction):
     def __init__(self, main_window: QMainWindow = None, parent=None, text="&Open"):
         super().__init__(main_window=main_window, parent=parent, text=text, shortcut="Ctrl+O")
+        # Layouts of the delimited files opened before, so recurring exports skip type discovery
+        self.schemas = SchemaCache(SCHEMA_CACHE_PATH)
+        self._thread = None
+        self._worker = None
+        # Saved dataset of the file being read, and of the one shown (removed when replaced)
+        self._loading = None
+        self._shown = None
+        self.triggered.connect(self.open_file)
 
     @Slot()
     def open_file(self):
+        if self._thread is not None:
+            return
         file_path = get_data_file()
-        file_is_valid = False
+        file_is_valid, schema = False, None
 
         if file_path:
             logger.debug(f"file_path is {file_path}")
-            file_is_valid = validate_file(file_path)
+            file_is_valid, schema = inspect_file(file_path, self.schemas)
 
-        if file_is_valid:
-            with open(file_path, "r") as file:
-                content = file.read()
-                logging.info(f"The content of the file is: {content}")
-        else:
+        if not file_is_valid:
             self.show_error_message("Invalid file type", "Please select a valid table-like data file")
+            return
+        self._loading = TemporaryDirectory(prefix="h2optim-open-", ignore_cleanup_errors=True)
+        self._start(FileLoadWorker(file_path, self._loading.name, schema), f"Opening {file_path}...")
+
+    def _start(self, worker: QObject, message: str):
+        # The data is read on a worker thread: the window stays responsive, busy until it is shown
+        self._set_busy(message)
+        self._thread = QThread(self)
+        self._worker = worker
+        self._worker.moveToThread(self._thread)
+        self._thread.started.connect(self._worker.run)
+        self._worker.finished.connect(self._show_dataset)
+        self._worker.failed.connect(self._show_failure)
+        self._thread.start()
+
+    def _set_busy(self, message: str = ""):
+        self.setEnabled(not message)
+        status_bar = self.main_window.statusBar() if self.main_window is not None else None
+        if message:
+            QApplication.setOverrideCursor(Qt.CursorShape.WaitCursor)
+            if status_bar is not None:
+                status_bar.showMessage(message)
+        else:
+            QApplication.restoreOverrideCursor()
+            if status_bar is not None:
+                status_bar.clearMessage()
+
+    def _stop(self):
+        self._thread.quit()
+        self._thread.wait()
+        self._thread = None
+        self._worker = None
+        self._set_busy()
+
+    @Slot(object, object)
+    def _show_dataset(self, dataset, zone_map):
+        self._stop()
+        logging.info(f"Loaded {len(dataset)} rows, columns: {dataset.names}")
+        table = self.main_window.findChild(ExcelLikeTable) if self.main_window is not None else None
+        if table is not None:
+            table.set_dataset(dataset, zone_map)
+        if self._shown is not None:
+            self._shown.cleanup()
+        self._shown, self._loading = self._loading, None
+
+    @Slot(str)
+    def _show_failure(self, message: str):
+        self._stop()
+        self._loading.cleanup()
+        self._loading = None
+        self.show_error_message("Could not read file", message)
 
     def show_error_message(self, title, message):
         msg_box = QMessageBox(self.main_window)
@@ -73,6 +188,107 @@ class Open(BaseAction):
         msg_box.exec()
 
 
+class OpenFolder(Open):
+    """Opens a folder of historian exports as one dataset, merged by timestamp."""
+
+    def __init__(self, main_window: QMainWindow = None, parent=None, text="Open &Folder..."):
+        super().__init__(main_window=main_window, parent=parent, text=text)
+        self.setShortcut(QKeySequence("Ctrl+Shift+O"))
+
+    @Slot()
+    def open_file(self):
+        if self._thread is not None:
+            return
+        folder = QFileDialog.getExistingDirectory(self.main_window, "Open Data Folder")
+        if not folder:
+            return
+        self._loading = TemporaryDirectory(prefix="h2optim-open-", ignore_cleanup_errors=True)
+        self._start(FolderLoadWorker(folder, self._loading.name, self.schemas), f"Merging the files of {folder}...")
+
+
+class BatchWorker(QObject):
+    """Runs the first sweep job of a spec file on a background thread, into shared memory."""
+
+    finished = Signal(object, str, str)  # SharedResult, swept input, first output
+    failed = Signal(str)
+
+    def __init__(self, spec_path: str):
+        super().__init__()
+        self.spec_path = spec_path
+
+    @Slot()
+    def run(self):
+        try:
+            spec = load_spec(self.spec_path)
+            job = next((job for job in spec.jobs if job.type == "sweep"), None)
+            if job is None:
+                raise ValueError("The spec has no sweep job")
+            result = run_sweep_shared(job.model or "clarifier", job.grid, job.inputs,
+                                      job.chunk_size or spec.chunk_size, job.workers or spec.workers)
+        except Exception as error:  # Unknown units, dead worker processes...: the action stays busy until reported
+            logger.debug(f"Batch run of {self.spec_path} failed", exc_info=True)
+            self.failed.emit(str(error) or type(error).__name__)
+            return
+        outputs = [entry.name for entry in result.descriptor.columns if entry.name not in job.grid]
+        self.finished.emit(result, next(iter(job.grid)), outputs[0])
+
+
+class RunBatch(BaseAction):
+    def __init__(self, main_window: QMainWindow = None, parent=None, text="&Run Batch"):
+        super().__init__(main_window=main_window, parent=parent, text=text, shortcut="Ctrl+R")
+        self._thread = None
+        self._worker = None
+        self.triggered.connect(self.run_batch)
+        removed = remove_stale_segments()  # Left behind by a crashed session
+        if removed:
+            logger.debug(f"Removed stale result segments: {removed}")
+
+    @Slot()
+    def run_batch(self):
+        if self._thread is not None:
+            return
+        spec_path, _ = QFileDialog.getOpenFileName(self.main_window, "Run batch spec", "",
+                                                   "Batch specs (*.toml *.json)")
+        if not spec_path:
+            return
+        self._thread = QThread(self)
+        self._worker = BatchWorker(spec_path)
+        self._worker.moveToThread(self._thread)
+        self._thread.started.connect(self._worker.run)
+        self._worker.finished.connect(self._show_result)
+        self._worker.failed.connect(self._show_failure)
+        self._thread.start()
+
+    def _stop(self):
+        self._thread.quit()
+        self._thread.wait()
+        self._thread = None
+        self._worker = None
+
+    @Slot(object, str, str)
+    def _show_result(self, result: SharedResult, x: str, y: str):
+        self._stop()
+        logging.info(f"Batch result: {len(result)} rows, {result.nbytes / 1e6:.1f} MB shared")
+        window = self.main_window
+        table = window.findChild(ExcelLikeTable) if window is not None else None
+        dashboard = window.findChild(Dashboard) if window is not None else None
+        if dashboard is not None:
+            dashboard.show_result(result.dataset(), x, y)
+        if table is not None:
+            table.set_shared_result(result)  # The table owns the result from now on
+        else:
+            result.release()
+
+    @Slot(str)
+    def _show_failure(self, message: str):
+        self._stop()
+        msg_box = QMessageBox(self.main_window)
+        msg_box.setIcon(QMessageBox.Icon.Warning)
+        msg_box.setWindowTitle("Batch failed")
+        msg_box.setText(message)
+        msg_box.exec()
+
+
 class Save(BaseAction):
     def __init__(self, main_window: QMainWindow = None, parent=None, text="&Save"):
         super().__init__(main_window=main_window, parent=parent, text=text, shortcut="Ctrl+S")
@@ -1,15 +1,35 @@
-from PySide6.QtWidgets import QFileDialog
-from PySide6.QtGui import QFont
 from pathlib import Path
 import os
 
-SANS_SERIF = QFont("Sans-Serif", 10)
-CONSOLAS = QFont("Monospace", 10)
-SANS_SERIF_BOLD = QFont("Sans-Serif", 10, QFont.Weight.Bold)
-CONSOLAS_BOLD = QFont("Monospace", 10, QFont.Weight.Bold)
+from utils.schema import SchemaCache, SchemaError
 
-SUPPORTED_FORMATS = {".json", ".csv", ".xlsx", ".xls", ".xml", ".tsv", ".ods"}
-MAX_FILE_SIZE_MB = 50  # Maximum file size in megabytes
+# Qt is imported on first use only (fonts, file dialog), so that headless code
+# (app/cli.py, worker processes) can use the file helpers without PySide6.
+_FONTS = {
+    "SANS_SERIF": ("Sans-Serif", False),
+    "CONSOLAS": ("Monospace", False),
+    "SANS_SERIF_BOLD": ("Sans-Serif", True),
+    "CONSOLAS_BOLD": ("Monospace", True),
+}
+
+
+def __getattr__(name):
+    """Creates the shared QFont objects (SANS_SERIF, CONSOLAS, ...) on first access."""
+    if name not in _FONTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    from PySide6.QtGui import QFont
+
+    family, bold = _FONTS[name]
+    font = QFont(family, 10, QFont.Weight.Bold) if bold else QFont(family, 10)
+    globals()[name] = font  # Later lookups find the same object
+    return font
+
+
+SUPPORTED_FORMATS = {".json", ".jsonl", ".ndjson", ".csv", ".xlsx", ".xls", ".xml", ".tsv", ".ods"}
+# Maximum file size in megabytes: files are opened on a worker thread into a memory-mapped
+# dataset (utils/ingest.py, load_table), so memory stays around one chunk
+MAX_FILE_SIZE_MB = 8192
+SCHEMA_CACHE_PATH = Path.home() / ".h2optim" / "schemas.json"
 
 
 def get_data_file(parent=None, caption="Open Data File", start_dir=None):
@@ -21,10 +41,12 @@ def get_data_file(parent=None, caption="Open Data File", start_dir=None):
     :param start_dir: Starting directory for the file dialog.
     :return: Selected file path or None if no file is selected.
     """
+    from PySide6.QtWidgets import QFileDialog
+
     if start_dir is None:
         start_dir = str(Path.home() / "Documents")
 
-    file_types = "Data Files (*.json *.csv *.xlsx *.xls *.xml *.tsv *.ods);;All Files (*)"
+    file_types = "Data Files (*.json *.jsonl *.ndjson *.csv *.xlsx *.xls *.xml *.tsv *.ods);;All Files (*)"
     file_path, _ = QFileDialog.getOpenFileName(parent, caption, start_dir, file_types)
     return file_path
 
@@ -50,3 +72,25 @@ def validate_file(file_path):
         return False
 
     return True
+
+
+def inspect_file(file_path, schemas=None):
+    """
+    Validates the selected file and returns the schema of delimited files.
+
+    The schema is inferred from a sample of the file, or taken from `schemas`
+    when a file of the same source pattern (e.g. a daily SCADA export) was
+    opened before.
+
+    :param file_path: Path to the file.
+    :param schemas: SchemaCache of previously seen layouts (optional).
+    :return: (is_valid, schema); the schema is None for other formats.
+    """
+    if not validate_file(file_path):
+        return False, None
+    try:
+        schema = (schemas or SchemaCache()).schema_for(file_path)
+    except (OSError, SchemaError) as error:
+        print(f"Could not read the file layout: {error}")
+        return False, None
+    return True, schema
@@ -0,0 +1,492 @@
+import csv
+import glob
+import heapq
+import logging
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime
+from itertools import islice
+from pathlib import Path
+from typing import Callable, Iterable, Iterator, Optional, Sequence, Union
+
+import numpy as np
+
+from app.instrumentation import instrumented
+from models.data_models import ColumnarDataset, ColumnarDatasetWriter
+from utils.records import read_json_table, read_xml_table
+from utils.schema import FileSchema, SchemaCache, read_schema_chunks
+from utils.spreadsheets import (CellLayoutError, SpreadsheetError, read_ods, read_xls, read_xlsx,
+                                read_xlsx_table, unique_names)
+
+# Folder / glob ingest of historian exports (one file per day or per sensor)
+# into a single time-ordered ColumnarDataset.
+#
+# 1. Runs: the files are parsed concurrently (thread or process pool). Each
+#    worker parses one file, sorts it by time and saves it as a temporary
+#    dataset, so a worker only ever holds one file in memory.
+# 2. Merge: the runs are memory-mapped and merged by timestamp with a k-way
+#    merge over blocks of rows. A heap orders the runs by the last timestamp
+#    of their buffered block; every buffered row older than the top of the
+#    heap can no longer be preceded by an unread row, so it is emitted, and
+#    the top run reads its next block. Memory stays around one block per run.
+# 3. Deduplication: rows sharing a timestamp (overlapping exports, or one
+#    file per sensor) are combined into one row, taking for each column the
+#    first non-missing value in file order.
+#
+# Readers turn a file into rows, the first one being the header; new formats
+# are added to READERS (spreadsheets: utils/spreadsheets.py). Formats read
+# straight into typed column chunks go to TABLE_READERS (JSON and XML
+# records: utils/records.py).
+
+Row = Sequence[object]
+Source = Union[str, os.PathLike, Iterable[Union[str, os.PathLike]]]
+TIME_COLUMN_NAMES = ("time", "timestamp", "datetime", "date", "date_time")
+
+
+def read_delimited(path: str, delimiter: Optional[str] = None, encoding: str = "utf-8-sig") -> Iterator[Row]:
+    """Rows of a CSV/TSV file; the delimiter is sniffed when not given."""
+    with open(path, newline="", encoding=encoding) as file:
+        if delimiter is None:
+            sample = file.read(65536)
+            file.seek(0)
+            if Path(path).suffix.lower() == ".tsv":
+                delimiter = "\t"
+            else:
+                try:
+                    delimiter = csv.Sniffer().sniff(sample, delimiters=",;\t|").delimiter
+                except csv.Error:
+                    delimiter = ","
+        yield from csv.reader(file, delimiter=delimiter)
+
+
+READERS: dict[str, Callable[..., Iterator[Row]]] = {
+    ".csv": read_delimited,
+    ".tsv": read_delimited,
+    ".txt": read_delimited,
+    ".xlsx": read_xlsx,
+    ".xlsm": read_xlsx,
+    ".ods": read_ods,
+    ".xls": read_xls,
+}
+# Readers of typed column chunks, faster than converting rows
+TABLE_READERS: dict[str, Callable[..., Iterator[dict[str, np.ndarray]]]] = {
+    ".xlsx": read_xlsx_table,
+    ".xlsm": read_xlsx_table,
+    ".json": read_json_table,
+    ".jsonl": read_json_table,
+    ".ndjson": read_json_table,
+    ".xml": read_xml_table,
+}
+
+
+class IngestError(ValueError):
+    """A file could not be ingested."""
+
+
+def expand_sources(sources: Source) -> list[str]:
+    """Files of a directory, a glob pattern or an explicit list, sorted by name."""
+    if isinstance(sources, (str, os.PathLike)):
+        source = os.fspath(sources)
+        if os.path.isdir(source):
+            paths = [os.path.join(source, name) for name in os.listdir(source)
+                     if Path(name).suffix.lower() in READERS or Path(name).suffix.lower() in TABLE_READERS]
+        elif glob.has_magic(source):
+            paths = glob.glob(source, recursive=True)
+        else:
+            paths = [source]
+        paths = sorted(paths)
+    else:
+        paths = [os.fspath(path) for path in sources]
+    if not paths:
+        raise IngestError(f"No data files in {sources}")
+    return paths
+
+
+def parse_times(values: np.ndarray, time_format: Optional[str] = None) -> np.ndarray:
+    """Parses timestamps to datetime64[ns] (ISO 8601 unless `time_format` is given)."""
+    values = np.asarray(values)
+    if values.dtype.kind == "M":
+        return values.astype("datetime64[ns]")
+    if time_format is None and values.dtype.kind == "U":
+        return values.astype("datetime64[ns]")
+    parsed = [np.datetime64("NaT") if value is None or value == "" else
+              np.datetime64(value) if isinstance(value, datetime) or time_format is None else
+              np.datetime64(datetime.strptime(str(value), time_format))
+              for value in values]
+    return np.array(parsed, dtype="datetime64[ns]")
+
+
+def to_column(values: Sequence[object]) -> np.ndarray:
+    """Typed column: float when every value is numeric or empty, datetime64 for dates, text otherwise.
+
+    Spreadsheet readers give typed values; text (CSV) values are parsed.
+    """
+    kinds = {type(value) for value in values} - {type(None)}
+    if kinds <= {float, int, bool}:
+        return np.array([np.nan if value is None else value for value in values], dtype=float)
+    if kinds == {datetime}:
+        return parse_times(np.array(values, dtype=object))
+    strings = np.array(["" if value is None else str(value) for value in values])
+    try:
+        return np.where(np.char.strip(strings) == "", "nan", strings).astype(float)
+    except ValueError:
+        return strings
+
+
+def _as_text(values: np.ndarray) -> np.ndarray:
+    """Column values as text, missing numbers as ""."""
+    return np.where(np.isnan(values), "", values.astype(str)) if values.dtype.kind == "f" else values.astype(str)
+
+
+def _concatenate(parts: list[np.ndarray]) -> np.ndarray:
+    """Joins column chunks, falling back to text when their types differ."""
+    if len({part.dtype.kind for part in parts}) > 1:
+        parts = [_as_text(part) for part in parts]
+    return np.concatenate(parts)
+
+
+def read_table_chunks(path: str, chunk_rows: int = 65536, schema: Optional[FileSchema] = None,
+                      **reader_options) -> Iterator[dict[str, np.ndarray]]:
+    """Streams a data file as typed column chunks (the first row holds the column names).
+
+    Args:
+        path: A file of a format in READERS or TABLE_READERS.
+        chunk_rows: Rows per chunk.
+        schema: Layout of a delimited file (see utils/schema.py), which skips type discovery.
+        **reader_options: Passed to the reader (e.g. sheet, delimiter).
+
+    Raises:
+        IngestError: If the format is not supported or the file is empty.
+    """
+    if schema is not None:
+        yield from read_schema_chunks(path, schema, chunk_rows)
+        return
+    suffix = Path(path).suffix.lower()
+    if suffix in TABLE_READERS:
+        chunks = TABLE_READERS[suffix](path, **reader_options)
+        try:
+            first = next(chunks, None)
+        except CellLayoutError as error:
+            logging.debug(f"{error}, reading rows instead")
+        else:
+            if first is not None:
+                yield first
+                yield from chunks
+            return
+    reader = READERS.get(suffix)
+    if reader is None:
+        raise IngestError(f"Unsupported file format: {path}")
+    rows = reader(path, **reader_options)
+    header = next(rows, [])
+    if not header:
+        raise IngestError(f"{path} is empty")
+    width = len(header)
+    names = unique_names(header)
+    while True:
+        records = list(islice(rows, chunk_rows))
+        if not records:
+            return
+        records = [row for row in records if any(value not in (None, "") for value in row)]
+        if not records:
+            continue
+        columns = zip(*(list(row[:width]) + [None] * (width - len(row)) for row in records))
+        yield {name: to_column(values) for name, values in zip(names, columns)}
+
+
+@instrumented
+def read_table(path: str, units: Optional[dict[str, str]] = None, **options) -> ColumnarDataset:
+    """Reads a whole data file (CSV, TSV, XLSX, ODS, ...) into a dataset.
+
+    Args:
+        path: Data file.
+        units: Optional units of the columns (by default, those of the schema option).
+        **options: See `read_table_chunks`.
+    """
+    if units is None and options.get("schema") is not None:
+        units = options["schema"].units
+    parts: dict[str, list[Union[np.ndarray, int]]] = {}
+    rows = 0
+    for chunk in read_table_chunks(path, **options):
+        # Columns first seen in later chunks (record files) are padded with missing values
+        length = len(next(iter(chunk.values()), ()))
+        for name, values in chunk.items():
+            parts.setdefault(name, [rows] if rows else []).append(values)
+        for name, values in parts.items():
+            if name not in chunk:
+                values.append(length)
+        rows += length
+    return ColumnarDataset({name: _concatenate(_pad(values)) for name, values in parts.items()},
+                           units={name: unit for name, unit in (units or {}).items() if name in parts})
+
+
+def load_table(path: str, directory: str, units: Optional[dict[str, str]] = None,
+               **options) -> ColumnarDataset:
+    """Reads a data file into a dataset saved under `directory`, and memory-maps it.
+
+    Unlike `read_table`, memory stays around one chunk whatever the file size: the
+    chunks are saved as they are read, then written into one dataset with the
+    column types they share (text when they differ).
+
+    Args:
+        path: Data file.
+        directory: Output directory of the dataset.
+        units: Optional units of the columns (by default, those of the schema option).
+        **options: See `read_table_chunks`.
+    """
+    if units is None and options.get("schema") is not None:
+        units = options["schema"].units
+    os.makedirs(directory, exist_ok=True)
+    chunk_root = tempfile.mkdtemp(prefix=".chunks-", dir=directory)
+    try:
+        chunks, dtypes = [], {}
+        for index, chunk in enumerate(read_table_chunks(path, **options)):
+            chunk_directory = os.path.join(chunk_root, f"{index:06d}")
+            ColumnarDataset(chunk).save(chunk_directory)
+            chunks.append(chunk_directory)
+            for name, values in chunk.items():
+                dtypes[name] = _common_dtype(dtypes.get(name), values.dtype)
+        with ColumnarDatasetWriter(directory, dtypes, {name: unit for name, unit in (units or {}).items()
+                                                       if name in dtypes}) as writer:
+            for chunk_directory in chunks:
+                chunk = ColumnarDataset.load(chunk_directory).columns
+                writer.append({name: _as_text(values) if dtypes[name].kind == "U" else values
+                               for name, values in chunk.items()})
+    finally:
+        shutil.rmtree(chunk_root, ignore_errors=True)
+    return ColumnarDataset.load(directory)
+
+
+def _common_dtype(previous: Optional[np.dtype], dtype: np.dtype) -> np.dtype:
+    """Type of a column holding values of both types; text wins when they differ."""
+    if previous is None or previous == dtype:
+        return np.dtype(dtype)
+    if previous.kind == dtype.kind and dtype.kind != "U":
+        return previous
+    width = max(d.itemsize // 4 if d.kind == "U" else 32 for d in (previous, dtype))
+    return np.dtype(f"<U{width}")
+
+
+def _pad(parts: list[Union[np.ndarray, int]]) -> list[np.ndarray]:
+    """Replaces the row counts of a column's absent chunks by missing values."""
+    dtype = next(part.dtype for part in parts if not isinstance(part, int))
+    return [np.full(part, _MISSING[dtype.kind], dtype=dtype) if isinstance(part, int) else part for part in parts]
+
+
+_MISSING = {"f": np.nan, "M": np.datetime64("NaT"), "U": ""}
+
+
+def _parse_file(path: str, run_directory: str, time_column: Optional[str], time_format: Optional[str],
+                reader_options: dict) -> dict:
+    """Parses one file into a time-sorted run saved under `run_directory`."""
+    try:
+        data = read_table(path, **reader_options).columns
+    except SpreadsheetError as error:
+        raise IngestError(str(error)) from error
+    if not data:  # Header only
+        ColumnarDataset().save(run_directory)
+        return {"directory": run_directory, "rows": 0, "dropped": 0, "dtypes": {}}
+    if time_column is None:
+        time_column = next((name for name in data if name.lower() in TIME_COLUMN_NAMES), next(iter(data)))
+    if time_column not in data:
+        raise IngestError(f"{path} has no {time_column!r} column")
+    try:
+        data[time_column] = parse_times(data[time_column], time_format)
+    except ValueError as error:
+        raise IngestError(f"{path}, column {time_column}: {error}") from error
+    times = data.pop(time_column)
+    valid = ~np.isnat(times)
+    order = np.argsort(times[valid], kind="stable")
+    dataset = ColumnarDataset({"time": times[valid][order],
+                               **{name: values[valid][order] for name, values in data.items()}})
+    dataset.save(run_directory)
+    return {"directory": run_directory, "rows": len(dataset), "dropped": int((~valid).sum()),
+            "dtypes": {name: dataset[name].dtype.str for name in dataset.names}}
+
+
+def _combine_dtypes(runs: list[dict]) -> dict[str, np.dtype]:
+    """Union of the run columns; text wins over numbers, wider text over narrower."""
+    dtypes: dict[str, np.dtype] = {"time": np.dtype("datetime64[ns]")}
+    for run in runs:
+        for name, dtype in run["dtypes"].items():
+            if name == "time":
+                continue
+            dtype = np.dtype(dtype)
+            previous = dtypes.get(name)
+            if previous is None:
+                dtypes[name] = dtype
+            elif previous.kind == "U" or dtype.kind == "U":
+                width = max(d.itemsize // 4 if d.kind == "U" else 32 for d in (previous, dtype))
+                dtypes[name] = np.dtype(f"<U{width}")
+    return dtypes
+
+
+def _missing(values: np.ndarray) -> np.ndarray:
+    if values.dtype.kind == "f":
+        return np.isnan(values)
+    if values.dtype.kind == "M":
+        return np.isnat(values)
+    return values == ""
+
+
+def _deduplicate(times: np.ndarray, priority: np.ndarray, columns: dict[str, np.ndarray]):
+    """Sorts rows by (time, priority) and combines rows of equal time.
+
+    Each column takes the first non-missing value of its time group.
+    """
+    order = np.lexsort((priority, times))
+    times = times[order]
+    starts = np.flatnonzero(np.r_[True, times[1:] != times[:-1]])
+    result = {"time": times[starts]}
+    for name, values in columns.items():
+        values = values[order]
+        if len(starts) == len(times):
+            result[name] = values
+            continue
+        position = np.where(_missing(values), len(values), np.arange(len(values)))
+        first = np.minimum.reduceat(position, starts)
+        # Groups without any value keep their first (missing) row
+        first = np.where(first == len(values), starts, first)
+        result[name] = values[first]
+    return result
+
+
+class _Run:
+    """Block reader over one memory-mapped run."""
+
+    def __init__(self, index: int, dataset: ColumnarDataset, block_rows: int):
+        self.index = index
+        self.dataset = dataset
+        self.block_rows = block_rows
+        self.position = 0
+        self.buffer: dict[str, np.ndarray] = {name: dataset[name][:0] for name in dataset.names}
+
+    @property
+    def exhausted(self) -> bool:
+        return self.position >= len(self.dataset)
+
+    def read_block(self):
+        stop = self.position + self.block_rows
+        for name in self.dataset.names:
+            self.buffer[name] = np.concatenate([self.buffer[name], self.dataset[name][self.position:stop]])
+        self.position = min(stop, len(self.dataset))
+
+    def take_before(self, boundary: Optional[np.datetime64]) -> dict[str, np.ndarray]:
+        """Removes and returns the buffered rows older than `boundary` (all of them if None)."""
+        count = len(self.buffer["time"]) if boundary is None else \
+            int(np.searchsorted(self.buffer["time"], boundary, side="left"))
+        taken = {name: values[:count] for name, values in self.buffer.items()}
+        self.buffer = {name: values[count:] for name, values in self.buffer.items()}
+        return taken
+
+
+def merge_runs(runs: list[ColumnarDataset], writer: ColumnarDatasetWriter, block_rows: int = 65536) -> int:
+    """K-way merge of time-sorted datasets into `writer`, deduplicating equal timestamps.
+
+    Returns:
+        The number of merged rows.
+    """
+    readers = [_Run(index, run, block_rows) for index, run in enumerate(runs) if len(run)]
+    heap = []
+    for reader in readers:
+        reader.read_block()
+        heapq.heappush(heap, (reader.buffer["time"][-1], reader.index, reader))
+    written = 0
+
+    def emit(boundary):
+        nonlocal written
+        parts = [(reader.index, reader.take_before(boundary)) for reader in readers]
+        parts = [(index, part) for index, part in parts if len(part["time"])]
+        if not parts:
+            return
+        times = np.concatenate([part["time"] for _, part in parts])
+        priority = np.concatenate([np.full(len(part["time"]), index) for index, part in parts])
+        columns = {}
+        for name, dtype in writer.dtypes.items():
+            if name == "time":
+                continue
+            columns[name] = np.concatenate([
+                part[name].astype(dtype) if name in part else
+                np.full(len(part["time"]), np.nan if dtype.kind == "f" else "", dtype=dtype)
+                for _, part in parts])
+        merged = _deduplicate(times, priority, columns)
+        writer.append(merged)
+        written += len(merged["time"])
+
+    while heap:
+        boundary, _, reader = heap[0]
+        emit(boundary)
+        if reader.exhausted:
+            heapq.heappop(heap)
+        else:
+            reader.read_block()
+            heapq.heapreplace(heap, (reader.buffer["time"][-1], reader.index, reader))
+    emit(None)
+    return written
+
+
+@instrumented
+def ingest(sources: Source, output: str,
+           time_column: Optional[str] = None,
+           time_format: Optional[str] = None,
+           units: Optional[dict[str, str]] = None,
+           mode: str = "process",
+           max_workers: Optional[int] = None,
+           block_rows: int = 65536,
+           schemas: Optional[SchemaCache] = None,
+           **reader_options) -> ColumnarDataset:
+    """Parses many data files in parallel and merges them into one dataset by timestamp.
+
+    Args:
+        sources: A directory, a glob pattern (e.g. "exports/**/*.csv") or a list of files.
+        output: Directory of the merged dataset.
+        time_column: Timestamp column of the files; detected by name when None.
+        time_format: strptime format of non-ISO timestamps.
+        units: Units of the merged columns.
+        mode: "process" or "thread" pool, or "serial".
+        max_workers: Pool size (defaults to the number of CPUs).
+        block_rows: Rows read from each run at a time during the merge.
+        schemas: Schemas of delimited files by source pattern; files of a known
+            layout skip type discovery, and the merged units default to the
+            units found in their headers.
+        **reader_options: Passed to the file readers (e.g. delimiter).
+
+    Returns:
+        The merged dataset, memory-mapped from `output`, with a "time" column first.
+
+    Raises:
+        IngestError: If a file cannot be parsed.
+    """
+    if mode not in ("process", "thread", "serial"):
+        raise ValueError(f"Unknown mode: {mode}")
+    paths = expand_sources(sources)
+    os.makedirs(output, exist_ok=True)
+    run_root = tempfile.mkdtemp(prefix=".ingest-", dir=output)
+    try:
+        file_options = [reader_options] * len(paths)
+        if schemas is not None:
+            found = [schemas.schema_for(path) for path in paths]
+            file_options = [{**reader_options, "schema": schema} if schema is not None else reader_options
+                            for schema in found]
+            if units is None:
+                units = {name: unit for schema in found if schema is not None
+                         for name, unit in schema.units.items()} or None
+        arguments = [(path, os.path.join(run_root, f"{index:06d}"), time_column, time_format, options)
+                     for index, (path, options) in enumerate(zip(paths, file_options))]
+        if mode == "serial":
+            runs = [_parse_file(*argument) for argument in arguments]
+        else:
+            pool = ProcessPoolExecutor if mode == "process" else ThreadPoolExecutor
+            with pool(max_workers=max_workers) as executor:
+                runs = list(executor.map(_parse_file, *zip(*arguments)))
+        dropped = sum(run["dropped"] for run in runs)
+        if dropped:
+            logging.warning(f"Dropped {dropped} rows without a timestamp")
+
+        with ColumnarDatasetWriter(output, _combine_dtypes(runs), units) as writer:
+            rows = merge_runs([ColumnarDataset.load(run["directory"]) for run in runs], writer, block_rows)
+    finally:
+        shutil.rmtree(run_root, ignore_errors=True)
+    logging.debug(f"Ingested {len(paths)} files into {rows} rows")
+    return ColumnarDataset.load(output)
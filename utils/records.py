@@ -0,0 +1,289 @@
+import json
+import logging
+import xml.etree.ElementTree as ET
+from itertools import islice
+from typing import Iterator, Optional
+
+import numpy as np
+
+# Streaming readers for record-oriented JSON and XML data files.
+#
+# JSON: a top-level array of records (or an array under `records_key`), or
+# JSON Lines. The file is read in blocks; each block is cut after its last
+# "}" followed by "," or "]" and the records up to that point are decoded at
+# once by the C decoder ("[" + block + "]"). A cut inside a nested object or
+# a string, or past the end of the array, fails to decode, in which case the
+# block is decoded record by record with `raw_decode` up to the closing "]".
+# Under `records_key`, the members of the top-level object are walked one by
+# one (other values are decoded and dropped) until the key itself, and the
+# object may go on after the array. Memory holds one block and one chunk of
+# records, whatever the file size.
+#
+# XML: every child of the root (or every `record_tag` element) is a record,
+# its attributes and leaf elements being the fields. Records are parsed with
+# `iterparse` and dropped from the tree once converted.
+#
+# Nested objects are flattened to dotted names ("sensor.flow"); lists are kept
+# as JSON text. Records become typed column chunks (see utils/ingest.py).
+
+_BLOCK_CHARACTERS = 1 << 22
+
+
+def flatten(record: dict, prefix: str = "") -> dict:
+    """Nested dicts as dotted keys; lists as JSON text."""
+    flat = {}
+    for key, value in record.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{name}."))
+        elif isinstance(value, list):
+            flat[name] = json.dumps(value)
+        else:
+            flat[name] = value
+    return flat
+
+
+def _skip(buffer: str, position: int, characters: str = " \t\r\n,") -> int:
+    while position < len(buffer) and buffer[position] in characters:
+        position += 1
+    return position
+
+
+def iter_json_records(path: str, records_key: Optional[str] = None, encoding: str = "utf-8",
+                      block_characters: int = _BLOCK_CHARACTERS) -> Iterator[dict]:
+    """Streams the records of a JSON array (or JSON Lines) file.
+
+    Args:
+        path: JSON file.
+        records_key: Name of the array holding the records, when the file is
+            an object such as {"meta": ..., "records": [...]}.
+        block_characters: Characters read at a time.
+
+    Raises:
+        ValueError: If the file is not an array of records.
+    """
+    decoder = json.JSONDecoder()
+    with open(path, encoding=encoding) as file:
+        reader = _Reader(file, block_characters)
+        position = reader.skip(0, " \t\r\n")
+        first = reader.buffer[position:position + 1]
+        if first == "{" and records_key is not None:
+            position = _find_member(decoder, reader, position + 1, records_key, path)
+            for records in _array_batches(decoder, reader, position + 1):
+                yield from records
+            return  # The object may go on after the records
+        if first == "[":
+            for records in _array_batches(decoder, reader, position + 1):
+                yield from records
+            position = reader.position
+            while True:
+                if reader.buffer[position:].strip(" \t\r\n"):
+                    raise ValueError(f"{path}: unexpected data after the records")
+                position = reader.shift(position)
+                if not reader.read():
+                    return
+        if first != "{":
+            raise ValueError(f"{path} is not a JSON array of records")
+        # JSON Lines: one record per line
+        while True:
+            more = reader.read()
+            cut = len(reader.buffer) if not more else reader.buffer.rfind("\n", position) + 1
+            for line in reader.buffer[position:cut].splitlines():
+                if line.strip():
+                    yield json.loads(line)
+            position = reader.shift(max(cut, position))
+            if not more:
+                return
+
+
+class _Reader:
+    """The text read so far of a file, extended block by block."""
+
+    def __init__(self, file, block_characters: int):
+        self.file = file
+        self.block_characters = block_characters
+        self.buffer = file.read(block_characters).lstrip("\ufeff")
+        self.at_end = not self.buffer
+        self.position = 0  # After the last array read by `_array_batches`
+
+    def read(self) -> bool:
+        """Appends a block; False at the end of the file."""
+        more = "" if self.at_end else self.file.read(self.block_characters)
+        self.at_end = not more
+        self.buffer += more
+        return bool(more)
+
+    def shift(self, position: int) -> int:
+        """Drops the text before `position`; returns the new position (0)."""
+        self.buffer = self.buffer[position:]
+        return 0
+
+    def skip(self, position: int, characters: str = " \t\r\n,") -> int:
+        """Position of the next character not in `characters`, reading on as needed."""
+        position = _skip(self.buffer, position, characters)
+        while position >= len(self.buffer) and self.read():
+            position = _skip(self.buffer, position, characters)
+        return position
+
+    def decode(self, decoder: json.JSONDecoder, position: int) -> tuple[object, int]:
+        """The JSON value at `position` and the position after it, reading on as needed."""
+        while True:
+            try:
+                value, end = decoder.raw_decode(self.buffer, position)
+            except json.JSONDecodeError:
+                if self.read():
+                    continue
+                raise
+            if end < len(self.buffer) or not self.read():  # A number may continue in the next block
+                return value, end
+
+
+def _find_member(decoder: json.JSONDecoder, reader: _Reader, position: int, key: str, path: str) -> int:
+    """Position of the "[" opening the `key` array of the top-level object starting before `position`.
+
+    Only the object's own keys are compared: the values of other members are decoded and skipped,
+    so a nested "records" key or a "records" string elsewhere is never taken for it.
+    """
+    while True:
+        position = reader.skip(position)
+        if reader.buffer[position:position + 1] in ("}", ""):
+            raise ValueError(f"{path} has no {key!r} array")
+        name, position = reader.decode(decoder, position)
+        position = reader.skip(position, " \t\r\n")
+        if not isinstance(name, str) or reader.buffer[position:position + 1] != ":":
+            raise ValueError(f"{path} is not a JSON object of records")
+        position = reader.skip(position + 1, " \t\r\n")
+        if name == key:
+            if reader.buffer[position:position + 1] != "[":
+                raise ValueError(f"{key!r} of {path} is not an array")
+            return position
+        _, position = reader.decode(decoder, position)
+        position = reader.shift(position)  # Skipped values are not kept
+
+
+def _array_batches(decoder: json.JSONDecoder, reader: _Reader, position: int) -> Iterator[list]:
+    """Yields the records of the array whose "[" is before `position`, a list per block.
+
+    `reader.position` is then the position after the closing "]".
+    """
+    while True:
+        position = reader.shift(position)
+        reader.read()
+        buffer = reader.buffer
+        cut = _array_cut(buffer)
+        block = buffer[:cut].strip(" \t\r\n,")
+        try:
+            records = json.loads(f"[{block}]") if block else []
+            position = cut
+        except json.JSONDecodeError:
+            # Cut inside a record, or after the end of the array: one record at a time
+            records, position = _raw_records(decoder, buffer, 0, reader.at_end)
+        yield records
+        position = _skip(buffer, position)
+        if reader.at_end and buffer[position:position + 1] != "]":
+            records, position = _raw_records(decoder, buffer, position, True)
+            yield records
+            position = _skip(buffer, position)
+            if buffer[position:position + 1] != "]":
+                raise ValueError("The records array is not closed")
+        if buffer[position:position + 1] == "]":
+            reader.position = position + 1
+            return
+
+
+def _array_cut(buffer: str) -> int:
+    """End of the last complete record candidate of the buffer."""
+    for separator in ("},", "}\n", "} ", "}]"):
+        end = buffer.rfind(separator)
+        if end >= 0:
+            return end + 1
+    return 0
+
+
+def _raw_records(decoder: json.JSONDecoder, buffer: str, position: int, at_end: bool) -> tuple[list, int]:
+    """Records of the buffer from `position` on, and the position after the last complete one."""
+    records = []
+    position = _skip(buffer, position)
+    while position < len(buffer) and buffer[position] != "]":
+        try:
+            record, end = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            if at_end:
+                raise
+            break
+        if end == len(buffer) and not at_end:
+            break  # A number may continue in the next block
+        records.append(record)
+        position = _skip(buffer, end)
+    return records, position
+
+
+def iter_xml_records(path: str, record_tag: Optional[str] = None) -> Iterator[dict]:
+    """Streams the records of an XML file.
+
+    Args:
+        path: XML file.
+        record_tag: Tag of the record elements (without namespace). By default,
+            the children of the root element.
+    """
+    parents = []
+    try:
+        for event, element in ET.iterparse(path, events=("start", "end")):
+            if event == "start":
+                parents.append(element)
+                continue
+            parents.pop()
+            tag = element.tag.rsplit("}", 1)[-1]
+            if (record_tag is None and len(parents) == 1) or (record_tag is not None and tag == record_tag):
+                yield _xml_record(element)
+                if parents:
+                    parents[-1].remove(element)
+    except ET.ParseError as error:  # A SyntaxError: truncated or malformed files fail like the JSON ones
+        raise ValueError(f"{path}: {error}") from error
+
+
+def _xml_record(element: ET.Element, prefix: str = "") -> dict:
+    record = {f"{prefix}{name.rsplit('}', 1)[-1]}": value for name, value in element.attrib.items()}
+    for child in element:
+        name = f"{prefix}{child.tag.rsplit('}', 1)[-1]}"
+        if len(child) or child.attrib:
+            record.update(_xml_record(child, f"{name}."))
+            if child.text and child.text.strip():
+                record[name] = child.text.strip()
+        else:
+            record[name] = (child.text or "").strip()
+    return record
+
+
+def record_chunks(records: Iterator[dict], chunk_rows: int = 65536) -> Iterator[dict[str, np.ndarray]]:
+    """Typed column chunks of a record stream.
+
+    Columns appear in the order their fields are first seen; a chunk holds
+    every column seen so far, missing fields being empty.
+    """
+    from utils.ingest import to_column
+
+    names: dict[str, None] = {}
+    count = 0
+    while True:
+        batch = [flatten(record) if isinstance(record, dict) else {"value": record}
+                 for record in islice(records, chunk_rows)]
+        if not batch:
+            logging.debug(f"Read {count} records into {len(names)} columns")
+            return
+        for record in batch:
+            for name in record:
+                if name not in names:
+                    names[name] = None
+        count += len(batch)
+        yield {name: to_column([record.get(name) for record in batch]) for name in names}
+
+
+def read_json_table(path: str, chunk_rows: int = 65536, **options) -> Iterator[dict[str, np.ndarray]]:
+    """Typed column chunks of a JSON records file (see `iter_json_records`)."""
+    return record_chunks(iter_json_records(path, **options), chunk_rows)
+
+
+def read_xml_table(path: str, chunk_rows: int = 65536, **options) -> Iterator[dict[str, np.ndarray]]:
+    """Typed column chunks of an XML records file (see `iter_xml_records`)."""
+    return record_chunks(iter_xml_records(path, **options), chunk_rows)
@@ -0,0 +1,340 @@
+import codecs
+import csv
+import json
+import logging
+import os
+import re
+import threading
+from datetime import datetime
+from itertools import islice
+from pathlib import Path
+from typing import Iterator, Optional
+
+import numpy as np
+from pydantic import BaseModel
+
+from app.instrumentation import instrumented
+from app.units import ureg
+from utils.spreadsheets import unique_names
+
+# Schema inference for delimited data files (CSV, TSV, SCADA exports).
+#
+# A schema (encoding, delimiter, header, column types, timestamp formats and
+# units) is inferred from the first `sample_bytes` of a file:
+# - encoding: byte order mark, else UTF-8 when the sample decodes, else cp1252;
+# - delimiter: csv.Sniffer restricted to , ; tab and |;
+# - header: the first row is a header when one of its cells is text above a
+#   numeric or datetime column (or when every column is text);
+# - types: float when every sampled value parses as a number, datetime when
+#   they all match ISO 8601 or one of TIME_FORMATS (day first before month
+#   first), text otherwise;
+# - units: "Flow (m3/d)" or "TSS [mg/L]" headers give the column "Flow" with
+#   unit "m^3/d" when pint understands the unit.
+#
+# Schemas are cached per source pattern (the file name with digit runs
+# replaced by "#", e.g. "scada_#-#-#.csv"), so a recurring daily export is only
+# inferred once. A cached schema is reused while the file's header line is
+# unchanged, and the file is then parsed by `read_schema_chunks`, which converts
+# whole columns at once: fixed-width timestamp formats are rearranged into ISO
+# strings with NumPy instead of calling strptime on every value.
+
+SAMPLE_BYTES = 1 << 16
+DELIMITERS = ",;\t|"
+DELIMITED_FORMATS = {".csv", ".tsv", ".txt"}
+TIME_FORMATS = (
+    "%d/%m/%Y %H:%M:%S", "%d/%m/%Y %H:%M", "%d/%m/%Y",
+    "%m/%d/%Y %H:%M:%S", "%m/%d/%Y %H:%M", "%m/%d/%Y",
+    "%d.%m.%Y %H:%M:%S", "%d.%m.%Y %H:%M", "%d.%m.%Y",
+    "%d-%m-%Y %H:%M:%S", "%d-%m-%Y %H:%M",
+    "%Y/%m/%d %H:%M:%S", "%Y/%m/%d %H:%M", "%Y/%m/%d",
+)
+_UNIT_SUFFIX = re.compile(r"^(?P<name>.*?)\s*[(\[](?P<unit>[^()\[\]]+)[)\]]\s*$")
+_POWER = re.compile(r"(?<=[A-Za-z])([23])(?![\d.])")  # m3 -> m^3
+_FIELDS = {"Y": ("year", 4), "m": ("month", 2), "d": ("day", 2), "H": ("hour", 2), "M": ("minute", 2),
+           "S": ("second", 2)}
+_ISO_LAYOUT = (("year", 0), ("month", 5), ("day", 8), ("hour", 11), ("minute", 14), ("second", 17))
+
+
+class SchemaError(ValueError):
+    """A file does not match its schema."""
+
+
+class ColumnSchema(BaseModel):
+    """Type of a column: "float", "datetime" or "text"."""
+
+    name: str
+    kind: str = "text"
+    time_format: Optional[str] = None  # strptime format of datetime columns (None for ISO 8601)
+    unit: Optional[str] = None
+
+
+class FileSchema(BaseModel):
+    """Layout of a delimited data file."""
+
+    encoding: str = "utf-8"
+    delimiter: str = ","
+    header: bool = True
+    signature: str = ""  # First line of the file, to check that a cached schema still applies
+    columns: list[ColumnSchema] = []
+
+    @property
+    def names(self) -> list[str]:
+        return [column.name for column in self.columns]
+
+    @property
+    def units(self) -> dict[str, str]:
+        return {column.name: column.unit for column in self.columns if column.unit}
+
+    def matches(self, path: str) -> bool:
+        """Whether the file starts with the same line as the file the schema was inferred from."""
+        try:
+            return _first_line(path, self.encoding) == self.signature
+        except (OSError, UnicodeDecodeError):
+            return False
+
+
+def source_pattern(path: str) -> str:
+    """Name shared by recurring exports: digit runs of the file name become "#"."""
+    return re.sub(r"\d+", "#", Path(path).name)
+
+
+def detect_encoding(sample: bytes) -> str:
+    """Encoding of a file from its first bytes."""
+    for bom, encoding in ((codecs.BOM_UTF8, "utf-8-sig"), (codecs.BOM_UTF16_LE, "utf-16"),
+                          (codecs.BOM_UTF16_BE, "utf-16")):
+        if sample.startswith(bom):
+            return encoding
+    try:
+        sample.decode("utf-8")
+    except UnicodeDecodeError as error:
+        if error.start < len(sample) - 3:  # Not just a character cut by the end of the sample
+            return "cp1252"
+    return "utf-8"
+
+
+def _first_line(path: str, encoding: str) -> str:
+    with open(path, encoding=encoding, newline="") as file:
+        return file.readline().rstrip("\r\n")
+
+
+def split_unit(header: str) -> tuple[str, Optional[str]]:
+    """Splits "Flow (m3/d)" into ("Flow", "m^3/d"); the unit is None when pint does not know it."""
+    match = _UNIT_SUFFIX.match(header)
+    if match is None or not match["name"]:
+        return header, None
+    unit = _POWER.sub(r"^\1", match["unit"].strip().replace("³", "^3").replace("²", "^2"))
+    try:
+        ureg.parse_units(unit)
+    except Exception:  # pint raises several error types for unknown or malformed units
+        return header, None
+    return match["name"], unit
+
+
+def infer_kind(values: list[str]) -> tuple[str, Optional[str]]:
+    """Column kind ("float", "datetime" or "text") and timestamp format of sampled text values."""
+    values = [value.strip() for value in values if value.strip()]
+    if not values:
+        return "float", None
+    try:
+        np.array(values).astype(float)
+        return "float", None
+    except ValueError:
+        pass
+    if all(any(character.isdigit() for character in value) for value in values):
+        try:
+            np.array(values).astype("datetime64[ns]")
+            return "datetime", None
+        except ValueError:
+            pass
+        for time_format in TIME_FORMATS:
+            try:
+                for value in values:
+                    datetime.strptime(value, time_format)
+            except ValueError:
+                continue
+            return "datetime", time_format
+    return "text", None
+
+
+@instrumented
+def infer_schema(path: str, sample_bytes: int = SAMPLE_BYTES) -> FileSchema:
+    """Infers the layout of a delimited file from its first bytes.
+
+    Raises:
+        SchemaError: If the file is empty.
+    """
+    with open(path, "rb") as file:
+        sample = file.read(sample_bytes)
+    if not sample.strip():
+        raise SchemaError(f"{path} is empty")
+    encoding = detect_encoding(sample)
+    text = sample.decode(encoding, errors="ignore")
+    lines = text.splitlines()
+    if len(sample) == sample_bytes and len(lines) > 1:
+        lines = lines[:-1]  # The last line may be cut
+    try:
+        delimiter = csv.Sniffer().sniff("\n".join(lines[:50]), delimiters=DELIMITERS).delimiter
+    except csv.Error:
+        delimiter = "\t" if Path(path).suffix.lower() == ".tsv" else ","
+    rows = [row for row in csv.reader(lines, delimiter=delimiter) if any(cell.strip() for cell in row)]
+    width = max(len(row) for row in rows)
+    columns = [[row[index] if index < len(row) else "" for row in rows] for index in range(width)]
+
+    kinds = [infer_kind(values[1:]) for values in columns]
+    first = [infer_kind(values[:1])[0] for values in columns]
+    header = len(rows) == 1 or all(kind == "text" for kind, _ in kinds) or any(
+        top == "text" and kind != "text" and values[0].strip() for top, (kind, _), values in zip(first, kinds, columns))
+    if not header:
+        kinds = [infer_kind(values) for values in columns]
+        names = [f"column_{index + 1}" for index in range(width)]
+    else:
+        names = unique_names([values[0].strip() for values in columns])
+    schema_columns = []
+    for name, (kind, time_format) in zip(names, kinds):
+        name, unit = split_unit(name) if header else (name, None)
+        schema_columns.append(ColumnSchema(name=name, kind=kind, time_format=time_format, unit=unit))
+    if len({column.name for column in schema_columns}) < width:  # "Flow (m3/d)" and "Flow (L/s)"
+        for column, name in zip(schema_columns, names):
+            column.name = name
+    schema = FileSchema(encoding=encoding, delimiter=delimiter, header=header,
+                        signature=lines[0], columns=schema_columns)
+    logging.debug(f"Inferred schema of {path}: {schema}")
+    return schema
+
+
+class SchemaCache:
+    """Schemas of delimited files by source pattern, optionally persisted to a JSON file.
+
+    Args:
+        path: JSON file of the cached schemas (in memory only when None).
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = os.fspath(path) if path is not None else None
+        self.schemas: dict[str, FileSchema] = {}
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        if self.path is not None and os.path.exists(self.path):
+            try:
+                with open(self.path) as file:
+                    self.schemas = {pattern: FileSchema.model_validate(schema)
+                                    for pattern, schema in json.load(file).items()}
+            except (OSError, ValueError) as error:
+                logging.warning(f"Ignoring the schema cache {self.path}: {error}")
+
+    def schema_for(self, path: str, sample_bytes: int = SAMPLE_BYTES) -> Optional[FileSchema]:
+        """Cached or inferred schema of a delimited file; None for other formats."""
+        path = os.fspath(path)
+        if Path(path).suffix.lower() not in DELIMITED_FORMATS:
+            return None
+        pattern = source_pattern(path)
+        with self._lock:
+            schema = self.schemas.get(pattern)
+        if schema is not None and schema.matches(path):
+            self.hits += 1
+            return schema
+        self.misses += 1
+        schema = infer_schema(path, sample_bytes)
+        with self._lock:
+            self.schemas[pattern] = schema
+            self._save()
+        return schema
+
+    def _save(self):
+        if self.path is None:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        temporary = f"{self.path}.{os.getpid()}.tmp"
+        with open(temporary, "w") as file:
+            json.dump({pattern: schema.model_dump() for pattern, schema in self.schemas.items()}, file, indent=1)
+        os.replace(temporary, self.path)
+
+
+def parse_formatted_times(values: np.ndarray, time_format: Optional[str]) -> np.ndarray:
+    """Parses a text column to datetime64[ns].
+
+    Formats made of zero-padded %Y %m %d %H %M %S fields are parsed without
+    strptime: the characters of every value are moved into an ISO 8601 layout
+    in one NumPy operation. Other formats, or values of uneven width, fall back
+    to strptime.
+    """
+    values = np.char.strip(np.asarray(values, dtype=str))
+    if time_format is None:
+        return np.where(values == "", "NaT", values).astype("datetime64[ns]")
+    layout = _fixed_layout(time_format)
+    present = values != ""
+    if layout is not None and present.any():
+        fields, literals, width = layout
+        filled = values[present]
+        if (np.char.str_len(filled) == width).all():
+            characters = filled.astype(f"U{width}").view(np.uint32).reshape(-1, width)
+            if all((characters[:, offset] == ord(literal)).all() for offset, literal in literals):
+                iso = np.tile(np.array([ord(character) for character in "0000-01-01T00:00:00"], np.uint32),
+                              (len(filled), 1))
+                for field, target in _ISO_LAYOUT:
+                    if field in fields:
+                        offset, size = fields[field]
+                        iso[:, target:target + size] = characters[:, offset:offset + size]
+                try:
+                    parsed = np.full(len(values), np.datetime64("NaT"), dtype="datetime64[ns]")
+                    parsed[present] = iso.view("U19").ravel().astype("datetime64[ns]")
+                    return parsed
+                except ValueError:
+                    pass  # Not digits where expected: let strptime report the value
+    return np.array([np.datetime64(datetime.strptime(value, time_format)) if value else np.datetime64("NaT")
+                     for value in values], dtype="datetime64[ns]")
+
+
+def _fixed_layout(time_format: str) -> Optional[tuple[dict, list, int]]:
+    """Offsets of the fields and literal characters of a fixed-width format."""
+    fields, literals, offset, index = {}, [], 0, 0
+    while index < len(time_format):
+        character = time_format[index]
+        if character == "%":
+            directive = time_format[index + 1:index + 2]
+            if directive not in _FIELDS:
+                return None
+            field, size = _FIELDS[directive]
+            fields[field] = (offset, size)
+            offset += size
+            index += 2
+        else:
+            literals.append((offset, character))
+            offset += 1
+            index += 1
+    return fields, literals, offset
+
+
+def read_schema_chunks(path: str, schema: FileSchema, chunk_rows: int = 65536) -> Iterator[dict[str, np.ndarray]]:
+    """Streams a delimited file as typed column chunks, typing whole columns as the schema says.
+
+    A column whose values do not fit its schema type in a chunk is typed like
+    a file without schema (see `to_column`).
+    """
+    from utils.ingest import to_column
+
+    width = len(schema.columns)
+    with open(path, encoding=schema.encoding, newline="") as file:
+        rows = csv.reader(file, delimiter=schema.delimiter)
+        if schema.header:
+            next(rows, None)
+        while True:
+            records = [row for row in islice(rows, chunk_rows) if row]
+            if not records:
+                return
+            if set(map(len, records)) != {width}:
+                records = [row[:width] + [""] * (width - len(row)) for row in records]
+            chunk = {}
+            for column, values in zip(schema.columns, zip(*records)):
+                values = np.array(values)
+                try:
+                    if column.kind == "float":
+                        values = np.where(np.char.strip(values) == "", "nan", values).astype(float)
+                    elif column.kind == "datetime":
+                        values = parse_formatted_times(values, column.time_format)
+                except ValueError:
+                    logging.debug(f"{path}: column {column.name} does not match its schema")
+                    values = to_column(list(values))
+                chunk[column.name] = values
+            yield chunk
@@ -0,0 +1,446 @@
+import functools
+import html
+import logging
+import os
+import re
+import zipfile
+import xml.etree.ElementTree as ET
+from datetime import datetime, timedelta
+from typing import Iterator, Optional, Sequence, Union
+
+import numpy as np
+
+# Read-only streaming readers for Excel (.xlsx) and OpenDocument (.ods)
+# spreadsheets, without a third-party dependency.
+#
+# Both formats are zip archives of XML parts. Only the parts needed are read:
+# the workbook lists the sheets (read lazily, sheet parts are opened only when
+# iterated), the shared strings and cell styles of a workbook are parsed once
+# and cached, and sheet rows are parsed with `iterparse`, each row element
+# being dropped from the tree once converted, so memory stays bounded
+# whatever the number of rows.
+#
+# Rows are lists of typed Python values: float, bool, str, datetime (for
+# cells with a date format or type) or None for empty cells. The first row of
+# a sheet is expected to hold the column names (see utils/ingest.py).
+
+Row = list[Optional[Union[float, bool, str, datetime]]]
+
+_XLSX_NS = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+_RELATIONSHIPS_NS = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+_PACKAGE_RELATIONSHIPS_NS = "{http://schemas.openxmlformats.org/package/2006/relationships}"
+_TABLE_NS = "{urn:oasis:names:tc:opendocument:xmlns:table:1.0}"
+_OFFICE_NS = "{urn:oasis:names:tc:opendocument:xmlns:office:1.0}"
+
+# Built-in Excel number formats displaying dates or times
+_DATE_FORMAT_IDS = set(range(14, 23)) | set(range(27, 37)) | set(range(45, 48)) | set(range(50, 59))
+_EXCEL_EPOCH = datetime(1899, 12, 30)
+_EXCEL_EPOCH_1904 = datetime(1904, 1, 1)
+_CELL_REFERENCE = re.compile(r"([A-Z]+)(\d*)")
+
+
+class SpreadsheetError(ValueError):
+    """A spreadsheet could not be read."""
+
+
+def _streamed(source, tag: str, events=("start", "end")) -> Iterator[ET.Element]:
+    """Yields every complete `tag` element, then removes it from the tree."""
+    parents = []
+    for event, element in ET.iterparse(source, events=events):
+        if event == "start":
+            parents.append(element)
+            continue
+        parents.pop()
+        if element.tag == tag:
+            yield element
+            if parents:
+                parents[-1].remove(element)
+
+
+def _file_key(path: str) -> tuple:
+    status = os.stat(path)
+    return os.path.abspath(path), status.st_mtime_ns, status.st_size
+
+
+# --- XLSX ---
+
+@functools.lru_cache(maxsize=8)
+def _xlsx_workbook(key: tuple) -> dict:
+    """Sheet parts, date system, shared strings and date styles of a workbook (cached per file version)."""
+    path = key[0]
+    try:
+        archive = zipfile.ZipFile(path)
+    except zipfile.BadZipFile as error:
+        raise SpreadsheetError(f"{path} is not an .xlsx workbook") from error
+    try:
+        with archive:
+            names = set(archive.namelist())
+            workbook = ET.fromstring(archive.read("xl/workbook.xml"))
+            relationships = ET.fromstring(archive.read("xl/_rels/workbook.xml.rels"))
+            targets = {relation.get("Id"): relation.get("Target")
+                       for relation in relationships.iter(f"{_PACKAGE_RELATIONSHIPS_NS}Relationship")}
+            sheets = {}
+            for sheet in workbook.iter(f"{_XLSX_NS}sheet"):
+                target = targets[sheet.get(f"{_RELATIONSHIPS_NS}id")]
+                sheets[sheet.get("name")] = target.lstrip("/") if target.startswith("/") else f"xl/{target}"
+            properties = workbook.find(f"{_XLSX_NS}workbookPr")
+            date1904 = properties is not None and properties.get("date1904") in ("1", "true")
+
+            shared_strings = []
+            if "xl/sharedStrings.xml" in names:
+                with archive.open("xl/sharedStrings.xml") as file:
+                    for item in _streamed(file, f"{_XLSX_NS}si"):
+                        # Plain text, or rich text runs; phonetic hints (rPh) are skipped
+                        parts = []
+                        for child in item:
+                            if child.tag == f"{_XLSX_NS}t":
+                                parts.append(child.text or "")
+                            elif child.tag == f"{_XLSX_NS}r":
+                                parts.extend(node.text or "" for node in child.iter(f"{_XLSX_NS}t"))
+                        shared_strings.append("".join(parts))
+
+            date_styles = set()
+            if "xl/styles.xml" in names:
+                styles = ET.fromstring(archive.read("xl/styles.xml"))
+                custom = {int(number_format.get("numFmtId")): number_format.get("formatCode", "")
+                          for number_format in styles.iter(f"{_XLSX_NS}numFmt")}
+                cell_formats = styles.find(f"{_XLSX_NS}cellXfs")
+                for index, cell_format in enumerate(cell_formats if cell_formats is not None else []):
+                    format_id = int(cell_format.get("numFmtId", 0))
+                    if format_id in _DATE_FORMAT_IDS or (format_id in custom and _is_date_format(custom[format_id])):
+                        date_styles.add(index)
+    except (KeyError, ET.ParseError) as error:  # Missing part or malformed XML
+        raise SpreadsheetError(f"{path} is not a valid .xlsx workbook: {error}") from error
+    logging.debug(f"Workbook {path}: {len(sheets)} sheets, {len(shared_strings)} shared strings")
+    shared_array = np.empty(len(shared_strings), dtype=object)
+    shared_array[:] = shared_strings
+    return {"sheets": sheets, "date1904": date1904, "shared_strings": shared_strings, "shared_array": shared_array,
+            "date_styles": date_styles}
+
+
+def _is_date_format(code: str) -> bool:
+    """Whether a custom number format displays a date or time."""
+    code = re.sub(r'"[^"]*"|\[[^\]]*\]|\\.', "", code)  # Quoted text, colors/locales, escapes
+    return bool(re.search(r"[dmyhs]", code, re.IGNORECASE)) and code.lower() != "general"
+
+
+def sheet_names(path: str) -> list[str]:
+    """Names of the sheets of an .xlsx or .ods file, without reading them."""
+    path = os.fspath(path)
+    if path.lower().endswith(".ods"):
+        return [name for name, _ in _ods_tables(path)]
+    return list(_xlsx_workbook(_file_key(path))["sheets"])
+
+
+def _column_number(reference: str) -> int:
+    letters = _CELL_REFERENCE.match(reference).group(1)
+    number = 0
+    for letter in letters:
+        number = number * 26 + ord(letter) - 64
+    return number - 1
+
+
+def _xlsx_sheet(path: str, sheet: Optional[Union[str, int]]) -> tuple[dict, str]:
+    """Cached workbook information and the archive part of a sheet (the first one by default)."""
+    workbook = _xlsx_workbook(_file_key(path))
+    names = list(workbook["sheets"])
+    if not names:
+        raise SpreadsheetError(f"{path} has no sheets")
+    if sheet is None:
+        sheet = names[0]
+    elif isinstance(sheet, int):
+        if not -len(names) <= sheet < len(names):
+            raise SpreadsheetError(f"{path} has no sheet {sheet}")
+        sheet = names[sheet]
+    if sheet not in workbook["sheets"]:
+        raise SpreadsheetError(f"{path} has no sheet {sheet!r}")
+    return workbook, workbook["sheets"][sheet]
+
+
+def read_xlsx(path: str, sheet: Optional[Union[str, int]] = None) -> Iterator[Row]:
+    """Streams the rows of an .xlsx sheet (the first one by default).
+
+    Args:
+        path: Workbook path.
+        sheet: Sheet name or zero-based index.
+    """
+    workbook, part = _xlsx_sheet(path, sheet)
+    shared_strings, date_styles = workbook["shared_strings"], workbook["date_styles"]
+    epoch = _EXCEL_EPOCH_1904 if workbook["date1904"] else _EXCEL_EPOCH
+
+    with zipfile.ZipFile(path) as archive, archive.open(part) as file:
+        for row in _streamed(file, f"{_XLSX_NS}row"):
+            values: Row = []
+            for cell in row.iter(f"{_XLSX_NS}c"):
+                reference = cell.get("r")
+                if reference is not None:
+                    column = _column_number(reference)
+                    values.extend([None] * (column - len(values)))
+                kind = cell.get("t", "n")
+                if kind == "inlineStr":
+                    values.append("".join(node.text or "" for node in cell.iter(f"{_XLSX_NS}t")))
+                    continue
+                node = cell.find(f"{_XLSX_NS}v")
+                text = node.text if node is not None else None
+                if text is None:
+                    value = None
+                elif kind == "s":
+                    value = shared_strings[int(text)]
+                elif kind == "b":
+                    value = text == "1"
+                elif kind in ("str", "e"):
+                    value = text
+                elif kind == "d":
+                    value = datetime.fromisoformat(text)
+                else:
+                    value = float(text)
+                    if int(cell.get("s", 0)) in date_styles:
+                        value = epoch + timedelta(days=value)
+                values.append(value)
+            yield values
+
+
+def unique_names(header: Sequence[object]) -> list[str]:
+    """Column names from a header row; blank or repeated names get their position as suffix."""
+    header = ["" if name is None else str(name).strip() for name in header]
+    return [name if name and header.index(name) == index else f"{name or 'column'}_{index + 1}"
+            for index, name in enumerate(header)]
+
+
+class CellLayoutError(SpreadsheetError):
+    """Cells `read_xlsx_table` cannot scan (e.g. without a reference); `read_xlsx` reads them."""
+
+
+def _xlsx_cell_pattern(prefix: bytes) -> re.Pattern:
+    c, f, v = (re.escape(prefix + tag) for tag in (b"c", b"f", b"v"))
+    return re.compile(rb"<" + c + rb' r="([A-Z]+)(\d+)"([^>]*?)(?:/>|>(?:<' + f + rb"\b[^>]*?(?:/>|>[^<]*</" + f +
+                      rb">))?(?:<" + v + rb">([^<]*)</" + v + rb">)?(.*?)</" + c + rb">)", re.DOTALL)
+
+
+_ATTRIBUTE = re.compile(rb'(\w+)="([^"]*)"')
+_INLINE_TEXT = re.compile(rb"<(?:\w+:)?t\b[^>]*>([^<]*)</")
+
+
+def _xlsx_block_columns(cells: list[tuple[bytes, ...]], workbook: dict, epoch: np.datetime64) -> tuple:
+    """Typed columns of the scanned cells of a block of rows.
+
+    Returns:
+        The row numbers, and per column index an array with one value per row.
+    """
+    letters, row_numbers, attributes, raw, inline = (np.array(values) for values in zip(*cells))
+    row_numbers = row_numbers.astype(np.int64)
+    rows, row_index = np.unique(row_numbers, return_inverse=True)
+    unique_letters, letter_index = np.unique(letters, return_inverse=True)
+    column_numbers = np.array([_column_number(letter.decode()) for letter in unique_letters])[letter_index]
+
+    # Cell type and date style, parsed once per distinct attribute string
+    unique_attributes, attribute_index = np.unique(attributes, return_inverse=True)
+    kinds, dates = [], []
+    for text in unique_attributes:
+        kinds.append(_cell_kind(text))
+        dates.append(int(dict(_ATTRIBUTE.findall(text)).get(b"s", 0)) in workbook["date_styles"])
+    kinds, dates = np.array(kinds)[attribute_index], np.array(dates)[attribute_index]
+
+    empty = (raw == b"") & (kinds != "inlineStr")
+    numeric = (kinds == "n") & ~dates & ~empty
+    boolean = (kinds == "b") & ~empty
+    date = (((kinds == "n") & dates) | (kinds == "d")) & ~empty
+    text = ~(numeric | boolean | date | empty)
+
+    columns = {}
+    for column in np.unique(column_numbers):
+        in_column = column_numbers == column
+        position = row_index[in_column]
+        if not np.any(text[in_column] | date[in_column]):
+            values = np.full(len(rows), np.nan)
+            selected = in_column & numeric
+            values[row_index[selected]] = raw[selected].astype(float)
+            selected = in_column & boolean
+            values[row_index[selected]] = raw[selected] == b"1"
+        elif not np.any(text[in_column] | numeric[in_column] | boolean[in_column]):
+            values = np.full(len(rows), np.datetime64("NaT"), dtype="datetime64[ns]")
+            selected = in_column & date & (kinds == "n")
+            milliseconds = np.round(raw[selected].astype(float) * 86400000).astype(np.int64)
+            values[row_index[selected]] = epoch + milliseconds.astype("timedelta64[ms]")
+            selected = in_column & (kinds == "d")
+            values[row_index[selected]] = raw[selected].astype(str).astype("datetime64[ns]")
+        elif np.all((kinds[in_column] == "s") | empty[in_column]):
+            # Shared strings: one vectorized lookup
+            values = np.full(len(rows), "", dtype=object)
+            selected = in_column & ~empty
+            values[row_index[selected]] = workbook["shared_array"][raw[selected].astype(np.int64)]
+            values = values.astype(str)
+        else:
+            values = np.full(len(rows), "", dtype=object)
+            values[position] = [_xlsx_text(kind, value, body, workbook) for kind, value, body in
+                                zip(kinds[in_column], raw[in_column], inline[in_column])]
+            values = values.astype(str)
+        columns[int(column)] = values
+    return rows, columns
+
+
+def _cell_kind(attributes: bytes) -> str:
+    return dict(_ATTRIBUTE.findall(attributes)).get(b"t", b"n").decode()
+
+
+def _xlsx_text(kind: str, value: bytes, body: bytes, workbook: dict) -> str:
+    """A cell of a mixed column, as text."""
+    if kind == "inlineStr":
+        return html.unescape(b"".join(_INLINE_TEXT.findall(body)).decode())
+    if value == b"":
+        return ""
+    if kind == "s":
+        return workbook["shared_strings"][int(value)]
+    return html.unescape(value.decode())
+
+
+def read_xlsx_table(path: str, sheet: Optional[Union[str, int]] = None,
+                    block_bytes: int = 1 << 23) -> Iterator[dict[str, np.ndarray]]:
+    """Streams an .xlsx sheet as typed column chunks, the first row holding the column names.
+
+    The sheet XML is scanned in blocks of whole rows with a regular expression
+    and each column is converted with NumPy: float for numbers and booleans,
+    datetime64 for date-formatted cells, text otherwise (including mixed columns).
+
+    Args:
+        path: Workbook path.
+        sheet: Sheet name or zero-based index.
+        block_bytes: Uncompressed XML read per chunk.
+
+    Raises:
+        CellLayoutError: If the sheet cannot be read this way (cells without
+            references); `read_xlsx` reads any sheet, more slowly.
+    """
+    workbook, part = _xlsx_sheet(path, sheet)
+    epoch = np.datetime64(_EXCEL_EPOCH_1904 if workbook["date1904"] else _EXCEL_EPOCH, "ms")
+    names = None
+    with zipfile.ZipFile(path) as archive, archive.open(part) as file:
+        pending, pattern, row_end, prefix = b"", None, None, b""
+        while True:
+            data = file.read(block_bytes)
+            pending += data
+            if pattern is None:
+                root = re.search(rb"<(\w+:)?worksheet\b", pending)
+                if root is None and data:
+                    continue
+                prefix = root.group(1) or b"" if root else b""
+                pattern, row_end = _xlsx_cell_pattern(prefix), b"</" + prefix + b"row>"
+            cut = len(pending) if not data else pending.rfind(row_end) + len(row_end)
+            if cut < len(row_end) and data:
+                continue
+            block, pending = pending[:cut], pending[cut:]
+            cells = pattern.findall(block)
+            if len(cells) != block.count(b"<" + prefix + b"c ") + block.count(b"<" + prefix + b"c>"):
+                raise CellLayoutError(f"{path}: cells without a reference")
+            if cells and names is None:
+                # The cells of the first row hold the names
+                count = next((index for index, cell in enumerate(cells) if cell[1] != cells[0][1]), len(cells))
+                header = {_column_number(cell[0].decode()): _xlsx_text(_cell_kind(cell[2]), cell[3], cell[4], workbook)
+                          for cell in cells[:count]}
+                names = unique_names([header.get(column, "") for column in range(max(header) + 1)])
+                cells = cells[count:]
+            if cells:
+                rows, columns = _xlsx_block_columns(cells, workbook, epoch)
+                for column in range(len(names), max(columns) + 1):
+                    names.append(f"column_{column + 1}")
+                yield {name: columns.get(column, np.full(len(rows), np.nan)) for column, name in enumerate(names)}
+            if not data:
+                return
+
+
+# --- ODS ---
+
+def _ods_value(cell: ET.Element):
+    kind = cell.get(f"{_OFFICE_NS}value-type")
+    if kind is None:
+        return None
+    if kind in ("float", "percentage", "currency"):
+        return float(cell.get(f"{_OFFICE_NS}value"))
+    if kind == "date":
+        return datetime.fromisoformat(cell.get(f"{_OFFICE_NS}date-value"))
+    if kind == "boolean":
+        return cell.get(f"{_OFFICE_NS}boolean-value") == "true"
+    # Strings (and durations) as displayed: one text:p element per line
+    paragraphs = ["".join(paragraph.itertext()) for paragraph in cell if paragraph.tag.endswith("}p")]
+    return "\n".join(paragraphs) if paragraphs else cell.get(f"{_OFFICE_NS}string-value", "")
+
+
+def _ods_rows(path: str, sheet: Optional[Union[str, int]]) -> Iterator[tuple[str, Row]]:
+    """Streams (table name, row) of the wanted table, stopping after it."""
+    table_tag, row_tag = f"{_TABLE_NS}table", f"{_TABLE_NS}table-row"
+    repeated_columns, repeated_rows = f"{_TABLE_NS}number-columns-repeated", f"{_TABLE_NS}number-rows-repeated"
+    try:
+        archive = zipfile.ZipFile(path)
+    except zipfile.BadZipFile as error:
+        raise SpreadsheetError(f"{path} is not an .ods spreadsheet") from error
+    try:
+        with archive, archive.open("content.xml") as file:
+            parents, table, index, found = [], None, -1, False
+            for event, element in ET.iterparse(file, events=("start", "end")):
+                if event == "start":
+                    parents.append(element)
+                    if element.tag == table_tag:
+                        index += 1
+                        table = element.get(f"{_TABLE_NS}name")
+                        found = sheet is None and index == 0 or sheet == table or sheet == index
+                    continue
+                parents.pop()
+                if element.tag == table_tag:
+                    if found:
+                        return
+                    if parents:
+                        parents[-1].remove(element)
+                elif element.tag == row_tag and found:
+                    cells = []
+                    for cell in element:
+                        if not cell.tag.endswith("table-cell"):
+                            continue
+                        cells.append((_ods_value(cell), int(cell.get(repeated_columns, 1))))
+                    while cells and cells[-1][0] in (None, ""):
+                        cells.pop()  # Trailing empty cells are often repeated to the sheet width
+                    if cells:
+                        values = [value for value, repeat in cells for _ in range(repeat)]
+                        for _ in range(int(element.get(repeated_rows, 1))):
+                            yield table, list(values)
+                    if parents:
+                        parents[-1].remove(element)
+    except (KeyError, ET.ParseError) as error:
+        raise SpreadsheetError(f"{path} is not a valid .ods spreadsheet: {error}") from error
+    if not found:
+        raise SpreadsheetError(f"{path} has no sheet {sheet!r}")
+
+
+def _ods_tables(path: str) -> list[tuple[str, int]]:
+    """(name, index) of the tables, dropping every element once parsed."""
+    tables, parents = [], []
+    try:
+        with zipfile.ZipFile(path) as archive, archive.open("content.xml") as file:
+            for event, element in ET.iterparse(file, events=("start", "end")):
+                if event == "start":
+                    parents.append(element)
+                    if element.tag == f"{_TABLE_NS}table":
+                        tables.append((element.get(f"{_TABLE_NS}name"), len(tables)))
+                    continue
+                parents.pop()
+                if parents:
+                    parents[-1].remove(element)
+    except (zipfile.BadZipFile, KeyError, ET.ParseError) as error:
+        raise SpreadsheetError(f"{path} is not a valid .ods spreadsheet: {error}") from error
+    return tables
+
+
+def read_ods(path: str, sheet: Optional[Union[str, int]] = None) -> Iterator[Row]:
+    """Streams the rows of an .ods table (the first one by default).
+
+    Args:
+        path: Spreadsheet path.
+        sheet: Table name or zero-based index.
+    """
+    for _, row in _ods_rows(path, sheet):
+        yield row
+
+
+def read_xls(path: str, sheet: Optional[Union[str, int]] = None) -> Iterator[Row]:
+    """Legacy .xls (BIFF) workbooks are binary and cannot be streamed here."""
+    raise SpreadsheetError(f"{os.path.basename(path)}: legacy Excel 97-2003 (.xls) workbooks are not "
+                           "supported, save it as .xlsx or .ods")
@@ -1,6 +1,7 @@
 from PySide6 import QtWidgets, QtCore
 from utils.actions import (
     Open,
+    OpenFolder,
     SaveAs,
     Save,
     Copy,
@@ -30,6 +31,7 @@ class FileMenu(QtWidgets.QMenu):
         self.main_window = main_window
 
         self.addAction(Open(parent, self))
+        self.addAction(OpenFolder(parent, self))
         self.addAction(Save(main_window, self))
         self.addAction(SaveAs(main_window, self))
 
@@ -50,6 +52,8 @@ class ViewMenu(QtWidgets.QMenu):
         self.addAction(ToolWindows(main_window, parent=self))
         self.addAction(Appearance(main_window, parent=self))
         self.addAction(RecentFiles(main_window, parent=self))
+        self.addSeparator()
+        self.addAction(main_window.diagnostics_panel.toggleViewAction())
 
 
 class HelpMenu(QtWidgets.QMenu):
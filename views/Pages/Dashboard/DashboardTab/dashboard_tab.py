@@ -18,7 +18,8 @@ from views.Pages.Dashboard  .SampleCharts.chart import (ScatterChartWidget,
                                                       AreaChartWidget,
                                                       PieChartWidget,
                                                       BarChartWidget,
-                                                      LineChartWidget)
+                                                      LineChartWidget,
+                                                      ResultChartWidget)
 
 
 class Dashboard(QTableWidget):
@@ -54,6 +55,11 @@ class Dashboard(QTableWidget):
         self.create_widget_for_cell(0, 3, PieChartWidget)
         self.create_widget_for_cell(1, 0, BarChartWidget, col_span=2)
         self.create_widget_for_cell(2, 2, LineChartWidget, col_span=2)
+        self.result_chart = self.create_widget_for_cell(3, 0, ResultChartWidget, col_span=4)
+
+    def show_result(self, dataset, x: str, y: str):
+        """Plots two columns of a batch result in the result chart."""
+        self.result_chart.plot(dataset, x, y)
 
     def create_widget_for_cell(self, row, col, chart_widget_class, row_span=1, col_span=1):
         chart_widget = chart_widget_class()  # Create the chart widget
@@ -68,3 +74,4 @@ class Dashboard(QTableWidget):
         # --- Set the span ---
         self.setSpan(row, col, row_span, col_span)
         # ---------------------
+        return chart_widget
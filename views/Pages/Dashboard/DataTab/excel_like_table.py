@@ -1,23 +1,191 @@
-from PySide6.QtWidgets import QTableWidget, QTableWidgetItem
+import logging
+from typing import Optional
 
+import numpy as np
+from PySide6.QtCore import QAbstractTableModel, QModelIndex, QObject, Qt, QThread, Signal, Slot
+from PySide6.QtWidgets import QHeaderView, QInputDialog, QMenu, QTableView
 
-class ExcelLikeTable(QTableWidget):
-    def __init__(self, num_rows: int = 1000000, num_columns: int = 26*26):
+from app.instrumentation import instrumented, span
+from app.shared_results import SharedResult
+from models.data_models import ColumnarDataset
+from models.formula_engine import FormulaEngine, FormulaError
+from models.zone_map import ZoneMap
+
+
+class FormulaWorker(QObject):
+    """Applies edits and recalculates formulas on a background thread."""
+
+    # Recomputed row ranges {column name or "column!row": (start, stop)}, and the arrays of those
+    # columns: the GUI thread never reads the engine's dataset while the worker writes to it
+    recalculated = Signal(object, object)
+    filtered = Signal(object)  # Sorted indices of the rows passing a filter
+    failed = Signal(str)
+
+    def __init__(self, engine: FormulaEngine):
         super().__init__()
+        self.engine = engine
+
+    def _emit(self, ranges: dict):
+        names = {key.split("!")[0] for key in ranges}
+        self.recalculated.emit(ranges, {name: self.engine.dataset[name] for name in names
+                                        if name in self.engine.dataset})
+
+    @Slot(str, str)
+    def set_formula(self, target: str, text: str):
+        try:
+            self.engine.set_formula(target, text)
+            self._emit(self.engine.recalculate())
+        except (FormulaError, KeyError, IndexError) as error:
+            self.failed.emit(str(error))
+
+    @Slot(str, int, object)
+    def set_value(self, column: str, row: int, value):
+        try:
+            self.engine.set_values(column, row, [value])
+            changed = self.engine.recalculate()
+            changed.setdefault(self.engine.resolve_column(column), (row, row + 1))
+            self._emit(changed)
+        except (FormulaError, KeyError, IndexError) as error:
+            self.failed.emit(str(error))
+
+    @Slot(object)
+    def filter_rows(self, predicates: dict):
+        try:
+            self.filtered.emit(self.engine.filter_rows(predicates))
+        except (FormulaError, KeyError, ValueError) as error:
+            self.failed.emit(str(error))
+
+
+class ColumnarTableModel(QAbstractTableModel):
+    """Table model over the column arrays of a dataset: cells are formatted when they are drawn.
+
+    Nothing is copied into the view, so a million-row column shows at once. Edits are not written
+    here but sent with `edited` (row, column, text) to be applied by the formula worker. A filter
+    shows only the rows of `row_index` (dataset rows, sorted); edits still name dataset rows.
+    """
+
+    edited = Signal(int, int, str)
+
+    def __init__(self, min_rows: int = 0, min_columns: int = 0, parent=None):
+        super().__init__(parent)
+        self.min_rows = min_rows
+        self.min_columns = min_columns
+        self.names: list[str] = []
+        self.columns: list[np.ndarray] = []
+        self.rows = 0
+        self.row_index: Optional[np.ndarray] = None
+
+    def set_columns(self, columns: dict[str, np.ndarray]):
+        """Shows new columns (arrays, not copied)."""
+        self.beginResetModel()
+        self.names = list(columns)
+        self.columns = list(columns.values())
+        self.rows = max((len(values) for values in self.columns), default=0)
+        self.row_index = None
+        self.endResetModel()
+
+    def set_row_index(self, rows: Optional[np.ndarray]):
+        """Shows only the given dataset rows (None shows them all)."""
+        self.beginResetModel()
+        self.row_index = rows
+        self.endResetModel()
+
+    def source_row(self, row: int) -> int:
+        """Dataset row shown at a view row."""
+        if self.row_index is None:
+            return row
+        return int(self.row_index[row]) if row < len(self.row_index) else -1
+
+    def clear(self):
+        """Drops every reference to the shown arrays."""
+        self.set_columns({})
+
+    def update_columns(self, ranges: dict, columns: dict[str, np.ndarray]):
+        """Takes the (possibly new or replaced) arrays of recalculated columns and repaints their ranges."""
+        for name, values in columns.items():
+            if name in self.names:
+                self.columns[self.names.index(name)] = values
+                continue
+            column = len(self.names)
+            inserted = column >= self.columnCount()
+            if inserted:
+                self.beginInsertColumns(QModelIndex(), column, column)
+            self.names.append(name)
+            self.columns.append(values)
+            if inserted:
+                self.endInsertColumns()
+            self.headerDataChanged.emit(Qt.Orientation.Horizontal, column, column)
+        for key, (start, stop) in ranges.items():
+            name = key.split("!")[0]
+            if name in self.names and stop > start:
+                column = self.names.index(name)
+                if self.row_index is not None:
+                    start, stop = np.searchsorted(self.row_index, [start, stop])
+                    if stop <= start:
+                        continue
+                self.dataChanged.emit(self.index(start, column), self.index(min(stop, self.rows) - 1, column))
+
+    def rowCount(self, parent=QModelIndex()) -> int:
+        if parent.isValid():
+            return 0
+        return max(self.rows, self.min_rows) if self.row_index is None else len(self.row_index)
+
+    def columnCount(self, parent=QModelIndex()) -> int:
+        return 0 if parent.isValid() else max(len(self.names), self.min_columns)
+
+    def data(self, index: QModelIndex, role=Qt.ItemDataRole.DisplayRole):
+        if role not in (Qt.ItemDataRole.DisplayRole, Qt.ItemDataRole.EditRole):
+            return None
+        column, row = index.column(), self.source_row(index.row())
+        if column >= len(self.columns) or row >= len(self.columns[column]):
+            return None
+        value = self.columns[column][row]
+        if isinstance(value, float) and np.isnan(value):
+            return ""
+        return str(value)
 
-        # Set row and column counts
-        self.setRowCount(num_rows)
-        self.setColumnCount(num_columns)
+    def setData(self, index: QModelIndex, value, role=Qt.ItemDataRole.EditRole) -> bool:
+        if role != Qt.ItemDataRole.EditRole or not index.isValid():
+            return False
+        self.edited.emit(self.source_row(index.row()), index.column(), str(value))
+        return True
 
-        # Generate column headers
-        self.setHorizontalHeaderLabels(self.generate_column_headers(num_columns))
+    def flags(self, index: QModelIndex):
+        return Qt.ItemFlag.ItemIsEnabled | Qt.ItemFlag.ItemIsSelectable | Qt.ItemFlag.ItemIsEditable
 
-    def generate_column_headers(self, num_columns: int):
-        """Generate column headers like A, B, ..., Z, AA, AB, etc."""
-        headers = []
-        for i in range(num_columns):
-            headers.append(self.column_name(i))
-        return headers
+    def headerData(self, section: int, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if role != Qt.ItemDataRole.DisplayRole:
+            return None
+        if orientation == Qt.Orientation.Vertical:
+            return str(self.source_row(section) + 1)
+        letter = ExcelLikeTable.column_name(section)
+        return f"{letter}: {self.names[section]}" if section < len(self.names) else letter
+
+
+class ExcelLikeTable(QTableView):
+    # Requests to the worker thread (queued connections)
+    formula_requested = Signal(str, str)
+    value_requested = Signal(str, int, object)
+    filter_requested = Signal(object)
+
+    def __init__(self, num_rows: int = 1000000, num_columns: int = 26*26):
+        super().__init__()
+
+        # Empty rows and lettered columns are shown up to these counts
+        self.table_model = ColumnarTableModel(num_rows, num_columns, self)
+        self.setModel(self.table_model)
+        # Fixed row heights: the view never measures a million rows
+        self.verticalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Fixed)
+
+        self.engine = None
+        self._worker = None
+        self._thread = None
+        self._result = None  # Shared-memory batch result behind the dataset, if any
+        self.table_model.edited.connect(self._on_cell_edited)
+        self.horizontalHeader().sectionDoubleClicked.connect(self._edit_column_formula)
+        self.horizontalHeader().setContextMenuPolicy(Qt.ContextMenuPolicy.CustomContextMenu)
+        self.horizontalHeader().customContextMenuRequested.connect(self._show_header_menu)
+        self._filters = {}  # Column name -> (low, high) of the shown filter
 
     @staticmethod
     def column_name(index: int) -> str:
@@ -27,3 +195,123 @@ class ExcelLikeTable(QTableWidget):
             name = chr(index % 26 + ord("A")) + name
             index = index // 26 - 1
         return name
+
+    def set_dataset(self, dataset: ColumnarDataset, zone_map: Optional[ZoneMap] = None):
+        """Shows a dataset and starts the formula worker thread for it.
+
+        Row filters go through `zone_map` (block min/max index of the dataset), built on the
+        first filter when not given.
+        """
+        self.stop_worker()
+        self.release_result()
+        self._filters = {}
+        self.engine = FormulaEngine(dataset, zone_map)
+        self._thread = QThread(self)
+        self._worker = FormulaWorker(self.engine)
+        self._worker.moveToThread(self._thread)
+        self.formula_requested.connect(self._worker.set_formula)
+        self.value_requested.connect(self._worker.set_value)
+        self.filter_requested.connect(self._worker.filter_rows)
+        self._worker.recalculated.connect(self._show_ranges)
+        self._worker.filtered.connect(self.table_model.set_row_index)
+        self._worker.failed.connect(lambda message: logging.warning(f"Formula error: {message}"))
+        self.table_model.set_columns({name: dataset[name] for name in dataset.names})
+        self._thread.start()
+
+    def set_shared_result(self, result: SharedResult):
+        """Shows a batch result from its shared-memory views; the table releases it when replaced.
+
+        The model reads the visible cells from the views: the result is never copied into the GUI.
+        """
+        self.set_dataset(result.dataset())
+        self._result = result
+
+    def release_result(self):
+        """Drops the shown batch result and frees its shared memory."""
+        if self._result is not None:
+            self.stop_worker()
+            # Drops the views of the result (model and engine) before it is released
+            self.table_model.clear()
+            self.engine = None
+            self._result.release()
+            self._result = None
+
+    def stop_worker(self):
+        if self._thread is not None:
+            self._thread.quit()
+            self._thread.wait()
+            self._thread = None
+            self._worker = None
+
+    def set_column_formula(self, column: str, text: str):
+        """Computes a whole column (letter or name) from a formula, e.g. "=rolling_mean(A, 24)"."""
+        if self.engine is not None:
+            self.formula_requested.emit(column, text)
+
+    def _edit_column_formula(self, index: int):
+        if self.engine is None:
+            return
+        column = self.column_name(index)
+        name = self.table_model.names[index] if index < len(self.table_model.names) else column
+        current = self.engine.formulas.get(name)
+        text, accepted = QInputDialog.getText(self, "Column formula", f"Formula for column {column}:",
+                                              text=current.text if current else "=")
+        if accepted and text.strip():
+            self.set_column_formula(column, text)
+
+    def filter_rows(self, column: str, low=None, high=None):
+        """Shows only the rows with `low <= column <= high` (None for open bounds), with the other filters."""
+        if self.engine is not None:
+            self._filters[column] = (low, high)
+            self.filter_requested.emit(dict(self._filters))
+
+    def clear_filter(self):
+        self._filters = {}
+        self.table_model.set_row_index(None)
+
+    def _show_header_menu(self, position):
+        index = self.horizontalHeader().logicalIndexAt(position)
+        if self.engine is None or not 0 <= index < len(self.table_model.names):
+            return
+        menu = QMenu(self)
+        menu.addAction("Filter rows...", lambda: self._edit_column_filter(index))
+        clear = menu.addAction("Clear filter", self.clear_filter)
+        clear.setEnabled(bool(self._filters))
+        menu.exec(self.horizontalHeader().mapToGlobal(position))
+
+    def _edit_column_filter(self, index: int):
+        name = self.table_model.names[index]
+        low, high = self._filters.get(name, (None, None))
+        current = f"{'' if low is None else low}:{'' if high is None else high}"
+        text, accepted = QInputDialog.getText(self, "Filter rows",
+                                              f"Range low:high of {name} (blank for open):", text=current)
+        if not accepted:
+            return
+        low, _, high = text.partition(":")
+        # Numbers or dates, converted by the zone map to the column's type
+        self.filter_rows(name, low.strip() or None, high.strip() or None)
+
+    def _on_cell_edited(self, row: int, column: int, text: str):
+        if self.engine is None:
+            return
+        text = text.strip()
+        letter = self.column_name(column)
+        if text.startswith("="):
+            self.formula_requested.emit(f"{letter}{row + 1}", text)
+            return
+        try:
+            value = float(text) if text else np.nan
+        except ValueError:
+            logging.warning(f"Not a number: {text!r}")
+            return
+        self.value_requested.emit(letter, row, value)
+
+    def paintEvent(self, event):
+        with span("qt.table.paint"):
+            super().paintEvent(event)
+
+    @Slot(object, object)
+    @instrumented("qt.table.show_ranges")
+    def _show_ranges(self, ranges: dict, columns: dict):
+        """Repaints the recomputed row ranges; only the visible cells are read."""
+        self.table_model.update_columns(ranges, columns)
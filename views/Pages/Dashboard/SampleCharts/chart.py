@@ -7,6 +7,8 @@ from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
 from matplotlib.figure import Figure
 import numpy as np
 
+from app.instrumentation import instrumented
+
 
 # Chart Widget Classes
 class LineChartWidget(QWidget):
@@ -91,3 +93,29 @@ class AreaChartWidget(QWidget):
         ax.fill_between(x, y, color="lightblue", alpha=0.6)
         ax.set_title("Area Chart")
         layout.addWidget(canvas)
+
+
+class ResultChartWidget(QWidget):
+    """Plots two columns of a batch result; the arrays are drawn straight from the result's buffers."""
+
+    MAX_POINTS = 200000  # Larger results are drawn with a stride
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        layout = QVBoxLayout(self)
+        self.figure = Figure()
+        self.canvas = FigureCanvas(self.figure)
+        self.ax = self.figure.add_subplot()
+        self.ax.set_title("Batch Result")
+        layout.addWidget(self.canvas)
+
+    @instrumented("qt.chart.plot")
+    def plot(self, dataset, x: str, y: str):
+        """Draws column `y` against column `x` of a ColumnarDataset (e.g. `SharedResult.dataset()`)."""
+        step = max(1, len(dataset) // self.MAX_POINTS)
+        self.ax.clear()
+        self.ax.scatter(dataset[x][::step], dataset[y][::step], s=2, color="steelblue")
+        self.ax.set_xlabel(f"{x} ({dataset.units[x]})" if x in dataset.units else x)
+        self.ax.set_ylabel(f"{y} ({dataset.units[y]})" if y in dataset.units else y)
+        self.ax.set_title("Batch Result")
+        self.canvas.draw_idle()
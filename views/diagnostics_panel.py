@@ -0,0 +1,85 @@
+from PySide6.QtCore import Qt, QTimer
+from PySide6.QtWidgets import (QCheckBox, QDockWidget, QFileDialog, QHBoxLayout, QHeaderView, QPushButton,
+                               QTableWidget, QTableWidgetItem, QVBoxLayout, QWidget)
+
+from app import instrumentation
+
+
+class DiagnosticsPanel(QDockWidget):
+    """Live statistics of the instrumented hot paths (see app/instrumentation.py).
+
+    "Record" turns the instrumentation on for the whole application, "Trace" also keeps
+    trace events, which "Export" writes as Chrome trace or speedscope JSON.
+    """
+
+    COLUMNS = ("name", "calls", "total", "mean", "p50", "p90", "p99", "max")
+
+    def __init__(self, parent=None):
+        super().__init__("Diagnostics", parent)
+        self.setObjectName("Diagnostics")
+
+        panel = QWidget(self)
+        layout = QVBoxLayout(panel)
+        controls = QHBoxLayout()
+        self.record_box = QCheckBox("Record", panel)
+        self.record_box.setChecked(instrumentation.enabled())
+        self.record_box.toggled.connect(self._set_recording)
+        self.trace_box = QCheckBox("Trace", panel)
+        self.trace_box.toggled.connect(self._set_recording)
+        reset_button = QPushButton("Reset", panel)
+        reset_button.clicked.connect(self.reset)
+        export_button = QPushButton("Export trace...", panel)
+        export_button.clicked.connect(self.export)
+        for widget in (self.record_box, self.trace_box, reset_button, export_button):
+            controls.addWidget(widget)
+        controls.addStretch()
+        layout.addLayout(controls)
+
+        self.table = QTableWidget(0, len(self.COLUMNS), panel)
+        self.table.setHorizontalHeaderLabels(self.COLUMNS)
+        self.table.horizontalHeader().setSectionResizeMode(0, QHeaderView.ResizeMode.Stretch)
+        self.table.setEditTriggers(QTableWidget.EditTrigger.NoEditTriggers)
+        layout.addWidget(self.table)
+        self.setWidget(panel)
+
+        # Refreshed while shown only: a hidden panel costs nothing
+        self.timer = QTimer(self)
+        self.timer.setInterval(1000)
+        self.timer.timeout.connect(self.refresh)
+        self.visibilityChanged.connect(self._on_visibility_changed)
+
+    def _set_recording(self):
+        if self.record_box.isChecked():
+            instrumentation.enable(trace=self.trace_box.isChecked())
+        else:
+            instrumentation.disable()
+
+    def _on_visibility_changed(self, visible: bool):
+        if visible:
+            self.refresh()
+            self.timer.start()
+        else:
+            self.timer.stop()
+
+    def refresh(self):
+        """Shows the current statistics; durations in ms, counted values (e.g. iterations) as is."""
+        entries = sorted(instrumentation.snapshot().items(), key=lambda item: -item[1]["total"])
+        self.table.setRowCount(len(entries))
+        for row, (name, entry) in enumerate(entries):
+            suffix = " ms" if entry["kind"] == "time" else ""
+            cells = [name, str(entry["calls"])] + [f"{entry[key]:.4g}{suffix}" for key in self.COLUMNS[2:]]
+            for column, text in enumerate(cells):
+                item = QTableWidgetItem(text)
+                if column:
+                    item.setTextAlignment(Qt.AlignmentFlag.AlignRight | Qt.AlignmentFlag.AlignVCenter)
+                self.table.setItem(row, column, item)
+
+    def reset(self):
+        instrumentation.REGISTRY.reset()
+        self.refresh()
+
+    def export(self):
+        path, _ = QFileDialog.getSaveFileName(self, "Export trace", "trace.json",
+                                              "Chrome trace (*.json);;speedscope (*.speedscope.json)")
+        if path:
+            instrumentation.export_trace(path)
@@ -1,11 +1,13 @@
 from PySide6.QtWidgets import (QMainWindow, QApplication, QPushButton, QVBoxLayout, QLabel,
                                QWidget, QStackedWidget, QButtonGroup, QToolBar, QStatusBar)
+from views.diagnostics_panel import DiagnosticsPanel
 from views.dock_widget import Sidebar
+from views.responsiveness import ResponsivenessIndicator
 from views.Pages.Dashboard.dashboard import TabbedWidget
 from views.Menubar.menu_bar import MenuBar
 
 from utils.colors import JORDY_BLUE
-from utils.actions import Open
+from utils.actions import Open, RunBatch
 
 from PySide6.QtCore import Qt, QTimer, QTime
 from PySide6.QtCore import Slot
@@ -24,6 +26,11 @@ class MainWindow(QMainWindow):
 
         self.main_widget = MainWidget(self)
 
+        # Hidden until shown from the View menu (the menu bar needs it)
+        self.diagnostics_panel = DiagnosticsPanel(self)
+        self.addDockWidget(Qt.DockWidgetArea.BottomDockWidgetArea, self.diagnostics_panel)
+        self.diagnostics_panel.hide()
+
         self.menu_bar = MenuBar(self)
 
         self.setMenuBar(self.menu_bar)
@@ -33,6 +40,7 @@ class MainWindow(QMainWindow):
 
         toolbar = QToolBar("Main Toolbar", self)
         toolbar.addAction(Open(self))
+        toolbar.addAction(RunBatch(self))
         self.addToolBar(Qt.ToolBarArea.TopToolBarArea, toolbar)  # Specify the area
 
         status_bar = QStatusBar(self)
@@ -41,6 +49,9 @@ class MainWindow(QMainWindow):
         self.time_label.setAlignment(Qt.AlignmentFlag.AlignRight)
         status_bar.addWidget(status_label)
         status_bar.addWidget(self.time_label, stretch=True)
+        # Event-loop latency; stalls are logged with the stack of the GUI thread
+        self.responsiveness = ResponsivenessIndicator(self)
+        status_bar.addPermanentWidget(self.responsiveness)
         self.setStatusBar(status_bar)
 
         # Create a QTimer to update the time every second
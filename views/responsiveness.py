@@ -0,0 +1,58 @@
+import time
+
+from PySide6.QtCore import Qt, QTimer
+from PySide6.QtWidgets import QApplication, QLabel
+
+from app.watchdog import StallWatchdog
+
+GOOD, SLOW, STALLED = "#2e7d32", "#ef6c00", "#c62828"
+
+
+class ResponsivenessIndicator(QLabel):
+    """Status-bar readout of the event-loop latency, driving a StallWatchdog (see app/watchdog.py).
+
+    Stalls longer than `threshold` seconds are logged with the stack of the GUI thread; the
+    tooltip shows the last one.
+    """
+
+    REFRESH_BEATS = 10  # The text is updated every 10 beats (0.5 s), not on every beat
+
+    def __init__(self, parent=None, threshold: float = 0.25, interval: float = 0.05):
+        super().__init__(parent)
+        self.setAlignment(Qt.AlignmentFlag.AlignRight | Qt.AlignmentFlag.AlignVCenter)
+        self.watchdog = StallWatchdog(threshold, interval)
+        self._beats = 0
+
+        self.heartbeat = QTimer(self)
+        self.heartbeat.setTimerType(Qt.TimerType.PreciseTimer)
+        self.heartbeat.setInterval(round(interval * 1000))
+        self.heartbeat.timeout.connect(self._beat)
+        self.heartbeat.start()
+        self.watchdog.start()
+        if QApplication.instance() is not None:
+            QApplication.instance().aboutToQuit.connect(self.stop)
+        self.refresh()
+
+    def _beat(self):
+        self.watchdog.beat()
+        self._beats += 1
+        if self._beats % self.REFRESH_BEATS == 0:
+            self.refresh()
+
+    def refresh(self):
+        latency = self.watchdog.latency * 1000
+        last = self.watchdog.stalls[-1] if self.watchdog.stalls else None
+        recent_stall = last is not None and time.time() - last.started < 10
+        color = STALLED if recent_stall else SLOW if latency > 50 else GOOD
+        self.setText(f"UI {latency:.0f} ms")
+        self.setStyleSheet(f"color: {color};")
+        if last is None:
+            self.setToolTip("Event-loop latency over the last second; no stall so far")
+        else:
+            self.setToolTip(f"Last stall: {last.duration * 1000:.0f} ms at "
+                            f"{time.strftime('%H:%M:%S', time.localtime(last.started))}, in:\n"
+                            + "".join(last.stack.splitlines(keepends=True)[-6:]))
+
+    def stop(self):
+        self.heartbeat.stop()
+        self.watchdog.stop()